@@ -4,8 +4,10 @@ Adds: Brand DNA Vault, Scheduled Posts, Supabase integration
 Keeps: ESG Engine, ChromaDB, Emotional Aligner from v1
 """
 
-import os, csv, json, math, time, requests, uuid
-from flask import Flask, request, jsonify
+import os, csv, json, math, time, uuid, hashlib
+from functools import wraps
+import numpy as np
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 # from sentence_transformers import SentenceTransformer
 # import chromadb
@@ -13,7 +15,27 @@ chromadb = None
 SentenceTransformer = None
 from supabase import create_client, Client
 from dotenv import load_dotenv
+from config import Config
+from services import http_transport
+from services.bedrock.ads_router import get_ads_router
 from services.media_generator import create_media_generator
+from services.embedding.batcher import MicroBatchEmbedder
+from services.embedding.cache import CachedEncoder, EmbeddingCache, normalize_text
+from services.embedding.classifier import LocalLabeler, label_texts, normalize_label
+from services.embedding.hashing import corpus_from_csv, load_or_fit
+from services.embedding.model import LazyEmbeddingModel, ModelNotReady
+from services.embedding.pool import EmbeddingProcessPool, parse_cpu_list
+from services.llm.cache import get_llm_cache
+from services.llm.classify import BatchClassifier
+from services.llm.fanout import FanOutExecutor
+from services.llm.json_extract import extract_json
+from services.llm.quota import BACKGROUND, INTERACTIVE, estimate_tokens, get_quota_scheduler
+from services.llm.router import AllProvidersFailed, router_from_config
+from services.llm.streaming import JSONFieldStream, sse, sse_payloads
+from services.vector_store.aggregates import RunningAggregates, field_category, field_value
+from services.vector_store.collection import VectorCollection
+from services.vector_store.partitioned import PartitionedCollection
+from services.vector_store.scoring import ERSDistribution, FusedScorer
 
 # Apify client for web scraping
 try:
@@ -28,7 +50,7 @@ load_dotenv(override=True)
 app = Flask(__name__)
 CORS(app)
 
-from routes.ads_intelligence import ads_bp
+from routes.ads_intelligence import ads_bp, init_ads_services
 app.register_blueprint(ads_bp)
 
 # ── CONFIG ────────────────────────────────────────────────────────────────────
@@ -39,49 +61,142 @@ SUPABASE_URL     = os.getenv("SUPABASE_URL",     "")
 SUPABASE_ANON    = os.getenv("SUPABASE_ANON_KEY","")
 APIFY_API_KEY    = os.getenv("APIFY_API_KEY",    "")
 LLM_PROVIDER     = os.getenv("LLM_PROVIDER", "gemini")
+VECTOR_STORE_PATH = os.getenv("VECTOR_STORE_PATH", os.path.join(os.path.dirname(__file__), "vector_store"))
+BRAND_KNOWLEDGE_PATH = os.getenv("BRAND_KNOWLEDGE_PATH", os.path.join(os.path.dirname(__file__), "brand_knowledge"))
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "") or None  # "int8" or unset
 
 if not GEMINI_API_KEY and not GROQ_API_KEY:
     print("⚠️  WARNING: No LLM API Key found. AI features will fail.")
 
 # ── CLIENTS ───────────────────────────────────────────────────────────────────
-print("⏳ Loading sentence-transformer embedding model...")
 # Mock classes for bypass (Python 3.14 compatibility)
 class MockEmbedder:
-    def encode(self, text):
-        class Result:
-            def tolist(self): return [0.0] * 384
-        return Result()
-
-embedder = MockEmbedder()
-print("⚠️  Embedding model mocked (Python 3.14 compatibility mode).")
-
-class MockCollection:
-    def __init__(self):
-        self.data = {"ids": [], "embeddings": [], "documents": [], "metadatas": []}
-    def count(self): 
-        return len(self.data["ids"])
-    def get(self, include=None, ids=None): 
-        return {
-            "ids": self.data["ids"],
-            "documents": self.data["documents"],
-            "metadatas": self.data["metadatas"]
-        }
-    def add(self, ids, embeddings, documents, metadatas):
-        self.data["ids"].extend(ids)
-        self.data["embeddings"].extend(embeddings)
-        self.data["documents"].extend(documents)
-        self.data["metadatas"].extend(metadatas)
-    def query(self, query_embeddings, n_results, include, where=None):
-        n = min(n_results, len(self.data["ids"]))
-        return {
-            "ids": [self.data["ids"][:n]],
-            "documents": [self.data["documents"][:n]],
-            "metadatas": [self.data["metadatas"][:n]],
-            "distances": [[0.1] * n]
-        }
+    model_id = "mock-zeros-384"  # keeps mock vectors out of the real model's cache entries
 
-collection = MockCollection()
-print("⚠️  ChromaDB mocked (Python 3.14 compatibility mode).")
+    def encode(self, text):
+        if isinstance(text, str):
+            return np.zeros(384, dtype=np.float32)
+        return np.zeros((len(text), 384), dtype=np.float32)
+
+# "minilm" (sentence-transformers), "hashing" (model-free n-gram vectors) or
+# "mock" (all zeros); "auto" picks minilm when it is installed.
+EMBEDDING_BACKEND = Config.EMBEDDING_BACKEND
+if EMBEDDING_BACKEND not in Config.EMBEDDING_BACKENDS:
+    # The backend's model id keys the embedding cache; a guess would file vectors under the wrong model
+    raise ValueError(f"Unknown EMBEDDING_BACKEND {EMBEDDING_BACKEND!r} "
+                     f"(expected one of: {', '.join(Config.EMBEDDING_BACKENDS)})")
+if EMBEDDING_BACKEND in ("auto", "minilm") and SentenceTransformer is None:
+    if EMBEDDING_BACKEND == "minilm":
+        print("⚠️  sentence-transformers unavailable, using hashed n-gram embeddings.")
+    EMBEDDING_BACKEND = "hashing"
+elif EMBEDDING_BACKEND == "auto":
+    EMBEDDING_BACKEND = "minilm"
+
+# Cheap to build (no download), and its model_id keys the embedding cache.
+# The IDF table is fitted on the seed posts once, then reused from disk.
+hashing_embedder = load_or_fit(
+    Config.EMBED_IDF_PATH or None,
+    corpus_from_csv(Config.EMBED_IDF_CORPUS)
+) if EMBEDDING_BACKEND == "hashing" else None
+
+def _load_embedder():
+    """Runs on the warm-up thread, never at import time."""
+    if EMBEDDING_BACKEND == "mock":
+        print("⚠️  Embedding model mocked (all-zero vectors).")
+        return MockEmbedder()
+    if EMBEDDING_BACKEND == "hashing":
+        return hashing_embedder
+    if EMBED_WORKERS > 0:
+        # Encoding runs in spawned processes that write into shared memory, off this worker's GIL
+        print(f"⏳ Starting {EMBED_WORKERS} embedding worker processes...")
+        return EmbeddingProcessPool(size=EMBED_WORKERS, dim=384,
+                                    cpu_affinity=parse_cpu_list(os.getenv("EMBED_WORKER_CPUS", ""))).start()
+    print("⏳ Loading sentence-transformer embedding model...")
+    return SentenceTransformer("all-MiniLM-L6-v2")
+
+# Loaded in the background on the first request (EMBED_WARMUP=background) or
+# on first use (EMBED_WARMUP=lazy); callers wait up to EMBED_READY_TIMEOUT.
+EMBED_WARMUP = os.getenv("EMBED_WARMUP", "background")
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "0"))  # 0 = encode on the calling thread (minilm only)
+embedder = LazyEmbeddingModel(
+    _load_embedder,
+    model_id={"mock": MockEmbedder.model_id, "minilm": "all-MiniLM-L6-v2",
+              "hashing": hashing_embedder.model_id if hashing_embedder else None}[EMBEDDING_BACKEND],
+    ready_timeout=float(os.getenv("EMBED_READY_TIMEOUT", "10"))
+)
+
+# Requests from concurrent handlers are encoded together in micro-batches
+embedding_service = MicroBatchEmbedder(
+    embedder.encode,
+    max_batch_size=int(os.getenv("EMBED_BATCH_SIZE", "64")),
+    max_wait_ms=float(os.getenv("EMBED_MAX_WAIT_MS", "5"))
+)
+# Repeated captions / drafts are served from a (model, text-hash) cache; only misses are batched
+embedding_cache = EmbeddingCache(embedder.model_id, path=Config.EMBED_CACHE_PATH or None,
+                                 capacity=Config.EMBED_CACHE_SIZE)
+cached_embedder = CachedEncoder(embedding_service.encode, embedding_cache)
+# The ads index embeds with the same warmed model and cache (mock keeps its in-memory ads stand-in)
+init_ads_services(cached_embedder if EMBEDDING_BACKEND != "mock" else None)
+
+# LLM answers: exact prompt-hash tier, plus a semantic tier for calls that
+# opt in with semantic_text (see services/llm/cache.py)
+llm_cache = get_llm_cache()
+if os.getenv("LLM_CACHE_SEMANTIC", "1") == "1":
+    llm_cache.enable_semantic(lambda texts: cached_embedder.encode(texts), embedder.model_id)
+
+# Per-post LLM tagging runs concurrently (bounded); slow items degrade to
+# "Unknown" (services/llm/fanout.py)
+llm_fanout = FanOutExecutor(max_concurrency=Config.LLM_FANOUT_CONCURRENCY, timeout=Config.LLM_FANOUT_TIMEOUT)
+# Provider calls wait only when the provider's request / token budget is spent
+# or it asked for a Retry-After; interactive calls go first (services/llm/quota.py)
+llm_quota = get_quota_scheduler()
+# Call classes (prompt templates) that run in the background lane
+LLM_BACKGROUND_CLASSES = {"emotion-batch"}
+
+# Every provider with a key serves calls: the fastest healthy one per kind of
+# call, LLM_PROVIDER first until measured, with circuit breakers and hedging
+# to the next provider (services/llm/router.py)
+llm_router = router_from_config()
+_llm_keys = {"gemini": GEMINI_API_KEY, "groq": GROQ_API_KEY}
+_preferred_provider = "groq" if LLM_PROVIDER == "groq" else "gemini"
+for _name in sorted(_llm_keys, key=lambda name: name != _preferred_provider):
+    if _llm_keys[_name] or (_name == _preferred_provider and not any(_llm_keys.values())):
+        llm_router.add(_name, _name)
+
+# Nearest-centroid emotion / archetype classifiers trained on earlier LLM
+# labels; only low-confidence texts still go to the LLM (services/embedding/classifier.py)
+local_labeler = LocalLabeler(Config.LOCAL_CLASSIFIER_PATH, embedder.model_id,
+                             threshold=Config.LOCAL_CLASSIFIER_THRESHOLD)
+
+# In-process vector index (exact cosine top-k over a NumPy embedding matrix).
+# Opened from a memory-mapped store so gunicorn --preload workers share its pages.
+collection = VectorCollection.open_or_create(
+    VECTOR_STORE_PATH,
+    name="brand_posts",
+    dim=384,
+    embedding_function=lambda texts: embed_texts(texts),
+    rank_key="ers",  # keeps is_winner / percentile_rank live on every write
+    quantization=VECTOR_QUANTIZATION,  # int8 first pass + exact float re-rank
+    # Dashboard stats (/api/stats, /api/database/stats) maintained on every write
+    aggregates=RunningAggregates(
+        numeric={"ers": field_value("ers", 0.0)},
+        categorical={
+            "platform": field_category("platform", "unknown"),
+            "emotion": field_category("emotion", "unknown"),
+            "source": field_category("source", "seed")
+        },
+        top_by="ers"
+    )
+)
+print(f"✅ Vector collection ready: {collection.count()} posts mapped from {VECTOR_STORE_PATH}")
+
+# Scraped brand knowledge (RAG context): one small store per brand_id, queried
+# with a real query embedding and cached per (brand, query hash)
+brand_knowledge = PartitionedCollection(
+    BRAND_KNOWLEDGE_PATH or None,
+    partition_key="brand_id",
+    embedding_function=lambda texts: embed_texts(texts)
+)
 
 # Supabase client (enhanced with validation and testing)
 supabase: Client = None
@@ -148,6 +263,52 @@ supabase_connected = validate_and_connect_supabase()
 _local_brand_dna = {}
 _local_posts = []
 
+# Per-brand running aggregates over scheduled_posts for /api/posts/stats.
+# Seeded with one select per brand, then updated by this process's writes;
+# re-seeded after POST_STATS_MAX_AGE so other workers' writes show up.
+POST_STATS_MAX_AGE = int(os.getenv("POST_STATS_MAX_AGE", "300"))
+_post_stats = {}  # brand_id -> (RunningAggregates, built_at)
+
+
+def _positive_resonance(post: dict):
+    score = post.get("resonance_score", 0)
+    return float(score) if isinstance(score, (int, float)) and score > 0 else None
+
+
+def _load_brand_posts(brand_id: str) -> list:
+    if supabase:
+        try:
+            res = supabase.table("scheduled_posts").select("*").eq("brand_id", brand_id).execute()
+            return res.data or []
+        except Exception:
+            return []
+    return [p for p in _local_posts if p.get("brand_id") == brand_id]
+
+
+def _brand_post_stats(brand_id: str) -> RunningAggregates:
+    """Running aggregates for one brand's scheduled posts, seeded on first use"""
+    cached = _post_stats.get(brand_id)
+    if cached and (not supabase or time.time() - cached[1] < POST_STATS_MAX_AGE):
+        return cached[0]
+    aggregates = RunningAggregates(
+        numeric={"resonance_score": _positive_resonance},
+        categorical={"status": field_category("status", None)},
+        source=lambda: ((p.get("id"), p) for p in _load_brand_posts(brand_id))
+    )
+    aggregates.rebuild()
+    _post_stats[brand_id] = (aggregates, time.time())
+    return aggregates
+
+
+def _track_post_stats(post: dict, removed: bool = False):
+    """Apply a scheduled_posts write to its brand's aggregates (if seeded)"""
+    cached = _post_stats.get(post.get("brand_id", "default"))
+    if cached:
+        if removed:
+            cached[0].remove(post.get("id"), post)
+        else:
+            cached[0].add(post.get("id"), post)
+
 
 # ── CORE HELPERS ──────────────────────────────────────────────────────────────
 
@@ -156,55 +317,246 @@ def calculate_ers(likes: int, comments: int, shares: int) -> float:
     return min(round(math.log1p(raw) * 10, 2), 100.0)
 
 def embed_text(text: str) -> list:
-    return embedder.encode(text).tolist()
+    return cached_embedder.encode(text).tolist()
+
+def embed_texts(texts) -> list:
+    """Embed many texts: cache hits first, misses through the micro-batcher."""
+    texts = list(texts)
+    return cached_embedder.encode(texts).tolist() if texts else []
+
+# TLS sessions to the configured LLM hosts are opened once per worker, before the first call needs them
+LLM_PREWARM_URLS = [url for url, key in (
+    ("https://generativelanguage.googleapis.com", GEMINI_API_KEY),
+    ("https://api.groq.com", GROQ_API_KEY)
+) if key] if os.getenv("HTTP_PREWARM", "1") == "1" else []
+
+@app.before_request
+def _warm_embedding_model():
+    if EMBED_WARMUP == "background":
+        embedder.warm()  # no-op once loading has started in this worker
+    if LLM_PREWARM_URLS:
+        http_transport.get_transport().prewarm(LLM_PREWARM_URLS)  # no-op after the first call
+
+@app.errorhandler(ModelNotReady)
+def _embedding_model_not_ready(e):
+    response = jsonify({
+        "success": False,
+        "error": "embedding_model_not_ready",
+        "state": e.state,
+        "message": "The embedding model is warming up. Please retry shortly."
+    })
+    response.status_code = 503
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
+
+def requires_embeddings(view):
+    """Fail fast with 503 before doing any work when the model is not ready in time."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not embedder.wait():
+            raise ModelNotReady(embedder.status()["state"], embedder.retry_after)
+        return view(*args, **kwargs)
+    return wrapper
+
+def persist_collection():
+    """Flush the vector collection to its memory-mapped store on disk."""
+    try:
+        collection.persist()
+    except Exception as e:
+        print(f"⚠️  Could not persist vector store: {e}")
 
-def call_gemini(prompt: str) -> str:
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent?key={GEMINI_API_KEY}"
-    payload = {
+LLM_MODELS = {"gemini": "gemini-2.5-flash", "groq": "llama-3.3-70b-versatile"}
+# Cache namespace prefix: any routed provider may answer, so cached answers
+# belong to the provider set rather than one provider
+LLM_ROUTE = "+".join(f"{name}:{LLM_MODELS[name]}" for name in sorted(llm_router.providers))
+
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/models"
+GROQ_CHAT_URL = "https://api.groq.com/openai/v1/chat/completions"
+
+def _gemini_payload(prompt: str) -> dict:
+    return {
         "contents": [{"parts": [{"text": prompt}]}],
         "generationConfig": {"temperature": 0.7, "maxOutputTokens": 8192}
     }
+
+def _groq_request(prompt: str) -> tuple:
+    headers = {"Authorization": f"Bearer {GROQ_API_KEY}", "Content-Type": "application/json"}
+    payload = {"model": LLM_MODELS["groq"], "messages": [{"role": "user", "content": prompt}],
+               "temperature": 0.7, "max_tokens": 1500}
+    return headers, payload
+
+def call_gemini(prompt: str) -> str:
+    url = f"{GEMINI_BASE_URL}/{LLM_MODELS['gemini']}:generateContent?key={GEMINI_API_KEY}"
     try:
-        res = requests.post(url, json=payload, timeout=30)
+        res = http_transport.post(url, json=_gemini_payload(prompt), timeout=30)
         res.raise_for_status()
         return res.json()["candidates"][0]["content"]["parts"][0]["text"]
     except Exception as e:
+        llm_quota.note_error("gemini", e)
         return f"[Gemini Error: {e}]"
 
 def call_groq(prompt: str) -> str:
-    url = "https://api.groq.com/openai/v1/chat/completions"
-    headers = {"Authorization": f"Bearer {GROQ_API_KEY}", "Content-Type": "application/json"}
-    payload = {"model": "llama-3.3-70b-versatile", "messages": [{"role": "user", "content": prompt}],
-               "temperature": 0.7, "max_tokens": 1500}
+    headers, payload = _groq_request(prompt)
     try:
-        res = requests.post(url, headers=headers, json=payload, timeout=30)
+        res = http_transport.post(GROQ_CHAT_URL, headers=headers, json=payload, timeout=30)
         res.raise_for_status()
         return res.json()["choices"][0]["message"]["content"]
     except Exception as e:
+        llm_quota.note_error("groq", e)
         return f"[Groq Error: {e}]"
 
-def call_llm(prompt: str) -> str:
-    return call_groq(prompt) if LLM_PROVIDER == "groq" else call_gemini(prompt)
+def _is_llm_answer(raw: str) -> bool:
+    """False for the "[Gemini Error: ...]" / "[Groq Error: ...]" strings, which are never cached"""
+    return bool(raw) and not (raw.startswith("[") and " Error: " in raw[:20])
 
-def parse_llm_json(raw: str) -> dict:
-    """Safely parse JSON from LLM response, stripping markdown fences."""
-    import re
-    clean = raw.strip()
-    
-    # Try capturing anything between { and } as a fallback
-    match = re.search(r"```(?:json)?\s*([\s\S]*?)\s*```", clean)
-    if match:
-        clean = match.group(1)
-    else:
-        # Fallback to general JSON boundary extraction
-        match = re.search(r"(\{[\s\S]*\})", clean)
-        if match:
-            clean = match.group(1)
-            
+def _provider_request(prompt: str):
+    """Router request function: one provider's call (admitted by the quota beforehand)"""
+    def request(provider: str) -> str:
+        answer = call_groq(prompt) if provider == "groq" else call_gemini(prompt)
+        if _is_llm_answer(answer):
+            llm_quota.settle(provider, estimate_tokens(answer))
+        return answer
+    return request
+
+def call_provider(prompt: str, call_class: str = "prompt") -> str:
+    """
+    Uncached call, routed to the fastest healthy provider for `call_class`
+
+    Returns:
+        The answer, or an "[LLM Error: ...]" string listing each provider's failure
+    """
+    background = call_class in LLM_BACKGROUND_CLASSES
+    tokens = estimate_tokens(prompt)
     try:
-        return json.loads(clean)
-    except json.JSONDecodeError:
+        # The quota wait happens before the router's clock starts; nobody waits
+        # on background calls, so they are not hedged (a hedge doubles quota use)
+        return llm_router.call(
+            _provider_request(prompt), call_class, ok=_is_llm_answer,
+            admit=lambda provider: llm_quota.acquire(provider, tokens, BACKGROUND if background else INTERACTIVE),
+            hedge=False if background else None
+        )
+    except AllProvidersFailed as e:
+        return f"[LLM Error: {e}]"
+
+def call_llm(prompt: str, template: str = "prompt", semantic_text: str = None, fresh: bool = False) -> str:
+    """
+    Call the routed providers through the LLM response cache
+
+    Args:
+        prompt: Full prompt (exact-tier key)
+        template: Names the prompt template; semantic hits only match within it,
+            and the router keeps latency stats per template
+        semantic_text: Variable part of the prompt, enabling near-duplicate reuse
+        fresh: Skip cached answers (the new one replaces them)
+    """
+    # Only cache misses reach a provider, so only they spend its quota
+    return llm_cache.get_or_call(f"{LLM_ROUTE}:{template}", prompt,
+                                 lambda: call_provider(prompt, template),
+                                 semantic_text=semantic_text, cacheable=_is_llm_answer, fresh=fresh)
+
+def stream_gemini(prompt: str):
+    """Yield Gemini answer text as it is generated (streamGenerateContent, SSE)"""
+    url = f"{GEMINI_BASE_URL}/{LLM_MODELS['gemini']}:streamGenerateContent?alt=sse&key={GEMINI_API_KEY}"
+    for data in sse_payloads(http_transport.stream_lines("POST", url, json=_gemini_payload(prompt), timeout=30)):
+        candidates = json.loads(data).get("candidates") or [{}]
+        for part in candidates[0].get("content", {}).get("parts", []):
+            if part.get("text"):
+                yield part["text"]
+
+def stream_groq(prompt: str):
+    """Yield Groq answer text as it is generated (chat completions, stream=true)"""
+    headers, payload = _groq_request(prompt)
+    payload["stream"] = True
+    for data in sse_payloads(http_transport.stream_lines("POST", GROQ_CHAT_URL, headers=headers,
+                                                         json=payload, timeout=30)):
+        choices = json.loads(data).get("choices") or [{}]
+        text = (choices[0].get("delta") or {}).get("content")
+        if text:
+            yield text
+
+def stream_llm(prompt: str, template: str = "prompt", fresh: bool = False):
+    """
+    Streaming call_llm: yield the answer in pieces as the provider produces them
+
+    A cached answer is yielded whole; a streamed one is cached when complete.
+    The stream goes to the router's first choice for `template`; a provider
+    that fails before sending any text is replaced by the next one (a
+    stream cannot be hedged without duplicating output).
+
+    Raises:
+        AllProvidersFailed: If no provider is available
+        requests.RequestException: If the last provider tried fails
+    """
+    namespace = f"{LLM_ROUTE}:{template}"
+    cached = None if fresh else llm_cache.peek(namespace, prompt)
+    if cached is not None:
+        yield cached
+        return
+    providers = llm_router.ranked(template)
+    if not providers:
+        raise AllProvidersFailed("no LLM provider available (all circuit breakers open)")
+    for n, provider in enumerate(providers):
+        llm_quota.acquire(provider, estimate_tokens(prompt), INTERACTIVE)
+        started = time.perf_counter()
+        pieces = []
+        try:
+            for piece in (stream_groq if provider == "groq" else stream_gemini)(prompt):
+                pieces.append(piece)
+                yield piece
+        except Exception as e:
+            llm_router.observe(provider, template, time.perf_counter() - started, e)
+            llm_quota.note_error(provider, e)
+            if pieces or n == len(providers) - 1:
+                raise
+            continue
+        elapsed = time.perf_counter() - started
+        answer = "".join(pieces)
+        llm_router.observe(provider, template, elapsed, None if _is_llm_answer(answer) else "empty answer")
+        if _is_llm_answer(answer):
+            llm_quota.settle(provider, estimate_tokens(answer))
+            llm_cache.put(namespace, prompt, answer, latency_ms=elapsed * 1000)
+        return
+
+def sse_llm_response(prepare, template: str = "prompt", fresh: bool = False) -> Response:
+    """
+    Stream an LLM-backed endpoint as server-sent events
+
+    Events: start, token (answer text as it arrives), item / field (JSON
+    values as they close, see services/llm/streaming.py), then done with the
+    blocking endpoint's response body, or error.
+
+    Args:
+        prepare: () -> (prompt, finish); runs before the stream opens, so its
+            errors (e.g. ModelNotReady → 503 + Retry-After) are answered like
+            the blocking endpoint's. finish(parsed_answer) returns the "done" payload.
+        template: Prompt template name (cache namespace, router call class)
+        fresh: Skip a cached answer
+    """
+    prompt, finish = prepare()
+
+    def events():
+        yield sse("start", {})
+        try:
+            reader = JSONFieldStream()
+            for piece in stream_llm(prompt, template, fresh=fresh):
+                yield sse("token", {"text": piece})
+                for kind, path, value in reader.feed(piece):
+                    yield sse(kind, {"path": list(path), "value": value})
+        except Exception as e:
+            yield sse("error", {"success": False, "error": f"LLM stream failed: {type(e).__name__}: {e}"})
+            return
+        result = reader.finish()
+        yield sse("done", finish(result if result is not None else {"error": "parse_failed", "raw": reader.text}))
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def parse_llm_json(raw: str) -> dict:
+    """Safely parse JSON from LLM response: fences / prose skipped, a max_tokens cut-off repaired."""
+    parsed = extract_json(raw)
+    if parsed is None:
         return {"error": "parse_failed", "raw": raw}
+    return parsed
 
 
 # ── BRAND DNA VAULT ───────────────────────────────────────────────────────────
@@ -343,6 +695,7 @@ def upload_logo():
 
 
 @app.route("/api/brand-dna/scrape-website", methods=["POST"])
+@requires_embeddings
 def scrape_website():
     """
     Scrape a company website to extract brand information
@@ -358,8 +711,8 @@ def scrape_website():
     if not url:
         return jsonify({"error": "URL is required"}), 400
     
-    # Initialize service with ChromaDB collection
-    service = BrandIntelligenceService(collection=collection)
+    # Knowledge lands in the brand's own partition (persisted on write)
+    service = BrandIntelligenceService(collection=brand_knowledge)
     
     # Scrape the website
     result = service.scrape_company_website(url, brand_id)
@@ -372,17 +725,11 @@ def scrape_website():
 
 # ── IDEATION ──────────────────────────────────────────────────────────────────
 
-@app.route("/api/ideate", methods=["POST"])
-def ideate():
-    """
-    Generate 5 content ideas based on Brand DNA + High-ERS Winners + Brand Context (RAG).
-    Enhanced with Phase 5 ERS optimization.
-    Body: { brand_id, focus_area (optional) }
-    """
+def _ideate_prompt(data: dict) -> str:
+    """Ideation prompt: Brand DNA + high-ERS winners + brand context (RAG)"""
     from services.brand_intelligence import get_brand_context
     from services.chromadb_optimizer import ChromaDBOptimizer
     
-    data = request.get_json()
     brand_id = data.get("brand_id", "default")
     focus = data.get("focus_area", "general brand storytelling")
 
@@ -417,7 +764,7 @@ def ideate():
             top_posts = [p[0] for p in sorted_p[:5]]
 
     # Get brand context from scraped website data (RAG)
-    brand_context = get_brand_context(brand_id, focus, collection)
+    brand_context = get_brand_context(brand_id, focus, brand_knowledge)
 
     mission = brand_dna.get("mission", "")
     tone = brand_dna.get("tone_descriptors", "[]")
@@ -453,7 +800,20 @@ Generate exactly 5 content ideas for social media. Return ONLY valid JSON:
   ]
 }}"""
 
-    raw = call_llm(prompt)
+    return prompt
+
+
+@app.route("/api/ideate", methods=["POST"])
+def ideate():
+    """
+    Generate 5 content ideas based on Brand DNA + High-ERS Winners + Brand Context (RAG).
+    Enhanced with Phase 5 ERS optimization.
+    Body: { brand_id, focus_area (optional), fresh (optional) }
+    """
+    data = request.get_json()
+    prompt = _ideate_prompt(data)
+
+    raw = call_llm(prompt, "ideate", fresh=bool(data.get("fresh")))
     result = parse_llm_json(raw)
     
     # 🚨 Catch LLM errors
@@ -463,19 +823,29 @@ Generate exactly 5 content ideas for social media. Return ONLY valid JSON:
     return jsonify({"success": True, "result": result})
 
 
-# ── CREATIVE STUDIO ───────────────────────────────────────────────────────────
+def _ideate_done(result: dict) -> dict:
+    if "error" in result:
+        return {"success": False, "error": f"LLM Ideation Failed: {result.get('raw', 'Unknown LLM Error')}"}
+    return {"success": True, "result": result}
 
-@app.route("/api/studio/generate", methods=["POST"])
-def studio_generate():
+
+@app.route("/api/ideate/stream", methods=["POST"])
+def ideate_stream():
     """
-    Generate full post content from an idea + Brand DNA + High-ERS Winners + Brand Context (RAG).
-    Enhanced with Phase 5 ERS optimization.
-    Body: { idea_title, idea_hook, angle, platform, brand_id }
+    /api/ideate as server-sent events: each idea is sent as soon as it is
+    generated ("item" events), then "done" with the /api/ideate body.
     """
+    data = request.get_json()
+    return sse_llm_response(lambda: (_ideate_prompt(data), _ideate_done), "ideate", fresh=bool(data.get("fresh")))
+
+
+# ── CREATIVE STUDIO ───────────────────────────────────────────────────────────
+
+def _studio_prompt(data: dict) -> str:
+    """Copywriting prompt for one idea: Brand DNA + high-ERS winners + brand context (RAG)"""
     from services.brand_intelligence import get_brand_context
     from services.chromadb_optimizer import ChromaDBOptimizer
     
-    data = request.get_json()
     idea = data.get("idea_title", "")
     hook = data.get("idea_hook", "")
     angle = data.get("angle", "storytelling")
@@ -522,7 +892,7 @@ def studio_generate():
             top_posts = [p[0] for p in sorted_p[:3]]
 
     # Get brand context from scraped website data (RAG)
-    brand_context = get_brand_context(brand_id, idea, collection)
+    brand_context = get_brand_context(brand_id, idea, brand_knowledge)
 
     mission = brand_dna.get("mission", "")
     tone = brand_dna.get("tone_descriptors", "[]")
@@ -568,11 +938,35 @@ Return ONLY valid JSON:
   "word_count": <integer>
 }}"""
 
-    raw = call_llm(prompt)
+    return prompt
+
+
+@app.route("/api/studio/generate", methods=["POST"])
+def studio_generate():
+    """
+    Generate full post content from an idea + Brand DNA + High-ERS Winners + Brand Context (RAG).
+    Enhanced with Phase 5 ERS optimization.
+    Body: { idea_title, idea_hook, angle, platform, brand_id, fresh (optional) }
+    """
+    data = request.get_json()
+    prompt = _studio_prompt(data)
+
+    raw = call_llm(prompt, "studio", fresh=bool(data.get("fresh")))
     result = parse_llm_json(raw)
     return jsonify({"success": True, "result": result})
 
 
+@app.route("/api/studio/generate/stream", methods=["POST"])
+def studio_generate_stream():
+    """
+    /api/studio/generate as server-sent events: post_text, hashtags, cta ...
+    are sent as each field closes ("field" events), then "done".
+    """
+    data = request.get_json()
+    return sse_llm_response(lambda: (_studio_prompt(data), lambda result: {"success": True, "result": result}),
+                            "studio", fresh=bool(data.get("fresh")))
+
+
 # ── MULTI-MODAL MEDIA GENERATION (Phase 6) ────────────────────────────────────
 
 @app.route('/api/studio/translate', methods=['POST'])
@@ -665,7 +1059,7 @@ def generate_media():
     brand_context = ""
     brand_logo_url = None
     try:
-        brand_context = get_brand_context(brand_id, caption, collection)
+        brand_context = get_brand_context(brand_id, caption, brand_knowledge)
         
         # Extact logo URL for overlay pipeline
         brand_data = supabase.table("brand_dna").select("logo_url").eq("brand_id", brand_id).execute()
@@ -760,29 +1154,17 @@ def generate_media():
 
 # ── ANALYZE (EMOTIONAL ALIGNER) ───────────────────────────────────────────────
 
-@app.route("/api/analyze", methods=["POST"])
-def analyze_draft():
-    """Core Emotional Aligner — unchanged from v1, now also checks banned words."""
-    data = request.get_json()
-    draft = data.get("draft", "").strip()
-    brand_id = data.get("brand_id", "default")
-
-    if not draft or len(draft) < 10:
-        return jsonify({"error": "Draft too short"}), 400
-    
-    # Check if DB is empty and provide helpful message
-    if collection.count() == 0:
-        return jsonify({
-            "success": False,
-            "error": "database_empty",
-            "message": "Your brand memory is being initialized. Please try again in a moment.",
-            "action": "Please refresh the page or click 'Seed Database' in settings.",
-            "technical_detail": "ChromaDB collection is empty. Run /api/seed to load historical posts."
-        }), 503  # Service Unavailable (temporary)
+ANALYZE_BATCH_MAX_DRAFTS = 100
+ANALYZE_PROMPT_TOKEN_BUDGET = int(os.getenv("ANALYZE_PROMPT_TOKEN_BUDGET", "6000"))
+ANALYZE_OUTPUT_TOKENS_PER_DRAFT = 350   # one analysis JSON object
+ANALYZE_PACK_TIMEOUT = float(os.getenv("ANALYZE_PACK_TIMEOUT", "90"))  # batched call plus single-draft retries
+LLM_MAX_OUTPUT_TOKENS = {"gemini": 8192, "groq": 1500}
+REFERENCE_SCORER = FusedScorer(semantic_weight=0.4, ers_weight=0.6,
+                               normalization=os.getenv("ERS_NORMALIZATION", "percentile"))
 
-    start = time.time()
 
-    # Check banned words from Brand DNA
+def _load_banned_words(brand_id: str) -> list:
+    """Banned words from the brand's DNA (Supabase, else the local fallback)."""
     banned_words = []
     brand_dna = _local_brand_dna.get(brand_id, {})
     if supabase:
@@ -803,31 +1185,43 @@ def analyze_draft():
     # Ensure banned_words is actually a list, not just characters of a string
     if isinstance(banned_words, str):
         banned_words = [w.strip() for w in banned_words.split(",")]
+    return banned_words
+
 
-    found_banned = [w for w in banned_words if w.lower() in draft.lower() and w.strip()]
+def _banned_word_matcher(banned_words: list):
+    """Lower-case the word list once; returns draft -> banned words it contains."""
+    needles = [(w, w.lower()) for w in banned_words if w.strip()]
+    def match(draft: str) -> list:
+        text = draft.lower()
+        return [w for w, needle in needles if needle in text]
+    return match
 
-    # ChromaDB semantic search
-    emb = embed_text(draft)
+
+def _rank_reference_posts(documents, metadatas, distances) -> list:
+    """Blend semantic similarity and corpus-percentile ERS; best five first."""
+    ers = [meta.get("ers", 0) or 0 for meta in metadatas]
+    sims = 1 - np.asarray(distances, dtype=np.float64)
+    best, combined, _ = REFERENCE_SCORER.top_k(sims, ers, 5, ERSDistribution.from_collection(collection))
+    return [{
+        "text": documents[i], "ers": ers[i], "semantic_sim": round(float(sims[i]), 3),
+        "combined": float(score), "platform": metadatas[i].get("platform", "instagram")
+    } for i, score in zip(best.tolist(), combined)]
+
+
+def _reference_posts_for(drafts: list) -> list:
+    """Embed every draft in one call and retrieve references with one batched query."""
     n = min(20, collection.count())
-    results = collection.query(query_embeddings=[emb], n_results=n,
+    results = collection.query(query_embeddings=embed_texts(drafts), n_results=n,
                                include=["documents","metadatas","distances"])
+    return [_rank_reference_posts(docs, metas, dists)
+            for docs, metas, dists in zip(results["documents"], results["metadatas"], results["distances"])]
 
-    candidates = []
-    for doc, meta, dist in zip(results["documents"][0], results["metadatas"][0], results["distances"][0]):
-        sim = 1 - dist
-        ers = meta.get("ers", 0)
-        candidates.append({
-            "text": doc, "ers": ers, "semantic_sim": round(sim, 3),
-            "combined": (sim * 0.4) + (ers / 100 * 0.6),
-            "platform": meta.get("platform", "instagram")
-        })
-
-    top_posts = sorted(candidates, key=lambda x: x["combined"], reverse=True)[:5]
 
+def _analysis_prompt(draft: str, top_posts: list, found_banned: list) -> str:
     posts_fmt = "\n\n".join([f"[Post {i+1} | ERS: {p['ers']:.1f}]\n{p['text']}"
                              for i, p in enumerate(top_posts)])
 
-    prompt = f"""You are an Emotional Alignment Checker for a brand's social media content.
+    return f"""You are an Emotional Alignment Checker for a brand's social media content.
 
 Brand's top resonating posts (Use strictly for TONE, PACING, and STYLE matching):
 {posts_fmt}
@@ -853,12 +1247,131 @@ Return ONLY valid JSON:
   "confidence": "<HIGH|MEDIUM|LOW>"
 }}"""
 
-    raw = call_llm(prompt)
+
+def _batch_analysis_prompt(items: list) -> str:
+    """
+    One prompt for several drafts. Reference posts shared between drafts are
+    listed once and cited by number.
+    """
+    refs, ref_numbers = [], {}
+    for item in items:
+        for p in item["top_posts"]:
+            if p["text"] not in ref_numbers:
+                ref_numbers[p["text"]] = len(refs) + 1
+                refs.append(p)
+    refs_fmt = "\n\n".join([f"[R{i+1} | ERS: {p['ers']:.1f}]\n{p['text']}" for i, p in enumerate(refs)])
+    drafts_fmt = "\n\n".join([
+        f"[Draft {n+1} | match against: {', '.join('R' + str(ref_numbers[p['text']]) for p in item['top_posts'])}]\n"
+        f"{item['draft']}"
+        + (f"\n⚠️ BANNED WORDS FOUND: {item['found_banned']}" if item["found_banned"] else "")
+        for n, item in enumerate(items)
+    ])
+
+    return f"""You are an Emotional Alignment Checker for a brand's social media content.
+
+Brand's top resonating posts (Use strictly for TONE, PACING, and STYLE matching):
+{refs_fmt}
+
+Drafts to analyze (each independently, against the posts it lists):
+{drafts_fmt}
+
+INSTRUCTIONS FOR REWRITE SUGGESTIONS:
+1. TOPIC PRESERVATION: You MUST maintain the exact original subject matter, meaning, and intent of each Draft.
+2. DO NOT copy the subject matter from the top resonating posts.
+3. Adjust only the TONE, PACING, and EMOTIONAL DELIVERY of each Draft to match the winning posts.
+
+Return ONLY valid JSON with exactly one entry per draft, in draft order:
+{{
+  "analyses": [
+    {{
+      "draft": <draft number>,
+      "resonance_score": <integer 0-100>,
+      "verdict": "<STRONG_MATCH|GOOD_MATCH|WEAK_MATCH|MISMATCH>",
+      "emotional_archetype": "<detected archetype>",
+      "what_works": "<1-2 sentences>",
+      "what_is_missing": "<1-2 sentences>",
+      "missing_signals": ["<signal1>", "<signal2>", "<signal3>"],
+      "rewrite_suggestion": "<rewritten version under 280 chars>",
+      "banned_words_found": [<banned words listed for that draft>],
+      "confidence": "<HIGH|MEDIUM|LOW>"
+    }}
+  ]
+}}"""
+
+
+def _pack_drafts(items: list) -> list:
+    """Group drafts into prompts that fit the prompt and output token budgets."""
+    # Any routed provider may get the prompt, so size packs for the smallest output limit
+    max_output = min(LLM_MAX_OUTPUT_TOKENS.get(name, 1500) for name in llm_router.providers)
+    per_prompt = max(1, max_output // ANALYZE_OUTPUT_TOKENS_PER_DRAFT)
+    packs, current, used = [], [], 0
+    for item in items:
+        cost = estimate_tokens(item["draft"]) + sum(estimate_tokens(p["text"]) for p in item["top_posts"])
+        if current and (len(current) == per_prompt or used + cost > ANALYZE_PROMPT_TOKEN_BUDGET):
+            packs.append(current)
+            current, used = [], 0
+        current.append(item)
+        used += cost
+    if current:
+        packs.append(current)
+    return packs
+
+
+def _analyze_pack(pack: list) -> list:
+    """Analyses for a pack, in pack order; drafts missing from a batched answer retry alone."""
+    results = [None] * len(pack)
+    if len(pack) > 1:
+        parsed = parse_llm_json(call_llm(_batch_analysis_prompt(pack), "analyze-batch"))
+        analyses = parsed.get("analyses") if isinstance(parsed.get("analyses"), list) else []
+        by_number = {a.get("draft"): a for a in analyses if isinstance(a, dict)}
+        for n, item in enumerate(pack):
+            analysis = by_number.get(n + 1)
+            if analysis is not None:
+                analysis.pop("draft", None)
+                analysis["banned_words_found"] = item["found_banned"]
+                results[n] = analysis
+    for n, item in enumerate(pack):
+        if results[n] is None:
+            results[n] = parse_llm_json(call_llm(
+                _analysis_prompt(item["draft"], item["top_posts"], item["found_banned"]), "analyze"))
+    return results
+
+
+@app.route("/api/analyze", methods=["POST"])
+def analyze_draft():
+    """Core Emotional Aligner — unchanged from v1, now also checks banned words."""
+    data = request.get_json()
+    draft = data.get("draft", "").strip()
+    brand_id = data.get("brand_id", "default")
+
+    if not draft or len(draft) < 10:
+        return jsonify({"error": "Draft too short"}), 400
+    
+    # Check if DB is empty and provide helpful message
+    if collection.count() == 0:
+        return jsonify({
+            "success": False,
+            "error": "database_empty",
+            "message": "Your brand memory is being initialized. Please try again in a moment.",
+            "action": "Please refresh the page or click 'Seed Database' in settings.",
+            "technical_detail": "ChromaDB collection is empty. Run /api/seed to load historical posts."
+        }), 503  # Service Unavailable (temporary)
+
+    start = time.time()
+
+    # Check banned words from Brand DNA
+    found_banned = _banned_word_matcher(_load_banned_words(brand_id))(draft)
+
+    # Semantic search
+    top_posts = _reference_posts_for([draft])[0]
+
+    raw = call_llm(_analysis_prompt(draft, top_posts, found_banned), "analyze")
     analysis = parse_llm_json(raw)
 
     # 🚨 NEW: Catch LLM errors
     if "error" in analysis:
         return jsonify({"success": False, "error": f"LLM Scoring Failed: {analysis.get('raw', 'Unknown error')}"}), 500
+    record_archetypes([draft], [analysis])
 
     return jsonify({
         "success": True, "draft": draft, "analysis": analysis,
@@ -869,6 +1382,118 @@ Return ONLY valid JSON:
     })
 
 
+@app.route("/api/analyze/stream", methods=["POST"])
+def analyze_draft_stream():
+    """
+    /api/analyze as server-sent events: resonance_score, verdict, then the
+    rewrite suggestion ... are sent as each field closes, then "done" with
+    the /api/analyze body.
+    """
+    data = request.get_json()
+    draft = data.get("draft", "").strip()
+    brand_id = data.get("brand_id", "default")
+
+    if not draft or len(draft) < 10:
+        return jsonify({"error": "Draft too short"}), 400
+    if collection.count() == 0:
+        return jsonify({
+            "success": False,
+            "error": "database_empty",
+            "message": "Your brand memory is being initialized. Please try again in a moment.",
+            "action": "Please refresh the page or click 'Seed Database' in settings.",
+            "technical_detail": "ChromaDB collection is empty. Run /api/seed to load historical posts."
+        }), 503
+
+    start = time.time()
+
+    def prepare():
+        found_banned = _banned_word_matcher(_load_banned_words(brand_id))(draft)
+        top_posts = _reference_posts_for([draft])[0]
+
+        def finish(analysis: dict) -> dict:
+            if "error" in analysis:
+                return {"success": False, "error": f"LLM Scoring Failed: {analysis.get('raw', 'Unknown error')}"}
+            record_archetypes([draft], [analysis])
+            return {
+                "success": True, "draft": draft, "analysis": analysis,
+                "reference_posts": top_posts[:3],
+                "processing_time_seconds": round(time.time() - start, 2),
+                "db_size": collection.count(),
+                "banned_words_found": found_banned
+            }
+
+        return _analysis_prompt(draft, top_posts, found_banned), finish
+
+    return sse_llm_response(prepare, "analyze")
+
+
+@app.route("/api/analyze/batch", methods=["POST"])
+def analyze_drafts_batch():
+    """
+    Analyze many drafts in one request.
+    Body: { drafts: [string], brand_id }
+    Drafts are embedded together, scored against the corpus in one batched
+    query, checked with one banned-word matcher, and packed several per LLM
+    prompt; the packs are sent concurrently. Results come back in input order.
+    """
+    data = request.get_json() or {}
+    drafts = data.get("drafts") or []
+    brand_id = data.get("brand_id", "default")
+
+    if not isinstance(drafts, list) or not drafts:
+        return jsonify({"error": "drafts must be a non-empty list"}), 400
+    if len(drafts) > ANALYZE_BATCH_MAX_DRAFTS:
+        return jsonify({"error": f"At most {ANALYZE_BATCH_MAX_DRAFTS} drafts per batch"}), 400
+    if collection.count() == 0:
+        return jsonify({
+            "success": False,
+            "error": "database_empty",
+            "message": "Your brand memory is being initialized. Please try again in a moment.",
+            "action": "Please refresh the page or click 'Seed Database' in settings.",
+            "technical_detail": "ChromaDB collection is empty. Run /api/seed to load historical posts."
+        }), 503
+
+    start = time.time()
+    match_banned = _banned_word_matcher(_load_banned_words(brand_id))
+
+    results = [{"draft": (d if isinstance(d, str) else "").strip()} for d in drafts]
+    valid = [r for r in results if len(r["draft"]) >= 10]
+    for r in results:
+        if len(r["draft"]) < 10:
+            r["error"] = "Draft too short"
+
+    if valid:
+        for item, top_posts in zip(valid, _reference_posts_for([r["draft"] for r in valid])):
+            item["top_posts"] = top_posts
+            item["found_banned"] = match_banned(item["draft"])
+        packs = _pack_drafts(valid)
+        # Packs are independent prompts: send them together (bounded by the fan-out pool)
+        for pack, analyses in zip(packs, llm_fanout.map(_analyze_pack, packs, timeout=ANALYZE_PACK_TIMEOUT)):
+            for item, analysis in zip(pack, analyses or [None] * len(pack)):
+                item["analysis"] = analysis or {"error": "parse_failed", "raw": "[LLM Error: analysis failed or timed out]"}
+        record_archetypes([r["draft"] for r in valid], [r["analysis"] for r in valid])
+
+    output = []
+    for r in results:
+        if "error" in r:
+            output.append({"success": False, "draft": r["draft"], "error": r["error"]})
+        elif "error" in r["analysis"]:
+            output.append({"success": False, "draft": r["draft"],
+                           "error": f"LLM Scoring Failed: {r['analysis'].get('raw', 'Unknown error')}"})
+        else:
+            output.append({"success": True, "draft": r["draft"], "analysis": r["analysis"],
+                           "reference_posts": r["top_posts"][:3],
+                           "banned_words_found": r["found_banned"]})
+
+    return jsonify({
+        "success": True,
+        "results": output,
+        "prompt_packs": len(packs) if valid else 0,
+        "processing_time_seconds": round(time.time() - start, 2),
+        "db_size": collection.count()
+    })
+
+
 # ── SCHEDULED POSTS ───────────────────────────────────────────────────────────
 
 @app.route("/api/posts/schedule", methods=["POST"])
@@ -902,6 +1527,7 @@ def schedule_post():
             return jsonify({"error": str(e)}), 500
     else:
         _local_posts.append(record)
+    _track_post_stats(record)
 
     return jsonify({"success": True, "post": record})
 
@@ -950,15 +1576,19 @@ def delete_post(post_id):
             res = supabase.table("scheduled_posts").delete().eq("id", post_id).eq("brand_id", brand_id).execute()
             if not res.data:
                 return jsonify({"error": "Post not found or unauthorized"}), 404
+            for removed in res.data:
+                _track_post_stats(removed, removed=True)
             return jsonify({"success": True, "message": "Post deleted from calendar"})
         except Exception as e:
             return jsonify({"error": str(e)}), 500
     else:
         global _local_posts
-        initial_len = len(_local_posts)
-        _local_posts = [p for p in _local_posts if p.get("id") != post_id]
-        if len(_local_posts) == initial_len:
+        removed = [p for p in _local_posts if p.get("id") == post_id]
+        if not removed:
             return jsonify({"error": "Post not found"}), 404
+        _local_posts = [p for p in _local_posts if p.get("id") != post_id]
+        for post in removed:
+            _track_post_stats(post, removed=True)
         return jsonify({"success": True, "message": "Post deleted from calendar"})
 
 
@@ -991,21 +1621,14 @@ def reschedule_post(post_id):
 def get_post_stats():
     """Dashboard metric cards — total posts, avg resonance, etc."""
     brand_id = request.args.get("brand_id", "default")
+    stats = _brand_post_stats(brand_id).snapshot()
+    statuses = stats["histograms"]["status"]
+    scores = stats["numeric"]["resonance_score"]
 
-    if supabase:
-        try:
-            res = supabase.table("scheduled_posts").select("*").eq("brand_id", brand_id).execute()
-            posts = res.data or []
-        except:
-            posts = []
-    else:
-        posts = [p for p in _local_posts if p.get("brand_id") == brand_id]
-
-    total = len(posts)
-    scheduled = len([p for p in posts if p.get("status") == "scheduled"])
-    published = len([p for p in posts if p.get("status") == "published"])
-    scores = [p.get("resonance_score", 0) for p in posts if p.get("resonance_score", 0) > 0]
-    avg_score = round(sum(scores) / len(scores), 1) if scores else 0
+    total = stats["count"]
+    scheduled = statuses.get("scheduled", 0)
+    published = statuses.get("published", 0)
+    avg_score = round(scores["avg"], 1) if scores["count"] else 0
 
     return jsonify({
         "success": True,
@@ -1026,17 +1649,43 @@ def health():
         "posts_in_chromadb": collection.count(),
         "llm_provider": LLM_PROVIDER,
         "supabase_connected": supabase is not None,
-        "embedding_model": "all-MiniLM-L6-v2"
+        "embedding_model": embedder.model_id,
+        "embedding_ready": embedder.ready,
+        "embedding_model_status": embedder.status(),
+        "embedding_batcher": embedding_service.metrics(),
+        "embedding_cache": embedding_cache.stats(),
+        "http_transport": http_transport.get_transport().metrics(),
+        "llm_cache": llm_cache.stats(),
+        "llm_fanout": llm_fanout.metrics(),
+        "llm_router": llm_router.metrics(),
+        "quota": llm_quota.metrics(),
+        "ads_llm_router": get_ads_router().metrics(),
+        "emotion_classifier": emotion_classifier.stats(),
+        "local_classifier": local_labeler.stats()
     })
 
 
+@app.route("/api/health/ready", methods=["GET"])
+def readiness():
+    """Readiness probe: 200 once the embedding model is loaded, else 503 + Retry-After."""
+    status = embedder.status()
+    if not embedder.ready:
+        response = jsonify({"ready": False, "embedding_model": status})
+        response.status_code = 503
+        response.headers["Retry-After"] = str(embedder.retry_after)
+        return response
+    return jsonify({"ready": True, "embedding_model": status})
+
+
 @app.route("/api/seed", methods=["POST"])
+@requires_embeddings
 def seed():
     csv_path = os.path.join(os.path.dirname(__file__), "../data/brand_posts.csv")
     if not os.path.exists(csv_path):
         return jsonify({"error": f"CSV not found at {csv_path}"}), 404
 
-    added = skipped = 0
+    ids, texts, metas = [], [], []
+    skipped = 0
     with open(csv_path, "r", encoding="utf-8") as f:
         reader = csv.DictReader(f)
         for i, row in enumerate(reader):
@@ -1044,18 +1693,22 @@ def seed():
             if collection.get(ids=[post_id])["ids"]:
                 skipped += 1
                 continue
-            text = row["post_text"].strip()
             ers = calculate_ers(int(row.get("likes",0)),
                                 int(row.get("comments",0)),
                                 int(row.get("shares",0)))
-            collection.add(ids=[post_id], embeddings=[embed_text(text)],
-                          documents=[text], metadatas=[{
-                              "ers": ers, "likes": int(row.get("likes",0)),
-                              "comments": int(row.get("comments",0)),
-                              "shares": int(row.get("shares",0)),
-                              "platform": row.get("platform","instagram")
-                          }])
-            added += 1
+            ids.append(post_id)
+            texts.append(row["post_text"].strip())
+            metas.append({
+                "ers": ers, "likes": int(row.get("likes",0)),
+                "comments": int(row.get("comments",0)),
+                "shares": int(row.get("shares",0)),
+                "platform": row.get("platform","instagram")
+            })
+
+    added = collection.add(ids=ids, embeddings=embed_texts(texts), documents=texts, metadatas=metas) if ids else 0
+    skipped += len(ids) - added  # added by another worker since the check above
+    if added:
+        persist_collection()
 
     return jsonify({"success": True, "added": added, "skipped": skipped,
                    "total": collection.count()})
@@ -1088,7 +1741,7 @@ Return ONLY valid JSON:
   ]
 }}"""
 
-    raw = call_llm(prompt)
+    raw = call_llm(prompt, "generate", fresh=bool(data.get("fresh")))
     result = parse_llm_json(raw)
     return jsonify({"success": True, "topic": topic, "result": result})
 
@@ -1097,31 +1750,108 @@ Return ONLY valid JSON:
 def get_ers_stats():
     if collection.count() == 0:
         return jsonify({"error":"DB empty"}), 400
-    all_p = collection.get(include=["documents","metadatas"])
-    ers_scores = [m.get("ers",0) for m in all_p["metadatas"]]
-    top10 = sorted(zip(all_p["documents"], all_p["metadatas"]),
-                   key=lambda x: x[1].get("ers",0), reverse=True)[:10]
+    stats = collection.stats(top_k=10)
+    ers = stats["numeric"]["ers"]
     return jsonify({
         "total_posts": collection.count(),
-        "avg_ers": round(sum(ers_scores)/len(ers_scores),2),
-        "max_ers": round(max(ers_scores),2),
-        "min_ers": round(min(ers_scores),2),
-        "top_posts": [{"text":d[:120]+"..","ers":m.get("ers",0),"platform":m.get("platform")}
-                      for d,m in top10]
+        "avg_ers": round(ers["avg"],2),
+        "max_ers": round(ers["max"],2),
+        "min_ers": round(ers["min"],2),
+        "top_posts": [{"text":t["document"][:120]+"..","ers":t["metadata"].get("ers",0),
+                       "platform":t["metadata"].get("platform")}
+                      for t in stats["top"]]
+    })
+
+
+@app.route("/api/stats/verify", methods=["POST"])
+def verify_stats():
+    """Rebuild the running stats from scratch and report any drift."""
+    result = collection.verify_stats(repair=True)
+    brands = {}
+    for brand_id in list(_post_stats):
+        brands[brand_id] = _post_stats[brand_id][0].verify(repair=True)["consistent"]
+    return jsonify({
+        "success": True,
+        "collection_consistent": result["consistent"],
+        "drift": sorted(result["drift"]),
+        "post_stats_consistent": brands
     })
 
 
+POSTS_PAGE_MAX = 500
+
+
+def _post_cursor(record: dict) -> str:
+    value = record["value"]
+    return f"{'' if value is None else repr(value)},{record['id']}"
+
+
+def _parse_post_cursor(raw: str):
+    value, sep, post_id = raw.partition(",")
+    if not sep or not post_id:
+        raise ValueError("cursor must be '<ers>,<id>'")
+    return (float(value) if value else None), post_id
+
+
 @app.route("/api/posts", methods=["GET"])
 def get_posts():
-    if collection.count() == 0:
-        return jsonify({"posts":[]}), 200
-    all_p = collection.get(include=["documents","metadatas"])
-    posts = [{"text":d,"ers":m.get("ers",0),"likes":m.get("likes",0),
-              "comments":m.get("comments",0),"shares":m.get("shares",0),
-              "platform":m.get("platform","unknown")}
-             for d,m in zip(all_p["documents"],all_p["metadatas"])]
-    posts.sort(key=lambda x: x["ers"], reverse=True)
-    return jsonify({"posts":posts})
+    """
+    Posts ordered by ERS (highest first, ties by id), read from the ERS index.
+    Query: after=<ers>,<id>  limit  platform  source  emotion  min_ers  max_ers
+           format=json (default) | ndjson
+    With limit the response is one page plus next_cursor; without it the
+    whole list is streamed, so memory stays flat at any corpus size.
+    """
+    args = request.args
+    try:
+        after = _parse_post_cursor(args["after"]) if args.get("after") else None
+        limit = int(args["limit"]) if args.get("limit") else None
+        if limit is not None and limit < 1:
+            raise ValueError("limit must be at least 1")
+        limit = min(limit, POSTS_PAGE_MAX) if limit is not None else None
+        min_ers = float(args["min_ers"]) if args.get("min_ers") else None
+        max_ers = float(args["max_ers"]) if args.get("max_ers") else None
+    except ValueError as e:
+        return jsonify({"error": f"Invalid pagination parameter: {e}"}), 400
+    fmt = args.get("format", "json")
+
+    filters = [{key: args[key]} for key in ("platform", "source", "emotion") if args.get(key)]
+    where = filters[0] if len(filters) == 1 else ({"$and": filters} if filters else None)
+
+    records = collection.scan_sorted("ers", where=where, after=after,
+                                     min_value=min_ers, max_value=max_ers,
+                                     batch_size=min((limit or 255) + 1, 256))
+
+    def to_post(record):
+        m = record["metadata"]
+        return {"id":record["id"],"text":record["document"],"ers":m.get("ers",0),"likes":m.get("likes",0),
+                "comments":m.get("comments",0),"shares":m.get("shares",0),
+                "platform":m.get("platform","unknown")}
+
+    if limit is not None and fmt != "ndjson":
+        page = []
+        for record in records:
+            if len(page) == limit:
+                return jsonify({"posts":[to_post(r) for r in page],
+                                "next_cursor":_post_cursor(page[-1])})
+            page.append(record)
+        return jsonify({"posts":[to_post(r) for r in page], "next_cursor":None})
+
+    def ndjson():
+        for count, record in enumerate(records):
+            if limit is not None and count == limit:
+                return
+            yield json.dumps({**to_post(record), "cursor":_post_cursor(record)}) + "\n"
+
+    def json_array():
+        yield '{"posts":['
+        for count, record in enumerate(records):
+            yield ("," if count else "") + json.dumps(to_post(record))
+        yield ']}'
+
+    if fmt == "ndjson":
+        return Response(stream_with_context(ndjson()), mimetype="application/x-ndjson")
+    return Response(stream_with_context(json_array()), mimetype="application/json")
 
 
 # ── DATABASE EXPANSION (Web Scraping) ────────────────────────────────────────
@@ -1217,6 +1947,7 @@ def scrape_posts():
 
 
 @app.route("/api/database/add-posts", methods=["POST"])
+@requires_embeddings
 def add_scraped_posts():
     """
     Add approved scraped posts to the database.
@@ -1230,13 +1961,14 @@ def add_scraped_posts():
     if not posts:
         return jsonify({"error": "No posts provided"}), 400
     
-    added = 0
-    for post in posts:
+    accepted = [(post, str(post.get("text") or "").strip()) for post in posts]
+    accepted = [(post, text) for post, text in accepted if len(text) >= 10]
+    # Tag every accepted post at once (local classifier first, then batched LLM)
+    emotions = classify_post_emotions([text for _, text in accepted])
+    
+    ids, texts, metas = [], [], []
+    for (post, text), (emotion, emotion_source) in zip(accepted, emotions):
         try:
-            text = post.get("text", "").strip()
-            if not text or len(text) < 10:
-                continue
-            
             # Calculate ERS
             ers = calculate_ers(
                 int(post.get("likes", 0)),
@@ -1244,30 +1976,28 @@ def add_scraped_posts():
                 int(post.get("shares", 0))
             )
             
-            # Analyze emotion with LLM
-            emotion = analyze_post_emotion(text)
-            
-            # Add to database
-            post_id = f"scraped_{collection.count()}_{added}"
-            collection.add(
-                ids=[post_id],
-                embeddings=[embed_text(text)],
-                documents=[text],
-                metadatas=[{
-                    "ers": ers,
-                    "likes": int(post.get("likes", 0)),
-                    "comments": int(post.get("comments", 0)),
-                    "shares": int(post.get("shares", 0)),
-                    "platform": post.get("platform", "unknown"),
-                    "emotion": emotion,
-                    "source": "scraped"
-                }]
-            )
-            added += 1
+            metas.append({
+                "ers": ers,
+                "likes": int(post.get("likes", 0)),
+                "comments": int(post.get("comments", 0)),
+                "shares": int(post.get("shares", 0)),
+                "platform": post.get("platform", "unknown"),
+                "emotion": emotion,
+                "emotion_source": emotion_source,
+                "source": "scraped"
+            })
+            # Content-hash ids: stable across workers and deletes, and a re-submitted post is skipped
+            ids.append(f"scraped_{hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()[:24]}")
+            texts.append(text)
         except Exception as e:
             print(f"Error adding post: {e}")
             continue
     
+    # Embed and add every accepted post in one batch; posts already stored are skipped
+    added = collection.add(ids=ids, embeddings=embed_texts(texts), documents=texts, metadatas=metas) if ids else 0
+    if added:
+        persist_collection()
+    
     return jsonify({
         "success": True,
         "added_count": added,
@@ -1277,6 +2007,7 @@ def add_scraped_posts():
 
 
 @app.route("/api/esg/scrape", methods=["POST"])
+@requires_embeddings
 def scrape_with_ers():
     """
     Scrape posts from social media accounts with ERS calculation.
@@ -1331,6 +2062,7 @@ def scrape_with_ers():
         )
         
         if result['success']:
+            persist_collection()
             response = {
                 "success": True,
                 "posts": result['posts'],
@@ -1377,36 +2109,19 @@ def get_database_stats():
             "sources": {}
         })
     
-    all_p = collection.get(include=["metadatas"])
-    metadatas = all_p["metadatas"]
-    
-    # Calculate stats
-    ers_scores = [m.get("ers", 0) for m in metadatas]
-    platforms = {}
-    emotions = {}
-    sources = {}
-    
-    for m in metadatas:
-        # Platform distribution
-        platform = m.get("platform", "unknown")
-        platforms[platform] = platforms.get(platform, 0) + 1
-        
-        # Emotion distribution
-        emotion = m.get("emotion", "unknown")
-        emotions[emotion] = emotions.get(emotion, 0) + 1
-        
-        # Source distribution
-        source = m.get("source", "seed")
-        sources[source] = sources.get(source, 0) + 1
+    # Running aggregates, maintained on every collection write
+    stats = collection.stats(top_k=0)
+    ers = stats["numeric"]["ers"]
+    histograms = stats["histograms"]
     
     return jsonify({
         "total_posts": collection.count(),
-        "avg_ers": round(sum(ers_scores) / len(ers_scores), 2) if ers_scores else 0,
-        "max_ers": round(max(ers_scores), 2) if ers_scores else 0,
-        "min_ers": round(min(ers_scores), 2) if ers_scores else 0,
-        "platforms": platforms,
-        "emotions": emotions,
-        "sources": sources
+        "avg_ers": round(ers["avg"], 2) if ers["count"] else 0,
+        "max_ers": round(ers["max"], 2) if ers["count"] else 0,
+        "min_ers": round(ers["min"], 2) if ers["count"] else 0,
+        "platforms": histograms["platform"],
+        "emotions": histograms["emotion"],
+        "sources": histograms["source"]
     })
 
 
@@ -1464,8 +2179,9 @@ def scrape_platform(apify_client, platform: str, keywords: str, count: int):
         print(f"🧠 Analyzing emotions for {len(posts)} posts...")
         for post in posts:
             post["ers"] = calculate_ers(post["likes"], post["comments"], post["shares"])
-            if post["text"]:
-                post["emotion"] = analyze_post_emotion(post["text"])
+        tagged = [post for post in posts if post["text"]]
+        for post, emotion in zip(tagged, tag_post_emotions([post["text"] for post in tagged])):
+            post["emotion"] = emotion
     
     return posts
 
@@ -1496,54 +2212,140 @@ def generate_mock_scraped_posts(keywords: str, count: int):
     return posts
 
 
+EMOTION_LABELS = ["Inspiring", "Authentic", "Vulnerable", "Educational", "Entertaining",
+                  "Promotional", "Informative", "Humorous", "Empathetic", "Authoritative"]
+
+# Captions are tagged many per prompt (JSON array answer), batches sized by a
+# token estimate and sent through the fan-out; labels are cached per caption
+emotion_classifier = BatchClassifier(
+    call=lambda prompt: call_provider(prompt, "emotion-batch"),
+    labels=EMOTION_LABELS,
+    task="the emotional tone of each numbered social media post",
+    max_prompt_tokens=Config.LLM_BATCH_TOKENS,
+    max_items=Config.LLM_BATCH_ITEMS,
+    map_fn=lambda run, batches: llm_fanout.map(run, batches),
+    cache=llm_cache,
+    namespace=f"{LLM_ROUTE}:emotion-label",
+    is_answer=_is_llm_answer
+)
+
+
 def analyze_post_emotion(text: str) -> str:
     """Analyze the emotional tone of a post using LLM"""
-    if not GEMINI_API_KEY and not GROQ_API_KEY:
-        return "Unknown"
-    
-    prompt = f"""Analyze the emotional tone of this social media post in ONE WORD.
+    return tag_post_emotions([text])[0]
 
-Post: {text[:200]}
 
-Choose ONE from: Inspiring, Authentic, Vulnerable, Educational, Entertaining, Promotional, Informative, Humorous, Empathetic, Authoritative
+def tag_post_emotions(texts: list) -> list:
+    """Emotion per text, in input order (see classify_post_emotions)"""
+    return [emotion for emotion, _ in classify_post_emotions(texts)]
 
-Return ONLY the single word, nothing else."""
-    
+
+def classify_post_emotions(texts: list) -> list:
+    """
+    Emotion-tag many posts: local classifier first, batched LLM prompts for the rest
+
+    Args:
+        texts: Post texts
+
+    Returns:
+        (emotion, source) per text, in input order. source is "local", "llm",
+        or None for "Unknown" (no LLM configured, or its batch failed)
+    """
     try:
-        result = call_llm(prompt).strip()
-        # Extract first word if LLM returns more
-        emotion = result.split()[0].strip('.,!?')
-        return emotion
-    except:
-        return "Unknown"
+        local = label_texts(local_labeler, "emotion", texts, embed_texts)
+    except ModelNotReady:
+        local = [None] * len(texts)
+    results = [(p[0], "local") if p else None for p in local]
+    escalate = [i for i, r in enumerate(results) if r is None]
+    if escalate and (GEMINI_API_KEY or GROQ_API_KEY):
+        for i, emotion in zip(escalate, emotion_classifier.classify([texts[i] for i in escalate])):
+            results[i] = (emotion, "llm" if emotion in EMOTION_LABELS else None)
+    return [r or ("Unknown", None) for r in results]
+
+
+def record_archetypes(drafts: list, analyses: list):
+    """
+    Keep the LLM's archetype for each analyzed draft as local training data,
+    and attach the local classifier's confident prediction ("archetype_local")
+    """
+    try:
+        local = label_texts(local_labeler, "archetype", drafts, embed_texts)
+    except ModelNotReady:
+        local = [None] * len(drafts)
+    labelled = []
+    for draft, analysis, prediction in zip(drafts, analyses, local):
+        if not isinstance(analysis, dict) or "error" in analysis:
+            continue
+        label = normalize_label(analysis.get("emotional_archetype"))
+        if label:
+            labelled.append((draft, label))
+        analysis["archetype_local"] = {"label": prediction[0], "confidence": prediction[1]} if prediction else None
+    local_labeler.record("archetype", [d for d, _ in labelled], [l for _, l in labelled])
+
+
+def retrain_local_classifier() -> dict:
+    """
+    Refit the local emotion / archetype classifiers
+
+    Emotion examples are posts whose `emotion` came from the LLM; archetype
+    examples are the ones recorded from /api/analyze.
+
+    Returns:
+        Agreement-with-LLM report per head
+    """
+    # Only LLM tags: seeded posts carry placeholder emotions, local ones would train on themselves
+    rows = collection.get(
+        where={"$and": [{"emotion_source": "llm"}, {"emotion": {"$in": EMOTION_LABELS}}]},
+        include=["embeddings", "metadatas"]
+    )
+    labels = [meta["emotion"] for meta in rows["metadatas"]]
+    report = {"emotion": local_labeler.train("emotion", np.array(rows["embeddings"]), labels)
+              if labels else {"examples": 0, "error": "no LLM-labelled posts"}}
+    texts, labels = local_labeler.recorded("archetype")
+    report["archetype"] = (local_labeler.train("archetype", embed_texts(texts), labels)
+                           if texts else {"examples": 0, "error": "no recorded archetypes"})
+    return report
+
+
+@app.route("/api/classifier/retrain", methods=["POST"])
+@requires_embeddings
+def retrain_classifier():
+    """Refit the local emotion / archetype classifiers and report their agreement with the LLM"""
+    return jsonify({"success": True, "report": retrain_local_classifier()})
 
 
 if __name__ == "__main__":
+    embedder.warm()
+    if LLM_PREWARM_URLS:
+        http_transport.get_transport().prewarm(LLM_PREWARM_URLS)
     # Auto-seed database if empty
     if collection.count() == 0:
         csv_path = os.path.join(os.path.dirname(__file__), "../data/brand_posts.csv")
         if os.path.exists(csv_path):
             print("📊 Auto-seeding database with sample posts...")
             try:
+                import random
+                emotions = ["Inspirational", "Educational", "Relatable", "Controversial", "Motivational", "Humorous"]
+                ids, texts, metas = [], [], []
                 with open(csv_path, "r", encoding="utf-8") as f:
                     reader = csv.DictReader(f)
                     for i, row in enumerate(reader):
-                        import random
-                        emotions = ["Inspirational", "Educational", "Relatable", "Controversial", "Motivational", "Humorous"]
-                        post_id = f"post_{i}"
-                        text = row["post_text"].strip()
                         ers = calculate_ers(int(row.get("likes",0)),
                                             int(row.get("comments",0)),
                                             int(row.get("shares",0)))
-                        collection.add(ids=[post_id], embeddings=[embed_text(text)],
-                                      documents=[text], metadatas=[{
-                                          "ers": ers, "likes": int(row.get("likes",0)),
-                                          "comments": int(row.get("comments",0)),
-                                          "shares": int(row.get("shares",0)),
-                                          "platform": row.get("platform","instagram"),
-                                          "emotion": random.choice(emotions),
-                                          "source": "seed"
-                                      }])
+                        ids.append(f"post_{i}")
+                        texts.append(row["post_text"].strip())
+                        metas.append({
+                            "ers": ers, "likes": int(row.get("likes",0)),
+                            "comments": int(row.get("comments",0)),
+                            "shares": int(row.get("shares",0)),
+                            "platform": row.get("platform","instagram"),
+                            "emotion": random.choice(emotions),
+                            "source": "seed"
+                        })
+                if ids:
+                    collection.add(ids=ids, embeddings=embed_texts(texts), documents=texts, metadatas=metas)
+                persist_collection()
                 print(f"✅ Auto-seeded {collection.count()} posts from CSV")
             except Exception as e:
                 print(f"⚠️  Auto-seed failed: {e}")
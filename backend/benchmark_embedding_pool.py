@@ -0,0 +1,98 @@
+"""
+Benchmark Embedding Process Pool
+Throughput of EmbeddingProcessPool against encoding on request threads.
+
+Both sides see the same load: `--clients` concurrent callers, each encoding
+batches of `--batch` captions. In-thread encoding shares one model and the
+GIL; the pool spreads the same batches over worker processes that write
+into shared memory.
+
+Uses all-MiniLM-L6-v2 when sentence-transformers is installed, otherwise a
+pure-Python encoder that holds the GIL the way tokenization does.
+
+Usage:
+    python benchmark_embedding_pool.py
+    python benchmark_embedding_pool.py --model synthetic --workers 1 2 4 --texts 4000
+    python benchmark_embedding_pool.py --cpus 0-3
+"""
+import argparse
+import importlib.util
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from services.embedding.pool import EmbeddingProcessPool, parse_cpu_list, resolve_factory
+
+DIM = 384
+WORDS = ("launch", "behind", "scenes", "team", "customers", "story", "growth", "lesson",
+         "today", "proud", "thank", "community", "new", "product", "journey", "build")
+
+
+class SyntheticEncoder:
+    """GIL-bound stand-in: hashed character trigrams, normalized"""
+
+    def encode(self, texts):
+        out = np.zeros((len(texts), DIM), dtype=np.float32)
+        for row, text in enumerate(texts):
+            padded = f"  {text.lower()}  "
+            for _ in range(4):  # roughly MiniLM tokenization + pooling cost per caption
+                for i in range(len(padded) - 2):
+                    out[row, hash(padded[i:i + 3]) % DIM] += 1.0
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.maximum(norms, 1e-12)
+
+
+def captions(count: int, rng: np.random.Generator):
+    return [" ".join(rng.choice(WORDS, rng.integers(12, 40))) for _ in range(count)]
+
+
+def run(encode, texts, clients: int, batch: int) -> float:
+    """Texts per second with `clients` concurrent callers"""
+    batches = [texts[i:i + batch] for i in range(0, len(texts), batch)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        for _ in executor.map(encode, batches):
+            pass
+    return len(texts) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the embedding process pool")
+    parser.add_argument("--model", choices=["auto", "minilm", "synthetic"], default="auto")
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=16, help="Texts per caller request")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent callers")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--cpus", default=os.getenv("EMBED_WORKER_CPUS", ""), help="e.g. 0-3")
+    args = parser.parse_args()
+
+    model = args.model
+    if model == "auto":
+        model = "minilm" if importlib.util.find_spec("sentence_transformers") else "synthetic"
+    factory = "services.embedding.pool:sentence_transformer" if model == "minilm" \
+        else "benchmark_embedding_pool:SyntheticEncoder"
+
+    texts = captions(args.texts, np.random.default_rng(3))
+    print(f"🧪 {args.texts} captions, {args.clients} concurrent callers × {args.batch} texts, "
+          f"model={model}, {os.cpu_count()} CPUs\n")
+
+    local = resolve_factory(factory)()
+    local.encode(texts[:8])
+    baseline = run(local.encode, texts, args.clients, args.batch)
+    print(f"   in-thread            {baseline:>9.0f} texts/s")
+
+    for size in args.workers:
+        pool = EmbeddingProcessPool(factory=factory, size=size, dim=DIM,
+                                    cpu_affinity=parse_cpu_list(args.cpus)).start()
+        try:
+            pool.encode(texts[:8])
+            rate = run(pool.encode, texts, args.clients, args.batch)
+        finally:
+            pool.close()
+        print(f"   pool × {size:<2} workers    {rate:>9.0f} texts/s   ({rate / baseline:.2f}× in-thread)")
+
+
+if __name__ == "__main__":
+    main()
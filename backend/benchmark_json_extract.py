@@ -0,0 +1,179 @@
+"""
+Benchmark LLM JSON Extraction
+Time and success rate of the shared extractor (services/llm/json_extract.py)
+against the parsers it replaced, on ~8K-token answers.
+
+Answers are synthetic /api/ideate-style objects (a long "ideas" array plus
+text fields) in the shapes models return: bare JSON, JSON in a ``` fence
+between prose, and a fenced answer cut off at max_tokens. The streaming
+rows feed the fenced answer in small chunks, as stream_llm() delivers it.
+
+Usage:
+    python benchmark_json_extract.py
+    python benchmark_json_extract.py --tokens 8000 --repeat 200 --chunk 64
+"""
+import argparse
+import json
+import re
+import statistics
+import time
+
+from services.llm.json_extract import extract_json
+from services.llm.streaming import JSONFieldStream
+
+CHARS_PER_TOKEN = 4
+
+
+# ── PARSERS BEING REPLACED ────────────────────────────────────────────────────
+
+def legacy_parse_llm_json(raw: str) -> dict:
+    """app.parse_llm_json before: fence regex, else first '{' to last '}' regex"""
+    clean = raw.strip()
+    match = re.search(r"```(?:json)?\s*([\s\S]*?)\s*```", clean)
+    if match:
+        clean = match.group(1)
+    else:
+        match = re.search(r"(\{[\s\S]*\})", clean)
+        if match:
+            clean = match.group(1)
+    try:
+        return json.loads(clean)
+    except json.JSONDecodeError:
+        return {"error": "parse_failed", "raw": raw}
+
+
+def legacy_media_parse(response: str) -> dict:
+    """MediaGeneratorService._parse_json_response before: per-character brace matching"""
+    try:
+        cleaned = re.sub(r'```json\s*|\s*```', '', response.strip()).strip()
+        if '{' in cleaned:
+            start = cleaned.index('{')
+            brace_count, end = 0, start
+            for i in range(start, len(cleaned)):
+                if cleaned[i] == '{':
+                    brace_count += 1
+                elif cleaned[i] == '}':
+                    brace_count -= 1
+                    if brace_count == 0:
+                        end = i + 1
+                        break
+            parsed = json.loads(cleaned[start:end])
+            if isinstance(parsed, dict):
+                return parsed
+        return {"error": "default"}
+    except Exception:
+        return {"error": "default"}
+
+
+def legacy_ads_parse(raw: str) -> dict:
+    """*AdsClient.invoke_json before: fence split, json.loads, then greedy regex"""
+    cleaned = raw.strip()
+    if cleaned.startswith("```"):
+        cleaned = cleaned.split("```")[1]
+        if cleaned.startswith("json"):
+            cleaned = cleaned[4:]
+    cleaned = cleaned.strip()
+    try:
+        return json.loads(cleaned)
+    except json.JSONDecodeError:
+        try:
+            match = re.search(r'\{.*\}', cleaned, re.DOTALL)
+            if match:
+                return json.loads(match.group(0))
+        except Exception:
+            pass
+        return {"error": "JSON parse failed"}
+
+
+def extractor_parse(raw: str) -> dict:
+    return extract_json(raw) or {"error": "parse_failed"}
+
+
+PARSERS = {
+    "parse_llm_json (before)": legacy_parse_llm_json,
+    "media _parse_json_response (before)": legacy_media_parse,
+    "ads invoke_json (before)": legacy_ads_parse,
+    "extract_json": extractor_parse,
+}
+
+
+# ── ANSWERS ───────────────────────────────────────────────────────────────────
+
+def ideate_answer(tokens: int) -> str:
+    """An /api/ideate-shaped object of roughly `tokens` tokens"""
+    ideas, size, i = [], 0, 0
+    while size < tokens * CHARS_PER_TOKEN:
+        idea = {
+            "id": str(i),
+            "title": f"Idea {i}: why our team {{finally}} shipped the launch",
+            "hook": "We almost gave up. Here's the \"one\" thing that changed everything for us — and for you.",
+            "angle": "Vulnerable founder story with a concrete lesson",
+            "predicted_ers": 60 + i % 40,
+            "hashtags": ["#buildinpublic", "#startups", "#lessons"],
+            "rationale": "Mirrors the emotional arc of the top winners: struggle, turning point, proof. " * 2
+        }
+        ideas.append(idea)
+        size += len(json.dumps(idea))
+        i += 1
+    return json.dumps({"ideas": ideas, "summary": "Five angles drawn from high-ERS winners.",
+                       "brand_fit": 0.92}, indent=2)
+
+
+def answers(tokens: int) -> dict:
+    body = ideate_answer(tokens)
+    fenced = f"Here are your ideas based on the winners:\n```json\n{body}\n```\nLet me know if you want more {{variants}}."
+    cut = fenced[:int(len(fenced) * 0.9)]  # stopped at max_tokens
+    return {"bare": body, "fenced + prose": fenced, "truncated": cut}
+
+
+# ── RUN ───────────────────────────────────────────────────────────────────────
+
+def time_ms(fn, arg, repeat: int):
+    times, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(arg)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), result
+
+
+def describe(result) -> str:
+    if not isinstance(result, dict) or "error" in result:
+        return "failed"
+    return f"ok, {len(result.get('ideas', []))} ideas"
+
+
+def stream_field_reader(chunks):
+    reader = JSONFieldStream()
+    for chunk in chunks:
+        reader.feed(chunk)
+    return reader.finish()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark LLM JSON extraction")
+    parser.add_argument("--tokens", type=int, default=8000, help="Approximate answer size in tokens")
+    parser.add_argument("--repeat", type=int, default=100)
+    parser.add_argument("--chunk", type=int, default=64, help="Characters per streamed chunk")
+    args = parser.parse_args()
+
+    cases = answers(args.tokens)
+    for name, text in cases.items():
+        print(f"\n📄 {name}: {len(text):,} chars (~{len(text) // CHARS_PER_TOKEN:,} tokens)")
+        for label, fn in PARSERS.items():
+            ms, result = time_ms(fn, text, args.repeat)
+            print(f"   {label:<38} {ms:8.3f} ms   {describe(result)}")
+
+    text = cases["fenced + prose"]
+    chunks = [text[i:i + args.chunk] for i in range(0, len(text), args.chunk)]
+    print(f"\n📡 streamed in {len(chunks):,} chunks of {args.chunk} chars (total per answer)")
+    for label, fn in {"JSONFieldStream.feed": stream_field_reader,
+                      "parse_llm_json per chunk (before)": lambda cs: [legacy_parse_llm_json("".join(cs[:i + 1]))
+                                                                        for i in range(len(cs))][-1]}.items():
+        repeat = max(1, args.repeat // 20) if "per chunk" in label else args.repeat
+        ms, result = time_ms(fn, chunks, repeat)
+        print(f"   {label:<38} {ms:8.3f} ms   {describe(result)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark Int8 Quantized Post Collection
+Memory savings and recall loss of quantization="int8" against exact float search.
+
+Runs on the persisted post corpus (VECTOR_STORE_PATH) when one exists, so the
+numbers reflect our real embeddings; otherwise on synthetic clustered vectors.
+Queries are perturbed copies of stored posts, the same shape as /api/analyze
+drafts that resemble existing content.
+
+Usage:
+    python benchmark_quantization.py
+    python benchmark_quantization.py --store ./vector_store --k 5 --rerank-factors 1 4 8
+    python benchmark_quantization.py --synthetic 1000000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from services.vector_store.collection import VectorCollection
+from services.vector_store.persistence import store_exists
+
+DIM = 384
+
+
+def synthetic_collection(size: int, rng: np.random.Generator) -> VectorCollection:
+    """Clustered unit vectors (real sentence embeddings are far from uniform)"""
+    collection = VectorCollection(name="bench_quant", dim=DIM, initial_capacity=size)
+    centres = rng.standard_normal((max(64, size // 1000), DIM), dtype=np.float32)
+    for start in range(0, size, 50_000):
+        count = min(50_000, size - start)
+        vectors = centres[rng.integers(0, len(centres), count)]
+        vectors += 0.6 * rng.standard_normal((count, DIM), dtype=np.float32)
+        collection.add(ids=[f"post_{start + i}" for i in range(count)], embeddings=vectors)
+    return collection
+
+
+def latency(collection: VectorCollection, queries: np.ndarray, k: int):
+    """Result ids per query and p50 latency in ms"""
+    ids, times = [], []
+    for q in queries:
+        start = time.perf_counter()
+        result = collection.query(query_embeddings=[q], n_results=k, include=[])
+        times.append((time.perf_counter() - start) * 1000)
+        ids.append(result["ids"][0])
+    return ids, round(float(np.percentile(times, 50)), 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark int8 quantized search")
+    parser.add_argument("--store", default=os.getenv("VECTOR_STORE_PATH", "./vector_store"))
+    parser.add_argument("--synthetic", type=int, default=200_000,
+                        help="Corpus size when no store exists at --store")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--rerank-factors", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(11)
+    with tempfile.TemporaryDirectory() as tmp:
+        if store_exists(args.store):
+            source = VectorCollection.open(args.store)
+            label = f"corpus at {args.store}"
+        else:
+            source = synthetic_collection(args.synthetic, rng)
+            label = "synthetic corpus"
+        quantized_path = os.path.join(tmp, "int8")
+        source.quantization = "int8"
+        source.persist(quantized_path)
+
+        exact = VectorCollection.open(quantized_path)
+        n = exact.count()
+        if n == 0:
+            print(f"⚠️  {label} is empty")
+            return
+        picks = rng.integers(0, n, args.queries)
+        queries = exact._vectors(np.sort(picks)) + 0.05 * rng.standard_normal((args.queries, exact.dim),
+                                                                               dtype=np.float32)
+        truth, exact_ms = latency(exact, queries, args.k)
+
+        float_bytes = os.path.getsize(os.path.join(quantized_path, "embeddings.npy"))
+        code_bytes = os.path.getsize(os.path.join(quantized_path, "codes.npy"))
+        print(f"🧪 int8 quantization on {label}: {n:,} posts, dim={exact.dim}, k={args.k}\n")
+        print(f"💾 first-pass vectors: float32 {float_bytes / 2**20:,.1f} MB → int8 {code_bytes / 2**20:,.1f} MB "
+              f"({float_bytes / max(code_bytes, 1):.1f}× smaller resident set)")
+        print(f"   exact float search p50 {exact_ms} ms\n")
+
+        for factor in args.rerank_factors:
+            quantized = VectorCollection.open(quantized_path, quantization="int8", rerank_factor=factor)
+            found, ms = latency(quantized, queries, args.k)
+            recall = np.mean([len(set(a) & set(b)) / max(len(b), 1) for a, b in zip(found, truth)])
+            note = "  (int8 scores only)" if factor == 1 else ""
+            print(f"   rerank × {factor:<2}  recall@{args.k} {recall:.4f}   p50 {ms:>8} ms{note}")
+
+
+if __name__ == "__main__":
+    main()
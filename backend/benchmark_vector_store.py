@@ -0,0 +1,106 @@
+"""
+Benchmark In-Process Vector Collection
+Measures exact cosine top-k query latency and indexed filtered-get latency
+(ChromaDBOptimizer.benchmark_queries) at 10k / 100k / 1M posts.
+
+Usage:
+    python benchmark_vector_store.py
+    python benchmark_vector_store.py --sizes 10000 100000 --queries 50
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from services.chromadb_optimizer import ChromaDBOptimizer
+from services.vector_store.collection import VectorCollection
+
+DIM = 384
+
+
+def build_collection(size: int, rng: np.random.Generator) -> VectorCollection:
+    """Fill a collection with random unit vectors and realistic metadata"""
+    collection = VectorCollection(name=f"bench_{size}", dim=DIM, initial_capacity=size, rank_key="ers")
+    platforms = ["instagram", "linkedin", "twitter"]
+    sources = ["instagram", "linkedin", "twitter", "meta_ads", "esg_scrape"]
+    batch = 50_000
+    for start in range(0, size, batch):
+        count = min(batch, size - start)
+        vectors = rng.standard_normal((count, DIM), dtype=np.float32)
+        collection.add(
+            ids=[f"post_{start + i}" for i in range(count)],
+            embeddings=vectors,
+            documents=[f"Benchmark post {start + i}" for i in range(count)],
+            metadatas=[{
+                "ers": float(ers),
+                "platform": platforms[(start + i) % 3],
+                "source": sources[(start + i) % 5],
+                "type": "ad" if (start + i) % 4 == 0 else "post",
+                "brand_id": f"brand_{(start + i) % 50}",
+            } for i, ers in enumerate(rng.uniform(0, 100, count))]
+        )
+    return collection
+
+
+def time_queries(collection: VectorCollection, queries: np.ndarray, **kwargs) -> dict:
+    """Run each query once and summarize latency in milliseconds"""
+    times = []
+    for q in queries:
+        start = time.perf_counter()
+        collection.query(query_embeddings=[q], n_results=20, **kwargs)
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return {
+        "p50_ms": round(times[len(times) // 2], 3),
+        "p95_ms": round(times[int(len(times) * 0.95) - 1], 3),
+        "max_ms": round(times[-1], 3)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark VectorCollection.query")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--persist", action="store_true",
+                        help="also time persist() and the mmap open() used by gunicorn workers")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    print(f"🧪 VectorCollection benchmark (dim={DIM}, top-20, {args.queries} queries)\n")
+
+    for size in args.sizes:
+        start = time.perf_counter()
+        collection = build_collection(size, rng)
+        build_s = time.perf_counter() - start
+        queries = rng.standard_normal((args.queries, DIM), dtype=np.float32)
+
+        plain = time_queries(collection, queries)
+        filtered = time_queries(collection, queries[: max(1, args.queries // 5)], where={"is_winner": True})
+
+        print(f"📊 {size:>9,} posts  (build {build_s:.1f}s, "
+              f"{collection._embeddings.nbytes / 1e6:.0f} MB embeddings)")
+        print(f"   query           p50 {plain['p50_ms']:>8} ms   p95 {plain['p95_ms']:>8} ms")
+        print(f"   query+where     p50 {filtered['p50_ms']:>8} ms   p95 {filtered['p95_ms']:>8} ms")
+
+        report = ChromaDBOptimizer(collection).benchmark_queries(iterations=20)
+        for name, stats in report["benchmarks"].items():
+            print(f"   get {name:<20} p50 {stats['p50_ms']:>8} ms   max {stats['max_ms']:>8} ms")
+
+        if args.persist:
+            with tempfile.TemporaryDirectory() as tmp:
+                start = time.perf_counter()
+                collection.persist(f"{tmp}/store")
+                persist_s = time.perf_counter() - start
+                start = time.perf_counter()
+                mapped = VectorCollection.open(f"{tmp}/store", rank_key="ers")
+                open_ms = (time.perf_counter() - start) * 1000
+                mapped_q = time_queries(mapped, queries)
+                print(f"   persist {persist_s:.1f}s   mmap open {open_ms:.1f} ms   "
+                      f"mapped query p50 {mapped_q['p50_ms']} ms")
+                del mapped
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,9 @@ from dotenv import load_dotenv
 # Ensure env vars are loaded
 load_dotenv(override=True)
 
+# Default data paths hang off backend/, like the app's stores, whatever the working directory
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
 class Config:
     # ── META Ad Library ──────────────────────────────────────────────
     META_ACCESS_TOKEN = os.getenv("META_ACCESS_TOKEN")
@@ -22,5 +25,57 @@ class Config:
     # ── Groq API (Fallback for Bedrock ADs) ───────────────────────────
     GROQ_ADS_API_KEY = os.getenv("GROQ_ADS_API_KEY")
 
+    # ── Gemini API (Fallback for Bedrock ADs) ─────────────────────────
+    GEMINI_ADS_API_KEY = os.getenv("GEMINI_ADS_API_KEY")
+
     # ── ChromaDB (local vector store) ────────────────────────────────
     CHROMA_DB_PATH = os.getenv("CHROMA_DB_PATH", "./chroma_ads_db")
+
+    # ── Ads ANN index (pure NumPy IVF, replaces Chroma for best_performing_ads) ──
+    ADS_VECTOR_BACKEND = os.getenv("ADS_VECTOR_BACKEND", "ivf")   # "ivf" or "chroma"
+    ADS_INDEX_PATH     = os.getenv("ADS_INDEX_PATH", "./ads_index")
+    ADS_ANN_NPROBE     = int(os.getenv("ADS_ANN_NPROBE", "8"))     # higher = better recall, slower
+
+    # ── Embedding cache (model + normalized-text hash → vector) ──────────────
+    EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", os.path.join(BACKEND_DIR, "embedding_cache", "embeddings.sqlite3"))
+    EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "50000"))     # vectors kept in memory
+
+    # ── Embedding backend ("auto" = minilm if installed, else "hashing") ─────
+    EMBEDDING_BACKENDS = ("auto", "minilm", "hashing", "mock")
+    EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "auto").lower()  # one of EMBEDDING_BACKENDS
+    EMBED_IDF_PATH    = os.getenv("EMBED_IDF_PATH", os.path.join(BACKEND_DIR, "embedding_cache", "hashing_idf.npy"))
+    EMBED_IDF_CORPUS  = os.getenv("EMBED_IDF_CORPUS", os.path.join(BACKEND_DIR, "..", "data", "brand_posts.csv"))  # fitted once if no table yet
+
+    # ── Outbound HTTP (shared keep-alive transport, see services/http_transport.py) ──
+    HTTP_POOL_MAXSIZE       = int(os.getenv("HTTP_POOL_MAXSIZE", "16"))      # keep-alive connections per host
+    HTTP_HOST_LIMITS        = os.getenv("HTTP_HOST_LIMITS", "")              # "api.groq.com=4,..." concurrent requests
+    HTTP_DEFAULT_HOST_LIMIT = int(os.getenv("HTTP_DEFAULT_HOST_LIMIT", "0"))  # 0 = unlimited
+    HTTP_DNS_TTL            = float(os.getenv("HTTP_DNS_TTL", "300"))        # 0 = no DNS caching
+    HTTP2_HOSTS             = os.getenv("HTTP2_HOSTS", "generativelanguage.googleapis.com,api.groq.com")
+
+    # ── LLM response cache (exact prompt hash + opt-in semantic tier) ───────
+    LLM_CACHE_PATH               = os.getenv("LLM_CACHE_PATH", "./llm_cache/responses.sqlite3")  # empty = memory only
+    LLM_CACHE_SIZE               = int(os.getenv("LLM_CACHE_SIZE", "5000"))          # answers kept in memory
+    LLM_CACHE_DISK_SIZE          = int(os.getenv("LLM_CACHE_DISK_SIZE", "100000"))   # rows kept in SQLite
+    LLM_CACHE_TTL                = float(os.getenv("LLM_CACHE_TTL", "86400"))        # seconds, 0 = forever
+    LLM_CACHE_SEMANTIC_THRESHOLD = float(os.getenv("LLM_CACHE_SEMANTIC_THRESHOLD", "0.95"))  # min cosine
+
+    # ── LLM fan-out (per-post tagging) + provider rate limits ─────────────
+    LLM_FANOUT_CONCURRENCY = int(os.getenv("LLM_FANOUT_CONCURRENCY", "8"))   # calls in flight
+    LLM_FANOUT_TIMEOUT     = float(os.getenv("LLM_FANOUT_TIMEOUT", "20"))    # seconds per item
+    LLM_RATE_LIMITS        = os.getenv("LLM_RATE_LIMITS", "")                # "gemini=60,groq=30" req/min
+    LLM_TOKEN_LIMITS       = os.getenv("LLM_TOKEN_LIMITS", "")               # "groq=6000" tokens/min
+    LLM_BATCH_TOKENS       = int(os.getenv("LLM_BATCH_TOKENS", "2000"))      # est. prompt tokens per batch
+    LLM_BATCH_ITEMS        = int(os.getenv("LLM_BATCH_ITEMS", "25"))         # captions per batch
+
+    # ── LLM router (fastest healthy provider, circuit breakers, hedging) ────
+    LLM_ROUTER_WINDOW           = int(os.getenv("LLM_ROUTER_WINDOW", "100"))           # calls kept per class
+    LLM_ROUTER_BREAKER_FAILURES = int(os.getenv("LLM_ROUTER_BREAKER_FAILURES", "3"))   # 429/5xx in a row
+    LLM_ROUTER_COOLDOWN         = float(os.getenv("LLM_ROUTER_COOLDOWN", "30"))        # seconds open
+    LLM_ROUTER_HEDGE            = os.getenv("LLM_ROUTER_HEDGE", "1") == "1"
+    LLM_ROUTER_HEDGE_AFTER      = float(os.getenv("LLM_ROUTER_HEDGE_AFTER", "10"))     # seconds, until p95 known
+    LLM_ROUTER_HEDGE_FLOOR      = float(os.getenv("LLM_ROUTER_HEDGE_FLOOR", "0.2"))    # seconds
+
+    # ── Local emotion / archetype classifier (LLM only below the threshold) ─
+    LOCAL_CLASSIFIER_PATH      = os.getenv("LOCAL_CLASSIFIER_PATH", os.path.join(BACKEND_DIR, "local_classifier"))
+    LOCAL_CLASSIFIER_THRESHOLD = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", "0.7"))  # min confidence
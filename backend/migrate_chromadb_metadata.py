@@ -2,6 +2,9 @@
 ChromaDB Metadata Migration Script
 Adds is_winner and percentile_rank fields to existing posts
 Phase 5, Day 6
+
+Only needed for external ChromaDB stores: the app's VectorCollection is
+opened with rank_key="ers" and keeps both fields current on every write.
 """
 import os
 from dotenv import load_dotenv
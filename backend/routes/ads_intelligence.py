@@ -5,12 +5,26 @@ from services.bedrock.marketing_intelligence import MarketingIntelligenceService
 
 ads_bp = Blueprint("ads", __name__, url_prefix="/api/ads")
 
-# Instantiate services once at module level (not per-request)
-ingestion_service    = ADIngestionService()
-recommendation_engine = ADRecommendationEngine(ingestion_service=ingestion_service)
+# Instantiate services once at module level (not per-request); the ads
+# vector store is built by init_ads_services() around the app's encoder
+ingestion_service    = None
+recommendation_engine = None
 intelligence_service  = MarketingIntelligenceService()
 
 
+def init_ads_services(embedding_fn=None):
+    """
+    Build the ingestion service and recommendation engine
+
+    Args:
+        embedding_fn: The app's shared encoder, so ads reuse its warmed model
+            and cache instead of loading a second copy (None = own encoder)
+    """
+    global ingestion_service, recommendation_engine
+    ingestion_service = ADIngestionService(embedding_fn=embedding_fn)
+    recommendation_engine = ADRecommendationEngine(ingestion_service=ingestion_service)
+
+
 @ads_bp.route("/scrape", methods=["POST"])
 def scrape_ads():
     """
@@ -0,0 +1,196 @@
+"""
+Ad Vector Store
+Chroma-compatible upsert / query surface for the best_performing_ads corpus,
+backed by the niche-partitioned IVF-Flat index in services/vector_store/ivf.py.
+
+Each niche is its own partition, so query_similar_ads (where={"niche": ...})
+only probes that niche's inverted lists.
+"""
+import json
+import os
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from services.vector_store.ivf import IVFFlatIndex
+from services.vector_store.where import matches_where
+
+PARTITION_KEY = "niche"
+OVERFETCH = 4  # candidates fetched per result when a where clause needs post-filtering
+
+
+class AdVectorStore:
+    """IVF-backed ads collection with the ChromaDB upsert/query/count surface"""
+
+    def __init__(
+        self,
+        embedding_function: Callable[[List[str]], List[List[float]]],
+        dim: Optional[int] = None,
+        path: Optional[str] = None,
+        n_probe: int = 8
+    ):
+        """
+        Initialize an empty store
+
+        Args:
+            embedding_function: Maps documents / query texts to embeddings
+            dim: Embedding dimension (inferred from the first batch if omitted)
+            path: Directory persist() writes to
+            n_probe: IVF lists probed per query (recall / latency knob)
+        """
+        self.embedding_function = embedding_function
+        self.path = path
+        self.n_probe = n_probe
+        self.index: Optional[IVFFlatIndex] = IVFFlatIndex(dim, n_probe=n_probe) if dim else None
+        self.records: Dict[str, Dict] = {}  # id → {"document", "metadata"}
+
+    @classmethod
+    def open_or_create(
+        cls,
+        path: str,
+        embedding_function: Callable[[List[str]], List[List[float]]],
+        n_probe: int = 8
+    ) -> "AdVectorStore":
+        """
+        Load the store at `path` if one was persisted, otherwise start empty
+
+        Args:
+            path: Store directory
+            embedding_function: Embedding callable
+            n_probe: IVF lists probed per query
+
+        Returns:
+            AdVectorStore
+        """
+        store = cls(embedding_function, path=path, n_probe=n_probe)
+        index_path = os.path.join(path, "index")
+        records_path = os.path.join(path, "records.json")
+        if IVFFlatIndex.exists(index_path) and os.path.exists(records_path):
+            store.index = IVFFlatIndex.load(index_path)
+            store.index.n_probe = n_probe
+            with open(records_path, "r", encoding="utf-8") as f:
+                store.records = json.load(f)
+        return store
+
+    def count(self) -> int:
+        return len(self.records)
+
+    def upsert(
+        self,
+        documents: Sequence[str],
+        metadatas: Sequence[Dict],
+        ids: Sequence[str],
+        embeddings: Optional[Sequence[Sequence[float]]] = None
+    ):
+        """
+        Insert or replace ads
+
+        Args:
+            documents: Text embedded for each ad
+            metadatas: Ad metadata (the "niche" key selects the partition)
+            ids: Ad ids
+            embeddings: Precomputed embeddings (computed from documents if omitted)
+        """
+        if not ids:
+            return
+        vectors = np.array(
+            embeddings if embeddings is not None else self.embedding_function(list(documents)),
+            dtype=np.float32, ndmin=2
+        )
+        if self.index is None:
+            self.index = IVFFlatIndex(vectors.shape[1], n_probe=self.n_probe)
+        self.index.add(list(ids), vectors, [m.get(PARTITION_KEY) for m in metadatas])
+        for record_id, document, metadata in zip(ids, documents, metadatas):
+            self.records[record_id] = {"document": document, "metadata": dict(metadata)}
+
+    def query(
+        self,
+        query_texts: Optional[Sequence[str]] = None,
+        n_results: int = 10,
+        where: Optional[Dict] = None,
+        include: Optional[List[str]] = None,
+        query_embeddings: Optional[Sequence[Sequence[float]]] = None
+    ) -> Dict:
+        """
+        Approximate cosine search
+
+        Args:
+            query_texts: Raw queries, embedded with embedding_function
+            n_results: Results per query
+            where: Metadata filter; {"niche": x} restricts the search to that partition
+            include: Fields to return ("documents", "metadatas", "distances")
+            query_embeddings: Precomputed query vectors
+
+        Returns:
+            Dict of lists-of-lists in ChromaDB shape (distance = 1 - cosine)
+        """
+        include = include or ["documents", "metadatas", "distances"]
+        if query_embeddings is None:
+            query_embeddings = self.embedding_function(list(query_texts or []))
+        partition, residual = self._split_where(where)
+
+        result = {"ids": [], **{field: [] for field in include}}
+        for q in query_embeddings:
+            ids, sims = self._search(q, n_results, partition, residual)
+            result["ids"].append(ids)
+            if "documents" in include:
+                result["documents"].append([self.records[i]["document"] for i in ids])
+            if "metadatas" in include:
+                result["metadatas"].append([dict(self.records[i]["metadata"]) for i in ids])
+            if "distances" in include:
+                result["distances"].append([float(1.0 - s) for s in sims])
+        return result
+
+    def _search(self, q, n_results: int, partition, residual: Optional[Dict]):
+        if self.index is None:
+            return [], []
+        if not residual:
+            ids, sims = self.index.search(q, n_results, partition=partition)
+            return ids, sims.tolist()
+
+        fetch = n_results * OVERFETCH
+        while True:
+            ids, sims = self.index.search(q, fetch, partition=partition)
+            kept = [(i, s) for i, s in zip(ids, sims.tolist())
+                    if matches_where(self.records[i]["metadata"], residual)]
+            if len(kept) >= n_results or len(ids) < fetch:
+                kept = kept[:n_results]
+                return [i for i, _ in kept], [s for _, s in kept]
+            fetch *= OVERFETCH
+
+    @staticmethod
+    def _split_where(where: Optional[Dict]):
+        """Pull a niche equality out of the where clause as the partition key"""
+        if not where:
+            return None, None
+        clauses = where["$and"] if list(where) == ["$and"] else [{k: v} for k, v in where.items()]
+        partition, residual = None, []
+        for clause in clauses:
+            value = clause.get(PARTITION_KEY) if len(clause) == 1 else None
+            if isinstance(value, dict) and list(value) == ["$eq"]:
+                value = value["$eq"]
+            if partition is None and isinstance(value, str):
+                partition = value
+            else:
+                residual.append(clause)
+        if not residual:
+            return partition, None
+        return partition, residual[0] if len(residual) == 1 else {"$and": residual}
+
+    def persist(self, path: Optional[str] = None):
+        """
+        Save the index and ad records
+
+        Args:
+            path: Target directory (defaults to the store's path)
+        """
+        target = path or self.path
+        if not target or self.index is None:
+            return
+        os.makedirs(target, exist_ok=True)
+        self.index.save(os.path.join(target, "index"))
+        staging = os.path.join(target, f".records.{os.getpid()}.json")
+        with open(staging, "w", encoding="utf-8") as f:
+            json.dump(self.records, f)
+        os.replace(staging, os.path.join(target, "records.json"))
+        self.path = target
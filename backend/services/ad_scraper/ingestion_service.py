@@ -1,10 +1,20 @@
 """
-Orchestrates META + YouTube scrapers and manages the ChromaDB vector store.
-Provides a mock fallback if ChromaDB fails to import (due to Python 3.14 limitations).
+Orchestrates META + YouTube scrapers and manages the ads vector store.
+Uses the NumPy IVF index (ADS_VECTOR_BACKEND=ivf, default) or ChromaDB, and
+embeds with all-MiniLM-L6-v2, or hashed n-gram vectors when sentence-transformers
+is unavailable, and keeps a mock fallback for EMBEDDING_BACKEND=mock.
+Inside the app it embeds with the app's shared encoder (one warmed model and
+cache per worker); standalone it builds its own from Config.
 """
 
+import importlib.util
+
+from services.ad_scraper.ad_vector_store import AdVectorStore
 from services.ad_scraper.meta_scraper import MetaAdScraper
 from services.ad_scraper.youtube_scraper import YouTubeAdScraper
+from services.embedding.cache import CachedEncoder, EmbeddingCache
+from services.embedding.hashing import corpus_from_csv, load_or_fit
+from services.embedding.model import LazyEmbeddingModel, ModelNotReady
 from config import Config
 
 # Try to import real ChromaDB; fallback to mock if it fails (e.g. Python 3.14)
@@ -14,7 +24,10 @@ try:
     CHROMA_AVAILABLE = True
 except Exception as e:
     CHROMA_AVAILABLE = False
-    print(f"⚠️  ChromaDB not available ({type(e).__name__}). Using in-memory mock collection for AD ingestion.")
+    print(f"⚠️  ChromaDB not available ({type(e).__name__}).")
+
+# Only probe for sentence-transformers here; importing it (torch) happens on first encode
+SENTENCE_TRANSFORMERS_AVAILABLE = importlib.util.find_spec("sentence_transformers") is not None
 
 class MockCollection:
     _data = {"ids": [], "documents": [], "metadatas": []}
@@ -52,8 +65,14 @@ class MockCollection:
         }
 
 class ADIngestionService:
-    def __init__(self):
-        if CHROMA_AVAILABLE:
+    def __init__(self, embedding_fn=None):
+        """
+        Args:
+            embedding_fn: Shared encoder to embed ads with (the app passes its
+                cached, warmed one); None builds one from Config.
+                Unused with ADS_VECTOR_BACKEND=chroma (Chroma embeds itself)
+        """
+        if Config.ADS_VECTOR_BACKEND == "chroma" and CHROMA_AVAILABLE:
             self.chroma_client = chromadb.PersistentClient(path=Config.CHROMA_DB_PATH)
             self.embedding_fn = embedding_functions.SentenceTransformerEmbeddingFunction(
                 model_name="all-MiniLM-L6-v2"
@@ -64,11 +83,46 @@ class ADIngestionService:
                 metadata={"hnsw:space": "cosine"}
             )
         else:
-            self.collection = MockCollection()
+            self.embedding_fn = embedding_fn if embedding_fn is not None else self._load_embedding_fn()
+            if self.embedding_fn is not None:
+                self.collection = AdVectorStore.open_or_create(
+                    Config.ADS_INDEX_PATH,
+                    embedding_function=self.embedding_fn,
+                    n_probe=Config.ADS_ANN_NPROBE
+                )
+            else:
+                print("⚠️  No embedding model available. Using in-memory mock collection for AD ingestion.")
+                self.collection = MockCollection()
 
         self.meta_scraper = MetaAdScraper(Config.META_ACCESS_TOKEN)
         self.yt_scraper = YouTubeAdScraper(Config.SERPAPI_KEY)
 
+    @staticmethod
+    def _load_embedding_fn():
+        """
+        all-MiniLM-L6-v2 (loaded on first encode) or the hashed n-gram embedder,
+        behind the embedding cache; None for EMBEDDING_BACKEND=mock
+        (Chroma's SentenceTransformerEmbeddingFunction needs sentence-transformers too)
+        """
+        backend = Config.EMBEDDING_BACKEND
+        if backend not in Config.EMBEDDING_BACKENDS:
+            raise ValueError(f"Unknown EMBEDDING_BACKEND {backend!r} "
+                             f"(expected one of: {', '.join(Config.EMBEDDING_BACKENDS)})")
+        if backend == "mock":
+            return None
+        if backend == "hashing" or not SENTENCE_TRANSFORMERS_AVAILABLE:
+            # Same IDF table as the app, so both fit it identically if it is missing
+            model = load_or_fit(Config.EMBED_IDF_PATH or None, corpus_from_csv(Config.EMBED_IDF_CORPUS))
+        else:
+            def load():
+                from sentence_transformers import SentenceTransformer
+                return SentenceTransformer("all-MiniLM-L6-v2")
+
+            model = LazyEmbeddingModel(load, model_id="all-MiniLM-L6-v2")
+        cache = EmbeddingCache(model.model_id, path=Config.EMBED_CACHE_PATH or None,
+                               capacity=Config.EMBED_CACHE_SIZE)
+        return CachedEncoder(lambda texts: model.encode(list(texts)), cache)
+
     def scrape_and_ingest(
         self, keyword: str, niche: str, platforms: list = None
     ) -> dict:
@@ -95,6 +149,11 @@ class ADIngestionService:
         ids = [f"{ad['platform']}_{ad['ad_id']}_{ad['scraped_at']}" for ad in all_ads]
 
         self.collection.upsert(documents=documents, metadatas=metadatas, ids=ids)
+        if isinstance(self.collection, AdVectorStore):
+            try:
+                self.collection.persist()
+            except OSError as e:
+                print(f"⚠️ Could not persist ads index: {e}")
         return {"status": "success", "ingested_count": len(all_ads)}
 
     def query_similar_ads(
@@ -110,6 +169,8 @@ class ADIngestionService:
                 where={"niche": niche},
                 include=["documents", "metadatas", "distances"]
             )
+        except ModelNotReady:
+            raise  # the same call would wait for the model again
         except Exception as e:
             # Fallback for mock collection which doesn't use the exact same kwargs
             print(f"Query error (likely due to mock): {e}")
@@ -1,7 +1,8 @@
-import requests
 from typing import List, Dict
 from datetime import datetime
 
+from services import http_transport
+
 META_AD_LIBRARY_BASE = "https://graph.facebook.com/v19.0/ads_archive"
 
 
@@ -35,7 +36,7 @@ class MetaAdScraper:
         }
 
         try:
-            response = requests.get(META_AD_LIBRARY_BASE, params=params, timeout=15)
+            response = http_transport.get(META_AD_LIBRARY_BASE, params=params, timeout=15)
             response.raise_for_status()
             raw_ads = response.json().get("data", [])
             return self._normalize(raw_ads, niche=niche)
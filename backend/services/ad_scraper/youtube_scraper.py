@@ -1,7 +1,8 @@
-import requests
 from typing import List, Dict
 from datetime import datetime
 
+from services import http_transport
+
 SERPAPI_BASE = "https://serpapi.com/search"
 
 
@@ -26,7 +27,7 @@ class YouTubeAdScraper:
         }
 
         try:
-            response = requests.get(SERPAPI_BASE, params=params, timeout=15)
+            response = http_transport.get(SERPAPI_BASE, params=params, timeout=15)
             response.raise_for_status()
             videos = response.json().get("video_results", [])[:limit]
             return self._normalize(videos, niche=niche)
@@ -5,6 +5,7 @@ Phase 5, Day 4-5: ERS Logic Optimization + Winner Filter
 import time
 from typing import Dict, List, Optional
 from apify_client import ApifyClient
+from services.llm.quota import QuotaScheduler, get_quota_scheduler
 
 
 class ApifyIngestionService:
@@ -17,7 +18,7 @@ class ApifyIngestionService:
         "twitter": "apify/twitter-scraper"
     }
     
-    def __init__(self, apify_client: ApifyClient, collection, embedder):
+    def __init__(self, apify_client: ApifyClient, collection, embedder, quota: Optional[QuotaScheduler] = None):
         """
         Initialize service
         
@@ -25,10 +26,12 @@ class ApifyIngestionService:
             apify_client: Apify API client
             collection: ChromaDB collection for storage
             embedder: Embedding function for vectorization
+            quota: Scheduler holding the "apify" request budget (default: the shared one)
         """
         self.client = apify_client
         self.collection = collection
         self.embedder = embedder
+        self.quota = quota or get_quota_scheduler()
         
     def calculate_ers(self, likes: int, comments: int, shares: int) -> float:
         """
@@ -254,41 +257,24 @@ class ApifyIngestionService:
         max_retries: int = 3
     ) -> List[Dict]:
         """
-        Run actor with exponential backoff retry logic
+        Run actor within the "apify" quota, retrying with jittered backoff
+        
+        Runs are spaced by the apify request budget (LLM_RATE_LIMITS) rather
+        than a fixed pause, and a 429's Retry-After is honoured.
         
         Args:
             actor_id: Apify actor ID
             run_input: Input parameters for actor
-            max_retries: Maximum number of retry attempts
+            max_retries: Maximum number of attempts
             
         Returns:
             List of scraped posts
         """
-        for attempt in range(max_retries):
-            try:
-                # Run actor
-                run = self.client.actor(actor_id).call(run_input=run_input)
-                
-                # Get results
-                items = []
-                for item in self.client.dataset(run["defaultDatasetId"]).iterate_items():
-                    items.append(item)
-                
-                # Rate limiting: wait 2 seconds between requests
-                time.sleep(2)
-                
-                return items
-                
-            except Exception as e:
-                if attempt < max_retries - 1:
-                    # Exponential backoff: 2^attempt seconds
-                    wait_time = 2 ** attempt
-                    print(f"Retry {attempt + 1}/{max_retries} after {wait_time}s: {str(e)}")
-                    time.sleep(wait_time)
-                else:
-                    raise e
+        def run_actor() -> List[Dict]:
+            run = self.client.actor(actor_id).call(run_input=run_input)
+            return list(self.client.dataset(run["defaultDatasetId"]).iterate_items())
         
-        return []
+        return self.quota.call("apify", run_actor, retries=max_retries - 1)
     
     def _store_posts(self, posts: List[Dict], target: str, platform: str):
         """Store posts in ChromaDB with metadata"""
@@ -145,8 +145,8 @@ class AWSImageGenerator:
     def _generate_with_dalle_fallback(self, prompt: str, width: int, height: int) -> bytes:
         """Fallback to OpenAI DALL-E 3 if AWS Bedrock fails or lacks permissions"""
         import os
-        import requests
         from openai import OpenAI
+        from services import http_transport
         
         openai_key = os.getenv("OPENAI_API_KEY")
         if not openai_key:
@@ -174,7 +174,7 @@ class AWSImageGenerator:
             image_url = response.data[0].url
             
             # Download binary image data from url
-            img_data = requests.get(image_url, timeout=15).content
+            img_data = http_transport.get(image_url, timeout=15).content
             print("✅ DALL-E 3 generation successful")
             return img_data
         except Exception as e:
@@ -184,7 +184,7 @@ class AWSImageGenerator:
     def _get_fallback_mock_image(self) -> bytes:
         """Returns a stable random Unsplash image as bytes if AWS fails"""
         import random
-        import requests
+        from services import http_transport
         
         mock_urls = [
             "https://images.unsplash.com/photo-1498050108023-c5249f4df085?w=800&h=800&fit=crop&q=80",
@@ -196,7 +196,7 @@ class AWSImageGenerator:
         url = random.choice(mock_urls)
         print(f"Mocking AWS generation with Unsplash placeholder: {url}")
         try:
-            resp = requests.get(url, timeout=10)
+            resp = http_transport.get(url, timeout=10)
             resp.raise_for_status()
             return resp.content
         except Exception as e:
@@ -264,8 +264,8 @@ class AWSImageGenerator:
         Overlays a brand logo onto the base image in the bottom-right corner.
         """
         import io
-        import requests
         from PIL import Image
+        from services import http_transport
 
         try:
             # Open base image
@@ -274,7 +274,7 @@ class AWSImageGenerator:
 
             # Fetch logo
             if logo_url_or_path.startswith("http"):
-                resp = requests.get(logo_url_or_path, timeout=10)
+                resp = http_transport.get(logo_url_or_path, timeout=10)
                 resp.raise_for_status()
                 logo_bytes = resp.content
             else:
@@ -0,0 +1,58 @@
+"""
+Routed Ads LLM Clients
+One LLMRouter (services/llm/router.py) over every ads client with an API
+key, shared by the recommendation engine and the marketing intelligence
+service. Each invoke_json call goes to the fastest healthy client for its
+call class, hedges to the next one past that client's p95, and fails over
+on errors or unparseable answers.
+"""
+import threading
+from typing import Optional
+
+from config import Config
+from services.llm.router import LLMRouter, router_from_config
+
+# (router name, Config key, module, class), in preference order
+ADS_CLIENTS = [
+    ("groq", "GROQ_ADS_API_KEY", "services.bedrock.groq_ads_client", "GroqAdsClient"),
+    ("gemini", "GEMINI_ADS_API_KEY", "services.bedrock.gemini_ads_client", "GeminiAdsClient"),
+    ("xai", "XAI_ADS_API_KEY", "services.bedrock.xai_ads_client", "XaiAdsClient"),
+    ("bedrock", "BEDROCK_API_KEY", "services.bedrock.bedrock_client", "BedrockClient"),
+]
+
+_shared: Optional[LLMRouter] = None
+_shared_lock = threading.Lock()
+
+
+def is_json_answer(result) -> bool:
+    """invoke_json results carrying "error" (e.g. JSON parse failed) are failures"""
+    return isinstance(result, dict) and "error" not in result
+
+
+def build_ads_router() -> LLMRouter:
+    """
+    Router over the ads clients whose key is configured
+
+    Clients whose library is missing are skipped. Without any key the Groq
+    client is registered anyway, so calls fail the way they did before.
+    """
+    import importlib
+
+    router = router_from_config()
+    configured = [entry for entry in ADS_CLIENTS if getattr(Config, entry[1], None)] or ADS_CLIENTS[:1]
+    for name, _, module, cls in configured:
+        try:
+            router.add(name, getattr(importlib.import_module(module), cls)())
+        except Exception as e:
+            print(f"⚠️  Ads LLM client {name} unavailable: {type(e).__name__}: {e}")
+    return router
+
+
+def get_ads_router() -> LLMRouter:
+    """Process-wide ads router (built on first use)"""
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = build_ads_router()
+    return _shared
@@ -5,8 +5,10 @@ Never use boto3 for Bedrock calls in this project.
 """
 
 import requests
-import json
 from config import Config
+from services import http_transport
+from services.llm.json_extract import extract_json
+from services.llm.quota import quota_limited
 
 
 class BedrockClient:
@@ -56,7 +58,7 @@ class BedrockClient:
         }
 
         try:
-            response = requests.post(
+            response = http_transport.post(
                 self.base_url,
                 headers=self.headers,
                 json=body,
@@ -80,33 +82,27 @@ class BedrockClient:
         except requests.exceptions.Timeout:
             raise BedrockInvokeError("Bedrock request timed out after 30s")
 
+    @quota_limited("bedrock")
     def invoke_json(self, prompt: str, max_tokens: int = 1500) -> dict:
         """
         Same as invoke() but automatically parses the response as JSON.
         Use this for all structured output calls (research, tuning, analytics).
 
         The prompt MUST instruct the model to return valid JSON only.
-        Strips markdown code fences (```json ... ```) if model adds them.
+        Skips markdown code fences (```json ... ```) if model adds them.
         """
         raw = self.invoke(prompt, max_tokens=max_tokens, temperature=0.3)
         # Lower temperature for JSON to reduce hallucinated structure
 
-        # Strip markdown fences if model wraps JSON in them
-        cleaned = raw.strip()
-        if cleaned.startswith("```"):
-            cleaned = cleaned.split("```")[1]
-            if cleaned.startswith("json"):
-                cleaned = cleaned[4:]
-        cleaned = cleaned.strip()
-
-        try:
-            return json.loads(cleaned)
-        except json.JSONDecodeError:
+        # Fences / surrounding prose are skipped, a max_tokens cut-off is repaired
+        parsed = extract_json(raw)
+        if parsed is None:
             # Return structured error so callers don't crash
             return {
                 "error": "JSON parse failed",
                 "raw_response": raw
             }
+        return parsed
 
 
 class BedrockInvokeError(Exception):
@@ -5,11 +5,13 @@ Uses the official google-genai library.
 """
 
 import os
-import json
 from google import genai
 from google.genai import types
 from config import Config
 from services.bedrock.bedrock_client import BedrockInvokeError
+from services.llm.cache import cached_invoke_json
+from services.llm.json_extract import extract_json
+from services.llm.quota import quota_limited
 
 class GeminiAdsClient:
     def __init__(self):
@@ -38,14 +40,14 @@ class GeminiAdsClient:
         except Exception as e:
             raise BedrockInvokeError(f"Gemini API error: {str(e)}") from e
 
+    @cached_invoke_json("gemini-ads")
+    @quota_limited("gemini-ads")
     def invoke_json(self, prompt: str, max_tokens: int = 1500) -> dict:
         """
         Same as invoke() but critically resilient for JSON parsing on Free Models.
         Mirrors BedrockClient exactly so it can be swapped effortlessly.
-        Use Gemini's system instructions to guarantee JSON format + aggressive regex cleanup.
+        Use Gemini's system instructions to guarantee JSON format + the shared JSON extractor.
         """
-        import re
-        
         try:
             response = self.client.models.generate_content(
                 model=self.model,
@@ -60,31 +62,15 @@ class GeminiAdsClient:
             
             # The API should return pure JSON since we requested application/json,
             # but free tier models sometimes hallucinate preamble text or markdown anyway.
-            cleaned = raw.strip()
-            
-            # Remove Markdown Fences
-            if cleaned.startswith("```"):
-                cleaned = cleaned.split("```")[1]
-                if cleaned.startswith("json"):
-                    cleaned = cleaned[4:]
-            cleaned = cleaned.strip()
-            
-            try:
-                return json.loads(cleaned)
-            except json.JSONDecodeError:
-                # Fallback: Aggressive Regex Search to find the first '{' and last '}'
-                try:
-                    match = re.search(r'\{.*\}', cleaned, re.DOTALL)
-                    if match:
-                        return json.loads(match.group(0))
-                except Exception:
-                    pass
+            parsed = extract_json(raw)
+            if parsed is not None:
+                return parsed
 
-                print(f"⚠️ Extreme JSON Parse Failure on Gemini Fallback:\n{raw}")
-                return {
-                    "error": "JSON parse failed from Gemini ADs fallback even after aggressive regex.",
-                    "raw_response": raw if 'raw' in locals() else "Unknown"
-                }
+            print(f"⚠️ Extreme JSON Parse Failure on Gemini Fallback:\n{raw}")
+            return {
+                "error": "JSON parse failed from Gemini ADs fallback.",
+                "raw_response": raw
+            }
 
         except Exception as e:
             raise BedrockInvokeError(f"Gemini API JSON invoke error: {str(e)}") from e
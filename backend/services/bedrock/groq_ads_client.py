@@ -1,9 +1,10 @@
 import os
-import json
-import re
 from openai import OpenAI
 from config import Config
 from services.bedrock.bedrock_client import BedrockInvokeError
+from services.llm.cache import cached_invoke_json
+from services.llm.json_extract import extract_json
+from services.llm.quota import quota_limited
 
 class GroqAdsClient:
     """
@@ -38,6 +39,8 @@ class GroqAdsClient:
         except Exception as e:
             raise BedrockInvokeError(f"Groq API error: {str(e)}") from e
 
+    @cached_invoke_json("groq-ads")
+    @quota_limited("groq-ads")
     def invoke_json(self, prompt: str, max_tokens: int = 1500) -> dict:
         """
         Same as invoke() but critically resilient for JSON parsing.
@@ -55,30 +58,15 @@ class GroqAdsClient:
             )
             raw = completion.choices[0].message.content
             
-            cleaned = raw.strip()
-            # Remove Markdown Fences if LLM adds them despite prompt
-            if cleaned.startswith("```"):
-                cleaned = cleaned.split("```")[1]
-                if cleaned.startswith("json"):
-                    cleaned = cleaned[4:]
-            cleaned = cleaned.strip()
-            
-            try:
-                return json.loads(cleaned)
-            except json.JSONDecodeError:
-                # Fallback: Aggressive Regex Search
-                try:
-                    match = re.search(r'\{.*\}', cleaned, re.DOTALL)
-                    if match:
-                        return json.loads(match.group(0))
-                except Exception:
-                    pass
+            parsed = extract_json(raw)
+            if parsed is not None:
+                return parsed
 
-                print(f"⚠️ Extreme JSON Parse Failure on Groq Fallback:\n{raw}")
-                return {
-                    "error": "JSON parse failed from Groq ADs fallback even after aggressive regex.",
-                    "raw_response": raw if 'raw' in locals() else "Unknown"
-                }
+            print(f"⚠️ Extreme JSON Parse Failure on Groq Fallback:\n{raw}")
+            return {
+                "error": "JSON parse failed from Groq ADs fallback.",
+                "raw_response": raw
+            }
 
         except Exception as e:
             raise BedrockInvokeError(f"Groq API JSON invoke error: {str(e)}") from e
@@ -4,10 +4,10 @@ Acts as a fallback when the AWS Bedrock client returns 400 Operation Not Allowed
 Uses the native Hugging Face InferenceClient.
 """
 
-import json
 from huggingface_hub import InferenceClient
 from config import Config
 from services.bedrock.bedrock_client import BedrockInvokeError
+from services.llm.json_extract import extract_json
 
 class HuggingFaceClient:
     def __init__(self):
@@ -49,19 +49,12 @@ class HuggingFaceClient:
         json_prompt = prompt + "\n\nIMPORTANT: Return ONLY valid JSON."
         raw = self.invoke(json_prompt, max_tokens=max_tokens, temperature=0.3)
 
-        # Strip markdown fences if model wraps JSON in them
-        cleaned = raw.strip()
-        if cleaned.startswith("```"):
-            cleaned = cleaned.split("```")[1]
-            if cleaned.startswith("json"):
-                cleaned = cleaned[4:]
-        cleaned = cleaned.strip()
-
-        try:
-            return json.loads(cleaned)
-        except json.JSONDecodeError:
+        # Fences / surrounding prose are skipped, a max_tokens cut-off is repaired
+        parsed = extract_json(raw)
+        if parsed is None:
             # Return structured error so callers don't crash
             return {
                 "error": "JSON parse failed from Hugging Face fallback",
                 "raw_response": raw
             }
+        return parsed
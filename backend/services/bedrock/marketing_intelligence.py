@@ -14,26 +14,25 @@ Agents:
 3. Analytics Agent         — metrics input → chart data + prioritized actions
 """
 
-import time
 from typing import Dict
 from services.bedrock.bedrock_client import BedrockClient, BedrockInvokeError
-from services.bedrock.groq_ads_client import GroqAdsClient
+from services.bedrock.ads_router import get_ads_router, is_json_answer
+from services.llm.quota import BACKGROUND, lane
 
 
 class MarketingIntelligenceService:
     def __init__(self):
-        # We only need 1 client now since we run synchronously
-        self.master_groq = GroqAdsClient()
+        # One merged prompt, routed to the fastest healthy ads LLM client
+        self.router = get_ads_router()
 
     def get_full_intelligence(self, request: Dict) -> Dict:
         """
         Run the 3 Market Intelligence checks synchronously via a single merged prompt.
-        Dodges Google Gemini Free Tier 429 quota block.
+        Dodges Google Gemini Free Tier 429 quota block: the call runs in the
+        background quota lane, so it waits only while a provider's budget is
+        spent, and then behind interactive calls such as ad recommendations.
         """
         
-        # Add a tiny 2s pad to let the AD_Recommendation inference clear the Gemini queue
-        time.sleep(2)
-        
         keyword = request.get('keyword', '')
         niche = request.get('niche', '')
         ad_draft = request.get("ad_draft", "No draft provided yet.")
@@ -121,9 +120,11 @@ Return ONLY valid JSON (no markdown fences) covering ALL THREE reports in this e
 }}"""
         
         try:
-            return self.master_groq.invoke_json(prompt, max_tokens=3000)
+            with lane(BACKGROUND):
+                return self.router.call(lambda client: client.invoke_json(prompt, max_tokens=3000),
+                                        "ads-intelligence", ok=is_json_answer)
         except Exception as inner_e:
-            err_dict = {"error": f"Groq primary failed: {str(inner_e)}"}
+            err_dict = {"error": f"All ads LLM engines failed: {str(inner_e)}"}
             return {
                 "market_research": err_dict,
                 "campaign_tuning": err_dict,
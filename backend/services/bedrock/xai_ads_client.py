@@ -1,8 +1,9 @@
-import json
-import re
 from openai import OpenAI
 from config import Config
 from services.bedrock.bedrock_client import BedrockInvokeError
+from services.llm.cache import cached_invoke_json
+from services.llm.json_extract import extract_json
+from services.llm.quota import quota_limited
 
 class XaiAdsClient:
     """
@@ -38,6 +39,8 @@ class XaiAdsClient:
         except Exception as e:
             raise BedrockInvokeError(f"xAI API error: {str(e)}") from e
 
+    @cached_invoke_json("xai-ads")
+    @quota_limited("xai-ads")
     def invoke_json(self, prompt: str, max_tokens: int = 1500) -> dict:
         """
         Same as invoke() but critically resilient for JSON parsing.
@@ -54,30 +57,15 @@ class XaiAdsClient:
             )
             raw = completion.choices[0].message.content
             
-            cleaned = raw.strip()
-            # Remove Markdown Fences if Grok adds them
-            if cleaned.startswith("```"):
-                cleaned = cleaned.split("```")[1]
-                if cleaned.startswith("json"):
-                    cleaned = cleaned[4:]
-            cleaned = cleaned.strip()
-            
-            try:
-                return json.loads(cleaned)
-            except json.JSONDecodeError:
-                # Fallback: Aggressive Regex Search
-                try:
-                    match = re.search(r'\{.*\}', cleaned, re.DOTALL)
-                    if match:
-                        return json.loads(match.group(0))
-                except Exception:
-                    pass
+            parsed = extract_json(raw)
+            if parsed is not None:
+                return parsed
 
-                print(f"⚠️ Extreme JSON Parse Failure on xAI Fallback:\n{raw}")
-                return {
-                    "error": "JSON parse failed from xAI ADs fallback even after aggressive regex.",
-                    "raw_response": raw if 'raw' in locals() else "Unknown"
-                }
+            print(f"⚠️ Extreme JSON Parse Failure on xAI Fallback:\n{raw}")
+            return {
+                "error": "JSON parse failed from xAI ADs fallback.",
+                "raw_response": raw
+            }
 
         except Exception as e:
             raise BedrockInvokeError(f"xAI API JSON invoke error: {str(e)}") from e
@@ -1,6 +1,11 @@
 """
 Brand Intelligence Service
 Scrapes company websites to extract brand information for RAG context
+
+Knowledge is stored in a PartitionedCollection keyed by brand_id (see
+services/vector_store/partitioned.py), so a context lookup embeds the query
+and searches only that brand's documents. A ChromaDB-style collection still
+works, filtered with where={"brand_id": ...}.
 """
 
 import requests
@@ -9,6 +14,10 @@ from urllib.parse import urljoin, urlparse
 import time
 import re
 
+from services import http_transport
+from services.embedding.model import ModelNotReady
+from services.vector_store.partitioned import PartitionedCollection
+
 
 class BrandIntelligenceService:
     """Service for scraping and analyzing brand websites"""
@@ -18,7 +27,7 @@ class BrandIntelligenceService:
         Initialize the service
         
         Args:
-            collection: ChromaDB collection for storing brand knowledge
+            collection: PartitionedCollection (or ChromaDB collection) for brand knowledge
         """
         self.collection = collection
         self.headers = {
@@ -42,7 +51,7 @@ class BrandIntelligenceService:
                 url = 'https://' + url
             
             # Fetch the homepage
-            response = requests.get(url, headers=self.headers, timeout=10)
+            response = http_transport.get(url, headers=self.headers, timeout=10)
             response.raise_for_status()
             
             soup = BeautifulSoup(response.content, 'html.parser')
@@ -60,7 +69,7 @@ class BrandIntelligenceService:
                 'scraped_at': time.strftime("%Y-%m-%dT%H:%M:%SZ")
             }
             
-            # Store in ChromaDB if collection provided
+            # Store in the brand knowledge collection if provided
             if self.collection:
                 self._store_in_chromadb(extracted_data)
             
@@ -119,7 +128,7 @@ class BrandIntelligenceService:
             if any(keyword in href or keyword in link_text for keyword in about_keywords):
                 try:
                     about_url = urljoin(base_url, link['href'])
-                    about_response = requests.get(about_url, headers=self.headers, timeout=10)
+                    about_response = http_transport.get(about_url, headers=self.headers, timeout=10)
                     about_soup = BeautifulSoup(about_response.content, 'html.parser')
                     
                     # Extract main content
@@ -201,7 +210,7 @@ class BrandIntelligenceService:
         return text.strip()
     
     def _store_in_chromadb(self, data: dict):
-        """Store extracted data in ChromaDB"""
+        """Store extracted data in the brand knowledge collection"""
         if not self.collection:
             return
         
@@ -265,49 +274,46 @@ class BrandIntelligenceService:
             })
             ids.append(f"{brand_id}_products")
         
-        # Add to ChromaDB (with embeddings generated automatically)
+        # Upsert so a re-scrape replaces the brand's sections; the collection embeds the documents
         if documents:
             try:
-                # Note: In production, you'd generate embeddings here
-                # For now, we'll use mock embeddings
-                embeddings = [[0.0] * 384 for _ in documents]
-                
-                self.collection.add(
+                self.collection.upsert(
                     ids=ids,
                     documents=documents,
-                    metadatas=metadatas,
-                    embeddings=embeddings
+                    metadatas=metadatas
                 )
             except Exception as e:
-                print(f"Error storing in ChromaDB: {e}")
+                print(f"Error storing brand knowledge: {e}")
 
 
 def get_brand_context(brand_id: str, query: str, collection=None) -> str:
     """
-    Retrieve brand context from ChromaDB for RAG
+    Retrieve brand context for RAG
     
     Args:
         brand_id: Brand identifier
         query: Query to search for relevant context
-        collection: ChromaDB collection
+        collection: PartitionedCollection of brand knowledge (or ChromaDB collection)
         
     Returns:
         Relevant brand context as string
     """
-    if not collection or collection.count() == 0:
+    if not collection:
         return ""
     
     try:
-        # Query ChromaDB for relevant brand knowledge
-        # Note: In production, you'd generate query embedding
-        query_embedding = [0.0] * 384  # Mock embedding
-        
-        results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=3,
-            where={"brand_id": brand_id},
-            include=["documents", "metadatas"]
-        )
+        if isinstance(collection, PartitionedCollection):
+            # Only this brand's partition is searched; repeated queries hit the result cache
+            results = collection.query(brand_id, query, n_results=3, include=["documents", "metadatas"])
+        else:
+            if collection.count() == 0:
+                return ""
+            results = collection.query(
+                query_texts=[query],
+                n_results=3,
+                where={"brand_id": brand_id},
+                include=["documents", "metadatas"]
+            )
         
         if results and results['documents'] and results['documents'][0]:
             context_parts = []
@@ -318,6 +324,8 @@ def get_brand_context(brand_id: str, query: str, collection=None) -> str:
         
         return ""
         
+    except ModelNotReady:
+        raise  # a 503 + Retry-After, not a silently missing brand context
     except Exception as e:
         print(f"Error retrieving brand context: {e}")
         return ""
@@ -0,0 +1,195 @@
+"""
+Micro-Batching Embedding Service
+Coalesces encode requests from concurrent callers into batched encoder calls.
+
+Sentence-transformer throughput on CPU grows almost linearly with batch size
+up to a few dozen texts, but request handlers each embed one or two strings.
+Callers submit() their texts and get a Future; a single background thread
+drains the queue and encodes everything pending in one call once either
+
+- `max_batch_size` texts are waiting, or
+- the oldest request has waited `max_wait_ms`
+
+so a lone request pays at most max_wait_ms of extra latency. The worker
+thread starts on first use, which keeps gunicorn --preload forks clean.
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Deque, Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+
+MAX_BATCH_SIZE = 64
+MAX_WAIT_MS = 5.0
+METRICS_WINDOW = 1024  # recent batches kept for percentile metrics
+
+EncodeFn = Callable[[List[str]], np.ndarray]
+
+
+class MicroBatchEmbedder:
+    """Queue of pending texts encoded in micro-batches by one worker thread"""
+
+    def __init__(
+        self,
+        encode_fn: EncodeFn,
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_wait_ms: float = MAX_WAIT_MS
+    ):
+        """
+        Args:
+            encode_fn: Encoder taking a list of texts, returning (n, dim) vectors
+            max_batch_size: Texts that trigger an immediate flush
+            max_wait_ms: Longest time a request waits for others to join its batch
+        """
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._pending: Deque[Tuple[List[str], Future, float]] = deque()
+        self._pending_texts = 0
+        self._cond = threading.Condition()
+        self._worker = None
+        self._closed = False
+
+        self._batches = 0
+        self._texts = 0
+        self._batch_sizes: Deque[int] = deque(maxlen=METRICS_WINDOW)
+        self._queue_waits: Deque[float] = deque(maxlen=METRICS_WINDOW)
+        self._encode_times: Deque[float] = deque(maxlen=METRICS_WINDOW)
+
+    # ── CALLER SIDE ───────────────────────────────────────────────────────────
+
+    def submit(self, texts: Sequence[str]) -> Future:
+        """
+        Queue texts for the next batch
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            Future resolving to an (len(texts), dim) float32 array
+        """
+        texts = list(texts)
+        future = Future()
+        if not texts:
+            future.set_result(np.zeros((0, 0), dtype=np.float32))
+            return future
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("MicroBatchEmbedder is closed")
+            self._ensure_worker()
+            self._pending.append((texts, future, time.perf_counter()))
+            self._pending_texts += len(texts)
+            self._cond.notify()
+        return future
+
+    def encode(self, texts: Union[str, Sequence[str]]) -> np.ndarray:
+        """
+        Blocking encode with the sentence-transformers call shape
+
+        Args:
+            texts: One text (→ (dim,) vector) or many (→ (n, dim) array)
+
+        Returns:
+            float32 vectors
+        """
+        if isinstance(texts, str):
+            return self.submit([texts]).result()[0]
+        return self.submit(texts).result()
+
+    def close(self):
+        """Encode what is queued, then stop the worker"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            worker = self._worker
+        if worker is not None:
+            worker.join()
+
+    # ── WORKER ────────────────────────────────────────────────────────────────
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+            self._worker.start()
+
+    def _next_batch(self) -> List[Tuple[List[str], Future, float]]:
+        """Block until a batch is due, then take it off the queue"""
+        with self._cond:
+            while not self._pending and not self._closed:
+                self._cond.wait()
+            if self._pending:
+                deadline = self._pending[0][2] + self.max_wait
+                while self._pending_texts < self.max_batch_size and not self._closed:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+            batch, size = [], 0
+            while self._pending and (not batch or size + len(self._pending[0][0]) <= self.max_batch_size):
+                item = self._pending.popleft()
+                batch.append(item)
+                size += len(item[0])
+            self._pending_texts -= size
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return  # closed and drained
+            self._encode_batch(batch)
+
+    def _encode_batch(self, batch: List[Tuple[List[str], Future, float]]):
+        texts = [text for item_texts, _, _ in batch for text in item_texts]
+        started = time.perf_counter()
+        try:
+            vectors = np.asarray(self.encode_fn(texts), dtype=np.float32).reshape(len(texts), -1)
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        finished = time.perf_counter()
+
+        offset = 0
+        for item_texts, future, enqueued in batch:
+            future.set_result(vectors[offset:offset + len(item_texts)])
+            offset += len(item_texts)
+            self._queue_waits.append(started - enqueued)
+        self._batches += 1
+        self._texts += len(texts)
+        self._batch_sizes.append(len(texts))
+        self._encode_times.append(finished - started)
+
+    # ── METRICS ───────────────────────────────────────────────────────────────
+
+    def metrics(self) -> Dict:
+        """
+        Batching statistics
+
+        Returns:
+            {"batches", "texts", "queued", "avg_batch_size", "max_batch_size",
+             "queue_wait_ms": {p50, p95, max}, "encode_ms": {p50, p95, max}}
+            (percentiles over the last METRICS_WINDOW batches / requests)
+        """
+        def summary(seconds: Sequence[float]) -> Dict:
+            if not seconds:
+                return {"p50": 0.0, "p95": 0.0, "max": 0.0}
+            ms = np.asarray(seconds) * 1000
+            return {"p50": round(float(np.percentile(ms, 50)), 3),
+                    "p95": round(float(np.percentile(ms, 95)), 3),
+                    "max": round(float(ms.max()), 3)}
+
+        sizes = list(self._batch_sizes)
+        return {
+            "batches": self._batches,
+            "texts": self._texts,
+            "queued": self._pending_texts,
+            "avg_batch_size": round(self._texts / self._batches, 2) if self._batches else 0.0,
+            "max_batch_size": max(sizes) if sizes else 0,
+            "queue_wait_ms": summary(list(self._queue_waits)),
+            "encode_ms": summary(list(self._encode_times))
+        }
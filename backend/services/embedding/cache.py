@@ -0,0 +1,204 @@
+"""
+Content-Hash Embedding Cache
+Two tiers keyed by (model id, normalized text): an in-memory LRU and SQLite.
+
+The same captions are embedded again and again (re-seeding, re-scraping a
+hashtag or a brand site, re-analyzing a draft), and an embedding is a pure
+function of model and text. Keys are SHA-256 of the model id plus the text
+after Unicode NFKC normalization and whitespace collapsing, so trivially
+different copies of a caption share one entry.
+
+The SQLite tier (WAL mode) survives restarts and is shared by every worker
+process. Each process opens its own connection on first use: caches are
+built at import, before gunicorn --preload forks, and SQLite connections
+must not cross fork(). CachedEncoder wraps any encoder so only misses reach the model, each
+distinct miss once per call.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+
+MEMORY_CAPACITY = 50_000   # vectors kept in the LRU (~77 MB at 384-d float32)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """NFKC-normalize and collapse runs of whitespace"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text or "")).strip()
+
+
+def cache_key(model_id: str, text: str) -> bytes:
+    """SHA-256 of model id + normalized text"""
+    return hashlib.sha256(f"{model_id}\0{normalize_text(text)}".encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """Bounded LRU in front of an optional SQLite store"""
+
+    def __init__(self, model_id: str, path: Optional[str] = None, capacity: int = MEMORY_CAPACITY):
+        """
+        Args:
+            model_id: Embedding model name (part of every key)
+            path: SQLite file for the persistent tier (None = memory only)
+            capacity: Vectors kept in memory
+        """
+        self.model_id = model_id
+        self.path = path
+        self.capacity = capacity
+        self._memory: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @property
+    def _db(self) -> Optional[sqlite3.Connection]:
+        """This process's connection, opened on first use (callers hold _lock)"""
+        if self.path is None:
+            return None
+        if self._conn is None or self._conn_pid != os.getpid():
+            self._conn = self._open_db(self.path)   # a parent's connection is left untouched
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    @staticmethod
+    def _open_db(path: str) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)")
+        db.commit()
+        return db
+
+    # ── LOOKUP ────────────────────────────────────────────────────────────────
+
+    def get_many(self, keys: Sequence[bytes]) -> List[Optional[np.ndarray]]:
+        """
+        Look keys up in memory, then on disk
+
+        Args:
+            keys: cache_key() values
+
+        Returns:
+            Vector or None per key; disk hits are promoted into memory
+        """
+        found: List[Optional[np.ndarray]] = [None] * len(keys)
+        missing = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[i] = vector
+                    self.memory_hits += 1
+                else:
+                    missing.setdefault(key, []).append(i)
+
+            db = self._db if missing else None
+            if db is not None:
+                unique = list(missing)
+                for start in range(0, len(unique), 500):  # SQLite variable limit
+                    chunk = unique[start:start + 500]
+                    rows = db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = np.frombuffer(blob, dtype=np.float32)
+                        self._remember(key, vector)
+                        for i in missing.pop(key):
+                            found[i] = vector
+                            self.disk_hits += 1
+            self.misses += sum(len(rows) for rows in missing.values())
+        return found
+
+    def put_many(self, keys: Sequence[bytes], vectors: np.ndarray):
+        """Store vectors in both tiers"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                self._remember(key, vector.copy())
+            db = self._db
+            if db is not None:
+                db.executemany(
+                    "INSERT OR IGNORE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, vector.tobytes()) for key, vector in zip(keys, vectors)]
+                )
+                db.commit()
+
+    def _remember(self, key: bytes, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.capacity:
+            self._memory.popitem(last=False)
+
+    # ── STATS ─────────────────────────────────────────────────────────────────
+
+    def stats(self) -> Dict:
+        """Hit counters per tier and the overall hit rate"""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "model_id": self.model_id,
+            "memory_entries": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "persistent": self.path is not None
+        }
+
+
+class CachedEncoder:
+    """Encoder wrapper that serves repeated texts from an EmbeddingCache"""
+
+    def __init__(self, encode_fn: Callable[[List[str]], np.ndarray], cache: EmbeddingCache):
+        """
+        Args:
+            encode_fn: Underlying encoder (list of texts → (n, dim) vectors)
+            cache: Cache consulted before encode_fn
+        """
+        self.encode_fn = encode_fn
+        self.cache = cache
+
+    def encode(self, texts: Union[str, Sequence[str]]) -> np.ndarray:
+        """
+        Embed texts, encoding only cache misses
+
+        Args:
+            texts: One text (→ (dim,) vector) or many (→ (n, dim) array)
+
+        Returns:
+            float32 vectors
+        """
+        if isinstance(texts, str):
+            return self.encode([texts])[0]
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        keys = [cache_key(self.cache.model_id, text) for text in texts]
+        found = self.cache.get_many(keys)
+
+        misses: Dict[bytes, str] = {}
+        for key, text, vector in zip(keys, texts, found):
+            if vector is None:
+                misses.setdefault(key, text)
+        if misses:
+            encoded = np.asarray(self.encode_fn(list(misses.values())), dtype=np.float32).reshape(len(misses), -1)
+            self.cache.put_many(list(misses), encoded)
+            fresh = dict(zip(misses, encoded))
+            found = [vector if vector is not None else fresh[key] for key, vector in zip(keys, found)]
+        return np.stack(found)
+
+    def __call__(self, texts: Sequence[str]) -> List[List[float]]:
+        """Chroma-style embedding function (list of texts → list of vectors)"""
+        return self.encode(list(texts)).tolist()
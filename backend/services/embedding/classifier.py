@@ -0,0 +1,290 @@
+"""
+Local Label Classifier
+Nearest-centroid classification over post embeddings, for labels the app
+used to ask an LLM for (a post's emotion, a draft's archetype).
+
+Training data is what the LLM already produced: `emotion` metadata on
+tagged posts, and archetypes recorded from /api/analyze answers. Each label
+gets the renormalized mean of its unit-norm examples; a text's scores are
+its cosines to the centroids, turned into a confidence with a softmax
+(`temperature`). One matrix product labels a whole batch in microseconds
+per item, so callers keep confident predictions and send only the rest to
+the LLM.
+
+LocalLabeler keeps one classifier ("head") per label kind under `root`:
+
+- <head>.npz: centroids, label names, example counts and the embedding
+  model id. A head trained with another embedder is ignored. Files are
+  reloaded when they change, so a retrain reaches every worker.
+- <head>_labels.jsonl: (text, label) pairs recorded for heads whose
+  examples are not stored anywhere else.
+
+agreement_report() measures, with k-fold holdout, how often the local
+prediction matches the LLM label, overall and above the confidence
+threshold.
+"""
+import json
+import os
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+TEMPERATURE = 0.05         # softmax temperature over cosine scores
+CONFIDENCE_THRESHOLD = 0.7
+MIN_EXAMPLES = 3           # labels with fewer examples are not learned
+FOLDS = 5
+
+
+def _unit_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+class CentroidClassifier:
+    """One unit-norm centroid per label; predicts the closest"""
+
+    def __init__(self, labels: Sequence[str], centroids: np.ndarray, counts: Sequence[int],
+                 model_id: str, temperature: float = TEMPERATURE, trained_at: Optional[float] = None):
+        self.labels = list(labels)
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.counts = [int(c) for c in counts]
+        self.model_id = model_id
+        self.temperature = temperature
+        self.trained_at = trained_at or time.time()
+
+    @classmethod
+    def fit(cls, vectors: np.ndarray, labels: Sequence[str], model_id: str,
+            min_examples: int = MIN_EXAMPLES, temperature: float = TEMPERATURE) -> Optional["CentroidClassifier"]:
+        """
+        Centroids for every label with at least `min_examples` examples
+
+        Returns:
+            The classifier, or None when fewer than two labels qualify
+        """
+        vectors = _unit_rows(vectors)
+        labels = list(labels)
+        counts = Counter(labels)
+        kept = sorted(label for label, count in counts.items() if count >= min_examples)
+        if len(kept) < 2:
+            return None
+        index = {label: i for i, label in enumerate(kept)}
+        rows = [i for i, label in enumerate(labels) if label in index]
+        centroids = np.zeros((len(kept), vectors.shape[1]), dtype=np.float32)
+        np.add.at(centroids, [index[labels[i]] for i in rows], vectors[rows])
+        return cls(kept, _unit_rows(centroids), [counts[label] for label in kept], model_id, temperature)
+
+    def predict(self, vectors: np.ndarray) -> List[Tuple[str, float]]:
+        """
+        Closest label for each vector
+
+        Returns:
+            (label, confidence) per vector; confidence is the softmax weight of the winner
+        """
+        scores = _unit_rows(np.atleast_2d(vectors)) @ self.centroids.T / self.temperature
+        scores -= scores.max(axis=1, keepdims=True)
+        weights = np.exp(scores)
+        weights /= weights.sum(axis=1, keepdims=True)
+        best = weights.argmax(axis=1)
+        return [(self.labels[b], round(float(weights[i, b]), 4)) for i, b in enumerate(best)]
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, centroids=self.centroids, labels=np.array(self.labels), counts=np.array(self.counts),
+                 meta=np.array(json.dumps({"model_id": self.model_id, "temperature": self.temperature,
+                                           "trained_at": self.trained_at})))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "CentroidClassifier":
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            return cls([str(label) for label in data["labels"]], data["centroids"], data["counts"].tolist(),
+                       meta["model_id"], meta["temperature"], meta["trained_at"])
+
+    def summary(self) -> Dict:
+        return {"labels": dict(zip(self.labels, self.counts)), "model_id": self.model_id,
+                "trained_at": self.trained_at}
+
+
+def agreement_report(vectors: np.ndarray, labels: Sequence[str], model_id: str,
+                     threshold: float = CONFIDENCE_THRESHOLD, folds: int = FOLDS,
+                     min_examples: int = MIN_EXAMPLES, seed: int = 7) -> Dict:
+    """
+    How well local predictions agree with the LLM labels, by k-fold holdout
+
+    Each example is predicted by a classifier fitted without its fold.
+
+    Returns:
+        examples, accuracy (agreement), coverage and accuracy above
+        `threshold`, and per-label support / precision / recall
+    """
+    labels = list(labels)
+    n = len(labels)
+    if n < folds * 2:
+        return {"examples": n, "error": f"need at least {folds * 2} labelled examples"}
+    order = np.random.default_rng(seed).permutation(n)
+    predicted: List[Optional[Tuple[str, float]]] = [None] * n
+    for fold in np.array_split(order, folds):
+        held_out = set(fold.tolist())
+        train = [i for i in range(n) if i not in held_out]
+        model = CentroidClassifier.fit(vectors[train], [labels[i] for i in train], model_id,
+                                       min_examples=min_examples)
+        if model is None:
+            continue
+        for i, prediction in zip(fold, model.predict(vectors[fold])):
+            predicted[i] = prediction
+
+    scored = [(labels[i], p[0], p[1]) for i, p in enumerate(predicted) if p is not None]
+    confident = [(truth, label) for truth, label, confidence in scored if confidence >= threshold]
+    per_label = {}
+    for name in sorted(set(labels)):
+        support = sum(truth == name for truth, _, _ in scored)
+        guessed = sum(label == name for _, label, _ in scored)
+        right = sum(truth == label == name for truth, label, _ in scored)
+        per_label[name] = {"support": support,
+                           "precision": round(right / guessed, 4) if guessed else None,
+                           "recall": round(right / support, 4) if support else None}
+    return {
+        "examples": n,
+        "evaluated": len(scored),
+        "accuracy": round(sum(t == p for t, p, _ in scored) / len(scored), 4) if scored else None,
+        "threshold": threshold,
+        "confident_coverage": round(len(confident) / len(scored), 4) if scored else None,
+        "confident_accuracy": round(sum(t == p for t, p in confident) / len(confident), 4) if confident else None,
+        "per_label": per_label
+    }
+
+
+class LocalLabeler:
+    """Named centroid classifiers on disk, reloaded when retrained"""
+
+    def __init__(self, root: str, model_id: str, threshold: float = CONFIDENCE_THRESHOLD):
+        """
+        Args:
+            root: Directory holding <head>.npz and <head>_labels.jsonl
+            model_id: Embedding model the vectors come from
+            threshold: Confidence a prediction needs to be used without the LLM
+        """
+        self.root = root
+        self.model_id = model_id
+        self.threshold = threshold
+        self._heads: Dict[str, Tuple[Optional[float], Optional[CentroidClassifier]]] = {}
+        self._lock = threading.Lock()
+        self.counters = Counter()
+
+    def _path(self, head: str, suffix: str = ".npz") -> str:
+        return os.path.join(self.root, head + suffix)
+
+    def head(self, head: str) -> Optional[CentroidClassifier]:
+        """The trained classifier for `head`, or None (untrained, or another embedder)"""
+        path = self._path(head)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+        with self._lock:
+            cached = self._heads.get(head)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+        model = None
+        if mtime is not None:
+            try:
+                model = CentroidClassifier.load(path)
+            except Exception as e:
+                print(f"⚠️  Could not load local classifier {path}: {e}")
+            if model is not None and model.model_id != self.model_id:
+                model = None
+        with self._lock:
+            self._heads[head] = (mtime, model)
+        return model
+
+    def predict(self, head: str, vectors: np.ndarray) -> List[Optional[Tuple[str, float]]]:
+        """
+        (label, confidence) per vector; None where the head is untrained or
+        the confidence is below the threshold (the caller asks the LLM)
+        """
+        model = self.head(head)
+        if model is None:
+            return [None] * len(vectors)
+        predictions = model.predict(vectors)
+        confident = [p if p[1] >= self.threshold else None for p in predictions]
+        with self._lock:
+            self.counters[f"{head}_confident"] += sum(p is not None for p in confident)
+            self.counters[f"{head}_escalated"] += sum(p is None for p in confident)
+        return confident
+
+    def train(self, head: str, vectors: np.ndarray, labels: Sequence[str],
+              min_examples: int = MIN_EXAMPLES) -> Dict:
+        """
+        Fit and save `head`, with an agreement report on the same examples
+
+        Returns:
+            The report, plus the trained labels (or an error when too few)
+        """
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(labels), -1)
+        report = agreement_report(vectors, labels, self.model_id, self.threshold, min_examples=min_examples)
+        model = CentroidClassifier.fit(vectors, labels, self.model_id, min_examples=min_examples)
+        if model is None:
+            report["error"] = f"need at least two labels with {min_examples}+ examples"
+            return report
+        model.save(self._path(head))
+        return {**report, **model.summary()}
+
+    def record(self, head: str, texts: Sequence[str], labels: Sequence[str]):
+        """Append LLM-labelled (text, label) examples for `head`"""
+        rows = [json.dumps({"text": t, "label": l}) for t, l in zip(texts, labels) if t and l]
+        if not rows:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        with self._lock, open(self._path(head, "_labels.jsonl"), "a", encoding="utf-8") as f:
+            f.write("\n".join(rows) + "\n")
+
+    def recorded(self, head: str) -> Tuple[List[str], List[str]]:
+        """Examples saved with record(); the latest label wins for a repeated text"""
+        examples: Dict[str, str] = {}
+        try:
+            with open(self._path(head, "_labels.jsonl"), encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        row = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # torn write
+                    examples[row["text"]] = row["label"]
+        except OSError:
+            pass
+        return list(examples), list(examples.values())
+
+    def stats(self) -> Dict:
+        heads = {}
+        for name in sorted({h for h in self._heads} | {f[:-4] for f in self._list() if f.endswith(".npz") and ".tmp" not in f}):
+            model = self.head(name)
+            heads[name] = model.summary()["labels"] if model is not None else None
+        with self._lock:
+            return {"threshold": self.threshold, "heads": heads, **self.counters}
+
+    def _list(self) -> List[str]:
+        try:
+            return os.listdir(self.root)
+        except OSError:
+            return []
+
+
+def normalize_label(label: Optional[str], max_length: int = 60) -> Optional[str]:
+    """'the  underdog story' → 'The Underdog Story' (free-text LLM labels)"""
+    if not isinstance(label, str):
+        return None
+    label = " ".join(label.split()).strip(" .,!\"'")
+    return label.title()[:max_length] or None
+
+
+def label_texts(labeler: LocalLabeler, head: str, texts: Sequence[str],
+                embed_fn: Callable[[List[str]], np.ndarray]) -> List[Optional[Tuple[str, float]]]:
+    """predict() for raw texts (embedded with embed_fn)"""
+    if not texts or labeler.head(head) is None:
+        return [None] * len(texts)
+    return labeler.predict(head, embed_fn(list(texts)))
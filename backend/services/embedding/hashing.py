@@ -0,0 +1,212 @@
+"""
+Hashed N-Gram Embedder
+Model-free sentence vectors: TF-IDF weighted word and character n-grams,
+feature-hashed (signed) into a fixed dimension and L2-normalized.
+
+Used when sentence-transformers cannot load, instead of all-zero vectors, so
+semantic search keeps ranking by lexical / sub-word overlap. Nothing is
+downloaded and a batch is processed with a handful of NumPy passes:
+
+- the batch is NFKC-normalized, lower-cased and concatenated into one byte
+  array (documents separated by a NUL byte)
+- every n-gram is a byte span [s, e); its polynomial hash comes from prefix
+  sums mod 2^64, P^(e-1) · (S[e] - S[s]) with S[i] = Σ_{j<i} b[j]·P^-j
+  (P is odd, so it is invertible mod 2^64), then a splitmix64 finalizer
+- features: word unigrams and bigrams, character 3-5 grams
+- weight = tf · idf, added with a hash-derived sign into one of dim buckets
+
+IDF is optional: fit() learns document frequencies over 2^IDF_BITS hashed
+slots. Vectors depend on the IDF table, so model_id carries its fingerprint.
+"""
+import csv
+import hashlib
+import os
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from services.embedding.cache import normalize_text
+
+DIM = 384
+IDF_BITS = 18
+CHAR_NGRAMS = (3, 4, 5)
+_P = np.uint64(0x100000001B3)                    # FNV prime (odd)
+_P_INV = np.uint64(pow(0x100000001B3, -1, 2 ** 64))
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+_WORD, _BIGRAM = 1, 2                            # feature kinds (char n-grams use 10 + n)
+
+
+def _mix(z: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer (wrapping uint64 arithmetic)"""
+    z = z ^ (z >> np.uint64(30))
+    z = z * _MIX1
+    z = z ^ (z >> np.uint64(27))
+    z = z * _MIX2
+    return z ^ (z >> np.uint64(31))
+
+
+class HashingEmbedder:
+    """TF-IDF hashed n-gram sentence encoder"""
+
+    def __init__(self, dim: int = DIM, idf: Optional[np.ndarray] = None):
+        """
+        Args:
+            dim: Output dimension
+            idf: (2^IDF_BITS,) float32 weights from fit() (None = plain TF)
+        """
+        self.dim = dim
+        self.idf = None if idf is None else np.asarray(idf, dtype=np.float32)
+
+    @property
+    def model_id(self) -> str:
+        """Identifies the vector space (dimension + IDF table)"""
+        fingerprint = hashlib.sha1(self.idf.tobytes()).hexdigest()[:10] if self.idf is not None else "tf"
+        return f"hashed-ngram-{self.dim}-{fingerprint}"
+
+    # ── FEATURES ──────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _features(texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Hashed n-grams of every text
+
+        Returns:
+            (doc index, 64-bit feature hash) arrays, one entry per occurrence
+        """
+        encoded = [normalize_text(t).lower().encode("utf-8") for t in texts]
+        lengths = np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded))
+        data = np.frombuffer(b"\0".join(encoded) + b"\0", dtype=np.uint8)
+        n = len(data)
+        if not n:
+            return np.zeros(0, np.int64), np.zeros(0, np.uint64)
+
+        starts = np.concatenate(([0], np.cumsum(lengths + 1)[:-1]))
+        doc_of = np.repeat(np.arange(len(texts)), lengths + 1)
+        doc_end = np.repeat(starts + lengths, lengths + 1)   # first byte past each position's text
+
+        # prefix sums S[i] = Σ_{j<i} b[j]·P^-j and powers P^k (all mod 2^64)
+        with np.errstate(over="ignore"):
+            inv_pows = np.cumprod(np.full(n, _P_INV, dtype=np.uint64))
+            inv_pows = np.concatenate(([np.uint64(1)], inv_pows[:-1]))
+            pows = np.cumprod(np.full(n, _P, dtype=np.uint64))
+            pows = np.concatenate(([np.uint64(1)], pows[:-1]))
+            prefix = np.concatenate(([np.uint64(0)], np.cumsum(data.astype(np.uint64) * inv_pows, dtype=np.uint64)))
+
+            def span_hash(s: np.ndarray, e: np.ndarray, kind: int) -> np.ndarray:
+                raw = pows[e - 1] * (prefix[e] - prefix[s])
+                return _mix(raw + np.uint64(kind) * _GOLDEN)
+
+            docs, hashes = [], []
+            positions = np.arange(n)
+            for size in CHAR_NGRAMS:
+                # contiguous spans [i, i + size): slices instead of gathers
+                count = n - size + 1
+                raw = pows[size - 1:size - 1 + count] * (prefix[size:size + count] - prefix[:count])
+                valid = (positions[:count] + size <= doc_end[:count]) & (data[:count] != 0)
+                docs.append(doc_of[:count][valid])
+                hashes.append(_mix(raw[valid] + np.uint64(10 + size) * _GOLDEN))
+
+            # words: maximal runs of alphanumeric / non-ASCII bytes
+            is_word = (data >= 128) | ((data >= 48) & (data <= 57)) | ((data >= 97) & (data <= 122))
+            edges = np.diff(np.concatenate(([False], is_word, [False])).astype(np.int8))
+            word_starts, word_ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+            word_docs = doc_of[word_starts]
+            docs.append(word_docs)
+            hashes.append(span_hash(word_starts, word_ends, _WORD))
+
+            same_doc = word_docs[:-1] == word_docs[1:]
+            docs.append(word_docs[:-1][same_doc])
+            hashes.append(span_hash(word_starts[:-1][same_doc], word_ends[1:][same_doc], _BIGRAM))
+
+        return np.concatenate(docs), np.concatenate(hashes)
+
+    # ── ENCODING ──────────────────────────────────────────────────────────────
+
+    def encode(self, texts: Union[str, Sequence[str]], **kwargs) -> np.ndarray:
+        """
+        Embed texts (sentence-transformers call shape)
+
+        Args:
+            texts: One text (→ (dim,)) or many (→ (n, dim))
+
+        Returns:
+            L2-normalized float32 vectors (all-zero for texts without features)
+        """
+        if isinstance(texts, str):
+            return self.encode([texts])[0]
+        texts = list(texts)
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        if not texts:
+            return out
+        docs, hashes = self._features(texts)
+        # every occurrence adds ±idf, so a bucket accumulates tf · idf without a per-feature sort
+        weights = np.where((hashes >> np.uint64(63)) == 1, -1.0, 1.0)
+        if self.idf is not None:
+            weights = weights * self.idf[(hashes >> np.uint64(20)) & np.uint64((1 << IDF_BITS) - 1)]
+        with np.errstate(over="ignore"):  # multiply-shift: low 32 bits → [0, dim)
+            buckets = (((hashes & np.uint64(0xFFFFFFFF)) * np.uint64(self.dim)) >> np.uint64(32)).astype(np.int64)
+        flat = np.bincount(docs * self.dim + buckets, weights=weights, minlength=len(texts) * self.dim)
+        out[:] = flat.reshape(len(texts), self.dim)
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        np.divide(out, norms, out=out, where=norms > 0)
+        return out
+
+    # ── IDF ───────────────────────────────────────────────────────────────────
+
+    def fit(self, corpus: Sequence[str]) -> "HashingEmbedder":
+        """
+        Learn smoothed IDF weights, log((1 + N) / (1 + df)) + 1, from a corpus
+
+        Args:
+            corpus: Representative documents (e.g. the seed posts)
+
+        Returns:
+            self
+        """
+        corpus = list(corpus)
+        docs, hashes = self._features(corpus)
+        slots = ((hashes >> np.uint64(20)) & np.uint64((1 << IDF_BITS) - 1)).astype(np.int64)
+        pairs = np.unique(docs * (1 << IDF_BITS) + slots)
+        df = np.bincount(pairs % (1 << IDF_BITS), minlength=1 << IDF_BITS)
+        self.idf = (np.log((1.0 + len(corpus)) / (1.0 + df)) + 1.0).astype(np.float32)
+        return self
+
+    def save_idf(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        np.save(path, self.idf)
+
+    @classmethod
+    def from_idf_file(cls, path: str, dim: int = DIM) -> "HashingEmbedder":
+        return cls(dim=dim, idf=np.load(path))
+
+
+def corpus_from_csv(path: Optional[str], column: str = "post_text") -> Optional[List[str]]:
+    """Non-empty `column` values of a CSV (None if the file is missing)"""
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return [row[column].strip() for row in csv.DictReader(f) if (row.get(column) or "").strip()]
+
+
+def load_or_fit(idf_path: Optional[str], corpus: Optional[List[str]] = None, dim: int = DIM) -> HashingEmbedder:
+    """
+    Embedder with a stable IDF table
+
+    The table is fitted once (from `corpus`) and saved, so later restarts
+    embed into the same space even if the corpus has changed since.
+
+    Args:
+        idf_path: .npy file holding the IDF table (None = do not persist)
+        corpus: Documents to fit on when no table exists yet (None = plain TF)
+        dim: Output dimension
+    """
+    if idf_path and os.path.exists(idf_path):
+        return HashingEmbedder.from_idf_file(idf_path, dim)
+    embedder = HashingEmbedder(dim=dim)
+    if corpus:
+        embedder.fit(corpus)
+        if idf_path:
+            embedder.save_idf(idf_path)
+    return embedder
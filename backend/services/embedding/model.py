@@ -0,0 +1,141 @@
+"""
+Lazy Embedding Model
+Keeps sentence-transformer loading off the import / worker boot path.
+
+The model is built by `loader` on a background thread, started by warm()
+(the app calls it on the first request of each worker) or by the first
+encode(). Until it is ready, encode() waits up to `ready_timeout` seconds
+and then raises ModelNotReady, which request handlers turn into a fast 503
+with Retry-After.
+
+A gunicorn --preload fork can copy the model mid-load without the loader
+thread; warm() notices the foreign pid and loads again in the worker.
+"""
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+READY_TIMEOUT = 10.0      # seconds encode() waits for a loading model
+RETRY_AFTER = 5           # seconds suggested to clients while loading
+FAILED_RETRY_SECONDS = 30.0
+
+COLD, LOADING, READY, FAILED = "cold", "loading", "ready", "failed"
+
+
+class ModelNotReady(RuntimeError):
+    """The embedding model is still loading (or failed to load)"""
+
+    def __init__(self, state: str, retry_after: int = RETRY_AFTER):
+        super().__init__(f"Embedding model is {state}")
+        self.state = state
+        self.retry_after = retry_after
+
+
+class LazyEmbeddingModel:
+    """Encoder proxy that loads its model in the background on first need"""
+
+    def __init__(
+        self,
+        loader: Callable[[], Any],
+        model_id: str,
+        ready_timeout: float = READY_TIMEOUT,
+        retry_after: int = RETRY_AFTER
+    ):
+        """
+        Args:
+            loader: Builds the model (anything with .encode(texts, **kwargs))
+            model_id: Name reported in status() and used for cache keys
+            ready_timeout: Seconds encode() blocks on a loading model
+            retry_after: Retry-After hint carried by ModelNotReady
+        """
+        self.loader = loader
+        self.model_id = model_id
+        self.ready_timeout = ready_timeout
+        self.retry_after = retry_after
+
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._settled = threading.Event()  # the current load attempt finished (either way)
+        self._model = None
+        self._state = COLD
+        self._owner_pid = None
+        self._error: Optional[str] = None
+        self._started_at: Optional[float] = None
+        self._load_seconds: Optional[float] = None
+
+    # ── LIFECYCLE ─────────────────────────────────────────────────────────────
+
+    def warm(self) -> str:
+        """Start loading in the background if nothing is loading yet; returns the state"""
+        if self._ready.is_set():
+            return READY
+        with self._lock:
+            orphaned = self._state == LOADING and self._owner_pid != os.getpid()
+            retry = self._state == FAILED and time.monotonic() - self._started_at >= FAILED_RETRY_SECONDS
+            if self._state == COLD or orphaned or retry:
+                self._state = LOADING
+                self._owner_pid = os.getpid()
+                self._started_at = time.monotonic()
+                self._settled.clear()
+                threading.Thread(target=self._load, name="embedding-model-warmup", daemon=True).start()
+            return self._state
+
+    def _load(self):
+        try:
+            model = self.loader()
+        except Exception as e:
+            with self._lock:
+                self._state = FAILED
+                self._error = f"{type(e).__name__}: {e}"
+                self._settled.set()
+            print(f"❌ Embedding model failed to load: {self._error}")
+            return
+        with self._lock:
+            self._model = model
+            self._state = READY
+            self._error = None
+            self._load_seconds = round(time.monotonic() - self._started_at, 3)
+            self._ready.set()
+            self._settled.set()
+        print(f"✅ Embedding model {self.model_id} ready in {self._load_seconds}s")
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until the model is ready (starting the load if needed)
+
+        Args:
+            timeout: Seconds to wait (default ready_timeout)
+
+        Returns:
+            Whether the model is ready
+        """
+        self.warm()
+        self._settled.wait(self.ready_timeout if timeout is None else timeout)
+        return self._ready.is_set()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    # ── ENCODING ──────────────────────────────────────────────────────────────
+
+    def encode(self, texts, **kwargs):
+        """
+        Encode with the loaded model
+
+        Raises:
+            ModelNotReady: The model did not become ready within ready_timeout
+        """
+        if not self._ready.is_set() and not self.wait():
+            raise ModelNotReady(self._state, self.retry_after)
+        return self._model.encode(texts, **kwargs)
+
+    def status(self) -> Dict:
+        """{"state", "model_id", "load_seconds", "error"} for health checks"""
+        return {
+            "state": self._state,
+            "model_id": self.model_id,
+            "load_seconds": self._load_seconds,
+            "error": self._error
+        }
@@ -0,0 +1,323 @@
+"""
+Embedding Process Pool
+Sentence-transformer encoding in dedicated worker processes.
+
+Encoding is CPU-bound and holds the GIL for much of its run, so inside a
+gunicorn gthread / gevent worker it serializes every request. The pool moves
+it to `size` spawned processes, each with its own model copy (optionally
+pinned to CPUs and limited to a few BLAS threads).
+
+Vectors never travel back through a pipe. A request allocates one
+multiprocessing.shared_memory segment sized for its output, its texts are
+split into chunks of `chunk_rows`, and the workers write float32 rows
+straight into their slice of the segment. The caller then wraps the segment
+as a NumPy array without copying (lease()) or copies it out once (encode()).
+
+When a worker dies, the requests in flight fail (one of their chunks is
+lost), and the workers and queues are rebuilt: a process killed inside
+Queue.get() can leave the shared queue locked for every other reader. If a
+rebuilt worker cannot load its model, the pool stops instead of looping.
+"""
+import importlib
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from typing import Dict, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+
+POOL_SIZE = 2
+CHUNK_ROWS = 64            # texts per task handed to one worker
+START_TIMEOUT = 300.0      # seconds to wait for every worker's model to load
+DEFAULT_FACTORY = "services.embedding.pool:sentence_transformer"
+
+
+def sentence_transformer(model_name: str = "all-MiniLM-L6-v2"):
+    """Default worker model factory"""
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+
+def resolve_factory(spec: str):
+    """'package.module:callable' → callable"""
+    module, _, attr = spec.partition(":")
+    return getattr(importlib.import_module(module), attr)
+
+
+def parse_cpu_list(spec: str) -> Optional[List[int]]:
+    """'0-3,6' → [0, 1, 2, 3, 6] (empty → None)"""
+    cpus = []
+    for part in filter(None, (p.strip() for p in (spec or "").split(","))):
+        low, _, high = part.partition("-")
+        cpus.extend(range(int(low), int(high or low) + 1))
+    return cpus or None
+
+
+def _worker_main(index, factory, factory_args, cpus, threads, tasks, results):
+    if threads:
+        for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+            os.environ[var] = str(threads)
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    try:
+        model = resolve_factory(factory)(*factory_args)
+    except Exception as e:
+        results.put(("failed", index, f"{type(e).__name__}: {e}"))
+        return
+    results.put(("ready", index, None))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        job_id, texts, shm_name, total, start, dim = task
+        try:
+            vectors = np.asarray(model.encode(texts), dtype=np.float32).reshape(len(texts), -1)
+            if vectors.shape[1] != dim:
+                raise ValueError(f"Model produced {vectors.shape[1]}-d vectors, pool expects {dim}")
+            shm = shared_memory.SharedMemory(name=shm_name)  # same resource tracker as the parent
+            out = np.ndarray((total, dim), dtype=np.float32, buffer=shm.buf)
+            out[start:start + len(texts)] = vectors
+            del out
+            shm.close()
+            results.put(("done", job_id, None))
+        except Exception as e:
+            results.put(("error", job_id, f"{type(e).__name__}: {e}"))
+
+
+class SharedEmbeddings:
+    """(n, dim) float32 vectors living in a shared-memory segment"""
+
+    def __init__(self, shm: shared_memory.SharedMemory, rows: int, dim: int):
+        self._shm = shm
+        self.array = np.ndarray((rows, dim), dtype=np.float32, buffer=shm.buf)
+
+    def release(self):
+        """Drop the array and free the segment (views still held elsewhere keep the mapping alive)"""
+        if self._shm is None:
+            return
+        self.array = None
+        try:
+            self._shm.close()
+        except BufferError:
+            pass  # caller still holds a view; the mapping goes away with it
+        self._shm.unlink()
+        self._shm = None
+
+
+class EmbeddingProcessPool:
+    """Worker processes encoding into shared-memory output buffers"""
+
+    def __init__(
+        self,
+        factory: str = DEFAULT_FACTORY,
+        factory_args: Sequence = (),
+        size: int = POOL_SIZE,
+        dim: int = 384,
+        chunk_rows: int = CHUNK_ROWS,
+        cpu_affinity: Optional[Sequence[int]] = None,
+        threads_per_worker: Optional[int] = 1
+    ):
+        """
+        Args:
+            factory: 'module:callable' building the model inside each worker
+            factory_args: Positional arguments for the factory (picklable)
+            size: Worker processes
+            dim: Embedding dimension
+            chunk_rows: Texts per task
+            cpu_affinity: CPUs to pin to; worker i gets an equal share (None = no pinning)
+            threads_per_worker: BLAS / OpenMP threads per worker (None = library default)
+        """
+        self.factory = factory
+        self.factory_args = tuple(factory_args)
+        self.size = size
+        self.dim = dim
+        self.chunk_rows = chunk_rows
+        self.cpu_affinity = list(cpu_affinity) if cpu_affinity else None
+        self.threads_per_worker = threads_per_worker
+
+        self._ctx = mp.get_context("spawn")  # fork is unsafe with torch / threads
+        self._tasks = None
+        self._results = None
+        self._workers: List = []
+        self._jobs: Dict[int, list] = {}      # job id → [chunks left, future, shm, rows, error]
+        self._job_ids = itertools.count()
+        self._lock = threading.Lock()
+        self._collector = None
+        self._closed = False
+        self._broken: Optional[str] = None    # set when a rebuilt worker failed to load
+        self.restarts = 0
+
+    # ── LIFECYCLE ─────────────────────────────────────────────────────────────
+
+    def _worker_cpus(self, index: int) -> Optional[List[int]]:
+        if not self.cpu_affinity:
+            return None
+        share = max(1, len(self.cpu_affinity) // self.size)
+        start = (index * share) % len(self.cpu_affinity)
+        return self.cpu_affinity[start:start + share]
+
+    def start(self, timeout: float = START_TIMEOUT) -> "EmbeddingProcessPool":
+        """
+        Spawn the workers and wait until each has loaded its model
+
+        Raises:
+            RuntimeError: A worker failed to load or did not report in time
+        """
+        self._spawn_workers()
+
+        pending = self.size
+        while pending:
+            try:
+                kind, index, error = self._results.get(timeout=timeout)
+            except queue.Empty:
+                self.close()
+                raise RuntimeError("Embedding workers did not start in time")
+            if kind == "failed":
+                self.close()
+                raise RuntimeError(f"Embedding worker {index} failed to load: {error}")
+            pending -= 1
+
+        self._collector = threading.Thread(target=self._collect, name="embedding-pool-collector", daemon=True)
+        self._collector.start()
+        return self
+
+    def _spawn_workers(self):
+        """Start `size` workers on fresh task / result queues"""
+        self._tasks = self._ctx.Queue()
+        self._results = self._ctx.Queue()
+        self._workers = []
+        for index in range(self.size):
+            worker = self._ctx.Process(
+                target=_worker_main, name=f"embedding-worker-{index}", daemon=True,
+                args=(index, self.factory, self.factory_args, self._worker_cpus(index),
+                      self.threads_per_worker, self._tasks, self._results)
+            )
+            worker.start()
+            self._workers.append(worker)
+
+    def _restart(self):
+        """Fail the requests in flight and rebuild the workers (runs on the collector thread)"""
+        with self._lock:
+            old = self._workers
+            jobs, self._jobs = self._jobs, {}
+            self._spawn_workers()
+            self.restarts += 1
+        print(f"⚠️  Embedding worker died (exit codes {[w.exitcode for w in old]}); restarted the pool")
+        for worker in old:
+            if worker.is_alive():
+                worker.terminate()
+            worker.join(timeout=5)
+        self._fail_jobs(jobs, RuntimeError("An embedding worker died"))
+
+    def close(self):
+        """Stop the workers; pending requests fail"""
+        self._closed = True
+        if self._tasks is None:
+            return
+        for _ in self._workers:
+            self._tasks.put(None)
+        for worker in self._workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        self._fail_pending(RuntimeError("Embedding pool closed"))
+
+    # ── REQUESTS ──────────────────────────────────────────────────────────────
+
+    def submit(self, texts: Sequence[str]) -> Future:
+        """
+        Encode texts across the workers
+
+        Returns:
+            Future resolving to SharedEmbeddings (call release() when done)
+        """
+        texts = list(texts)
+        if self._broken:
+            raise RuntimeError(f"Embedding pool stopped: {self._broken}")
+        if self._closed or self._collector is None:
+            raise RuntimeError("Embedding pool is not running")
+        future = Future()
+        shm = shared_memory.SharedMemory(create=True, size=max(1, len(texts)) * self.dim * 4)
+        if not texts:
+            future.set_result(SharedEmbeddings(shm, 0, self.dim))
+            return future
+
+        job_id = next(self._job_ids)
+        starts = range(0, len(texts), self.chunk_rows)
+        with self._lock:  # a restart swaps the queues and fails registered jobs together
+            self._jobs[job_id] = [len(starts), future, shm, len(texts), None]
+            for start in starts:
+                self._tasks.put((job_id, texts[start:start + self.chunk_rows], shm.name, len(texts), start, self.dim))
+        return future
+
+    @contextmanager
+    def lease(self, texts: Sequence[str]) -> Iterator[np.ndarray]:
+        """Zero-copy (n, dim) view of the shared output, valid inside the block"""
+        result = self.submit(texts).result()
+        try:
+            yield result.array
+        finally:
+            result.release()
+
+    def encode(self, texts: Union[str, Sequence[str]], **kwargs) -> np.ndarray:
+        """sentence-transformers call shape; copies the vectors out of shared memory"""
+        if isinstance(texts, str):
+            return self.encode([texts])[0]
+        with self.lease(texts) as vectors:
+            return vectors.copy()
+
+    # ── COLLECTOR ─────────────────────────────────────────────────────────────
+
+    def _collect(self):
+        while not self._closed:
+            if any(not worker.is_alive() for worker in self._workers) and not self._closed:
+                self._restart()
+            try:
+                kind, job_id, error = self._results.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                return
+            if kind == "ready":   # a rebuilt worker loaded its model
+                continue
+            if kind == "failed":
+                self._broken = f"worker {job_id} failed to load: {error}"
+                print(f"❌ Embedding pool stopped: {self._broken}")
+                self.close()
+                return
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    continue
+                job[0] -= 1
+                if kind == "error":
+                    job[4] = job[4] or error
+                if job[0]:
+                    continue
+                del self._jobs[job_id]
+            _, future, shm, rows, failure = job
+            if failure:
+                shm.close()
+                shm.unlink()
+                future.set_exception(RuntimeError(f"Embedding failed: {failure}"))
+            else:
+                future.set_result(SharedEmbeddings(shm, rows, self.dim))
+
+    def _fail_pending(self, error: Exception):
+        with self._lock:
+            jobs, self._jobs = self._jobs, {}
+        self._fail_jobs(jobs, error)
+
+    @staticmethod
+    def _fail_jobs(jobs: Dict[int, list], error: Exception):
+        for _, future, shm, _, _ in jobs.values():
+            shm.close()
+            shm.unlink()
+            if not future.done():
+                future.set_exception(error)
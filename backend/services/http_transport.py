@@ -0,0 +1,388 @@
+"""
+Shared HTTP Transport
+One pooled, keep-alive client for every outbound call (LLM APIs, Bedrock,
+scrapers, image downloads). Bare requests.get/post opened a new TCP + TLS
+connection per call.
+
+- a requests.Session whose adapter keeps one urllib3 connection pool per
+  host, with up to pool_maxsize idle keep-alive connections each
+- hosts in http2_hosts go through an httpx.Client(http2=True) when httpx and
+  h2 are installed; its responses become requests.Response objects and its
+  errors requests exceptions, so callers handle both paths alike
+- resolved addresses are cached for dns_ttl seconds (a getaddrinfo wrapper,
+  installed process-wide once)
+- optional per-host concurrency limits (one BoundedSemaphore per host)
+- prewarm(urls) opens connections, TLS handshake included, in the background
+- stream_lines() yields a streamed body (e.g. server-sent events) line by
+  line, holding the connection and its host slot until the caller finishes
+
+get_transport() builds the shared instance from Config once per process, so
+gunicorn --preload workers never share sockets inherited across fork(). The
+module-level request / get / post / head mirror the requests API.
+"""
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional, Sequence
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from config import Config
+
+try:
+    import h2  # noqa: F401 — httpx negotiates HTTP/2 only when h2 is installed
+    import httpx
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+POOL_HOSTS = 32            # per-host pools kept before the least recently used is closed
+POOL_MAXSIZE = 16          # keep-alive connections kept per host
+DNS_TTL = 300.0
+DNS_CACHE_SIZE = 1024
+PREWARM_TIMEOUT = 5.0
+_HTTP2_KWARGS = {"params", "headers", "json", "data", "timeout", "allow_redirects"}
+_RAW_VERSIONS = {10: "HTTP/1.0", 11: "HTTP/1.1"}
+
+
+def parse_host_limits(spec: str) -> Dict[str, int]:
+    """'api.groq.com=4,generativelanguage.googleapis.com=8' → {host: limit}"""
+    limits = {}
+    for part in filter(None, (p.strip() for p in (spec or "").split(","))):
+        host, _, limit = part.partition("=")
+        limits[host.strip().lower()] = int(limit)
+    return limits
+
+
+# ── DNS CACHE ─────────────────────────────────────────────────────────────────
+
+_system_getaddrinfo = socket.getaddrinfo
+_dns_cache: Dict[tuple, tuple] = {}
+_dns_lock = threading.Lock()
+_dns_stats = {"hits": 0, "misses": 0}
+_dns_ttl = 0.0
+
+
+def _cached_getaddrinfo(host, port, *args, **kwargs):
+    key = (host, port, args, tuple(sorted(kwargs.items())))
+    now = time.monotonic()
+    entry = _dns_cache.get(key)
+    if entry is not None and entry[0] > now:
+        _dns_stats["hits"] += 1
+        return entry[1]
+    result = _system_getaddrinfo(host, port, *args, **kwargs)
+    with _dns_lock:
+        _dns_stats["misses"] += 1
+        if len(_dns_cache) >= DNS_CACHE_SIZE:
+            _dns_cache.clear()
+        _dns_cache[key] = (now + _dns_ttl, result)
+    return result
+
+
+def install_dns_cache(ttl: float):
+    """Cache successful lookups for `ttl` seconds (0 leaves resolution untouched)"""
+    global _dns_ttl
+    _dns_ttl = ttl
+    if ttl > 0 and socket.getaddrinfo is not _cached_getaddrinfo:
+        socket.getaddrinfo = _cached_getaddrinfo
+
+
+# ── TRANSPORT ─────────────────────────────────────────────────────────────────
+
+class _CountingAdapter(HTTPAdapter):
+    """HTTPAdapter whose connection pools report every new connection"""
+
+    def __init__(self, on_connect, **kwargs):
+        self._on_connect = on_connect
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        on_connect = self._on_connect
+
+        def counting(base):
+            def _new_conn(pool):
+                on_connect(pool.host)
+                return base._new_conn(pool)
+            return type(base.__name__, (base,), {"_new_conn": _new_conn})
+
+        manager = self.poolmanager
+        manager.pool_classes_by_scheme = {
+            scheme: counting(base) for scheme, base in manager.pool_classes_by_scheme.items()
+        }
+
+
+class HTTPTransport:
+    """Thread-safe pooled HTTP client with per-host limits and reuse metrics"""
+
+    def __init__(
+        self,
+        pool_maxsize: int = POOL_MAXSIZE,
+        host_limits: Optional[Dict[str, int]] = None,
+        default_host_limit: int = 0,
+        dns_ttl: float = DNS_TTL,
+        http2_hosts: Sequence[str] = ()
+    ):
+        """
+        Args:
+            pool_maxsize: Keep-alive connections kept per host
+            host_limits: Max concurrent requests per host
+            default_host_limit: Limit for hosts not in host_limits (0 = unlimited)
+            dns_ttl: Seconds a DNS answer is reused (0 = no caching)
+            http2_hosts: Hosts sent over HTTP/2 when httpx + h2 are installed
+        """
+        self.host_limits = {h.lower(): n for h, n in (host_limits or {}).items()}
+        self.default_host_limit = default_host_limit
+        self.http2_hosts = {h.lower() for h in http2_hosts} if HTTP2_AVAILABLE else set()
+        install_dns_cache(dns_ttl)
+
+        self.session = requests.Session()
+        adapter = _CountingAdapter(self._connection_opened, pool_connections=POOL_HOSTS,
+                                   pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._http2 = None
+        if self.http2_hosts:
+            self._http2 = httpx.Client(http2=True, limits=httpx.Limits(
+                max_connections=None, max_keepalive_connections=pool_maxsize))
+
+        self._lock = threading.Lock()
+        self._limiters: Dict[str, Optional[threading.BoundedSemaphore]] = {}
+        self._hosts: Dict[str, Dict] = {}
+        self._prewarmed = False
+
+    # ── REQUESTS ──────────────────────────────────────────────────────────────
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Send a request over a pooled connection (requests.request signature)
+
+        Raises:
+            requests.RequestException: As requests would, on either protocol
+        """
+        host = (urlsplit(url).hostname or "").lower()
+        with self._tracked(host) as stats:
+            if host in self.http2_hosts and set(kwargs) <= _HTTP2_KWARGS:
+                response = self._send_http2(method, url, **kwargs)
+            else:
+                response = self.session.request(method, url, **kwargs)
+            self._count_protocol(stats, response)
+            return response
+
+    def stream_lines(self, method: str, url: str, **kwargs) -> Iterator[str]:
+        """
+        Send a request and yield its body line by line as it arrives
+
+        The connection and the host's concurrency slot are held until the
+        generator is exhausted or closed. Streams always use the HTTP/1.1
+        session.
+
+        Raises:
+            requests.HTTPError: For a non-2xx status, before any line is yielded
+        """
+        host = (urlsplit(url).hostname or "").lower()
+        with self._tracked(host) as stats:
+            with self.session.request(method, url, stream=True, **kwargs) as response:
+                self._count_protocol(stats, response)
+                response.raise_for_status()
+                for line in response.iter_lines(chunk_size=None):
+                    yield line.decode("utf-8", errors="replace")
+
+    @contextmanager
+    def _tracked(self, host: str):
+        """Hold a host slot for one request and count it"""
+        limiter = self._limiter(host)
+        started = time.perf_counter()
+        if limiter is not None:
+            limiter.acquire()
+        stats = self._host_stats(host)
+        with self._lock:
+            stats["wait_ms"] += (time.perf_counter() - started) * 1000
+            stats["requests"] += 1
+            stats["in_flight"] += 1
+            stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        try:
+            yield stats
+        except Exception:
+            with self._lock:
+                stats["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                stats["in_flight"] -= 1
+            if limiter is not None:
+                limiter.release()
+
+    def _count_protocol(self, stats: Dict, response: requests.Response):
+        protocol = getattr(response, "http_version", None) \
+            or _RAW_VERSIONS.get(getattr(response.raw, "version", None), "HTTP/1.1")
+        with self._lock:
+            stats["protocols"][protocol] = stats["protocols"].get(protocol, 0) + 1
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def head(self, url: str, **kwargs) -> requests.Response:
+        return self.request("HEAD", url, **kwargs)
+
+    def _send_http2(self, method: str, url: str, params=None, headers=None, json=None,
+                    data=None, timeout=None, allow_redirects=True) -> requests.Response:
+        """httpx request, converted to the requests response / exception types"""
+        if isinstance(timeout, tuple):
+            timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+        body = {"data": data} if isinstance(data, dict) else {"content": data}
+        try:
+            r = self._http2.request(method, url, params=params, headers=headers, json=json,
+                                    timeout=timeout, follow_redirects=allow_redirects, **body)
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(str(e)) from e
+        except httpx.TransportError as e:
+            raise requests.exceptions.ConnectionError(str(e)) from e
+
+        response = requests.Response()
+        response.status_code = r.status_code
+        response.headers = CaseInsensitiveDict(r.headers)
+        response._content = r.content
+        response.encoding = r.encoding
+        response.url = str(r.url)
+        response.reason = r.reason_phrase
+        response.elapsed = r.elapsed
+        response.http_version = r.http_version
+        return response
+
+    # ── LIMITS & METRICS ──────────────────────────────────────────────────────
+
+    def _limiter(self, host: str) -> Optional[threading.BoundedSemaphore]:
+        if host not in self._limiters:
+            with self._lock:
+                if host not in self._limiters:
+                    limit = self.host_limits.get(host, self.default_host_limit)
+                    self._limiters[host] = threading.BoundedSemaphore(limit) if limit > 0 else None
+        return self._limiters[host]
+
+    def _host_stats(self, host: str) -> Dict:
+        stats = self._hosts.get(host)
+        if stats is None:
+            with self._lock:
+                stats = self._hosts.setdefault(host, {
+                    "requests": 0, "errors": 0, "new_connections": 0, "in_flight": 0,
+                    "max_in_flight": 0, "wait_ms": 0.0, "protocols": {}
+                })
+        return stats
+
+    def _connection_opened(self, host: str):
+        stats = self._host_stats((host or "").lower())
+        with self._lock:
+            stats["new_connections"] += 1
+
+    def metrics(self) -> Dict:
+        """
+        Per-host request, connection-reuse and limiter counters
+
+        new_connections counts the pooled HTTP/1.1 path only; HTTP/2 requests
+        are multiplexed over httpx's own connections.
+        """
+        with self._lock:
+            hosts = {}
+            for host, stats in self._hosts.items():
+                pooled = stats["requests"] - stats["protocols"].get("HTTP/2", 0)
+                hosts[host] = {
+                    **stats,
+                    "protocols": dict(stats["protocols"]),
+                    "wait_ms": round(stats["wait_ms"], 2),
+                    "reused_connections": max(0, pooled - stats["new_connections"]),
+                    "reuse_ratio": round(1 - stats["new_connections"] / pooled, 3) if pooled else None,
+                    "limit": self.host_limits.get(host, self.default_host_limit) or None
+                }
+        totals = {key: sum(h[key] for h in hosts.values())
+                  for key in ("requests", "errors", "new_connections", "reused_connections")}
+        return {
+            "http2_enabled": bool(self.http2_hosts),
+            "dns_cache": {"ttl": _dns_ttl, "entries": len(_dns_cache), **_dns_stats},
+            "totals": totals,
+            "hosts": hosts
+        }
+
+    # ── LIFECYCLE ─────────────────────────────────────────────────────────────
+
+    def prewarm(self, urls: Iterable[str], timeout: float = PREWARM_TIMEOUT) -> Optional[threading.Thread]:
+        """
+        Open a keep-alive connection to each URL's origin on a background thread
+
+        Only the first call per transport does anything; failures are ignored.
+        """
+        if self._prewarmed:
+            return None
+        with self._lock:
+            if self._prewarmed:
+                return None
+            self._prewarmed = True
+        origins = sorted({f"{p.scheme}://{p.netloc}/" for p in map(urlsplit, urls) if p.netloc})
+
+        def warm():
+            for origin in origins:
+                try:
+                    self.head(origin, timeout=timeout, allow_redirects=False)
+                except Exception:
+                    pass
+
+        thread = threading.Thread(target=warm, name="http-prewarm", daemon=True)
+        thread.start()
+        return thread
+
+    def close(self):
+        self.session.close()
+        if self._http2 is not None:
+            self._http2.close()
+
+
+# ── SHARED INSTANCE ───────────────────────────────────────────────────────────
+
+_transport: Optional[HTTPTransport] = None
+_transport_pid: Optional[int] = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> HTTPTransport:
+    """The process-wide transport (rebuilt in a forked child)"""
+    global _transport, _transport_pid
+    if _transport is None or _transport_pid != os.getpid():
+        with _transport_lock:
+            if _transport is None or _transport_pid != os.getpid():
+                _transport = HTTPTransport(
+                    pool_maxsize=Config.HTTP_POOL_MAXSIZE,
+                    host_limits=parse_host_limits(Config.HTTP_HOST_LIMITS),
+                    default_host_limit=Config.HTTP_DEFAULT_HOST_LIMIT,
+                    dns_ttl=Config.HTTP_DNS_TTL,
+                    http2_hosts=[h.strip() for h in Config.HTTP2_HOSTS.split(",") if h.strip()]
+                )
+                _transport_pid = os.getpid()
+    return _transport
+
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    return get_transport().request(method, url, **kwargs)
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return get_transport().request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return get_transport().request("POST", url, **kwargs)
+
+
+def head(url: str, **kwargs) -> requests.Response:
+    return get_transport().request("HEAD", url, **kwargs)
+
+
+def stream_lines(method: str, url: str, **kwargs) -> Iterator[str]:
+    return get_transport().stream_lines(method, url, **kwargs)
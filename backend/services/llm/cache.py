@@ -0,0 +1,424 @@
+"""
+LLM Response Cache
+Exact and semantic reuse of LLM answers, in memory and in SQLite.
+
+Many calls repeat: emotion tagging of the same captions on every re-scrape,
+creative prompts for the same caption and format, generation for the same
+topics. Two tiers answer them without a provider round trip:
+
+- exact: SHA-256 of (namespace, normalized prompt). The namespace names the
+  provider / model / template, so equal prompts to different models never
+  collide. Entries expire after `ttl` seconds.
+- semantic (opt-in per call): the caller passes `semantic_text`, the
+  variable part of the prompt (e.g. the caption, not the template around
+  it). Its embedding is compared with earlier ones in the same namespace,
+  and the closest answer is served if the cosine is at least `threshold`.
+
+Memory is a bounded LRU; SQLite (WAL) persists entries across restarts and
+is shared by every worker (each opening its own connection on first use),
+trimmed to `disk_capacity` rows. Concurrent misses on the same key wait for
+one provider call instead of each making their own. Answers that fail `cacheable` (error strings, parse failures) are
+returned but never stored.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import Config
+from services.embedding.cache import normalize_text
+
+MEMORY_CAPACITY = 5000
+DISK_CAPACITY = 100_000
+TTL_SECONDS = 86_400.0
+SEMANTIC_THRESHOLD = 0.95
+SEMANTIC_CAPACITY = 5000   # prompt embeddings kept per namespace
+_TRIM_EVERY = 100          # stores between disk trims
+
+
+def response_key(namespace: str, prompt: str) -> bytes:
+    """SHA-256 of namespace + normalized prompt"""
+    return hashlib.sha256(f"{namespace}\0{normalize_text(prompt)}".encode("utf-8")).digest()
+
+
+class _SemanticIndex:
+    """Unit-norm prompt embeddings of one namespace, newest last"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.keys: List[bytes] = []
+        self.created: List[float] = []
+        self.rows: List[np.ndarray] = []
+        self._matrix: Optional[np.ndarray] = None
+
+    def add(self, key: bytes, vector: np.ndarray, created: float):
+        self.keys.append(key)
+        self.rows.append(vector)
+        self.created.append(created)
+        if len(self.keys) > self.capacity:
+            del self.keys[0], self.rows[0], self.created[0]
+        self._matrix = None
+
+    def best(self, vector: np.ndarray) -> Tuple[Optional[int], float]:
+        if not self.rows:
+            return None, 0.0
+        if self._matrix is None:
+            self._matrix = np.stack(self.rows)
+        scores = self._matrix @ vector
+        index = int(np.argmax(scores))
+        return index, float(scores[index])
+
+
+class LLMResponseCache:
+    """Exact + semantic LLM answer cache with hit / latency-saved counters"""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        capacity: int = MEMORY_CAPACITY,
+        ttl: float = TTL_SECONDS,
+        disk_capacity: int = DISK_CAPACITY,
+        semantic_threshold: float = SEMANTIC_THRESHOLD,
+        semantic_capacity: int = SEMANTIC_CAPACITY
+    ):
+        """
+        Args:
+            path: SQLite file for the persistent tier (None = memory only)
+            capacity: Answers kept in memory
+            ttl: Seconds an answer stays valid (0 = forever)
+            disk_capacity: Rows kept in SQLite (oldest trimmed first)
+            semantic_threshold: Minimum cosine for a semantic hit
+            semantic_capacity: Prompt embeddings kept per namespace
+        """
+        self.path = path
+        self.capacity = capacity
+        self.ttl = ttl
+        self.disk_capacity = disk_capacity
+        self.semantic_threshold = semantic_threshold
+        self.semantic_capacity = semantic_capacity
+
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[bytes, Tuple[str, float, float]]" = OrderedDict()
+        self._semantic: Dict[str, _SemanticIndex] = {}
+        self._inflight: Dict[bytes, Future] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_pid: Optional[int] = None
+        self._semantic_pid: Optional[int] = None   # process whose stored embeddings are loaded
+        self._embed_fn: Optional[Callable[[List[str]], np.ndarray]] = None
+        self._embed_model: Optional[str] = None
+        self._stores_since_trim = 0
+
+        self.counters = {
+            "memory_hits": 0, "disk_hits": 0, "semantic_hits": 0, "coalesced": 0,
+            "misses": 0, "stores": 0, "uncacheable": 0, "latency_saved_ms": 0.0
+        }
+
+    @property
+    def _db(self) -> Optional[sqlite3.Connection]:
+        """This process's connection, opened on first use (callers hold _lock)"""
+        if self.path is None:
+            return None
+        if self._conn is None or self._conn_pid != os.getpid():
+            self._conn = self._open_db(self.path)   # a parent's connection is left untouched
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    @staticmethod
+    def _open_db(path: str) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key BLOB PRIMARY KEY, namespace TEXT NOT NULL, "
+            "value TEXT NOT NULL, created REAL NOT NULL, latency_ms REAL NOT NULL, "
+            "embed_model TEXT, vector BLOB)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS responses_created ON responses (created)")
+        db.commit()
+        return db
+
+    def enable_semantic(self, embed_fn: Callable[[List[str]], np.ndarray], model_id: str):
+        """
+        Turn on the semantic tier for embeddings made by `model_id`
+
+        Stored embeddings are loaded on first use, in the process that uses
+        them (so a pre-fork call leaves workers to read their own rows).
+
+        Args:
+            embed_fn: Texts → (n, dim) vectors
+            model_id: Embedding model name; vectors from other models are ignored
+        """
+        with self._lock:
+            self._embed_fn = embed_fn
+            self._embed_model = model_id
+            self._semantic = {}
+            self._semantic_pid = None
+
+    def _load_semantic(self):
+        """Load this process's stored embeddings once (callers hold _lock)"""
+        if self._embed_fn is None or self._semantic_pid == os.getpid():
+            return
+        self._semantic = {}
+        self._semantic_pid = os.getpid()
+        if self.path is None:
+            return
+        rows = self._db.execute(
+            "SELECT key, namespace, vector, created FROM responses "
+            "WHERE vector IS NOT NULL AND embed_model = ? AND created > ? ORDER BY created",
+            (self._embed_model, self._oldest_valid())
+        ).fetchall()
+        for key, namespace, blob, created in rows:
+            self._index(namespace).add(key, np.frombuffer(blob, dtype=np.float32), created)
+
+    # ── LOOKUP ────────────────────────────────────────────────────────────────
+
+    def get_or_call(
+        self,
+        namespace: str,
+        prompt: str,
+        call: Callable[[], Any],
+        semantic_text: Optional[str] = None,
+        cacheable: Optional[Callable[[Any], bool]] = None,
+        fresh: bool = False
+    ) -> Any:
+        """
+        Cached answer for (namespace, prompt), else call() and store its result
+
+        Args:
+            namespace: Provider / model / template the prompt belongs to
+            prompt: Full prompt text (exact key)
+            call: Makes the provider request; its result must be JSON-serializable
+            semantic_text: Variable part of the prompt, enabling the semantic tier
+            cacheable: Predicate a fresh result must pass to be stored
+            fresh: Skip lookups (the new answer still replaces the cached one)
+
+        Returns:
+            The cached or fresh answer (a new copy for every caller)
+        """
+        key = response_key(namespace, prompt)
+        if not fresh:
+            hit = self._lookup(key)
+            if hit is not None:
+                return hit
+
+        vector = self._embed(semantic_text) if semantic_text else None
+        if vector is not None and not fresh:
+            hit = self._lookup_semantic(namespace, vector)
+            if hit is not None:
+                return hit
+
+        with self._lock:
+            pending = self._inflight.get(key)
+            if pending is None:
+                self._inflight[key] = leader = Future()
+        if pending is not None:
+            self.counters["coalesced"] += 1
+            return json.loads(json.dumps(pending.result()))
+
+        try:
+            started = time.perf_counter()
+            value = call()
+            latency_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self.counters["misses"] += 1
+            if cacheable is None or cacheable(value):
+                self._store(key, namespace, value, latency_ms, vector)
+            else:
+                with self._lock:
+                    self.counters["uncacheable"] += 1
+            leader.set_result(value)
+            return value
+        except BaseException as e:
+            leader.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def peek(self, namespace: str, prompt: str, semantic_text: Optional[str] = None) -> Optional[Any]:
+        """
+        Cached answer for (namespace, prompt) without calling anything
+
+        For callers that fetch answers in bulk (e.g. one batched prompt for
+        many items) and store them per item with put().
+
+        Returns:
+            The cached answer, or None (counted as a miss)
+        """
+        hit = self._lookup(response_key(namespace, prompt))
+        if hit is None and semantic_text:
+            vector = self._embed(semantic_text)
+            if vector is not None:
+                hit = self._lookup_semantic(namespace, vector)
+        if hit is None:
+            with self._lock:
+                self.counters["misses"] += 1
+        return hit
+
+    def put(self, namespace: str, prompt: str, value: Any, semantic_text: Optional[str] = None,
+            latency_ms: float = 0.0):
+        """Store an answer obtained outside get_or_call() (see peek())"""
+        vector = self._embed(semantic_text) if semantic_text else None
+        self._store(response_key(namespace, prompt), namespace, value, latency_ms, vector)
+
+    def _oldest_valid(self) -> float:
+        return time.time() - self.ttl if self.ttl > 0 else 0.0
+
+    def _lookup(self, key: bytes, semantic: bool = False) -> Optional[Any]:
+        """Live answer for key, counted as a semantic hit or by the tier that held it"""
+        with self._lock:
+            entry = self._memory.get(key)
+            tier = "memory_hits"
+            if entry is not None:
+                self._memory.move_to_end(key)
+            elif self.path is not None:
+                row = self._db.execute(
+                    "SELECT value, created, latency_ms FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    entry = tuple(row)
+                    self._remember(key, entry)
+                    tier = "disk_hits"
+            if entry is None or entry[1] <= self._oldest_valid():
+                return None
+            # Counted from this entry, under the same lock: it may be evicted once released
+            self.counters["semantic_hits" if semantic else tier] += 1
+            self.counters["latency_saved_ms"] += entry[2]
+        return json.loads(entry[0])
+
+    def _lookup_semantic(self, namespace: str, vector: np.ndarray) -> Optional[Any]:
+        with self._lock:
+            self._load_semantic()
+            index = self._semantic.get(namespace)
+            if index is None:
+                return None
+            position, score = index.best(vector)
+            if position is None or score < self.semantic_threshold \
+                    or index.created[position] <= self._oldest_valid():
+                return None
+            key = index.keys[position]
+        return self._lookup(key, semantic=True)
+
+    def _embed(self, text: str) -> Optional[np.ndarray]:
+        """Unit-norm embedding of text, or None (tier off, or the embedder failed)"""
+        if self._embed_fn is None:
+            return None
+        try:
+            vector = np.asarray(self._embed_fn([text]), dtype=np.float32).reshape(-1)
+        except Exception:
+            return None  # e.g. the embedding model is still loading: exact tier only
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else None
+
+    # ── STORE ─────────────────────────────────────────────────────────────────
+
+    def _index(self, namespace: str) -> _SemanticIndex:
+        index = self._semantic.get(namespace)
+        if index is None:
+            index = self._semantic[namespace] = _SemanticIndex(self.semantic_capacity)
+        return index
+
+    def _remember(self, key: bytes, entry: Tuple[str, float, float]):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.capacity:
+            self._memory.popitem(last=False)
+
+    def _store(self, key: bytes, namespace: str, value: Any, latency_ms: float, vector: Optional[np.ndarray]):
+        entry = (json.dumps(value), time.time(), latency_ms)
+        with self._lock:
+            self._remember(key, entry)
+            self.counters["stores"] += 1
+            if vector is not None:
+                self._load_semantic()
+                self._index(namespace).add(key, vector, entry[1])
+            db = self._db
+            if db is None:
+                return
+            db.execute(
+                "INSERT OR REPLACE INTO responses (key, namespace, value, created, latency_ms, embed_model, vector) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, namespace, entry[0], entry[1], latency_ms,
+                 self._embed_model if vector is not None else None,
+                 vector.tobytes() if vector is not None else None)
+            )
+            self._stores_since_trim += 1
+            if self._stores_since_trim >= _TRIM_EVERY:
+                self._stores_since_trim = 0
+                db.execute("DELETE FROM responses WHERE created <= ?", (self._oldest_valid(),))
+                db.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses "
+                    "ORDER BY created DESC LIMIT -1 OFFSET ?)", (self.disk_capacity,)
+                )
+            db.commit()
+
+    # ── STATS ─────────────────────────────────────────────────────────────────
+
+    def stats(self) -> Dict:
+        """Hit / miss counters, hit rate and provider time saved"""
+        with self._lock:
+            self._load_semantic()
+            counters = dict(self.counters)
+            hits = counters["memory_hits"] + counters["disk_hits"] + counters["semantic_hits"] + counters["coalesced"]
+            lookups = hits + counters["misses"]
+            return {
+                **counters,
+                "latency_saved_ms": round(counters["latency_saved_ms"], 1),
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "semantic_entries": sum(len(index.keys) for index in self._semantic.values()),
+                "semantic_enabled": self._embed_fn is not None,
+                "persistent": self.path is not None
+            }
+
+
+# ── SHARED INSTANCE ───────────────────────────────────────────────────────────
+
+_shared: Optional[LLMResponseCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMResponseCache:
+    """Process-wide cache configured from Config (exact tier until enable_semantic())"""
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = LLMResponseCache(
+                    path=Config.LLM_CACHE_PATH or None,
+                    capacity=Config.LLM_CACHE_SIZE,
+                    ttl=Config.LLM_CACHE_TTL,
+                    disk_capacity=Config.LLM_CACHE_DISK_SIZE,
+                    semantic_threshold=Config.LLM_CACHE_SEMANTIC_THRESHOLD
+                )
+    return _shared
+
+
+def cached_invoke_json(provider: str):
+    """
+    Serve an ads client's invoke_json(prompt, max_tokens) from the shared cache
+
+    The namespace is provider + the client's model + max_tokens. Results
+    carrying an "error" key are not stored; fresh=True forces a new answer.
+    """
+    def decorate(method):
+        @wraps(method)
+        def wrapper(self, prompt: str, max_tokens: int = 1500, fresh: bool = False) -> dict:
+            return get_llm_cache().get_or_call(
+                f"{provider}:{getattr(self, 'model', '')}:json:{max_tokens}",
+                prompt,
+                lambda: method(self, prompt, max_tokens),
+                cacheable=lambda result: isinstance(result, dict) and "error" not in result,
+                fresh=fresh
+            )
+        return wrapper
+    return decorate
@@ -0,0 +1,212 @@
+"""
+Batched LLM Classification
+Labels many short texts (e.g. emotion-tagging scraped captions) with a few
+multi-item prompts instead of one prompt per text.
+
+A one-per-caption prompt repeats the same instruction block every time and
+spends a request of the provider's quota on a one-word answer.
+BatchClassifier.classify():
+
+1. serves texts it has already labelled from the LLM response cache (exact
+   or near-duplicate, stored per text, so a caption keeps its label whichever
+   batch it arrives in);
+2. packs the rest into numbered batches sized by a token estimate
+   (`max_prompt_tokens`, `max_items`), each asking for a JSON array of labels;
+3. checks that each answer is an array with one allowed label per item. A
+   malformed answer is split in half and retried, down to single items; an
+   item that still fails gets `default` and is not cached. A provider error
+   (see `is_answer`) fails its batch without retries, so a rate-limited
+   provider is not hit with more calls.
+
+Batches run through `map_fn` (e.g. the bounded fan-out executor), so several
+go out at once. stats() reports how many provider calls batching saved.
+"""
+import json
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from services.llm.quota import estimate_tokens
+
+ITEM_OVERHEAD_TOKENS = 6     # numbering, newline
+MAX_PROMPT_TOKENS = 2000
+MAX_ITEMS = 25
+MAX_ITEM_CHARS = 200
+
+_ARRAY = re.compile(r"\[[\s\S]*\]")
+
+
+def _serial_map(fn: Callable[[Any], Any], items: List[Any]) -> List[Any]:
+    return [fn(item) for item in items]
+
+
+class BatchClassifier:
+    """Assigns each text one label from a fixed set, many texts per prompt"""
+
+    def __init__(
+        self,
+        call: Callable[[str], str],
+        labels: Sequence[str],
+        task: str,
+        default: str = "Unknown",
+        max_prompt_tokens: int = MAX_PROMPT_TOKENS,
+        max_items: int = MAX_ITEMS,
+        max_item_chars: int = MAX_ITEM_CHARS,
+        map_fn: Callable[[Callable[[Any], Any], List[Any]], List[Any]] = _serial_map,
+        cache=None,
+        namespace: str = "classify",
+        is_answer: Callable[[str], bool] = bool
+    ):
+        """
+        Args:
+            call: Sends a prompt to the provider and returns its raw text
+            labels: Allowed labels
+            task: What to judge, e.g. "the emotional tone of each numbered social media post"
+            default: Label for items that cannot be classified
+            max_prompt_tokens: Estimated prompt size limit per batch
+            max_items: Items per batch limit
+            max_item_chars: Each text is truncated to this many characters
+            map_fn: Runs the batch function over the batches (serial by default)
+            cache: Optional LLMResponseCache holding one label per text
+            namespace: Cache namespace (should name the provider / model / task)
+            is_answer: False for raw results that are provider errors, not answers
+        """
+        self.call = call
+        self.labels = list(labels)
+        self.task = task
+        self.default = default
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_items = max_items
+        self.max_item_chars = max_item_chars
+        self.map_fn = map_fn
+        self.cache = cache
+        self.namespace = namespace
+        self.is_answer = is_answer
+        self._canonical = {label.lower(): label for label in self.labels}
+        self._base_tokens = estimate_tokens(self.build_prompt([]))
+        self._lock = threading.Lock()
+        self.counters = {"items": 0, "cached": 0, "classified": 0, "defaulted": 0,
+                         "calls": 0, "batches": 0, "splits": 0, "provider_errors": 0}
+
+    # ── PROMPT ────────────────────────────────────────────────────────────────
+
+    def _clip(self, text: str) -> str:
+        return " ".join(text.split())[:self.max_item_chars]
+
+    def build_prompt(self, texts: List[str]) -> str:
+        """Numbered multi-item prompt asking for a JSON array of len(texts) labels"""
+        items = "\n".join(f"{i}. {self._clip(text)}" for i, text in enumerate(texts, 1))
+        return f"""Classify {self.task}.
+
+Choose each label from: {", ".join(self.labels)}
+
+Items:
+{items}
+
+Return ONLY a JSON array of exactly {len(texts)} labels, one per item, in item order, e.g. ["{self.labels[0]}"]."""
+
+    def parse(self, raw: str, expected: int) -> Optional[List[str]]:
+        """
+        Labels from a batch answer
+
+        Returns:
+            `expected` canonical labels, or None if the answer is not a JSON
+            array of that length or contains a label outside the set
+        """
+        match = _ARRAY.search(raw or "")
+        if not match:
+            return None
+        try:
+            values = json.loads(match.group(0))
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(values, list) or len(values) != expected:
+            return None
+        labels = [self._canonical.get(str(value).strip().strip(".,!?").lower()) for value in values]
+        return None if None in labels else labels
+
+    def _batches(self, texts: List[str]) -> List[List[str]]:
+        """Greedy packing by estimated prompt tokens and item count"""
+        batches, current, tokens = [], [], self._base_tokens
+        for text in texts:
+            cost = estimate_tokens(self._clip(text)) + ITEM_OVERHEAD_TOKENS
+            if current and (len(current) >= self.max_items or tokens + cost > self.max_prompt_tokens):
+                batches.append(current)
+                current, tokens = [], self._base_tokens
+            current.append(text)
+            tokens += cost
+        if current:
+            batches.append(current)
+        return batches
+
+    # ── CLASSIFY ──────────────────────────────────────────────────────────────
+
+    def _run(self, texts: List[str]) -> List[Optional[str]]:
+        """Labels for one batch; halves and retries on a malformed answer"""
+        with self._lock:
+            self.counters["calls"] += 1
+        try:
+            raw = self.call(self.build_prompt(texts))
+        except Exception as e:
+            print(f"⚠️  Batch classification call failed: {type(e).__name__}: {e}")
+            raw = None
+        if not raw or not self.is_answer(raw):
+            with self._lock:
+                self.counters["provider_errors"] += 1
+            return [None] * len(texts)
+        labels = self.parse(raw, len(texts))
+        if labels is not None:
+            return labels
+        if len(texts) == 1:
+            return [None]
+        with self._lock:
+            self.counters["splits"] += 1
+        middle = len(texts) // 2
+        return self._run(texts[:middle]) + self._run(texts[middle:])
+
+    def classify(self, texts: Sequence[str]) -> List[str]:
+        """
+        Label every text
+
+        Args:
+            texts: Texts to classify
+
+        Returns:
+            One label per text, in input order (`default` where classification failed)
+        """
+        keys = [self._clip(text) for text in texts]
+        known: Dict[str, str] = {}
+        todo: List[str] = []
+        cached = 0
+        for key in dict.fromkeys(keys):  # identical texts are classified once
+            hit = self.cache.peek(self.namespace, key, semantic_text=key) if self.cache is not None else None
+            if hit in self.labels:
+                known[key] = hit
+                cached += 1
+            else:
+                todo.append(key)
+
+        batches = self._batches(todo)
+        for batch, labels in zip(batches, self.map_fn(self._run, batches)):
+            for key, label in zip(batch, labels or [None] * len(batch)):  # None: the batch timed out
+                if label is None:
+                    continue
+                known[key] = label
+                if self.cache is not None:
+                    self.cache.put(self.namespace, key, label, semantic_text=key)
+
+        results = [known.get(key, self.default) for key in keys]
+        with self._lock:
+            self.counters["items"] += len(texts)
+            self.counters["cached"] += cached
+            self.counters["classified"] += len(todo)
+            self.counters["defaulted"] += sum(key not in known for key in keys)
+            self.counters["batches"] += len(batches)
+        return results
+
+    def stats(self) -> Dict:
+        """Counters plus provider calls saved versus one prompt per uncached text"""
+        with self._lock:
+            counters = dict(self.counters)
+        counters["calls_saved"] = counters["classified"] - counters["calls"]
+        return counters
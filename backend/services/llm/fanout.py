@@ -0,0 +1,102 @@
+"""
+Bounded LLM Fan-Out
+Runs one LLM call per item (e.g. emotion-tagging scraped posts) concurrently.
+
+A scrape used to tag its posts one after another, so a request waited for
+the sum of every round trip. FanOutExecutor.map() submits the items to a
+shared pool of `max_concurrency` threads (the calls are network-bound and
+release the GIL), keeps results in input order, and gives up on an item
+`timeout` seconds after it started: that item gets the default value while
+the rest of the batch still completes. Wall time approaches the slowest call
+instead of the total.
+
+Rate limits are not applied here: the quota scheduler (services/llm/quota.py)
+admits each provider call itself, so cache hits cost nothing and every
+caller of that provider shares the budget.
+"""
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+MAX_CONCURRENCY = 8
+ITEM_TIMEOUT = 20.0        # seconds an item may run before it degrades to the default
+_IDLE_POLL = 0.05          # seconds between checks while no item has started yet
+
+
+class FanOutExecutor:
+    """Order-preserving concurrent map with per-item timeouts"""
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY, timeout: float = ITEM_TIMEOUT,
+                 name: str = "llm-fanout"):
+        """
+        Args:
+            max_concurrency: Items in flight at once, across all concurrent map() calls
+            timeout: Seconds an item may run before map() stops waiting for it
+            name: Thread name prefix
+        """
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self.counters = {"items": 0, "completed": 0, "timed_out": 0, "failed": 0, "batches": 0}
+
+    def map(
+        self,
+        fn: Callable[[Any], Any],
+        items: Iterable[Any],
+        default: Any = None,
+        timeout: Optional[float] = None
+    ) -> List[Any]:
+        """
+        fn(item) for every item, concurrently
+
+        Args:
+            fn: Called once per item on a pool thread
+            items: Inputs
+            default: Result for items that raise or time out
+            timeout: Per-item limit in seconds, counted from when the item starts
+
+        Returns:
+            Results in input order
+        """
+        limit = self.timeout if timeout is None else timeout
+        items = list(items)
+        results = [default] * len(items)
+        started: List[Optional[float]] = [None] * len(items)
+
+        def run(index: int, item: Any):
+            started[index] = time.monotonic()
+            return fn(item)
+
+        futures = {self._pool.submit(run, i, item): i for i, item in enumerate(items)}
+        pending = set(futures)
+        completed = failed = timed_out = 0
+        while pending:
+            deadlines = [started[futures[f]] + limit for f in pending if started[futures[f]] is not None]
+            wait_for = max(0.0, min(deadlines) - time.monotonic()) if deadlines else _IDLE_POLL
+            done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    results[futures[future]] = future.result()
+                    completed += 1
+                except Exception as e:
+                    failed += 1
+                    print(f"⚠️  Fan-out item failed: {type(e).__name__}: {e}")
+
+            now = time.monotonic()
+            expired = {f for f in pending if started[futures[f]] is not None and now >= started[futures[f]] + limit}
+            timed_out += len(expired)
+            pending -= expired  # left running on its thread; its result is discarded
+
+        with self._lock:
+            self.counters["batches"] += 1
+            self.counters["items"] += len(items)
+            self.counters["completed"] += completed
+            self.counters["failed"] += failed
+            self.counters["timed_out"] += timed_out
+        return results
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            return {"max_concurrency": self.max_concurrency, "item_timeout": self.timeout, **self.counters}
@@ -0,0 +1,139 @@
+"""
+LLM JSON Extraction
+Pulls the first top-level JSON object out of an LLM answer, whatever
+surrounds it (``` fences, a "Here is your JSON:" preamble, closing chatter),
+for every caller that used to clean answers up itself.
+
+- extract_json() jumps to each '{' with str.find and lets the C decoder
+  (json.JSONDecoder.raw_decode) read the object from there; prose braces
+  fail within a few characters, so the text is decoded essentially once.
+  Raw newlines inside strings, which models often emit, are accepted.
+- repair_truncated() rescues an answer cut off at max_tokens: it keeps
+  the longest prefix that ends on a complete member, drops a half-written
+  array element, and closes the open arrays / objects. extract_json() uses
+  it when the object never closes.
+
+Streamed answers are read by services/llm/streaming.JSONFieldStream, which
+falls back to extract_json() when its object does not close.
+"""
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+_decoder = json.JSONDecoder(strict=False)
+
+# A complete string, a lone quote (string still open), or structure / scalars
+_TOKENS = re.compile(r'"(?:[^"\\]|\\.)*"|"|[{}\[\]:,]|[^\s{}\[\]:,"]+', re.DOTALL)
+
+
+def _truncated(error: json.JSONDecodeError, text: str) -> bool:
+    """Whether decoding failed because the text ended inside the object"""
+    return error.msg.startswith("Unterminated string") or error.pos >= len(text.rstrip())
+
+
+def extract_json(text: str, repair: bool = True) -> Optional[Dict[str, Any]]:
+    """
+    First top-level JSON object in `text`
+
+    Args:
+        text: LLM answer
+        repair: Close an object cut off at the end of the text (see repair_truncated)
+
+    Returns:
+        The object, or None if there is none
+    """
+    if not text:
+        return None
+    start = text.find("{")
+    while start != -1:
+        try:
+            return _decoder.raw_decode(text, start)[0]
+        except json.JSONDecodeError as e:
+            if _truncated(e, text):
+                # Every later '{' lies inside this unfinished object
+                return _decode_repaired(text, start) if repair else None
+        start = text.find("{", start + 1)
+    return None
+
+
+def repair_truncated(text: str, start: int = 0) -> Optional[str]:
+    """
+    Close a JSON object that was cut off
+
+    Keeps text[start:] up to the last point where a member (or an array
+    element) was complete, then appends the missing ']' / '}'. Array
+    elements are kept only whole, so a half-written item disappears rather
+    than coming back with missing fields.
+
+    Returns:
+        The closed JSON text, or None if nothing before the cut is usable
+    """
+    closers: List[str] = []   # pending ']' / '}'
+    expects: List[str] = []   # per container: key, colon, value or comma
+    open_items = 0            # open containers that are array elements
+    items: List[bool] = []
+    cut: Optional[int] = None
+    cut_closers: List[str] = []
+    previous = ""
+    for match in _TOKENS.finditer(text, start):
+        token = match.group()
+        first = token[0]
+        complete = False
+        if token == '"':
+            break  # the text ends inside a string
+        if first in "{[":
+            if closers and expects[-1] != "value":
+                break
+            is_item = bool(closers) and closers[-1] == "]"
+            if closers:
+                expects[-1] = "comma"
+            closers.append("}" if first == "{" else "]")
+            expects.append("key" if first == "{" else "value")
+            items.append(is_item)
+            open_items += is_item
+            complete = not is_item  # an empty member value is fine, an empty array item is not
+        elif first in "}]":
+            if not closers or token != closers[-1] or not (expects[-1] == "comma" or previous in "{["):
+                break
+            closers.pop()
+            expects.pop()
+            open_items -= items.pop()
+            if not closers:
+                return text[start:match.end()]
+            complete = True
+        elif not closers:
+            break
+        elif token == ",":
+            if expects[-1] != "comma":
+                break
+            expects[-1] = "key" if closers[-1] == "}" else "value"
+        elif token == ":":
+            if expects[-1] != "colon":
+                break
+            expects[-1] = "value"
+        elif expects[-1] == "key" and first == '"':
+            expects[-1] = "colon"
+        elif expects[-1] == "value":
+            if first != '"' and match.end() == len(text):
+                break  # a number or literal may be cut short
+            expects[-1] = "comma"
+            complete = True
+        else:
+            break
+        if complete and open_items == 0:
+            cut, cut_closers = match.end(), closers[:]
+        previous = first
+    if cut is None:
+        return None
+    return text[start:cut] + "".join(reversed(cut_closers))
+
+
+def _decode_repaired(text: str, start: int) -> Optional[Dict[str, Any]]:
+    repaired = repair_truncated(text, start)
+    if repaired is None:
+        return None
+    try:
+        value = _decoder.decode(repaired)
+    except json.JSONDecodeError:
+        return None
+    return value if isinstance(value, dict) and value else None
@@ -0,0 +1,406 @@
+"""
+Provider Quota Scheduler
+Shared admission control for rate-limited upstream APIs (LLM providers, the
+ads LLM clients, Apify), in place of fixed sleeps before each call.
+
+- Budgets: per provider, a requests-per-minute and a tokens-per-minute
+  TokenBucket (a rate with a burst). acquire() reserves one request plus
+  the prompt's estimated tokens; settle() charges the answer's tokens after
+  the call. Providers without a configured budget are unlimited.
+- Retry-After: note_error() reads the wait a 429 / 503 asks for (the
+  Retry-After or retry-after-ms header, Gemini's "retryDelay", Groq's "try
+  again in 7.5s") and holds the provider until then. A 429 without a hint
+  holds it for a jittered exponential backoff that grows while 429s repeat.
+- Priority lanes: callers waiting for the same provider are admitted by
+  lane, then arrival. Interactive requests (/api/analyze, ideate) use
+  INTERACTIVE, the default; background work (emotion tagging, ads
+  intelligence) runs in `with lane(BACKGROUND):` or passes the priority.
+
+A call is only delayed when its provider is out of budget or held; when
+quota is available acquire() returns immediately.
+"""
+import contextlib
+import contextvars
+import heapq
+import itertools
+import random
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from config import Config
+
+INTERACTIVE = 0
+BACKGROUND = 10
+LANE_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+BACKOFF_BASE = 1.0         # seconds, first hint-less 429 backoff
+BACKOFF_CAP = 60.0
+CHARS_PER_TOKEN = 4
+
+_lane: contextvars.ContextVar = contextvars.ContextVar("quota_lane", default=INTERACTIVE)
+
+_RETRY_HINTS = [
+    (re.compile(r"retry-?after[\"']?\s*[:=]\s*[\"']?(\d+(?:\.\d+)?)", re.IGNORECASE), 1.0),
+    (re.compile(r"retryDelay[\"']?\s*:\s*[\"'](\d+(?:\.\d+)?)s", re.IGNORECASE), 1.0),
+    (re.compile(r"(?:try again|retry) in (\d+(?:\.\d+)?)\s*ms\b", re.IGNORECASE), 0.001),
+    (re.compile(r"(?:try again|retry) in (?:(\d+)m)?(\d+(?:\.\d+)?)\s*s\b", re.IGNORECASE), None),
+]
+_THROTTLED = re.compile(r"\b429\b|resource_exhausted|rate.?limit|too many requests", re.IGNORECASE)
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text or "") // CHARS_PER_TOKEN + 1
+
+
+@contextlib.contextmanager
+def lane(priority: int) -> Iterator[None]:
+    """Run the block's quota waits in `priority` (lower goes first)"""
+    token = _lane.set(priority)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+def current_lane() -> int:
+    return _lane.get()
+
+
+def _chain(error: BaseException) -> Iterator[BaseException]:
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        yield error
+        error = error.__cause__ or error.__context__
+
+
+def _status(error: BaseException) -> Optional[int]:
+    for e in _chain(error):
+        status = getattr(e, "status_code", None) or getattr(getattr(e, "response", None), "status_code", None)
+        if isinstance(status, int):
+            return status
+    return None
+
+
+def retry_after_seconds(error: Any) -> Optional[float]:
+    """
+    Wait a throttled provider asked for, from an exception (and its causes)
+    or an error string
+
+    Returns:
+        Seconds, or None when the error carries no hint
+    """
+    texts = [error] if isinstance(error, str) else []
+    for e in _chain(error) if isinstance(error, BaseException) else ():
+        headers = getattr(getattr(e, "response", None), "headers", None) or {}
+        if headers.get("retry-after-ms"):
+            try:
+                return float(headers["retry-after-ms"]) / 1000.0
+            except ValueError:
+                pass
+        value = headers.get("Retry-After") or headers.get("retry-after")
+        if value:
+            try:
+                return max(0.0, float(value))
+            except ValueError:
+                try:
+                    return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+                except (TypeError, ValueError):
+                    pass
+        texts.append(str(e))
+        texts.append(getattr(getattr(e, "response", None), "text", "") or "")
+    for text in texts:
+        for pattern, scale in _RETRY_HINTS:
+            match = pattern.search(text)
+            if not match:
+                continue
+            if scale is None:  # "1m30.5s" / "7.5s"
+                return float(match.group(1) or 0) * 60 + float(match.group(2))
+            return float(match.group(1)) * scale
+    return None
+
+
+def is_throttled(error: Any) -> bool:
+    """Whether an error is a 429 / quota rejection"""
+    if isinstance(error, BaseException):
+        status = _status(error)
+        if status is not None:
+            return status == 429
+        return any(_THROTTLED.search(str(e)) for e in _chain(error))
+    return bool(_THROTTLED.search(str(error)))
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None,
+                  base: float = BACKOFF_BASE, cap: float = BACKOFF_CAP) -> float:
+    """
+    Seconds to wait before retry number `attempt` (0-based)
+
+    The provider's Retry-After when known (plus up to 10% so waiters do not
+    return at the same instant), else equal-jitter exponential backoff:
+    half of min(cap, base * 2**attempt) plus a random share of the other half.
+    """
+    if retry_after is not None:
+        return retry_after + random.uniform(0.0, min(1.0, 0.1 * retry_after))
+    ceiling = min(cap, base * 2 ** attempt)
+    return ceiling / 2 + random.uniform(0.0, ceiling / 2)
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, up to `burst` saved"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        """
+        Args:
+            rate: Tokens added per second
+            burst: Bucket size (default: one second of tokens, at least 1)
+        """
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, amount: float = 1.0) -> float:
+        """Seconds until `amount` tokens are available (0.0 = now); amounts above burst count as burst"""
+        with self._lock:
+            self._refill()
+            missing = min(amount, self.burst) - self._tokens
+            return max(0.0, missing / self.rate)
+
+    def take(self, amount: float = 1.0):
+        """Remove tokens without waiting (the balance may go negative, delaying later callers)"""
+        with self._lock:
+            self._refill()
+            self._tokens -= amount
+
+
+class _ProviderQuota:
+    def __init__(self, rpm: Optional[float], tpm: Optional[float]):
+        self.requests = TokenBucket(rpm / 60.0) if rpm else None
+        self.tokens = TokenBucket(tpm / 60.0, burst=tpm) if tpm else None
+        self.held_until = 0.0
+        self.strikes = 0              # 429s in a row without a Retry-After hint
+        self.queue: list = []         # heap of (priority, arrival)
+        self.cond = threading.Condition()
+        self.counters = {"admitted": 0, "waited": 0, "waited_seconds": 0.0, "throttled": 0, "held_seconds": 0.0}
+
+    def delay(self, tokens: float) -> float:
+        delay = max(0.0, self.held_until - time.monotonic())
+        if self.requests is not None:
+            delay = max(delay, self.requests.delay(1.0))
+        if self.tokens is not None and tokens:
+            delay = max(delay, self.tokens.delay(tokens))
+        return delay
+
+
+class QuotaScheduler:
+    """Per-provider request / token budgets with Retry-After holds and priority lanes"""
+
+    def __init__(self, limits: Optional[Dict[str, Tuple[Optional[float], Optional[float]]]] = None):
+        """
+        Args:
+            limits: provider → (requests per minute, tokens per minute); None = unlimited
+        """
+        self._limits = {name.lower(): value for name, value in (limits or {}).items()}
+        self._providers: Dict[str, _ProviderQuota] = {}
+        self._lock = threading.Lock()
+        self._arrivals = itertools.count()
+
+    def _quota(self, provider: str) -> _ProviderQuota:
+        provider = provider.lower()
+        with self._lock:
+            quota = self._providers.get(provider)
+            if quota is None:
+                quota = self._providers[provider] = _ProviderQuota(*self._limits.get(provider, (None, None)))
+            return quota
+
+    # ── ADMISSION ─────────────────────────────────────────────────────────────
+
+    def acquire(self, provider: str, tokens: float = 0, priority: Optional[int] = None) -> float:
+        """
+        Reserve one request and `tokens` prompt tokens, waiting only if needed
+
+        Args:
+            provider: Budget name (e.g. "gemini", "groq-ads", "apify")
+            tokens: Estimated prompt tokens
+            priority: Lane; defaults to the current lane(), lower is admitted first
+
+        Returns:
+            Seconds waited
+        """
+        quota = self._quota(provider)
+        ticket = (current_lane() if priority is None else priority, next(self._arrivals))
+        started, waited = time.monotonic(), False
+        with quota.cond:
+            heapq.heappush(quota.queue, ticket)
+            try:
+                while True:
+                    delay = quota.delay(tokens) if quota.queue[0] == ticket else None
+                    if delay == 0.0:
+                        break
+                    waited = True
+                    quota.cond.wait(timeout=delay)  # the head waits for budget, the rest for their turn
+            except BaseException:
+                quota.queue.remove(ticket)
+                heapq.heapify(quota.queue)
+                quota.cond.notify_all()
+                raise
+            heapq.heappop(quota.queue)
+            if quota.requests is not None:
+                quota.requests.take(1.0)
+            if quota.tokens is not None and tokens:
+                quota.tokens.take(tokens)
+            quota.counters["admitted"] += 1
+            if waited:
+                waited = time.monotonic() - started
+                quota.counters["waited"] += 1
+                quota.counters["waited_seconds"] += waited
+            quota.cond.notify_all()
+        return float(waited)
+
+    def settle(self, provider: str, tokens: float = 0):
+        """After a successful call: charge the answer's tokens, clear 429 backoff"""
+        quota = self._quota(provider)
+        with quota.cond:
+            quota.strikes = 0
+            if quota.tokens is not None and tokens:
+                quota.tokens.take(tokens)
+
+    def hold(self, provider: str, seconds: float):
+        """Admit nothing for `provider` for `seconds` (e.g. its Retry-After)"""
+        quota = self._quota(provider)
+        with quota.cond:
+            until = time.monotonic() + seconds
+            if until > quota.held_until:
+                quota.counters["held_seconds"] += until - max(quota.held_until, time.monotonic())
+                quota.held_until = until
+            quota.cond.notify_all()
+
+    def note_error(self, provider: str, error: Any) -> Optional[float]:
+        """
+        Hold the provider if `error` is a 429, or a 503 with a Retry-After
+
+        Returns:
+            Seconds the provider is held, or None for other errors
+        """
+        retry_after = retry_after_seconds(error)
+        unavailable = isinstance(error, BaseException) and _status(error) == 503 and retry_after is not None
+        if not (is_throttled(error) or unavailable):
+            return None
+        quota = self._quota(provider)
+        with quota.cond:
+            quota.counters["throttled"] += 1
+            attempt = quota.strikes
+            quota.strikes = 0 if retry_after is not None else quota.strikes + 1
+        delay = backoff_delay(attempt, retry_after)
+        self.hold(provider, delay)
+        return delay
+
+    def call(self, provider: str, fn: Callable[[], Any], retries: int = 0, tokens: float = 0,
+             priority: Optional[int] = None) -> Any:
+        """
+        fn() within `provider`'s quota, retrying failures with Retry-After-aware backoff
+
+        Args:
+            provider: Budget name
+            fn: The call
+            retries: Further attempts after a failure
+            tokens: Estimated tokens per attempt
+            priority: Lane (default: the current lane)
+
+        Raises:
+            Exception: fn's last error
+        """
+        for attempt in range(retries + 1):
+            self.acquire(provider, tokens, priority)
+            try:
+                result = fn()
+            except Exception as e:
+                if attempt >= retries:
+                    raise
+                held = self.note_error(provider, e)
+                delay = held if held is not None else backoff_delay(attempt)
+                print(f"Retry {attempt + 1}/{retries} for {provider} in {delay:.1f}s: {e}")
+                if held is None:
+                    time.sleep(delay)  # the next acquire() waits out a hold
+                continue
+            self.settle(provider)
+            return result
+
+    # ── METRICS ───────────────────────────────────────────────────────────────
+
+    def metrics(self) -> Dict:
+        now = time.monotonic()
+        with self._lock:
+            providers = dict(self._providers)
+        report = {}
+        for name, quota in sorted(providers.items()):
+            with quota.cond:
+                waiting: Dict[str, int] = {}
+                for priority, _ in quota.queue:
+                    key = LANE_NAMES.get(priority, str(priority))
+                    waiting[key] = waiting.get(key, 0) + 1
+                report[name] = {
+                    **{k: round(v, 3) if isinstance(v, float) else v for k, v in quota.counters.items()},
+                    "rpm": round(quota.requests.rate * 60, 2) if quota.requests else None,
+                    "tpm": round(quota.tokens.rate * 60) if quota.tokens else None,
+                    "held_for": round(max(0.0, quota.held_until - now), 2),
+                    "waiting": waiting
+                }
+        return report
+
+
+def parse_quota_limits(rate_spec: str, token_spec: str = "") -> Dict[str, Tuple[Optional[float], Optional[float]]]:
+    """'gemini=60,groq=30' (req/min) + 'groq=6000' (tokens/min) → {provider: (rpm, tpm)}"""
+    limits: Dict[str, list] = {}
+    for column, spec in enumerate((rate_spec, token_spec)):
+        for part in filter(None, (p.strip() for p in (spec or "").split(","))):
+            provider, _, per_minute = part.partition("=")
+            if float(per_minute) > 0:
+                limits.setdefault(provider.strip().lower(), [None, None])[column] = float(per_minute)
+    return {name: (rpm, tpm) for name, (rpm, tpm) in limits.items()}
+
+
+_shared: Optional[QuotaScheduler] = None
+_shared_lock = threading.Lock()
+
+
+def get_quota_scheduler() -> QuotaScheduler:
+    """Process-wide scheduler with the budgets from Config (LLM_RATE_LIMITS, LLM_TOKEN_LIMITS)"""
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = QuotaScheduler(parse_quota_limits(Config.LLM_RATE_LIMITS, Config.LLM_TOKEN_LIMITS))
+    return _shared
+
+
+def quota_limited(provider: str):
+    """
+    Run an ads client's invoke_json(prompt, max_tokens) within `provider`'s
+    quota, in the caller's lane. Stack it under @cached_invoke_json so cache
+    hits spend nothing.
+    """
+    def decorate(method):
+        @wraps(method)
+        def wrapper(self, prompt: str, max_tokens: int = 1500, **kwargs) -> dict:
+            scheduler = get_quota_scheduler()
+            scheduler.acquire(provider, estimate_tokens(prompt))
+            try:
+                result = method(self, prompt, max_tokens, **kwargs)
+            except Exception as e:
+                scheduler.note_error(provider, e)
+                raise
+            scheduler.settle(provider, estimate_tokens(result if isinstance(result, str) else str(result)))
+            return result
+        return wrapper
+    return decorate
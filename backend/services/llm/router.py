@@ -0,0 +1,365 @@
+"""
+Latency-Aware LLM Router
+One interface over several interchangeable providers (app.py's Gemini /
+Groq calls, the ads clients), picking per call instead of a static setting.
+
+- Rolling stats per (call class, provider): the last `window` latencies
+  give p50 / p95, the last `window` outcomes the error rate. A call class
+  names a kind of request ("ideate", "emotion-batch", "ads-recommend"),
+  since one provider can be fast at short tags and slow at long drafts.
+- Circuit breaker per provider: `breaker_failures` consecutive 429 / 5xx /
+  timeout / connection failures open it for `cooldown` seconds (doubling
+  while it keeps failing, up to `max_cooldown`). It then lets one trial
+  call through (half-open); success closes it.
+- Choice: healthy providers (breaker closed, error rate at most
+  `max_error_rate`) ranked by p50 for the call class. A provider with fewer
+  than `min_samples` calls in that class ranks first, so new providers and
+  classes get measured.
+- Hedging: when the chosen provider has not answered within its p95 for the
+  class (`hedge_after` until that is known, never under `hedge_floor`), the
+  same request goes to the next provider and the first good answer wins.
+  Latency and the hedge clock start after the caller's `admit` (e.g. a
+  quota wait), so local queueing is not blamed on the provider.
+  The slower call finishes in the background and still updates the stats.
+- Failover: a failed call (exception, or a result `ok` rejects) moves on to
+  the next provider. AllProvidersFailed carries every provider's error.
+"""
+import contextvars
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from config import Config
+
+WINDOW = 100
+MIN_SAMPLES = 5
+MAX_ERROR_RATE = 0.5
+BREAKER_FAILURES = 3
+COOLDOWN = 30.0
+MAX_COOLDOWN = 300.0
+HEDGE_AFTER = 10.0         # seconds, before a class has min_samples latencies
+HEDGE_FLOOR = 0.2          # seconds; never hedge sooner than this
+MAX_WORKERS = 16
+
+# Failures that say "this provider is unavailable right now" (as opposed to
+# a bad request or an unparseable answer): these count towards the breaker
+_UNAVAILABLE = re.compile(
+    r"\b(429|5\d\d)\b|rate.?limit|resource_exhausted|quota|overloaded|unavailable|timed? ?out|timeout|"
+    r"connection (error|reset|refused|aborted)", re.IGNORECASE)
+
+
+class AllProvidersFailed(Exception):
+    """Raised when no provider produced an acceptable answer"""
+
+
+def is_unavailable(error: Any) -> bool:
+    """Whether an exception (or error result) looks like 429 / 5xx / timeout / connection failure"""
+    return bool(_UNAVAILABLE.search(f"{type(error).__name__}: {error}"))
+
+
+class _Breaker:
+    __slots__ = ("failures", "opened_at", "cooldown", "trial")
+
+    def __init__(self, cooldown: float):
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.cooldown = cooldown
+        self.trial = False
+
+    def state(self, now: float) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if now - self.opened_at >= self.cooldown else "open"
+
+
+class _Stats:
+    __slots__ = ("latencies", "outcomes")
+
+    def __init__(self, window: int):
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def error_rate(self) -> float:
+        return (len(self.outcomes) - sum(self.outcomes)) / len(self.outcomes) if self.outcomes else 0.0
+
+
+class LLMRouter:
+    """Routes each call to the fastest healthy provider, with breakers and hedging"""
+
+    def __init__(
+        self,
+        window: int = WINDOW,
+        min_samples: int = MIN_SAMPLES,
+        max_error_rate: float = MAX_ERROR_RATE,
+        breaker_failures: int = BREAKER_FAILURES,
+        cooldown: float = COOLDOWN,
+        max_cooldown: float = MAX_COOLDOWN,
+        hedge: bool = True,
+        hedge_after: float = HEDGE_AFTER,
+        hedge_floor: float = HEDGE_FLOOR,
+        max_workers: int = MAX_WORKERS
+    ):
+        """
+        Args:
+            window: Latencies / outcomes kept per (call class, provider)
+            min_samples: Calls in a class before its latency is trusted
+            max_error_rate: Recent error rate above which a provider is skipped
+            breaker_failures: Consecutive unavailable-type failures that open a breaker
+            cooldown: Seconds a breaker stays open at first
+            max_cooldown: Cap for the doubling cooldown
+            hedge: Send a second request when the first is slower than its p95
+            hedge_after: Hedge delay in seconds while p95 is unknown
+            hedge_floor: Minimum hedge delay in seconds
+            max_workers: Threads running provider calls
+        """
+        self.window = window
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.breaker_failures = breaker_failures
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.hedge = hedge
+        self.hedge_after = hedge_after
+        self.hedge_floor = hedge_floor
+        self._providers: Dict[str, Any] = {}
+        self._breakers: Dict[str, _Breaker] = {}
+        self._stats: Dict[Tuple[str, str], _Stats] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-router")
+        self.counters = {"calls": 0, "hedges": 0, "hedge_wins": 0, "failovers": 0, "failed": 0}
+
+    # ── PROVIDERS ─────────────────────────────────────────────────────────────
+
+    def add(self, name: str, target: Any):
+        """Register a provider; `target` is what call()'s request function receives"""
+        with self._lock:
+            self._providers[name] = target
+            self._breakers[name] = _Breaker(self.cooldown)
+
+    @property
+    def providers(self) -> List[str]:
+        return list(self._providers)
+
+    def _stat(self, call_class: str, name: str) -> _Stats:
+        stats = self._stats.get((call_class, name))
+        if stats is None:
+            stats = self._stats[(call_class, name)] = _Stats(self.window)
+        return stats
+
+    def ranked(self, call_class: str = "default", only: Optional[List[str]] = None) -> List[str]:
+        """
+        Providers to try for a call, best first
+
+        Healthy ones by p50 (unmeasured ones first, in registration order),
+        then ones with a high error rate. Providers whose breaker is open
+        are left out; a half-open one is included if no trial is running.
+        """
+        now = time.monotonic()
+        healthy, degraded = [], []
+        with self._lock:
+            for position, name in enumerate(self._providers):
+                if only is not None and name not in only:
+                    continue
+                breaker = self._breakers[name]
+                state = breaker.state(now)
+                if state == "open" or (state == "half_open" and breaker.trial):
+                    continue
+                stats = self._stat(call_class, name)
+                measured = len(stats.latencies) >= self.min_samples
+                key = (measured, stats.percentile(0.5) if measured else 0.0, position)
+                if len(stats.outcomes) >= self.min_samples and stats.error_rate() > self.max_error_rate:
+                    degraded.append((key, name))
+                else:
+                    healthy.append((key, name))
+        return [name for _, name in sorted(healthy)] + [name for _, name in sorted(degraded)]
+
+    # ── CALLS ─────────────────────────────────────────────────────────────────
+
+    def call(
+        self,
+        request: Callable[[Any], Any],
+        call_class: str = "default",
+        ok: Optional[Callable[[Any], bool]] = None,
+        only: Optional[List[str]] = None,
+        admit: Optional[Callable[[str], Any]] = None,
+        hedge: Optional[bool] = None
+    ) -> Any:
+        """
+        Run request(target) against the best provider, hedging and failing over
+
+        Args:
+            request: Makes the call given a provider's target (e.g. lambda c: c.invoke_json(p))
+            call_class: Kind of call, for per-class latency stats
+            ok: Rejects results that are errors in disguise (e.g. "[Groq Error: ...]")
+            only: Restrict to these providers
+            admit: admit(name) waits for local admission (e.g. a quota) before
+                each request; that wait is neither latency nor hedge delay
+            hedge: Override the router's hedging for this call (e.g. off for background work)
+
+        Returns:
+            The first acceptable result
+
+        Raises:
+            AllProvidersFailed: If every provider failed or none is available
+        """
+        with self._lock:
+            self.counters["calls"] += 1
+        candidates = self.ranked(call_class, only)
+        if not candidates:
+            with self._lock:
+                self.counters["failed"] += 1
+            raise AllProvidersFailed("no LLM provider available (all circuit breakers open)")
+
+        hedge = self.hedge if hedge is None else hedge
+        errors: Dict[str, str] = {}
+        running: Dict[Future, Tuple[str, threading.Event]] = {}
+        hedged_from: Optional[str] = None
+        while candidates or running:
+            if not running:
+                if errors:
+                    with self._lock:
+                        self.counters["failovers"] += 1
+                name = candidates.pop(0)
+                running.update(self._submit(name, request, call_class, ok, admit))
+            timeout = None
+            if hedge and candidates and len(running) == 1:
+                name, admitted = next(iter(running.values()))
+                admitted.wait()  # the hedge clock starts when the request is sent
+                timeout = self._hedge_delay(call_class, name)
+            done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                hedged_from = next(iter(running.values()))[0]
+                with self._lock:
+                    self.counters["hedges"] += 1
+                name = candidates.pop(0)
+                running.update(self._submit(name, request, call_class, ok, admit))
+                continue
+            for future in done:
+                name = running.pop(future)[0]
+                success, value = future.result()
+                if success:
+                    if hedged_from is not None and name != hedged_from:
+                        with self._lock:
+                            self.counters["hedge_wins"] += 1
+                    return value
+                errors[name] = value
+        with self._lock:
+            self.counters["failed"] += 1
+        raise AllProvidersFailed("; ".join(f"{name}: {error}" for name, error in errors.items()))
+
+    def _submit(self, name: str, request: Callable[[Any], Any], call_class: str,
+                ok: Optional[Callable[[Any], bool]],
+                admit: Optional[Callable[[str], Any]]) -> Dict[Future, Tuple[str, threading.Event]]:
+        """{future: (name, admitted)} for one attempt; admitted is set once it is past admit()"""
+        with self._lock:
+            breaker = self._breakers[name]
+            if breaker.state(time.monotonic()) == "half_open":
+                breaker.trial = True
+            target = self._providers[name]
+        admitted = threading.Event()
+        # Run in the caller's context, so e.g. its quota lane applies to the call
+        context = contextvars.copy_context()
+        future = self._pool.submit(context.run, self._attempt, name, target, request, call_class, ok,
+                                   admit, admitted)
+        return {future: (name, admitted)}
+
+    def _attempt(self, name: str, target: Any, request: Callable[[Any], Any], call_class: str,
+                 ok: Optional[Callable[[Any], bool]], admit: Optional[Callable[[str], Any]],
+                 admitted: threading.Event) -> Tuple[bool, Any]:
+        """(True, result) or (False, error text); never raises"""
+        try:
+            if admit is not None:
+                admit(name)
+        except Exception as e:
+            return False, f"{type(e).__name__}: {e}"
+        finally:
+            admitted.set()
+        started = time.perf_counter()
+        try:
+            result = request(target)
+            error = None if ok is None or ok(result) else result
+        except Exception as e:
+            error = e
+        self.observe(name, call_class, time.perf_counter() - started, error)
+        if error is None:
+            return True, result
+        return False, f"{type(error).__name__}: {error}" if isinstance(error, Exception) else str(error)[:300]
+
+    def _hedge_delay(self, call_class: str, name: str) -> float:
+        with self._lock:
+            stats = self._stat(call_class, name)
+            p95 = stats.percentile(0.95) if len(stats.latencies) >= self.min_samples else None
+        return max(self.hedge_floor, p95 if p95 is not None else self.hedge_after)
+
+    def observe(self, name: str, call_class: str, seconds: float, error: Any = None):
+        """
+        Record one call's outcome (call() does this itself; streaming callers
+        that pick a provider with ranked() report here)
+        """
+        now = time.monotonic()
+        with self._lock:
+            stats = self._stat(call_class, name)
+            stats.outcomes.append(error is None)
+            breaker = self._breakers.get(name)
+            if error is None:
+                stats.latencies.append(seconds)
+                if breaker is not None:
+                    breaker.failures, breaker.opened_at, breaker.trial = 0, None, False
+                    breaker.cooldown = self.cooldown
+                return
+            if breaker is None or not is_unavailable(error):
+                if breaker is not None:
+                    breaker.trial = False
+                return
+            if breaker.state(now) == "half_open":
+                breaker.opened_at = now
+                breaker.cooldown = min(self.max_cooldown, breaker.cooldown * 2)
+            else:
+                breaker.failures += 1
+                if breaker.failures >= self.breaker_failures and breaker.opened_at is None:
+                    breaker.opened_at = now
+                    print(f"⚠️  LLM provider {name} circuit open for {breaker.cooldown:.0f}s: {str(error)[:120]}")
+            breaker.trial = False
+
+    # ── METRICS ───────────────────────────────────────────────────────────────
+
+    def metrics(self) -> Dict:
+        """Breaker state per provider and latency / error stats per call class"""
+        now = time.monotonic()
+        with self._lock:
+            providers = {}
+            for name, breaker in self._breakers.items():
+                providers[name] = {"breaker": breaker.state(now), "consecutive_failures": breaker.failures,
+                                   "classes": {}}
+            for (call_class, name), stats in self._stats.items():
+                if name not in providers or not stats.outcomes:
+                    continue
+                p50, p95 = stats.percentile(0.5), stats.percentile(0.95)
+                providers[name]["classes"][call_class] = {
+                    "calls": len(stats.outcomes),
+                    "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+                    "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+                    "error_rate": round(stats.error_rate(), 4)
+                }
+            return {"providers": providers, **self.counters}
+
+
+def router_from_config() -> LLMRouter:
+    """An empty router with the LLM_ROUTER_* settings from Config"""
+    return LLMRouter(
+        window=Config.LLM_ROUTER_WINDOW,
+        breaker_failures=Config.LLM_ROUTER_BREAKER_FAILURES,
+        cooldown=Config.LLM_ROUTER_COOLDOWN,
+        hedge=Config.LLM_ROUTER_HEDGE,
+        hedge_after=Config.LLM_ROUTER_HEDGE_AFTER,
+        hedge_floor=Config.LLM_ROUTER_HEDGE_FLOOR
+    )
@@ -0,0 +1,184 @@
+"""
+LLM Streaming Helpers
+Server-sent events in both directions, plus a JSON reader that reports
+values as soon as they close.
+
+- sse_payloads() turns a provider's SSE body (Gemini streamGenerateContent
+  with alt=sse, Groq / OpenAI chat completions with stream=true) into its
+  data payloads.
+- JSONFieldStream is fed the answer text chunk by chunk. It tracks the JSON
+  structure incrementally (strings, escapes, nesting), starting at the first
+  '{' so a leading ``` fence or chatter is skipped. It reports:
+    item  – each object / array element of a top-level array, when it
+            closes (e.g. every idea of {"ideas": [...]})
+    field – each other top-level value, when it closes (e.g. post_text,
+            then hashtags)
+  Only those values are decoded, so the cost is one scan of the text.
+  finish() returns the whole object; one that never closed (cut off at
+  max_tokens, or invalid) is left to extract_json() and its repair.
+- sse() formats one event for the browser.
+"""
+import json
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+from services.llm.json_extract import extract_json
+
+_WHITESPACE = " \t\r\n"
+
+
+def sse(event: str, data: Any) -> str:
+    """One server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def sse_payloads(lines: Iterable[str]) -> Iterator[str]:
+    """
+    Data payloads of an SSE body
+
+    Multi-line data fields are joined, comments and other fields are skipped,
+    and an OpenAI-style "[DONE]" payload ends the stream.
+    """
+    data: List[str] = []
+    for line in lines:
+        if line.startswith("data:"):
+            data.append(line[5:].lstrip(" "))
+        elif not line and data:
+            payload = "\n".join(data)
+            data = []
+            if payload == "[DONE]":
+                return
+            yield payload
+    if data and "\n".join(data) != "[DONE]":
+        yield "\n".join(data)
+
+
+class _Frame:
+    __slots__ = ("is_object", "start", "path", "key", "index", "expect_key", "scalar_start")
+
+    def __init__(self, is_object: bool, start: int, path: Tuple):
+        self.is_object = is_object
+        self.start = start
+        self.path = path
+        self.key: Optional[str] = None
+        self.index = 0
+        self.expect_key = is_object
+        self.scalar_start: Optional[int] = None
+
+    def child_path(self) -> Tuple:
+        return self.path + ((self.key,) if self.is_object else (self.index,))
+
+
+class JSONFieldStream:
+    """Incremental reader for a JSON object arriving in chunks"""
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._stack: List[_Frame] = []
+        self._start: Optional[int] = None
+        self._end: Optional[int] = None
+        self._string_start: Optional[int] = None
+        self._escaped = False
+        self._streamed_keys = set()
+
+    @property
+    def done(self) -> bool:
+        """Whether the top-level object has closed"""
+        return self._end is not None
+
+    def feed(self, chunk: str) -> List[Tuple[str, Tuple, Any]]:
+        """
+        Append answer text
+
+        Returns:
+            ("item" | "field", path, value) for every value that closed in this chunk
+        """
+        self.text += chunk
+        events: List[Tuple[str, Tuple, Any]] = []
+        text = self.text
+        i = self._pos
+        while i < len(text) and self._end is None:
+            c = text[i]
+            if self._start is None:
+                if c == "{":
+                    self._start = i
+                    self._stack.append(_Frame(True, i, ()))
+            elif self._string_start is not None:
+                if self._escaped:
+                    self._escaped = False
+                elif c == "\\":
+                    self._escaped = True
+                elif c == '"':
+                    self._close_string(i, events)
+            else:
+                self._structural(c, i, events)
+            i += 1
+        self._pos = i
+        return events
+
+    def _close_string(self, i: int, events: List):
+        frame = self._stack[-1]
+        start, self._string_start = self._string_start, None
+        if frame.is_object and frame.expect_key:
+            frame.key = json.loads(self.text[start:i + 1])
+            frame.expect_key = False
+        else:
+            self._completed(frame, start, i + 1, events)
+
+    def _structural(self, c: str, i: int, events: List):
+        frame = self._stack[-1]
+        if c in _WHITESPACE or c == ":":
+            return
+        if c == '"':
+            self._string_start = i
+        elif c in "{[":
+            self._stack.append(_Frame(c == "{", i, frame.child_path()))
+        elif c in "}]":
+            self._end_scalar(frame, i, events)
+            self._stack.pop()
+            if not self._stack:
+                self._end = i + 1
+            else:
+                self._completed(self._stack[-1], frame.start, i + 1, events)
+        elif c == ",":
+            self._end_scalar(frame, i, events)
+            if frame.is_object:
+                frame.expect_key = True
+            else:
+                frame.index += 1
+        elif frame.scalar_start is None:
+            frame.scalar_start = i  # number, true, false or null
+
+    def _end_scalar(self, frame: _Frame, i: int, events: List):
+        if frame.scalar_start is not None:
+            start, frame.scalar_start = frame.scalar_start, None
+            self._completed(frame, start, i, events)
+
+    def _completed(self, parent: _Frame, start: int, end: int, events: List):
+        """A value of `parent` spans text[start:end]"""
+        path = parent.child_path()
+        if len(path) == 2 and not parent.is_object and self.text[start] in "{[":
+            self._streamed_keys.add(path[0])
+            events.append(("item", path, self._decode(start, end)))
+        elif len(path) == 1 and path[0] not in self._streamed_keys:
+            events.append(("field", path, self._decode(start, end)))
+
+    def _decode(self, start: int, end: int) -> Any:
+        try:
+            return json.loads(self.text[start:end])
+        except json.JSONDecodeError:
+            return None
+
+    def result(self) -> Optional[Any]:
+        """The complete object, or None if it has not closed (or is invalid)"""
+        if self._end is None:
+            return None
+        return self._decode(self._start, self._end)
+
+    def finish(self, repair: bool = True) -> Optional[Any]:
+        """
+        The object after the last chunk: the closed one, else what
+        extract_json() finds in the whole text (e.g. a repaired truncation)
+        """
+        result = self.result()
+        return result if result is not None else extract_json(self.text, repair)
@@ -8,10 +8,10 @@ Supports three formats:
 3. Video Storyboard - 5-8 scenes with keyframe descriptions
 """
 
-import json
-import re
 from typing import Dict, List, Any, Literal
 
+from services.llm.json_extract import extract_json
+
 MediaFormat = Literal["image", "carousel", "video"]
 
 
@@ -336,7 +336,7 @@ JSON:"""
     
     def _parse_json_response(self, response: str, default: Dict[str, Any]) -> Dict[str, Any]:
         """
-        Parse JSON from LLM response, handling markdown fences and errors
+        Parse JSON from LLM response, handling markdown fences, prose and truncation
         
         Args:
             response: Raw LLM response
@@ -345,46 +345,14 @@ JSON:"""
         Returns:
             Parsed JSON dict or default
         """
-        try:
-            # Remove markdown code fences
-            cleaned = re.sub(r'```json\s*|\s*```', '', response.strip())
-            cleaned = cleaned.strip()
-            
-            # Remove any leading/trailing text before/after JSON
-            # Try to find JSON object
-            if '{' in cleaned:
-                start = cleaned.index('{')
-                # Find matching closing brace
-                brace_count = 0
-                end = start
-                for i in range(start, len(cleaned)):
-                    if cleaned[i] == '{':
-                        brace_count += 1
-                    elif cleaned[i] == '}':
-                        brace_count -= 1
-                        if brace_count == 0:
-                            end = i + 1
-                            break
-                
-                json_str = cleaned[start:end]
-                parsed = json.loads(json_str)
-                
-                # Validate structure
-                if isinstance(parsed, dict):
-                    return parsed
-            
-            # If no JSON found, log the response for debugging
-            print(f"⚠️  Could not find valid JSON in LLM response")
-            print(f"Response preview: {response[:200]}...")
-            return default
-            
-        except json.JSONDecodeError as e:
-            print(f"⚠️  JSON decode error: {e}")
-            print(f"Attempted to parse: {json_str[:200] if 'json_str' in locals() else 'N/A'}...")
-            return default
-        except Exception as e:
-            print(f"⚠️  Unexpected parse error: {e}")
-            return default
+        parsed = extract_json(response)
+        if parsed is not None:
+            return parsed
+        
+        # If no JSON found, log the response for debugging
+        print(f"⚠️  Could not find valid JSON in LLM response")
+        print(f"Response preview: {(response or '')[:200]}...")
+        return default
 
 
 # ── HELPER FUNCTIONS ──────────────────────────────────────────────────────────
@@ -5,20 +5,21 @@ Flow:
 1. User submits campaign brief (keyword, goal, audience, budget, tone)
 2. Brief is embedded → top-K similar performing ads retrieved from ChromaDB
 3. Retrieved ads formatted as context block
-4. Context + brief sent to Bedrock (via BedrockClient, API Key auth)
-5. Bedrock returns structured campaign recommendations as JSON
+4. Context + brief sent to the fastest healthy ads LLM client (Groq, Gemini,
+   xAI or Bedrock, whichever have keys — see services/bedrock/ads_router.py)
+5. The LLM returns structured campaign recommendations as JSON
 """
 
 import json
 from services.ad_scraper.ingestion_service import ADIngestionService
 from services.bedrock.bedrock_client import BedrockClient, BedrockInvokeError
-from services.bedrock.groq_ads_client import GroqAdsClient
+from services.bedrock.ads_router import get_ads_router, is_json_answer
 
 
 class ADRecommendationEngine:
     def __init__(self, ingestion_service=None):
         self.ingestion_service = ingestion_service or ADIngestionService()
-        self.groq_client = GroqAdsClient()
+        self.router = get_ads_router()
 
     def generate_ad_recommendations(self, user_input: dict) -> dict:
         """
@@ -59,21 +60,21 @@ class ADRecommendationEngine:
         # Step 4: Build full RAG prompt
         prompt = self._build_rag_prompt(user_input, context_block)
 
-        # Step 5: Call Groq API strictly 
+        # Step 5: Call the routed ads LLM clients (fastest healthy first, hedged, failing over)
         try:
-            recommendations = self.groq_client.invoke_json(prompt, max_tokens=2000)
-            
-            # Catch partial parse errors
-            if isinstance(recommendations, dict) and 'error' in recommendations and 'JSON parse failed' in recommendations['error']:
-                print("⚠️ Groq returned malformed JSON or partial response. Using High-Quality Mock Data.")
-                recommendations = self._get_mock_recommendations(user_input)
-                
+            recommendations = self.router.call(lambda client: client.invoke_json(prompt, max_tokens=2000),
+                                               "ads-recommend", ok=is_json_answer)
+
         except Exception as inner_e:
-            if '429' in str(inner_e) or 'RESOURCE_EXHAUSTED' in str(inner_e) or '403' in str(inner_e):
-                print(f"⚠️ Groq Credits Empty or Quota Exceeded (403/429). Using High-Quality Mock Data for Demo.")
+            # Every client failed; the message lists each client's error
+            if 'JSON parse failed' in str(inner_e):
+                print("⚠️ LLM returned malformed JSON or partial response. Using High-Quality Mock Data.")
+                recommendations = self._get_mock_recommendations(user_input)
+            elif '429' in str(inner_e) or 'RESOURCE_EXHAUSTED' in str(inner_e) or '403' in str(inner_e):
+                print(f"⚠️ LLM Credits Empty or Quota Exceeded (403/429). Using High-Quality Mock Data for Demo.")
                 recommendations = self._get_mock_recommendations(user_input)
             else:
-                recommendations = {"error": f"Groq primary engine failed: {str(inner_e)}"}
+                recommendations = {"error": f"All ads LLM engines failed: {str(inner_e)}"}
 
         return {
             "recommendations": recommendations,
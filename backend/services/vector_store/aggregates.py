@@ -0,0 +1,274 @@
+"""
+Running Aggregates
+Dashboard statistics maintained on every write instead of recomputed per read.
+
+Tracks, for a stream of (id, metadata) records:
+
+- count
+- per numeric field: count, sum, sum of squares (→ mean / std), min, max
+  (min/max survive deletes through an OrderStatisticTree over the live values)
+- per categorical field: a histogram
+- a bounded top-k heap by one numeric field
+
+The heap keeps `top_capacity` entries and is the true top-m of the live
+records for m = its size. Deletes can shrink it below what a read asks for;
+it is then refilled with one pass over `source`. verify() rebuilds
+everything from `source` and reports whether the running state had drifted.
+"""
+import heapq
+import itertools
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from services.vector_store.ranking import OrderStatisticTree
+
+NumericExtractor = Callable[[Dict], Optional[float]]
+CategoryExtractor = Callable[[Dict], Hashable]
+RecordSource = Callable[[], Iterable[Tuple[str, Dict]]]
+
+
+def field_value(key: str, default: Optional[float] = None) -> NumericExtractor:
+    """Numeric extractor reading metadata[key] (non-numbers fall back to default)"""
+    def extract(metadata: Dict) -> Optional[float]:
+        value = metadata.get(key, default)
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return default
+        return float(value)
+    return extract
+
+
+def field_category(key: str, default: Hashable = "unknown") -> CategoryExtractor:
+    """Categorical extractor reading metadata[key]"""
+    return lambda metadata: metadata.get(key, default)
+
+
+class _NumericAggregate:
+    """count / sum / sum of squares / min / max of one field over live records"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.squares = 0.0
+        self.values = OrderStatisticTree()
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        self.squares += value * value
+        self.values.add(value)
+
+    def remove(self, value: float):
+        if self.values.remove(value):
+            self.count -= 1
+            self.total -= value
+            self.squares -= value * value
+
+    def snapshot(self) -> Dict:
+        if not self.count:
+            return {"count": 0, "sum": 0.0, "avg": 0.0, "std": 0.0, "min": None, "max": None}
+        mean = self.total / self.count
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "avg": mean,
+            "std": max(0.0, self.squares / self.count - mean * mean) ** 0.5,
+            "min": self.values.kth_smallest(0),
+            "max": self.values.kth_largest(1)
+        }
+
+
+class RunningAggregates:
+    """Incrementally maintained count / numeric / histogram / top-k statistics"""
+
+    def __init__(
+        self,
+        numeric: Optional[Dict[str, NumericExtractor]] = None,
+        categorical: Optional[Dict[str, CategoryExtractor]] = None,
+        top_by: Optional[str] = None,
+        top_capacity: int = 40,
+        source: Optional[RecordSource] = None
+    ):
+        """
+        Initialize empty aggregates
+
+        Args:
+            numeric: Field name → extractor returning a float (None = skip record)
+            categorical: Field name → extractor returning a histogram bucket
+            top_by: Numeric field ranked by the top-k heap
+            top_capacity: Heap entries kept (reads may ask for up to this many)
+            source: Callable yielding every live (id, metadata), used to
+                refill the heap and by verify()
+        """
+        self.numeric_fields = dict(numeric or {})
+        self.categorical_fields = dict(categorical or {})
+        self.top_by = top_by
+        self.top_capacity = top_capacity
+        self.source = source
+        self._clear()
+
+    def _clear(self):
+        self.count = 0
+        self._numeric = {name: _NumericAggregate() for name in self.numeric_fields}
+        self._histograms: Dict[str, Dict[Hashable, int]] = {name: {} for name in self.categorical_fields}
+        self._seq = itertools.count()
+        self._heap: List[Tuple[float, int, str]] = []   # min-heap of (value, seq, id)
+        self._heap_entries: Dict[str, Tuple[float, int, str]] = {}
+        self._heap_complete = True                       # heap holds every ranked record
+        self._ranked = 0                                 # records with a top_by value
+
+    def copy_spec(self, source: Optional[RecordSource] = None) -> "RunningAggregates":
+        """Empty aggregates with the same configuration"""
+        return RunningAggregates(self.numeric_fields, self.categorical_fields, self.top_by,
+                                 self.top_capacity, source or self.source)
+
+    # ── WRITES ────────────────────────────────────────────────────────────────
+
+    def add(self, record_id: str, metadata: Dict):
+        """Account for a new record"""
+        self.count += 1
+        for name, extract in self.numeric_fields.items():
+            value = extract(metadata)
+            if value is not None:
+                self._numeric[name].add(value)
+        for name, extract in self.categorical_fields.items():
+            bucket = extract(metadata)
+            histogram = self._histograms[name]
+            histogram[bucket] = histogram.get(bucket, 0) + 1
+        if self.top_by is not None:
+            self._heap_add(record_id, self.numeric_fields[self.top_by](metadata))
+
+    def remove(self, record_id: str, metadata: Dict):
+        """Account for a deleted record (metadata as it was stored)"""
+        self.count -= 1
+        for name, extract in self.numeric_fields.items():
+            value = extract(metadata)
+            if value is not None:
+                self._numeric[name].remove(value)
+        for name, extract in self.categorical_fields.items():
+            bucket = extract(metadata)
+            histogram = self._histograms[name]
+            remaining = histogram.get(bucket, 0) - 1
+            if remaining > 0:
+                histogram[bucket] = remaining
+            else:
+                histogram.pop(bucket, None)
+        if self.top_by is not None:
+            self._heap_remove(record_id, self.numeric_fields[self.top_by](metadata))
+
+    def update(self, record_id: str, old: Dict, new: Dict):
+        """Account for a record whose metadata changed"""
+        self.remove(record_id, old)
+        self.add(record_id, new)
+
+    def _heap_add(self, record_id: str, value: Optional[float]):
+        if value is None:
+            return
+        self._ranked += 1
+        heap = self._heap
+        if not self._heap_complete and (not heap or value < heap[0][0]):
+            return  # might rank below records the heap already dropped
+        entry = (value, next(self._seq), record_id)
+        heapq.heappush(heap, entry)
+        self._heap_entries[record_id] = entry
+        if len(heap) > self.top_capacity:
+            evicted = heapq.heappop(heap)
+            del self._heap_entries[evicted[2]]
+            self._heap_complete = False
+
+    def _heap_remove(self, record_id: str, value: Optional[float]):
+        if value is None:
+            return
+        self._ranked -= 1
+        entry = self._heap_entries.pop(record_id, None)
+        if entry is not None:
+            self._heap.remove(entry)
+            heapq.heapify(self._heap)
+
+    def _refill_heap(self):
+        """Rebuild the heap from source after deletes drained it"""
+        extract = self.numeric_fields[self.top_by]
+        ranked = ((extract(metadata), record_id) for record_id, metadata in self.source())
+        entries = [(value, next(self._seq), record_id) for value, record_id in ranked if value is not None]
+        best = heapq.nlargest(self.top_capacity, entries, key=lambda e: (e[0], -e[1]))
+        heapq.heapify(best)
+        self._heap = best
+        self._heap_entries = {entry[2]: entry for entry in best}
+        self._heap_complete = len(entries) <= self.top_capacity
+
+    # ── READS ─────────────────────────────────────────────────────────────────
+
+    def top(self, k: int = 10) -> List[Tuple[str, float]]:
+        """
+        Highest-ranked records by top_by
+
+        Args:
+            k: Number of records (at most top_capacity)
+
+        Returns:
+            (id, value) pairs, best first; ties keep insertion order
+        """
+        if self.top_by is None:
+            raise ValueError("RunningAggregates was created without top_by")
+        k = min(k, self.top_capacity)
+        if len(self._heap) < min(k, self._ranked) and self.source is not None:
+            self._refill_heap()
+        best = sorted(self._heap, key=lambda e: (-e[0], e[1]))[:k]
+        return [(record_id, value) for value, _, record_id in best]
+
+    def numeric(self, name: str) -> Dict:
+        """{count, sum, avg, std, min, max} of one numeric field"""
+        return self._numeric[name].snapshot()
+
+    def snapshot(self, top_k: int = 10) -> Dict:
+        """
+        Current statistics
+
+        Returns:
+            {"count", "numeric": {field: {count, sum, avg, std, min, max}},
+             "histograms": {field: {bucket: count}}, "top": [(id, value)]}
+        """
+        result = {
+            "count": self.count,
+            "numeric": {name: self.numeric(name) for name in self._numeric},
+            "histograms": {name: dict(histogram) for name, histogram in self._histograms.items()}
+        }
+        if self.top_by is not None:
+            result["top"] = self.top(top_k)
+        return result
+
+    # ── CONSISTENCY ───────────────────────────────────────────────────────────
+
+    def rebuild(self, records: Optional[Iterable[Tuple[str, Dict]]] = None):
+        """Recompute everything from `records` (default: source())"""
+        self._clear()
+        for record_id, metadata in (records if records is not None else self.source()):
+            self.add(record_id, metadata)
+
+    def verify(self, repair: bool = True) -> Dict:
+        """
+        Compare the running state with a from-scratch rebuild
+
+        Args:
+            repair: Adopt the rebuilt state when they differ
+
+        Returns:
+            {"consistent": bool, "drift": {section: (running, rebuilt)}}
+        """
+        fresh = self.copy_spec()
+        fresh.rebuild()
+        running, rebuilt = self.snapshot(self.top_capacity), fresh.snapshot(self.top_capacity)
+
+        drift = {}
+        for section in ("count", "histograms"):
+            if running[section] != rebuilt[section]:
+                drift[section] = (running[section], rebuilt[section])
+        for name, stats in rebuilt["numeric"].items():
+            mine = running["numeric"][name]
+            if (mine["count"], mine["min"], mine["max"]) != (stats["count"], stats["min"], stats["max"]) \
+                    or abs(mine["sum"] - stats["sum"]) > 1e-6 * max(1.0, abs(stats["sum"])):
+                drift[f"numeric.{name}"] = (mine, stats)
+        if "top" in rebuilt and [v for _, v in running["top"]] != [v for _, v in rebuilt["top"]]:
+            drift["top"] = (running["top"], rebuilt["top"])
+
+        if drift and repair:
+            self.__dict__.update(fresh.__dict__)
+        return {"consistent": not drift, "drift": drift}
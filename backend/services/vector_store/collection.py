@@ -0,0 +1,1041 @@
+"""
+In-Process Vector Collection
+Exact cosine search over a contiguous float32 embedding matrix.
+
+Drop-in replacement for the ChromaDB collection surface used across the
+backend (add / upsert / update / delete / get / query / count). Rows are
+L2-normalized on insert so a query is one matrix-vector product followed by
+an argpartition top-k.
+
+A collection opened from disk (see persistence.py) keeps its rows in a
+memory-mapped base segment shared by every worker; writes made after opening
+land in a small heap tail until the next persist(). Each worker remembers
+which rows it wrote or deleted since then, so when another worker has
+replaced the store, reads re-map onto the new one and persist() writes the
+latest store plus this worker's changes instead of its own stale view.
+
+Metadata filters are compiled once and answered from secondary indexes
+(see indexes.py) that are maintained on every write. A collection created
+with a rank_key derives is_winner / percentile_rank from live ERS order
+statistics (see ranking.py) instead of trusting stored snapshots. Optional
+running aggregates (see aggregates.py) keep dashboard stats current the same way.
+
+With quantization="int8" the persisted base segment also carries int8 codes
+(see quantization.py). Queries score the codes first and re-rank a shortlist
+of rerank_factor × n_results rows exactly against the float rows, so only the
+codes (a quarter of the float bytes) need to stay resident.
+"""
+import threading
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from services.vector_store.aggregates import RunningAggregates
+from services.vector_store.indexes import MetadataIndexes
+from services.vector_store.persistence import open_store, store_exists, store_lock, store_signature, write_store
+from services.vector_store.quantization import FIT_SAMPLE, ScalarQuantizer
+from services.vector_store.ranking import WINNER_FRACTION
+from services.vector_store.where import compile_where
+
+
+DEFAULT_DIM = 384  # all-MiniLM-L6-v2
+DEFAULT_GET_INCLUDE = ["documents", "metadatas"]
+DEFAULT_QUERY_INCLUDE = ["documents", "metadatas", "distances"]
+QUANTIZATION_MODES = (None, "int8")
+RERANK_FACTOR = 8  # shortlist = n_results × this, re-ranked in float
+QUERY_BLOCK = 65536  # rows scored per matrix product in query()
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """
+    L2-normalize each row in place, leaving all-zero rows untouched
+
+    Args:
+        vectors: 2-D float32 array
+
+    Returns:
+        The same array, normalized
+    """
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k highest scores, best first
+
+    Uses argpartition so only the k winners are fully sorted.
+
+    Args:
+        scores: 1-D score array
+        k: Number of indices to return
+
+    Returns:
+        Index array of length min(k, len(scores))
+    """
+    n = scores.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(n)
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class _SegmentedList:
+    """List view over a read-only base sequence plus an in-memory tail"""
+
+    def __init__(self, base: Optional[Sequence] = None):
+        self.base = base
+        self.base_size = len(base) if base is not None else 0
+        self.tail: List = []
+        self.overrides: Dict[int, object] = {}
+
+    def __len__(self) -> int:
+        return self.base_size + len(self.tail)
+
+    def __getitem__(self, row: int):
+        if row >= self.base_size:
+            return self.tail[row - self.base_size]
+        if row in self.overrides:
+            return self.overrides[row]
+        return self.base[row]
+
+    def __setitem__(self, row: int, value):
+        if row >= self.base_size:
+            self.tail[row - self.base_size] = value
+        else:
+            self.overrides[row] = value
+
+    def extend(self, values):
+        self.tail.extend(values)
+
+
+class VectorCollection:
+    """NumPy-backed collection with the ChromaDB add/get/query/count surface"""
+
+    def __init__(
+        self,
+        name: str = "posts",
+        dim: int = DEFAULT_DIM,
+        embedding_function: Optional[Callable[[List[str]], List[List[float]]]] = None,
+        initial_capacity: int = 1024,
+        path: Optional[str] = None,
+        rank_key: Optional[str] = None,
+        winner_fraction: float = WINNER_FRACTION,
+        aggregates: Optional[RunningAggregates] = None,
+        quantization: Optional[str] = None,
+        rerank_factor: int = RERANK_FACTOR
+    ):
+        """
+        Initialize an empty collection
+
+        Args:
+            name: Collection name (informational)
+            dim: Embedding dimension
+            embedding_function: Optional callable mapping documents to embeddings,
+                used when add() is called without embeddings
+            initial_capacity: Rows pre-allocated before the first resize
+            path: Directory persist() writes to (see persistence.py)
+            rank_key: Metadata key (e.g. "ers") whose live ranking maintains
+                is_winner / percentile_rank on every write
+            winner_fraction: Share of ranked records flagged is_winner
+            aggregates: Empty RunningAggregates to maintain on every write
+                (read with stats())
+            quantization: "int8" to persist int8 codes and search them first
+            rerank_factor: Shortlist size per result re-ranked exactly
+        """
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"Unsupported quantization: {quantization}")
+        self.name = name
+        self.dim = dim
+        self.embedding_function = embedding_function
+        self.path = path
+        self.rank_key = rank_key
+        self.winner_fraction = winner_fraction
+        self._aggregates_template = aggregates
+        self.quantization = quantization
+        self.rerank_factor = rerank_factor
+
+        self._lock = threading.RLock()
+        self._signature = None   # store_signature() of the store the base segment maps
+        self._reset(None, initial_capacity)
+        self._aggregates_cache: Optional[RunningAggregates] = self._new_aggregates()
+
+    @classmethod
+    def open(
+        cls,
+        path: str,
+        embedding_function: Optional[Callable[[List[str]], List[List[float]]]] = None,
+        initial_capacity: int = 1024,
+        rank_key: Optional[str] = None,
+        winner_fraction: float = WINNER_FRACTION,
+        aggregates: Optional[RunningAggregates] = None,
+        quantization: Optional[str] = None,
+        rerank_factor: int = RERANK_FACTOR
+    ) -> "VectorCollection":
+        """
+        Open a persisted collection without copying it onto the heap
+
+        Embeddings, ids, documents and metadata are memory-mapped, so opening
+        costs only the manifest read and every process mapping the same store
+        shares the same physical pages.
+
+        Args:
+            path: Store directory written by persist()
+            embedding_function: Optional embedding callable
+            initial_capacity: Heap rows reserved for writes made after opening
+            rank_key: Metadata key whose live ranking maintains is_winner / percentile_rank
+            winner_fraction: Share of ranked records flagged is_winner
+            aggregates: Empty RunningAggregates, filled from the store on first read
+            quantization: "int8" to search the store's codes (written by the
+                next persist() if the store has none yet)
+            rerank_factor: Shortlist size per result re-ranked exactly
+
+        Returns:
+            VectorCollection backed by the store
+        """
+        signature = store_signature(path)
+        store = open_store(path)
+        manifest = store["manifest"]
+        collection = cls(
+            name=manifest["name"],
+            dim=manifest["dim"],
+            embedding_function=embedding_function,
+            initial_capacity=initial_capacity,
+            path=path,
+            rank_key=rank_key,
+            winner_fraction=winner_fraction,
+            aggregates=aggregates,
+            quantization=quantization,
+            rerank_factor=rerank_factor
+        )
+        collection._reset(store, initial_capacity)
+        collection._signature = signature
+        collection._aggregates_cache = None
+        return collection
+
+    @classmethod
+    def open_or_create(
+        cls,
+        path: str,
+        name: str = "posts",
+        dim: int = DEFAULT_DIM,
+        embedding_function: Optional[Callable[[List[str]], List[List[float]]]] = None,
+        rank_key: Optional[str] = None,
+        winner_fraction: float = WINNER_FRACTION,
+        aggregates: Optional[RunningAggregates] = None,
+        quantization: Optional[str] = None
+    ) -> "VectorCollection":
+        """
+        Open the store at `path` if one exists, otherwise start an empty
+        collection that will persist there
+
+        Args:
+            path: Store directory
+            name: Collection name for a new store
+            dim: Embedding dimension for a new store
+            embedding_function: Optional embedding callable
+            rank_key: Metadata key whose live ranking maintains is_winner / percentile_rank
+            winner_fraction: Share of ranked records flagged is_winner
+            aggregates: Empty RunningAggregates to maintain on every write
+            quantization: "int8" for quantized first-pass search
+
+        Returns:
+            VectorCollection
+        """
+        if store_exists(path):
+            return cls.open(path, embedding_function=embedding_function, rank_key=rank_key,
+                            winner_fraction=winner_fraction, aggregates=aggregates,
+                            quantization=quantization)
+        return cls(name=name, dim=dim, embedding_function=embedding_function, path=path,
+                   rank_key=rank_key, winner_fraction=winner_fraction, aggregates=aggregates,
+                   quantization=quantization)
+
+    def persist(self, path: Optional[str] = None):
+        """
+        Write all live rows to disk and re-map the collection onto the new files
+
+        Deleted rows are compacted away. The write is atomic: it goes to a
+        sibling directory which then replaces `path`. The store lock is held
+        from re-reading the store to the swap, so when another process has
+        persisted since this collection last synced, its rows are kept and
+        only the writes made here are applied on top.
+
+        Args:
+            path: Target directory (defaults to the collection's path)
+        """
+        target = path or self.path
+        if not target:
+            raise ValueError("persist() needs a path")
+
+        with self._lock, store_lock(target):
+            if target == self.path and store_signature(target) != self._signature and store_exists(target):
+                self._reload(open_store(target))
+            rows = np.flatnonzero(self._alive[:self._size])
+            quantizer = None
+            if self.quantization == "int8":
+                sample = rows
+                if len(rows) > FIT_SAMPLE:
+                    sample = np.sort(np.random.default_rng(0).choice(rows, FIT_SAMPLE, replace=False))
+                quantizer = ScalarQuantizer.fit(self._vectors(sample))
+            write_store(
+                target,
+                name=self.name,
+                dim=self.dim,
+                ids=[self._ids[int(r)] for r in rows],
+                embedding_chunks=(self._vectors(rows[i:i + 65536])
+                                  for i in range(0, len(rows), 65536)),
+                documents=[self._documents[int(r)] for r in rows],
+                metadatas=[self._metadata_at(int(r)) for r in rows],
+                quantizer=quantizer,
+                locked=True
+            )
+            self.path = target
+            self._reset(open_store(target), self._embeddings.shape[0])
+            self._signature = store_signature(target)
+            # Aggregates are keyed by id, so they stay valid across compaction
+
+    def _refresh(self):
+        """Re-map onto the store if another process has replaced it (caller holds _lock)"""
+        if not self.path:
+            return
+        signature = store_signature(self.path)
+        if signature is None or signature == self._signature:
+            return
+        with store_lock(self.path, shared=True):
+            signature = store_signature(self.path)
+            self._reload(open_store(self.path))
+        self._signature = signature
+
+    def _reload(self, store: Dict):
+        """
+        Re-map onto `store` and replay the writes made since the last open / persist
+
+        Rows written here overwrite the store's copy of the same id; ids
+        deleted here are deleted from it. Everything else comes from `store`.
+        """
+        tail = np.flatnonzero(self._alive[self._base_size:self._size]) + self._base_size
+        touched = [row for row in self._touched if self._alive[row]]
+        rows = np.union1d(np.array(touched, dtype=np.int64), tail).astype(np.int64)
+        ids = [self._ids[int(r)] for r in rows]
+        vectors = np.array(self._vectors(rows), dtype=np.float32).reshape(len(rows), self.dim)
+        documents = [self._documents[int(r)] for r in rows]
+        metadatas = [self._metadatas[int(r)] for r in rows]
+        deleted = self._deleted
+
+        self._reset(store, self._embeddings.shape[0])
+        self._aggregates_cache = None   # rebuilt from the new rows on first use
+        for record_id in deleted:
+            row = self._id_to_row.get(record_id)
+            if row is not None:
+                self._remove(row)
+        self._write_rows(ids, vectors, documents, metadatas)
+
+    def _reset(self, store: Optional[Dict], capacity: int):
+        """(Re)initialize storage, optionally on top of an opened store"""
+        if store is not None:
+            self._base_embeddings = store["embeddings"]
+            base_size = self._base_embeddings.shape[0]
+        else:
+            self._base_embeddings = np.zeros((0, self.dim), dtype=np.float32)
+            base_size = 0
+
+        self._base_size = base_size
+        quantized = store is not None and self.quantization and store["codes"] is not None
+        self._base_codes = store["codes"] if quantized else None
+        self._quantizer = store["quantizer"] if quantized else None
+        self._embeddings = np.zeros((max(1, capacity), self.dim), dtype=np.float32)  # tail rows
+        self._alive = np.zeros(base_size + max(1, capacity), dtype=bool)
+        self._alive[:base_size] = True
+        self._size = base_size   # rows written (including deleted)
+        self._live = base_size   # rows not deleted
+
+        self._ids = _SegmentedList(store["ids"] if store else None)
+        self._documents = _SegmentedList(store["documents"] if store else None)
+        self._metadatas = _SegmentedList(store["metadatas"] if store else None)
+        self._id_to_row_cache: Optional[Dict[str, int]] = None if store else {}
+        self._indexes_cache: Optional[MetadataIndexes] = None if store else self._new_indexes(
+            max(1, capacity))
+        self._touched: set = set()   # base rows overwritten since the store was mapped
+        self._deleted: set = set()   # ids deleted since the store was mapped
+
+    def _new_aggregates(self) -> Optional[RunningAggregates]:
+        if self._aggregates_template is None:
+            return None
+        return self._aggregates_template.copy_spec(source=self._live_records)
+
+    def _live_records(self):
+        """(id, stored metadata) for every live row"""
+        for row in np.flatnonzero(self._alive[:self._size]):
+            yield self._ids[int(row)], self._metadatas[int(row)]
+
+    def _new_indexes(self, capacity: int) -> MetadataIndexes:
+        return MetadataIndexes(capacity=capacity, rank_key=self.rank_key,
+                               winner_fraction=self.winner_fraction)
+
+    @property
+    def _id_to_row(self) -> Dict[str, int]:
+        """Id → row map, built lazily for mapped stores"""
+        if self._id_to_row_cache is None:
+            alive = self._alive
+            self._id_to_row_cache = {
+                self._ids[row]: row for row in range(self._size) if alive[row]
+            }
+        return self._id_to_row_cache
+
+    @property
+    def _indexes(self) -> MetadataIndexes:
+        """Secondary metadata indexes, built lazily from the columnar sidecar"""
+        if self._indexes_cache is None:
+            indexes = self._new_indexes(self._alive.shape[0])
+            metadatas = self._metadatas
+            if self._base_size:
+                indexes.load_columns(0, self._base_size, metadatas.base.column,
+                                     lambda row: metadatas.base[row])
+            for row, override in metadatas.overrides.items():
+                indexes.on_update(row, metadatas.base[row], override)
+            indexes.on_append(self._base_size, metadatas.tail)
+            for row in np.flatnonzero(~self._alive[:self._size]):
+                indexes.on_remove(int(row), metadatas[int(row)])
+            self._indexes_cache = indexes
+        return self._indexes_cache
+
+    @property
+    def _aggregates(self) -> RunningAggregates:
+        """Running aggregates, built with one pass for mapped stores"""
+        if self._aggregates_cache is None:
+            aggregates = self._new_aggregates()
+            aggregates.rebuild()
+            self._aggregates_cache = aggregates
+        return self._aggregates_cache
+
+    # ── WRITES ────────────────────────────────────────────────────────────────
+
+    def add(
+        self,
+        ids: Sequence[str],
+        embeddings: Optional[Sequence[Sequence[float]]] = None,
+        documents: Optional[Sequence[str]] = None,
+        metadatas: Optional[Sequence[Dict]] = None
+    ) -> int:
+        """
+        Add new records. Ids that already exist are skipped (ChromaDB semantics).
+
+        Args:
+            ids: Record ids
+            embeddings: One vector per id (computed via embedding_function if omitted)
+            documents: One document per id
+            metadatas: One metadata dict per id
+
+        Returns:
+            Number of records added
+        """
+        ids, embeddings, documents, metadatas = self._prepare(ids, embeddings, documents, metadatas)
+
+        with self._lock:
+            self._refresh()
+            fresh, seen = [], set()
+            for i, record_id in enumerate(ids):
+                if record_id in self._id_to_row or record_id in seen:
+                    continue
+                seen.add(record_id)
+                fresh.append(i)
+            if not fresh:
+                return 0
+            self._append(
+                [ids[i] for i in fresh],
+                embeddings[fresh],
+                [documents[i] for i in fresh],
+                [metadatas[i] for i in fresh]
+            )
+            return len(fresh)
+
+    def upsert(
+        self,
+        ids: Sequence[str],
+        embeddings: Optional[Sequence[Sequence[float]]] = None,
+        documents: Optional[Sequence[str]] = None,
+        metadatas: Optional[Sequence[Dict]] = None
+    ):
+        """
+        Insert new records and overwrite existing ones
+
+        Args:
+            ids: Record ids
+            embeddings: One vector per id (computed via embedding_function if omitted)
+            documents: One document per id
+            metadatas: One metadata dict per id
+        """
+        ids, embeddings, documents, metadatas = self._prepare(ids, embeddings, documents, metadatas)
+
+        with self._lock:
+            self._refresh()
+            self._write_rows(ids, embeddings, documents, metadatas)
+
+    def update(
+        self,
+        ids: Sequence[str],
+        embeddings: Optional[Sequence[Sequence[float]]] = None,
+        documents: Optional[Sequence[str]] = None,
+        metadatas: Optional[Sequence[Dict]] = None
+    ):
+        """
+        Update existing records in place. Metadata is merged key-by-key;
+        unknown ids are ignored.
+
+        Args:
+            ids: Record ids
+            embeddings: Optional replacement vectors
+            documents: Optional replacement documents
+            metadatas: Optional metadata patches
+        """
+        vectors = self._as_matrix(embeddings) if embeddings is not None else None
+
+        with self._lock:
+            self._refresh()
+            for i, record_id in enumerate(ids):
+                row = self._id_to_row.get(record_id)
+                if row is None:
+                    continue
+                merged = None
+                if metadatas is not None:
+                    merged = dict(self._metadatas[row])
+                    merged.update(metadatas[i] or {})
+                self._overwrite(
+                    row,
+                    vectors[i] if vectors is not None else None,
+                    documents[i] if documents is not None else None,
+                    merged
+                )
+
+    def delete(self, ids: Optional[Sequence[str]] = None, where: Optional[Dict] = None):
+        """
+        Delete records by id and/or metadata filter
+
+        Args:
+            ids: Record ids to delete
+            where: Metadata filter selecting records to delete
+        """
+        with self._lock:
+            self._refresh()
+            rows = self._select_rows(ids=ids, where=where)
+            for row in rows:
+                self._remove(int(row))
+
+    # ── READS ─────────────────────────────────────────────────────────────────
+
+    def count(self) -> int:
+        """Number of live records"""
+        with self._lock:
+            self._refresh()
+            return self._live
+
+    def stats(self, top_k: int = 10) -> Dict:
+        """
+        Running aggregates (O(1) apart from sorting the top-k)
+
+        Args:
+            top_k: Records returned in "top"
+
+        Returns:
+            RunningAggregates.snapshot() with "top" expanded to
+            {"id", "document", "metadata", "value"} dicts
+        """
+        if self._aggregates_template is None:
+            raise ValueError(f"Collection '{self.name}' was created without aggregates")
+        with self._lock:
+            self._refresh()
+            snapshot = self._aggregates.snapshot(top_k)
+            if "top" in snapshot:
+                id_to_row = self._id_to_row
+                snapshot["top"] = [
+                    {"id": record_id, "document": self._documents[id_to_row[record_id]],
+                     "metadata": self._metadata_at(id_to_row[record_id]), "value": value}
+                    for record_id, value in snapshot["top"]
+                ]
+            return snapshot
+
+    def verify_stats(self, repair: bool = True) -> Dict:
+        """
+        Check the running aggregates against a from-scratch rebuild
+
+        Args:
+            repair: Replace them with the rebuilt ones on mismatch
+
+        Returns:
+            {"consistent": bool, "drift": {...}}
+        """
+        if self._aggregates_template is None:
+            raise ValueError(f"Collection '{self.name}' was created without aggregates")
+        with self._lock:
+            return self._aggregates.verify(repair=repair)
+
+    def value_percentiles(self, key: str, values: Sequence[float]) -> Optional[np.ndarray]:
+        """
+        Mid-rank of values among the live values of `key`
+
+        Args:
+            key: Metadata key; answered from the rank index when key == rank_key
+            values: Raw values to place in the distribution
+
+        Returns:
+            (len(values),) floats in [0, 1], or None when `key` is not ranked
+        """
+        if key != self.rank_key:
+            return None
+        with self._lock:
+            self._refresh()
+            return self._indexes.rank.midranks(np.asarray(values, dtype=np.float64))
+
+    def value_moments(self, key: str) -> Optional[Tuple[float, float]]:
+        """(mean, std) of `key` from the running aggregates, or None when not tracked"""
+        if self._aggregates_template is None or key not in self._aggregates_template.numeric_fields:
+            return None
+        with self._lock:
+            self._refresh()
+            stats = self._aggregates.numeric(key)
+        return (stats["avg"], stats["std"]) if stats["count"] else None
+
+    def get(
+        self,
+        ids: Optional[Sequence[str]] = None,
+        where: Optional[Dict] = None,
+        limit: Optional[int] = None,
+        offset: Optional[int] = None,
+        include: Optional[List[str]] = None
+    ) -> Dict:
+        """
+        Fetch records by id and/or metadata filter, in insertion order
+
+        Args:
+            ids: Restrict to these ids
+            where: Metadata filter
+            limit: Maximum number of records
+            offset: Number of matching records to skip
+            include: Fields to return ("documents", "metadatas", "embeddings")
+
+        Returns:
+            Dict with "ids" plus the requested fields
+        """
+        include = DEFAULT_GET_INCLUDE if include is None else include
+
+        with self._lock:
+            self._refresh()
+            start = offset or 0
+            rows = self._select_rows(
+                ids=ids, where=where, limit=start + limit if limit is not None else None)
+            rows = rows[start:start + limit] if limit is not None else rows[start:]
+            return self._build_result(rows, include)
+
+    def scan_sorted(
+        self,
+        key: str = "ers",
+        where: Optional[Dict] = None,
+        after: Optional[Tuple[Optional[float], str]] = None,
+        min_value: Optional[float] = None,
+        max_value: Optional[float] = None,
+        batch_size: int = 256
+    ) -> Iterator[Dict]:
+        """
+        Stream records ordered by a sorted-index key, highest first
+
+        Order is (key descending, id ascending); records without a numeric
+        value come last, by id. Each batch re-seeks from the last record
+        yielded, so the lock is only held per batch and concurrent writes
+        never skip or repeat records.
+
+        Args:
+            key: Key with a SortedIndex (e.g. "ers")
+            where: Additional metadata filter
+            after: Cursor (value, id) of the last record already seen;
+                value None means the unranked tail
+            min_value: Inclusive lower bound on the key
+            max_value: Inclusive upper bound on the key
+            batch_size: Records gathered per lock acquisition
+
+        Yields:
+            {"id", "document", "metadata", "value"} dicts
+        """
+        if key not in self._indexes.sorted:
+            raise ValueError(f"'{key}' has no sorted index")
+        node = compile_where(where) if where else None
+        lower = -np.inf if min_value is None else float(min_value)
+        upper = np.inf if max_value is None else float(max_value)
+        ranged = min_value is not None or max_value is not None
+
+        cursor = after
+        while True:
+            with self._lock:
+                self._refresh()
+                if cursor is None or cursor[0] is not None:
+                    batch = self._sorted_batch(key, node, cursor, lower, upper, batch_size)
+                    if not batch and not ranged:
+                        batch = self._unranked_batch(key, node, None, batch_size)
+                elif ranged:
+                    batch = []
+                else:
+                    batch = self._unranked_batch(key, node, cursor[1], batch_size)
+                records = [
+                    {"id": self._ids[row], "document": self._documents[row],
+                     "metadata": self._metadata_at(row), "value": value}
+                    for value, _, row in batch
+                ]
+            if not records:
+                return
+            yield from records
+            cursor = (records[-1]["value"], records[-1]["id"])
+
+    def _sorted_batch(self, key, node, cursor, lower, upper, batch_size):
+        """Next (value, id, row) entries after `cursor` in descending key order"""
+        index = self._indexes.sorted[key]
+        top = upper if cursor is None else min(upper, cursor[0])
+        want = batch_size
+        while True:
+            values, rows, exhausted = index.descending(top, lower, want)
+            live = self._alive[rows]
+            if node is not None and live.any():
+                order = np.argsort(rows[live], kind="stable")
+                kept = self._indexes.select(node, self._alive, self._size, self._metadata_at,
+                                            rows=rows[live][order])
+                live[live] = np.isin(rows[live], kept)
+            entries = sorted(
+                ((float(v), self._ids[int(r)], int(r)) for v, r in zip(values[live], rows[live])),
+                key=lambda e: (-e[0], e[1])
+            )
+            if cursor is not None:
+                entries = [e for e in entries if e[0] < cursor[0] or e[1] > cursor[1]]
+            if len(entries) >= batch_size or exhausted:
+                return entries[:batch_size]
+            want *= 4
+
+    def _unranked_batch(self, key, node, after_id, batch_size):
+        """Live rows without a numeric key value, by id, after `after_id`"""
+        index = self._indexes.sorted[key]
+        rows = np.flatnonzero(self._alive[:self._size] & np.isnan(index.by_row[:self._size]))
+        if node is not None and len(rows):
+            rows = self._indexes.select(node, self._alive, self._size, self._metadata_at, rows=rows)
+        ids = sorted((self._ids[int(r)], int(r)) for r in rows)
+        if after_id is not None:
+            ids = [entry for entry in ids if entry[0] > after_id]
+        return [(None, record_id, row) for record_id, row in ids[:batch_size]]
+
+    def query(
+        self,
+        query_embeddings: Optional[Sequence[Sequence[float]]] = None,
+        n_results: int = 10,
+        where: Optional[Dict] = None,
+        include: Optional[List[str]] = None,
+        query_texts: Optional[Sequence[str]] = None
+    ) -> Dict:
+        """
+        Exact cosine top-k search
+
+        Args:
+            query_embeddings: Query vectors
+            n_results: Results per query
+            where: Metadata filter applied before ranking
+            include: Fields to return ("documents", "metadatas", "distances", "embeddings")
+            query_texts: Raw query strings, embedded with embedding_function
+
+        Returns:
+            Dict of lists-of-lists (one inner list per query). Distances are
+            cosine distances (1 - cosine similarity).
+        """
+        include = DEFAULT_QUERY_INCLUDE if include is None else include
+        if query_embeddings is None:
+            if query_texts is None:
+                raise ValueError("query() requires query_embeddings or query_texts")
+            query_embeddings = self._embed(list(query_texts))
+        queries = normalize_rows(self._as_matrix(query_embeddings))
+
+        result = {"ids": []}
+        for field in include:
+            result[field] = []
+
+        with self._lock:
+            self._refresh()
+            candidates = self._candidate_rows(where)
+            k = min(n_results, self._live)
+            if self._base_codes is not None:
+                hits = [self._quantized_top_k(q, k, candidates) for q in queries]
+            else:
+                hits = self._exact_top_k(queries, k, candidates)
+
+            for rows, sims in hits:
+                hit = self._build_result(rows, include)
+                result["ids"].append(hit["ids"])
+                for field in include:
+                    if field == "distances":
+                        result["distances"].append((1.0 - sims).astype(float).tolist())
+                    else:
+                        result[field].append(hit.get(field, []))
+
+        return result
+
+    # ── INTERNALS ─────────────────────────────────────────────────────────────
+
+    def _prepare(self, ids, embeddings, documents, metadatas):
+        """Validate write arguments and fill in defaults"""
+        ids = list(ids)
+        documents = list(documents) if documents is not None else [""] * len(ids)
+        metadatas = [dict(m or {}) for m in metadatas] if metadatas is not None else [{} for _ in ids]
+
+        if embeddings is None:
+            if self.embedding_function is not None:
+                embeddings = self._embed(documents)
+            else:
+                embeddings = np.zeros((len(ids), self.dim), dtype=np.float32)
+
+        vectors = self._as_matrix(embeddings)
+        if not (len(ids) == len(documents) == len(metadatas) == vectors.shape[0]):
+            raise ValueError("ids, embeddings, documents and metadatas must have the same length")
+        return ids, normalize_rows(vectors), documents, metadatas
+
+    def _embed(self, texts: List[str]):
+        """Embed texts with the configured embedding function"""
+        if self.embedding_function is None:
+            raise ValueError(f"Collection '{self.name}' has no embedding_function")
+        return self.embedding_function(texts)
+
+    def _as_matrix(self, vectors) -> np.ndarray:
+        """Coerce a sequence of vectors to a (n, dim) float32 array"""
+        matrix = np.array(vectors, dtype=np.float32, ndmin=2)
+        if matrix.shape[1] != self.dim:
+            raise ValueError(f"Expected embeddings of dimension {self.dim}, got {matrix.shape[1]}")
+        return matrix
+
+    def _reserve(self, extra: int):
+        """Grow the tail buffer geometrically to fit `extra` more rows"""
+        tail_size = self._size - self._base_size
+        needed = tail_size + extra
+        capacity = self._embeddings.shape[0]
+        if needed > capacity:
+            grown = np.zeros((max(needed, capacity * 2), self.dim), dtype=np.float32)
+            grown[:tail_size] = self._embeddings[:tail_size]
+            self._embeddings = grown
+        if self._size + extra > self._alive.shape[0]:
+            alive = np.zeros(self._base_size + self._embeddings.shape[0], dtype=bool)
+            alive[:self._size] = self._alive[:self._size]
+            self._alive = alive
+
+    def _write_rows(self, ids, vectors, documents, metadatas):
+        """Overwrite the rows of known ids and append the rest (vectors normalized)"""
+        fresh = []
+        for i, record_id in enumerate(ids):
+            row = self._id_to_row.get(record_id)
+            if row is None:
+                fresh.append(i)
+            else:
+                self._overwrite(row, vectors[i], documents[i], metadatas[i])
+        if fresh:
+            self._append(
+                [ids[i] for i in fresh],
+                vectors[fresh],
+                [documents[i] for i in fresh],
+                [metadatas[i] for i in fresh]
+            )
+
+    def _append(self, ids, vectors, documents, metadatas):
+        """Append already-normalized records at the end of the tail"""
+        count = len(ids)
+        self._reserve(count)
+        start = self._size
+        tail_start = start - self._base_size
+        self._embeddings[tail_start:tail_start + count] = vectors
+        self._alive[start:start + count] = True
+        id_to_row = self._id_to_row
+        for offset, record_id in enumerate(ids):
+            id_to_row[record_id] = start + offset
+        self._ids.extend(ids)
+        self._documents.extend(documents)
+        self._metadatas.extend(metadatas)
+        if self._indexes_cache is not None:
+            self._indexes_cache.on_append(start, metadatas)
+        if self._aggregates_cache is not None:
+            for record_id, metadata in zip(ids, metadatas):
+                self._aggregates_cache.add(record_id, metadata)
+        self._size += count
+        self._live += count
+
+    def _overwrite(self, row: int, vector, document, metadata):
+        """Replace the stored fields of an existing row"""
+        if row < self._base_size:
+            self._touched.add(row)
+        if vector is not None:
+            normalized = normalize_rows(np.array(vector, dtype=np.float32, ndmin=2))[0]
+            if row < self._base_size:
+                self._base_embeddings[row] = normalized  # copy-on-write page
+                if self._base_codes is not None:
+                    self._base_codes[row] = self._quantizer.encode(normalized[None])[0]
+            else:
+                self._embeddings[row - self._base_size] = normalized
+        if document is not None:
+            self._documents[row] = document
+        if metadata is not None:
+            if self._indexes_cache is not None:
+                self._indexes_cache.on_update(row, self._metadatas[row], metadata)
+            if self._aggregates_cache is not None:
+                self._aggregates_cache.update(self._ids[row], self._metadatas[row], metadata)
+            self._metadatas[row] = metadata
+
+    def _vectors(self, rows: np.ndarray) -> np.ndarray:
+        """Embedding rows (ascending row numbers) gathered from base and tail"""
+        split = np.searchsorted(rows, self._base_size)
+        base_rows, tail_rows = rows[:split], rows[split:]
+        if not len(tail_rows):
+            return self._base_embeddings[base_rows]
+        tail = self._embeddings[tail_rows - self._base_size]
+        if not len(base_rows):
+            return tail
+        return np.concatenate([self._base_embeddings[base_rows], tail])
+
+    def _row_vector(self, row: int) -> np.ndarray:
+        """Embedding of a single row"""
+        if row < self._base_size:
+            return self._base_embeddings[row]
+        return self._embeddings[row - self._base_size]
+
+    def _row_block(self, start: int, stop: int) -> np.ndarray:
+        """Embeddings of rows [start, stop) as slices (no gather when within one segment)"""
+        base = self._base_size
+        if stop <= base:
+            return self._base_embeddings[start:stop]
+        if start >= base:
+            return self._embeddings[start - base:stop - base]
+        return np.concatenate([self._base_embeddings[start:], self._embeddings[:stop - base]])
+
+    def _exact_top_k(self, queries: np.ndarray, k: int, candidates: Optional[np.ndarray]):
+        """
+        Exact top-k for a batch of queries with one matrix product per block
+
+        All queries are scored together (block @ queries.T), so a batch costs
+        one pass over the embeddings instead of one per query. Blocks of
+        QUERY_BLOCK rows keep the score matrix bounded.
+
+        Returns:
+            [(rows best first, cosine similarities)] per query
+        """
+        total = self._size if candidates is None else len(candidates)
+        # a single query stays a matrix-vector product (BLAS gemv beats an n×1 gemm)
+        weights = queries[0] if len(queries) == 1 else queries.T
+        found_rows = [[] for _ in queries]
+        found_scores = [[] for _ in queries]
+        for start in range(0, total, QUERY_BLOCK):
+            stop = min(total, start + QUERY_BLOCK)
+            if candidates is None:
+                rows = np.arange(start, stop)
+                scores = (self._row_block(start, stop) @ weights).reshape(stop - start, -1)
+                scores[~self._alive[start:stop]] = -np.inf
+            else:
+                rows = candidates[start:stop]
+                scores = (self._vectors(rows) @ weights).reshape(len(rows), -1)
+            for j in range(len(queries)):
+                best = top_k_indices(scores[:, j], k)
+                found_rows[j].append(rows[best])
+                found_scores[j].append(scores[best, j])
+
+        hits = []
+        for rows, scores in zip(found_rows, found_scores):
+            rows = np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+            scores = np.concatenate(scores) if scores else np.empty(0, dtype=np.float32)
+            best = top_k_indices(scores, k)
+            best = best[np.isfinite(scores[best])]
+            hits.append((rows[best], scores[best]))
+        return hits
+
+    def _quantized_top_k(self, q: np.ndarray, k: int, candidates: Optional[np.ndarray]):
+        """
+        Two-pass search: int8 scores for the base segment (exact for the tail),
+        then exact float re-ranking of the best rerank_factor × k rows
+
+        Returns:
+            (rows best first, exact cosine similarities)
+        """
+        if candidates is None:
+            tail = self._embeddings[:self._size - self._base_size] @ q
+            scores = np.concatenate([self._quantizer.scores(self._base_codes, q), tail])
+            scores[~self._alive[:self._size]] = -np.inf
+            rows = None
+        else:
+            rows = candidates
+            split = np.searchsorted(rows, self._base_size)
+            scores = np.concatenate([
+                self._quantizer.scores(self._base_codes[rows[:split]], q),
+                self._embeddings[rows[split:] - self._base_size] @ q
+            ])
+
+        shortlist = top_k_indices(scores, k * self.rerank_factor)
+        shortlist = shortlist[np.isfinite(scores[shortlist])]
+        shortlist = np.sort(shortlist if rows is None else rows[shortlist])
+        exact = self._vectors(shortlist) @ q
+        best = top_k_indices(exact, k)
+        return shortlist[best], exact[best]
+
+    def _remove(self, row: int):
+        """Tombstone a row"""
+        if not self._alive[row]:
+            return
+        self._alive[row] = False
+        self._deleted.add(self._ids[row])
+        if self._indexes_cache is not None:
+            self._indexes_cache.on_remove(row, self._metadatas[row])
+        if self._aggregates_cache is not None:
+            self._aggregates_cache.remove(self._ids[row], self._metadatas[row])
+        del self._id_to_row[self._ids[row]]
+        self._live -= 1
+
+    def _candidate_rows(self, where: Optional[Dict]) -> Optional[np.ndarray]:
+        """Live rows passing the filter, or None when there is no filter"""
+        if not where:
+            return None
+        return self._select_rows(where=where)
+
+    def _select_rows(self, ids=None, where=None, limit: Optional[int] = None) -> np.ndarray:
+        """
+        Live row numbers matching ids and where, in insertion order
+
+        Args:
+            ids: Restrict to these ids
+            where: Metadata filter
+            limit: Stop once this many rows are found
+
+        Returns:
+            Ascending int64 row array
+        """
+        rows = None
+        if ids is not None:
+            rows = np.array(sorted({self._id_to_row[i] for i in ids if i in self._id_to_row}),
+                            dtype=np.int64)
+        if not where and rows is None and limit is None:
+            return np.flatnonzero(self._alive[:self._size])
+        return self._indexes.select(
+            compile_where(where) if where else None,
+            self._alive,
+            self._size,
+            self._metadata_at,
+            limit=limit,
+            rows=rows
+        )
+
+    def _metadata_at(self, row: int) -> Dict:
+        """Stored metadata, with rank-derived fields overlaid when ranking is on"""
+        metadata = self._metadatas[row]
+        if self.rank_key is None:
+            return metadata
+        return {**metadata, **self._indexes.rank.derive(row)}
+
+    def _build_result(self, rows, include: List[str]) -> Dict:
+        """Assemble a ChromaDB-shaped result for the given rows"""
+        rows = [int(r) for r in rows]
+        result = {"ids": [self._ids[r] for r in rows]}
+        if "documents" in include:
+            result["documents"] = [self._documents[r] for r in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [self._metadata_at(r) for r in rows]
+        if "embeddings" in include:
+            result["embeddings"] = [self._row_vector(r).tolist() for r in rows]
+        return result
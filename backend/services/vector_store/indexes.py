@@ -0,0 +1,581 @@
+"""
+Secondary Indexes and Query Planner for VectorCollection
+Answers compiled where clauses without touching per-row metadata dicts.
+
+- BitmapIndex: one boolean bitmap per distinct value (is_winner, source,
+  platform, brand_id, type) plus live counts for selectivity estimates
+- SortedIndex: a per-row float column plus a value-sorted (value, row) array
+  for range bisects (ers, percentile_rank)
+
+The planner estimates each indexed condition's match count, drives an $and
+from its most selective child and verifies the rest with vectorized gathers.
+When nothing is selective it scans the bitmaps window by window and stops as
+soon as `limit` rows are found. Conditions on unindexed keys fall back to
+per-row evaluation of only the surviving candidates.
+
+With a rank key configured, is_winner / percentile_rank conditions are
+answered from live ERS order statistics (see ranking.py) instead of the
+stored values.
+"""
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from services.vector_store.ranking import WINNER_FRACTION, RankIndex
+from services.vector_store.where import AndNode, Condition
+
+DEFAULT_BITMAP_KEYS = ("is_winner", "source", "platform", "brand_id", "type")
+DEFAULT_SORTED_KEYS = ("ers", "percentile_rank")
+
+SCAN_WINDOW = 65536       # rows per vectorized scan step
+DRIVER_FRACTION = 1 / 16  # use an index as driver when it keeps ≤ this share of rows
+RANGE_OPS = {"$gt", "$gte", "$lt", "$lte", "$eq"}
+
+
+def _grow(array: np.ndarray, capacity: int, fill) -> np.ndarray:
+    """Return `array` extended to `capacity` entries"""
+    if array.shape[0] >= capacity:
+        return array
+    grown = np.full(max(capacity, array.shape[0] * 2), fill, dtype=array.dtype)
+    grown[:array.shape[0]] = array
+    return grown
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, complex)
+
+
+class BitmapIndex:
+    """Equality index: value → row bitmap"""
+
+    def __init__(self, key: str, capacity: int = 1024):
+        self.key = key
+        self.capacity = capacity
+        self.bitmaps: Dict[Hashable, np.ndarray] = {}
+        self.counts: Dict[Hashable, int] = {}
+
+    def ensure_capacity(self, capacity: int):
+        if capacity <= self.capacity:
+            return
+        self.capacity = max(capacity, self.capacity * 2)
+        for value, bitmap in self.bitmaps.items():
+            self.bitmaps[value] = _grow(bitmap, self.capacity, False)
+
+    def add(self, row: int, value):
+        try:
+            bitmap = self.bitmaps.get(value)
+        except TypeError:  # unhashable values are left to per-row evaluation
+            return
+        if bitmap is None:
+            bitmap = np.zeros(self.capacity, dtype=bool)
+            self.bitmaps[value] = bitmap
+            self.counts[value] = 0
+        bitmap[row] = True
+        self.counts[value] += 1
+
+    def discard(self, row: int, value):
+        try:
+            bitmap = self.bitmaps.get(value)
+        except TypeError:
+            return
+        if bitmap is not None and bitmap[row]:
+            bitmap[row] = False
+            self.counts[value] -= 1
+
+    def add_codes(self, start: int, codes: np.ndarray, dictionary: Sequence, present: np.ndarray):
+        """Bulk-load a dictionary-encoded column"""
+        self.ensure_capacity(start + len(codes))
+        for code, value in enumerate(dictionary):
+            rows = np.flatnonzero(present & (codes == code))
+            if len(rows):
+                self._bulk(value, start + rows)
+
+    def add_values(self, start: int, values: np.ndarray, present: np.ndarray):
+        """Bulk-load a typed (bool / int / float) column"""
+        self.ensure_capacity(start + len(values))
+        for value in np.unique(values[present]):
+            rows = np.flatnonzero(present & (values == value))
+            self._bulk(value.item(), start + rows)
+
+    def _bulk(self, value, rows: np.ndarray):
+        bitmap = self.bitmaps.get(value)
+        if bitmap is None:
+            bitmap = np.zeros(self.capacity, dtype=bool)
+            self.bitmaps[value] = bitmap
+            self.counts[value] = 0
+        bitmap[rows] = True
+        self.counts[value] += len(rows)
+
+    # planner hooks
+
+    def supports(self, condition: Condition) -> bool:
+        if condition.op in ("$eq", "$ne"):
+            return _hashable(condition.operand)
+        if condition.op in ("$in", "$nin"):
+            return isinstance(condition.operand, (list, tuple, set)) and all(
+                _hashable(v) for v in condition.operand)
+        return False
+
+    def _values(self, condition: Condition) -> List:
+        return [condition.operand] if condition.op in ("$eq", "$ne") else list(condition.operand)
+
+    def estimate(self, condition: Condition, total: int) -> int:
+        matched = sum(self.counts.get(v, 0) for v in self._values(condition))
+        return total - matched if condition.op in ("$ne", "$nin") else matched
+
+    def mask(self, condition: Condition, start: int, stop: int) -> np.ndarray:
+        result = np.zeros(stop - start, dtype=bool)
+        for value in self._values(condition):
+            bitmap = self.bitmaps.get(value)
+            if bitmap is not None:
+                result |= bitmap[start:stop]
+        if condition.op in ("$ne", "$nin"):
+            np.logical_not(result, out=result)
+        return result
+
+    def mask_rows(self, condition: Condition, rows: np.ndarray) -> np.ndarray:
+        result = np.zeros(len(rows), dtype=bool)
+        for value in self._values(condition):
+            bitmap = self.bitmaps.get(value)
+            if bitmap is not None:
+                result |= bitmap[rows]
+        if condition.op in ("$ne", "$nin"):
+            np.logical_not(result, out=result)
+        return result
+
+
+def _hashable(value) -> bool:
+    try:
+        hash(value)
+        return True
+    except TypeError:
+        return False
+
+
+class SortedIndex:
+    """Range index: dense per-row column plus a lazily merged sorted array"""
+
+    def __init__(self, key: str, capacity: int = 1024):
+        self.key = key
+        self.by_row = np.full(capacity, np.nan, dtype=np.float64)
+        self.sorted_values = np.empty(0, dtype=np.float64)
+        self.sorted_rows = np.empty(0, dtype=np.int64)
+        self._pending: List[int] = []   # rows added since the last merge
+        self._dirty = False             # bulk-loaded rows need a full sort
+        self._size = 0
+
+    def ensure_capacity(self, capacity: int):
+        self.by_row = _grow(self.by_row, capacity, np.nan)
+
+    def set(self, row: int, value, fresh: bool):
+        """
+        Record a row's value
+
+        Args:
+            row: Row number
+            value: Metadata value (non-numeric values are stored as missing)
+            fresh: True for newly appended rows, False for updates
+        """
+        number = float(value) if _is_number(value) else np.nan
+        self._size = max(self._size, row + 1)
+        if fresh:
+            self.by_row[row] = number
+            self._pending.append(row)
+            return
+
+        old = self.by_row[row]
+        if number == old or (np.isnan(number) and np.isnan(old)):
+            return
+        self.by_row[row] = number
+        if not self._dirty and not np.isnan(old):
+            # Pull the stale entry out of the sorted array; the row is re-merged
+            # from by_row on the next read (rows still pending are deduplicated)
+            lo = np.searchsorted(self.sorted_values, old, "left")
+            hi = np.searchsorted(self.sorted_values, old, "right")
+            hits = np.flatnonzero(self.sorted_rows[lo:hi] == row)
+            if len(hits):
+                position = lo + int(hits[0])
+                self.sorted_values = np.delete(self.sorted_values, position)
+                self.sorted_rows = np.delete(self.sorted_rows, position)
+        self._pending.append(row)
+
+    def load(self, start: int, values: np.ndarray, present: np.ndarray):
+        """Bulk-load a numeric column"""
+        self.ensure_capacity(start + len(values))
+        column = values.astype(np.float64)
+        column[~present] = np.nan
+        self.by_row[start:start + len(values)] = column
+        self._size = max(self._size, start + len(values))
+        self._dirty = True
+
+    def _ensure_sorted(self):
+        if len(self._pending) > len(self.sorted_values) // 4:
+            self._dirty = True  # one full argsort beats many inserts
+        if self._dirty:
+            column = self.by_row[:self._size]
+            rows = np.flatnonzero(~np.isnan(column))
+            order = np.argsort(column[rows], kind="stable")
+            self.sorted_rows = rows[order]
+            self.sorted_values = column[self.sorted_rows]
+            self._pending = []
+            self._dirty = False
+        elif self._pending:
+            rows = np.unique(np.array(self._pending, dtype=np.int64))
+            values = self.by_row[rows]
+            keep = ~np.isnan(values)
+            rows, values = rows[keep], values[keep]
+            order = np.argsort(values, kind="stable")
+            rows, values = rows[order], values[order]
+            positions = np.searchsorted(self.sorted_values, values, side="right")
+            self.sorted_values = np.insert(self.sorted_values, positions, values)
+            self.sorted_rows = np.insert(self.sorted_rows, positions, rows)
+            self._pending = []
+
+    def _bounds(self, condition: Condition) -> Tuple[int, int]:
+        values = self.sorted_values
+        operand = float(condition.operand)
+        if condition.op == "$eq":
+            return (np.searchsorted(values, operand, "left"), np.searchsorted(values, operand, "right"))
+        if condition.op == "$gt":
+            return np.searchsorted(values, operand, "right"), len(values)
+        if condition.op == "$gte":
+            return np.searchsorted(values, operand, "left"), len(values)
+        if condition.op == "$lt":
+            return 0, np.searchsorted(values, operand, "left")
+        return 0, np.searchsorted(values, operand, "right")  # $lte
+
+    def descending(self, upper: float, lower: float, count: int) -> Tuple[np.ndarray, np.ndarray, bool]:
+        """
+        Entries with lower ≤ value ≤ upper, highest first
+
+        Returns at least `count` entries when that many exist, extended so the
+        last value's tie group is complete (callers order ties themselves).
+        Deleted rows are included; callers mask them by liveness.
+
+        Args:
+            upper: Inclusive upper bound
+            lower: Inclusive lower bound
+            count: Minimum entries wanted
+
+        Returns:
+            (values, rows, exhausted): values descending; exhausted when
+            nothing at or above `lower` remains past the returned entries
+        """
+        self._ensure_sorted()
+        values = self.sorted_values
+        hi = int(np.searchsorted(values, upper, "right"))
+        floor = int(np.searchsorted(values, lower, "left"))
+        if count <= 0:
+            return values[:0], self.sorted_rows[:0], hi <= floor
+        lo = max(floor, hi - count)
+        if lo > floor:
+            lo = max(floor, int(np.searchsorted(values, values[lo], "left")))
+        return values[lo:hi][::-1], self.sorted_rows[lo:hi][::-1], lo == floor
+
+    # planner hooks
+
+    def supports(self, condition: Condition) -> bool:
+        return condition.op in RANGE_OPS and _is_number(condition.operand)
+
+    def estimate(self, condition: Condition, total: int) -> int:
+        self._ensure_sorted()
+        lo, hi = self._bounds(condition)
+        return int(hi - lo)
+
+    def rows(self, condition: Condition) -> np.ndarray:
+        """Matching rows straight from the sorted array, ascending by row"""
+        self._ensure_sorted()
+        lo, hi = self._bounds(condition)
+        return np.sort(self.sorted_rows[lo:hi])
+
+    def _compare(self, column: np.ndarray, condition: Condition) -> np.ndarray:
+        operand = float(condition.operand)
+        with np.errstate(invalid="ignore"):
+            if condition.op == "$eq":
+                return column == operand
+            if condition.op == "$gt":
+                return column > operand
+            if condition.op == "$gte":
+                return column >= operand
+            if condition.op == "$lt":
+                return column < operand
+            return column <= operand
+
+    def mask(self, condition: Condition, start: int, stop: int) -> np.ndarray:
+        return self._compare(self.by_row[start:stop], condition)
+
+    def mask_rows(self, condition: Condition, rows: np.ndarray) -> np.ndarray:
+        return self._compare(self.by_row[rows], condition)
+
+
+class MetadataIndexes:
+    """Secondary indexes over a collection's metadata plus the query planner"""
+
+    def __init__(
+        self,
+        bitmap_keys: Iterable[str] = DEFAULT_BITMAP_KEYS,
+        sorted_keys: Iterable[str] = DEFAULT_SORTED_KEYS,
+        capacity: int = 1024,
+        rank_key: Optional[str] = None,
+        winner_fraction: float = WINNER_FRACTION
+    ):
+        """
+        Args:
+            bitmap_keys: Keys indexed for equality / membership
+            sorted_keys: Keys indexed for ranges
+            capacity: Rows pre-allocated
+            rank_key: Key whose live ranking derives is_winner / percentile_rank
+            winner_fraction: Share of ranked rows flagged as winners
+        """
+        self.bitmaps = {key: BitmapIndex(key, capacity) for key in bitmap_keys}
+        self.sorted = {key: SortedIndex(key, capacity) for key in sorted_keys}
+        self.rank = RankIndex(rank_key, winner_fraction, capacity) if rank_key else None
+
+    # ── MAINTENANCE ───────────────────────────────────────────────────────────
+
+    def ensure_capacity(self, capacity: int):
+        for index in self.bitmaps.values():
+            index.ensure_capacity(capacity)
+        for index in self.sorted.values():
+            index.ensure_capacity(capacity)
+        if self.rank is not None:
+            self.rank.ensure_capacity(capacity)
+
+    def on_append(self, start: int, metadatas: Sequence[Dict]):
+        """Index freshly appended rows"""
+        self.ensure_capacity(start + len(metadatas))
+        for offset, meta in enumerate(metadatas):
+            row = start + offset
+            for key, index in self.bitmaps.items():
+                if key in meta:
+                    index.add(row, meta[key])
+            for key, index in self.sorted.items():
+                if key in meta:
+                    index.set(row, meta[key], fresh=True)
+            if self.rank is not None:
+                self.rank.add(row, meta)
+
+    def on_update(self, row: int, old: Dict, new: Dict):
+        """Re-index a row whose metadata changed"""
+        for key, index in self.bitmaps.items():
+            if key in old:
+                index.discard(row, old[key])
+            if key in new:
+                index.add(row, new[key])
+        for key, index in self.sorted.items():
+            if old.get(key) != new.get(key) or (key in old) != (key in new):
+                index.set(row, new.get(key), fresh=False)
+        if self.rank is not None:
+            self.rank.update(row, new)
+
+    def on_remove(self, row: int, old: Dict):
+        """Drop a deleted row from the bitmaps and ranking (sorted entries are masked by liveness)"""
+        for key, index in self.bitmaps.items():
+            if key in old:
+                index.discard(row, old[key])
+        if self.rank is not None:
+            self.rank.remove(row)
+
+    def load_columns(self, start: int, count: int, column_lookup: Callable[[str], Optional[Dict]],
+                     row_lookup: Callable[[int], Dict]):
+        """
+        Bulk-build indexes for a mapped segment from its columnar sidecar
+
+        Args:
+            start: First row of the segment
+            count: Rows in the segment
+            column_lookup: key → column dict from ColumnarMetadata.column()
+            row_lookup: row → metadata dict (fallback for JSON-encoded columns)
+        """
+        self.ensure_capacity(start + count)
+        for key, index in self.bitmaps.items():
+            column = column_lookup(key)
+            if column is None:
+                continue
+            present = np.asarray(column["present"])
+            if column["kind"] == "category":
+                index.add_codes(start, np.asarray(column["values"]), column["dictionary"], present)
+            elif column["kind"] in ("bool", "int", "float"):
+                index.add_values(start, np.asarray(column["values"]), present)
+            else:
+                for row in np.flatnonzero(present):
+                    index.add(start + int(row), row_lookup(start + int(row))[key])
+        for key, index in self.sorted.items():
+            column = column_lookup(key)
+            if column is None:
+                continue
+            present = np.asarray(column["present"])
+            if column["kind"] in ("bool", "int", "float"):
+                index.load(start, np.asarray(column["values"]), present)
+            else:
+                for row in np.flatnonzero(present):
+                    index.set(start + int(row), row_lookup(start + int(row))[key], fresh=True)
+        if self.rank is not None:
+            self.rank.load(start, self._float_column(column_lookup(self.rank.key), count, start, row_lookup))
+
+    def _float_column(self, column: Optional[Dict], count: int, start: int,
+                      row_lookup: Callable[[int], Dict]) -> np.ndarray:
+        """Numeric values of a column as float64, NaN where missing or non-numeric"""
+        values = np.full(count, np.nan, dtype=np.float64)
+        if column is None or column["kind"] in ("bool", "category"):
+            return values
+        present = np.asarray(column["present"])
+        if column["kind"] in ("int", "float"):
+            values[present] = np.asarray(column["values"])[present]
+            return values
+        for row in np.flatnonzero(present):
+            value = row_lookup(start + int(row))[self.rank.key]
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                values[row] = value
+        return values
+
+    # ── PLANNING ──────────────────────────────────────────────────────────────
+
+    def _index_for(self, condition: Condition):
+        if self.rank is not None and condition.key in RankIndex.DERIVED_KEYS:
+            # stored values are stale snapshots; unsupported forms run per row
+            return self.rank if self.rank.supports(condition) else None
+        index = self.bitmaps.get(condition.key) or self.sorted.get(condition.key)
+        if index is not None and index.supports(condition):
+            return index
+        return None
+
+    def is_indexed(self, node) -> bool:
+        """True when every leaf of the node can be answered from an index"""
+        if isinstance(node, Condition):
+            return self._index_for(node) is not None
+        return all(self.is_indexed(child) for child in node.children)
+
+    def estimate(self, node, total: int) -> int:
+        """Estimated number of matching rows (indexed nodes only)"""
+        if isinstance(node, Condition):
+            return self._index_for(node).estimate(node, total)
+        estimates = [self.estimate(child, total) for child in node.children]
+        if isinstance(node, AndNode):
+            return min(estimates)
+        return min(total, sum(estimates))
+
+    def mask(self, node, start: int, stop: int) -> np.ndarray:
+        """Vectorized match mask for rows [start, stop)"""
+        if isinstance(node, Condition):
+            return self._index_for(node).mask(node, start, stop)
+        masks = (self.mask(child, start, stop) for child in node.children)
+        result = next(masks).copy()
+        for other in masks:
+            if isinstance(node, AndNode):
+                result &= other
+            else:
+                result |= other
+        return result
+
+    def mask_rows(self, node, rows: np.ndarray) -> np.ndarray:
+        """Vectorized match mask for an explicit row array"""
+        if isinstance(node, Condition):
+            return self._index_for(node).mask_rows(node, rows)
+        masks = (self.mask_rows(child, rows) for child in node.children)
+        result = next(masks).copy()
+        for other in masks:
+            if isinstance(node, AndNode):
+                result &= other
+            else:
+                result |= other
+        return result
+
+    def rows(self, node, total: int) -> np.ndarray:
+        """All matching rows, ascending, using the cheapest access path"""
+        if isinstance(node, Condition):
+            index = self._index_for(node)
+            if isinstance(index, SortedIndex):
+                return index.rows(node)
+            return np.flatnonzero(index.mask(node, 0, total))
+        if isinstance(node, AndNode):
+            ordered = sorted(node.children, key=lambda child: self.estimate(child, total))
+            rows = self.rows(ordered[0], total)
+            for child in ordered[1:]:
+                if not len(rows):
+                    break
+                rows = rows[self.mask_rows(child, rows)]
+            return rows
+        return np.unique(np.concatenate([self.rows(child, total) for child in node.children]))
+
+    def split(self, node) -> Tuple[Optional[object], Optional[object]]:
+        """
+        Split a predicate into an indexed part and a residual evaluated per row
+
+        Returns:
+            (indexed node or None, residual node or None)
+        """
+        if self.is_indexed(node):
+            return node, None
+        if isinstance(node, AndNode):
+            indexed = [child for child in node.children if self.is_indexed(child)]
+            residual = [child for child in node.children if not self.is_indexed(child)]
+            return (
+                (indexed[0] if len(indexed) == 1 else AndNode(indexed)) if indexed else None,
+                residual[0] if len(residual) == 1 else AndNode(residual)
+            )
+        return None, node
+
+    def select(
+        self,
+        node,
+        alive: np.ndarray,
+        total: int,
+        metadata_at: Callable[[int], Dict],
+        limit: Optional[int] = None,
+        rows: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        Execute a compiled predicate
+
+        Args:
+            node: Compiled where clause (or None for "all rows")
+            alive: Liveness mask over all written rows
+            total: Number of written rows
+            metadata_at: Row → metadata dict, used for residual predicates
+            limit: Stop after this many matches (insertion order)
+            rows: Restrict evaluation to these ascending rows (e.g. from ids=)
+
+        Returns:
+            Matching live row numbers in ascending order
+        """
+        indexed, residual = self.split(node) if node is not None else (None, None)
+
+        if rows is not None:
+            rows = rows[alive[rows]]
+            if indexed is not None:
+                rows = rows[self.mask_rows(indexed, rows)]
+            return self._apply_residual([rows], residual, metadata_at, limit)
+
+        if indexed is not None and self.estimate(indexed, total) <= max(1, total * DRIVER_FRACTION):
+            driven = self.rows(indexed, total)
+            return self._apply_residual([driven[alive[driven]]], residual, metadata_at, limit)
+
+        def windows():
+            for start in range(0, total, SCAN_WINDOW):
+                stop = min(total, start + SCAN_WINDOW)
+                mask = alive[start:stop].copy()
+                if indexed is not None:
+                    mask &= self.mask(indexed, start, stop)
+                yield np.flatnonzero(mask) + start
+
+        return self._apply_residual(windows(), residual, metadata_at, limit)
+
+    @staticmethod
+    def _apply_residual(chunks, residual, metadata_at, limit: Optional[int]) -> np.ndarray:
+        """Filter candidate chunks with the per-row residual, stopping at limit"""
+        selected: List[np.ndarray] = []
+        found = 0
+        for chunk in chunks:
+            if residual is not None:
+                chunk = np.array([row for row in chunk.tolist()
+                                  if residual.matches(metadata_at(row))], dtype=np.int64)
+            if limit is not None and found + len(chunk) >= limit:
+                selected.append(chunk[:limit - found])
+                found = limit
+                break
+            selected.append(chunk)
+            found += len(chunk)
+        if not selected:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(selected).astype(np.int64, copy=False)
@@ -0,0 +1,476 @@
+"""
+IVF-Flat Approximate Nearest-Neighbour Index
+Pure NumPy inverted-file index for cosine search over millions of vectors.
+
+Vectors are grouped into partitions (e.g. one per ad niche). Each partition
+is clustered with spherical k-means into ~sqrt(n) inverted lists; a query
+scores the partition's centroids, probes the `n_probe` closest lists and
+ranks only their members exactly. Raising n_probe trades latency for recall
+(n_probe = n_lists is exact search).
+
+- Partitions below `train_threshold` vectors stay a single flat list
+- Inserts go straight into the nearest list; a partition is re-clustered
+  once it has grown `retrain_factor`× since its last training
+- save() / load() use the same atomic directory swap as the collection store
+"""
+import json
+import os
+import time
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from services.vector_store.collection import normalize_rows, top_k_indices
+from services.vector_store.persistence import StringBlob, atomic_directory, write_string_blob
+
+FORMAT_VERSION = 1
+DEFAULT_PARTITION = ""
+MAX_LISTS = 4096
+KMEANS_ITERATIONS = 10
+KMEANS_POINTS_PER_LIST = 64  # training sample size per centroid
+
+
+def spherical_kmeans(
+    vectors: np.ndarray,
+    n_clusters: int,
+    iterations: int = KMEANS_ITERATIONS,
+    seed: int = 0
+) -> np.ndarray:
+    """
+    Cluster unit vectors by cosine similarity
+
+    Trains on a random sample of at most KMEANS_POINTS_PER_LIST points per
+    cluster, which is plenty for list assignment and keeps retraining cheap.
+
+    Args:
+        vectors: (n, dim) L2-normalized float32 rows
+        n_clusters: Number of centroids
+        iterations: Lloyd iterations
+        seed: RNG seed
+
+    Returns:
+        (n_clusters, dim) normalized centroids
+    """
+    rng = np.random.default_rng(seed)
+    n = vectors.shape[0]
+    n_clusters = max(1, min(n_clusters, n))
+    sample_size = min(n, n_clusters * KMEANS_POINTS_PER_LIST)
+    sample = vectors[np.sort(rng.choice(n, sample_size, replace=False))] if sample_size < n else vectors
+    centroids = sample[rng.choice(sample.shape[0], n_clusters, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignment = assign_to_centroids(sample, centroids)
+        order = np.argsort(assignment, kind="stable")
+        counts = np.bincount(assignment, minlength=n_clusters)
+        sums = np.zeros_like(centroids)
+        nonempty = np.flatnonzero(counts)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[nonempty]
+        sums[nonempty] = np.add.reduceat(sample[order], starts, axis=0)
+        empty = counts == 0
+        if empty.any():  # re-seed dead centroids on random points
+            sums[empty] = sample[rng.choice(sample.shape[0], int(empty.sum()), replace=False)]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+def assign_to_centroids(vectors: np.ndarray, centroids: np.ndarray, chunk: int = 65536) -> np.ndarray:
+    """Index of the most similar centroid for each row"""
+    assignment = np.empty(vectors.shape[0], dtype=np.int64)
+    for start in range(0, vectors.shape[0], chunk):
+        assignment[start:start + chunk] = np.argmax(vectors[start:start + chunk] @ centroids.T, axis=1)
+    return assignment
+
+
+class _InvertedList:
+    """Growable block of vectors plus their internal row ids"""
+
+    def __init__(self, dim: int, capacity: int = 16):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.rows = np.zeros(capacity, dtype=np.int64)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.size = 0
+        self.live = 0
+
+    def append(self, rows: np.ndarray, vectors: np.ndarray) -> int:
+        """Append vectors; returns the first slot used"""
+        count = len(rows)
+        needed = self.size + count
+        if needed > self.vectors.shape[0]:
+            capacity = max(needed, self.vectors.shape[0] * 2)
+            for name in ("vectors", "rows", "alive"):
+                old = getattr(self, name)
+                grown = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+                grown[:self.size] = old[:self.size]
+                setattr(self, name, grown)
+        start = self.size
+        self.vectors[start:needed] = vectors
+        self.rows[start:needed] = rows
+        self.alive[start:needed] = True
+        self.size = needed
+        self.live += count
+        return start
+
+    def kill(self, slot: int):
+        if self.alive[slot]:
+            self.alive[slot] = False
+            self.live -= 1
+
+    def live_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        keep = self.alive[:self.size]
+        return self.rows[:self.size][keep], self.vectors[:self.size][keep]
+
+
+class _Partition:
+    """Centroids plus inverted lists for one partition key"""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.centroids: Optional[np.ndarray] = None  # None = single flat list
+        self.lists: List[_InvertedList] = [_InvertedList(dim)]
+        self.trained_size = 0
+
+    @property
+    def live(self) -> int:
+        return sum(lst.live for lst in self.lists)
+
+    def assign(self, vectors: np.ndarray) -> np.ndarray:
+        if self.centroids is None:
+            return np.zeros(vectors.shape[0], dtype=np.int64)
+        return assign_to_centroids(vectors, self.centroids)
+
+
+class IVFFlatIndex:
+    """Partitioned IVF-Flat cosine index with incremental inserts"""
+
+    def __init__(
+        self,
+        dim: int,
+        n_probe: int = 8,
+        n_lists: Optional[int] = None,
+        train_threshold: int = 1024,
+        retrain_factor: float = 2.0,
+        seed: int = 0
+    ):
+        """
+        Initialize an empty index
+
+        Args:
+            dim: Vector dimension
+            n_probe: Lists scanned per query (recall / latency knob)
+            n_lists: Lists per partition (default ~sqrt(partition size), ≤ 4096)
+            train_threshold: Partition size at which clustering starts
+            retrain_factor: Re-cluster a partition after it grows this much
+            seed: RNG seed for k-means
+        """
+        self.dim = dim
+        self.n_probe = n_probe
+        self.n_lists = n_lists
+        self.train_threshold = train_threshold
+        self.retrain_factor = retrain_factor
+        self.seed = seed
+
+        self._partitions: Dict[Hashable, _Partition] = {}
+        self._ids: List[str] = []                                    # row → external id
+        self._locations: Dict[str, Tuple[Hashable, int, int]] = {}   # id → (partition, list, slot)
+
+    def __len__(self) -> int:
+        return len(self._locations)
+
+    def __contains__(self, record_id: str) -> bool:
+        return record_id in self._locations
+
+    @property
+    def partitions(self) -> List[Hashable]:
+        return list(self._partitions)
+
+    # ── WRITES ────────────────────────────────────────────────────────────────
+
+    def add(self, ids: Sequence[str], vectors, partitions: Optional[Sequence[Hashable]] = None):
+        """
+        Insert vectors; ids already present are replaced
+
+        Args:
+            ids: External ids
+            vectors: (n, dim) vectors (normalized here)
+            partitions: Partition key per vector (e.g. niche); default single partition
+        """
+        matrix = normalize_rows(np.array(vectors, dtype=np.float32, ndmin=2))
+        if matrix.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of dimension {self.dim}, got {matrix.shape[1]}")
+        if len(ids) != matrix.shape[0]:
+            raise ValueError("ids and vectors must have the same length")
+        keys = list(partitions) if partitions is not None else [DEFAULT_PARTITION] * len(ids)
+
+        self.remove([i for i in ids if i in self._locations])
+
+        groups: Dict[Hashable, List[int]] = {}
+        for position, key in enumerate(keys):
+            groups.setdefault(DEFAULT_PARTITION if key is None else key, []).append(position)
+
+        for key, positions in groups.items():
+            partition = self._partitions.get(key)
+            if partition is None:
+                partition = self._partitions[key] = _Partition(self.dim)
+            block = matrix[positions]
+            rows = np.arange(len(self._ids), len(self._ids) + len(positions), dtype=np.int64)
+            self._ids.extend(ids[p] for p in positions)
+            self._insert(key, partition, rows, block)
+            if self._needs_training(partition):
+                self._train(key, partition)
+
+    def remove(self, ids: Sequence[str]):
+        """Delete vectors by id (unknown ids are ignored)"""
+        for record_id in ids:
+            location = self._locations.pop(record_id, None)
+            if location is not None:
+                key, list_no, slot = location
+                self._partitions[key].lists[list_no].kill(slot)
+
+    def _insert(self, key: Hashable, partition: _Partition, rows: np.ndarray, vectors: np.ndarray):
+        assignment = partition.assign(vectors)
+        for list_no in np.unique(assignment):
+            members = np.flatnonzero(assignment == list_no)
+            start = partition.lists[list_no].append(rows[members], vectors[members])
+            for offset, row in enumerate(rows[members].tolist()):
+                self._locations[self._ids[row]] = (key, int(list_no), start + offset)
+
+    def _needs_training(self, partition: _Partition) -> bool:
+        live = partition.live
+        if live < self.train_threshold:
+            return False
+        return partition.centroids is None or live >= partition.trained_size * self.retrain_factor
+
+    def _target_lists(self, size: int) -> int:
+        if self.n_lists:
+            return max(1, min(self.n_lists, size))
+        return int(max(1, min(MAX_LISTS, round(np.sqrt(size)))))
+
+    def _train(self, key: Hashable, partition: _Partition):
+        """(Re)cluster a partition and redistribute its live vectors"""
+        rows, vectors = self._live_arrays(partition)
+        partition.centroids = spherical_kmeans(vectors, self._target_lists(len(rows)), seed=self.seed)
+        partition.lists = [_InvertedList(self.dim) for _ in range(partition.centroids.shape[0])]
+        partition.trained_size = len(rows)
+        self._insert(key, partition, rows, vectors)
+
+    def rebuild(self):
+        """Re-cluster every partition (e.g. after bulk deletes)"""
+        for key, partition in self._partitions.items():
+            if partition.live >= self.train_threshold:
+                self._train(key, partition)
+
+    @staticmethod
+    def _live_arrays(partition: _Partition) -> Tuple[np.ndarray, np.ndarray]:
+        parts = [lst.live_arrays() for lst in partition.lists]
+        rows = np.concatenate([p[0] for p in parts]) if parts else np.empty(0, dtype=np.int64)
+        vectors = np.concatenate([p[1] for p in parts]) if parts else np.empty((0, 0), dtype=np.float32)
+        return rows, vectors
+
+    # ── SEARCH ────────────────────────────────────────────────────────────────
+
+    def search(
+        self,
+        query,
+        k: int = 10,
+        partition: Optional[Hashable] = None,
+        n_probe: Optional[int] = None
+    ) -> Tuple[List[str], np.ndarray]:
+        """
+        Approximate top-k cosine search
+
+        Args:
+            query: Query vector
+            k: Number of neighbours
+            partition: Restrict to one partition (None searches all)
+            n_probe: Override the index-wide n_probe (≥ n_lists = exact)
+
+        Returns:
+            (ids best first, cosine similarities)
+        """
+        q = normalize_rows(np.array(query, dtype=np.float32, ndmin=2))[0]
+        n_probe = n_probe or self.n_probe
+        if partition is not None:
+            targets = [self._partitions[partition]] if partition in self._partitions else []
+        else:
+            targets = list(self._partitions.values())
+
+        score_blocks, row_blocks = [], []
+        for part in targets:
+            if part.centroids is None:
+                probe = [0]
+            else:
+                probe = top_k_indices(part.centroids @ q, n_probe).tolist()
+            for list_no in probe:
+                lst = part.lists[list_no]
+                if not lst.live:
+                    continue
+                scores = lst.vectors[:lst.size] @ q
+                scores[~lst.alive[:lst.size]] = -np.inf
+                score_blocks.append(scores)
+                row_blocks.append(lst.rows[:lst.size])
+
+        if not score_blocks:
+            return [], np.empty(0, dtype=np.float32)
+        scores = np.concatenate(score_blocks)
+        rows = np.concatenate(row_blocks)
+        best = top_k_indices(scores, k)
+        best = best[np.isfinite(scores[best])]
+        return [self._ids[r] for r in rows[best].tolist()], scores[best]
+
+    def exact_search(self, query, k: int = 10, partition: Optional[Hashable] = None):
+        """Brute-force search over every list (ground truth for recall)"""
+        return self.search(query, k, partition=partition, n_probe=MAX_LISTS * 4)
+
+    def recall_report(
+        self,
+        queries,
+        k: int = 10,
+        n_probes: Sequence[int] = (1, 2, 4, 8, 16, 32),
+        partition: Optional[Hashable] = None
+    ) -> Dict:
+        """
+        Recall@k and latency of approximate search against exact search
+
+        Args:
+            queries: (q, dim) query vectors
+            k: Neighbours per query
+            n_probes: n_probe settings to evaluate
+            partition: Optional partition restriction
+
+        Returns:
+            Dict with the exact-search baseline and one row per n_probe
+        """
+        queries = np.array(queries, dtype=np.float32, ndmin=2)
+        truth, exact_times = [], []
+        for q in queries:
+            start = time.perf_counter()
+            ids, _ = self.exact_search(q, k, partition=partition)
+            exact_times.append((time.perf_counter() - start) * 1000)
+            truth.append(set(ids))
+
+        rows = []
+        for n_probe in n_probes:
+            hits, times = [], []
+            for q, expected in zip(queries, truth):
+                start = time.perf_counter()
+                ids, _ = self.search(q, k, partition=partition, n_probe=n_probe)
+                times.append((time.perf_counter() - start) * 1000)
+                if expected:
+                    hits.append(len(expected.intersection(ids)) / len(expected))
+            rows.append({
+                "n_probe": n_probe,
+                f"recall@{k}": round(float(np.mean(hits)) if hits else 1.0, 4),
+                "p50_ms": round(float(np.percentile(times, 50)), 3),
+                "p95_ms": round(float(np.percentile(times, 95)), 3)
+            })
+
+        return {
+            "vectors": len(self),
+            "partitions": len(self._partitions),
+            "k": k,
+            "exact": {
+                "p50_ms": round(float(np.percentile(exact_times, 50)), 3),
+                "p95_ms": round(float(np.percentile(exact_times, 95)), 3)
+            },
+            "approximate": rows
+        }
+
+    # ── PERSISTENCE ───────────────────────────────────────────────────────────
+
+    def save(self, path: str):
+        """
+        Write the index atomically to a directory
+
+        Layout: manifest.json (settings, partitions, list sizes),
+        vectors.npy (live vectors grouped by partition and list),
+        centroids.npy, ids.bin / ids.offsets.npy
+
+        Args:
+            path: Target directory
+        """
+        partitions, vector_blocks, centroid_blocks, ids = [], [], [], []
+        for key, part in self._partitions.items():
+            sizes = []
+            for lst in part.lists:
+                rows, vectors = lst.live_arrays()
+                sizes.append(len(rows))
+                vector_blocks.append(vectors)
+                ids.extend(self._ids[r] for r in rows.tolist())
+            if part.centroids is not None:
+                centroid_blocks.append(part.centroids)
+            partitions.append({
+                "key": key,
+                "trained": part.centroids is not None,
+                "trained_size": part.trained_size,
+                "list_sizes": sizes
+            })
+
+        with atomic_directory(path, prefix=".ivf_index_") as staging:
+            np.save(os.path.join(staging, "vectors.npy"),
+                    np.concatenate(vector_blocks) if vector_blocks else np.zeros((0, self.dim), np.float32))
+            np.save(os.path.join(staging, "centroids.npy"),
+                    np.concatenate(centroid_blocks) if centroid_blocks else np.zeros((0, self.dim), np.float32))
+            write_string_blob(staging, "ids", ids)
+            with open(os.path.join(staging, "manifest.json"), "w", encoding="utf-8") as f:
+                json.dump({
+                    "format_version": FORMAT_VERSION,
+                    "dim": self.dim,
+                    "n_probe": self.n_probe,
+                    "n_lists": self.n_lists,
+                    "train_threshold": self.train_threshold,
+                    "retrain_factor": self.retrain_factor,
+                    "seed": self.seed,
+                    "partitions": partitions
+                }, f)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFFlatIndex":
+        """
+        Load an index written by save()
+
+        Args:
+            path: Index directory
+
+        Returns:
+            IVFFlatIndex ready for search and further inserts
+        """
+        with open(os.path.join(path, "manifest.json"), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported IVF index format: {manifest.get('format_version')}")
+
+        index = cls(
+            dim=manifest["dim"],
+            n_probe=manifest["n_probe"],
+            n_lists=manifest["n_lists"],
+            train_threshold=manifest["train_threshold"],
+            retrain_factor=manifest["retrain_factor"],
+            seed=manifest["seed"]
+        )
+        vectors = np.load(os.path.join(path, "vectors.npy"))
+        centroids = np.load(os.path.join(path, "centroids.npy"))
+        ids = StringBlob(path, "ids")
+        index._ids = [ids[i] for i in range(len(ids))]
+
+        row = centroid_row = 0
+        for spec in manifest["partitions"]:
+            part = _Partition(index.dim)
+            sizes = spec["list_sizes"]
+            if spec["trained"]:
+                part.centroids = centroids[centroid_row:centroid_row + len(sizes)]
+                centroid_row += len(sizes)
+            part.trained_size = spec["trained_size"]
+            part.lists = []
+            for list_no, size in enumerate(sizes):
+                lst = _InvertedList(index.dim, capacity=max(16, size))
+                lst.append(np.arange(row, row + size, dtype=np.int64), vectors[row:row + size])
+                for slot in range(size):
+                    index._locations[index._ids[row + slot]] = (spec["key"], list_no, slot)
+                part.lists.append(lst)
+                row += size
+            index._partitions[spec["key"]] = part
+        return index
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return bool(path) and os.path.exists(os.path.join(path, "manifest.json"))
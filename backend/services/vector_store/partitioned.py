@@ -0,0 +1,198 @@
+"""
+Partitioned Vector Collection
+One small VectorCollection per partition key value (e.g. brand_id).
+
+Brand knowledge used to share the post collection and was looked up with a
+`where={"brand_id": ...}` filter, so every lookup touched mixed data. Here
+each brand gets its own store directory under `root`, opened on first use,
+and a query only scores that brand's handful of rows. Reads for a brand
+without a store return nothing and keep nothing open.
+
+Query results are cached per (partition, query-text hash, n_results). A
+partition's cache entries are dropped when it is written, and when another
+worker has replaced its store on disk (the manifest's inode / mtime changed),
+in which case the partition is re-opened first.
+"""
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from services.embedding.cache import normalize_text
+from services.vector_store.collection import DEFAULT_DIM, DEFAULT_QUERY_INCLUDE, VectorCollection
+from services.vector_store.persistence import store_exists, store_signature
+
+QUERY_CACHE_SIZE = 1024
+PARTITION_CAPACITY = 16   # heap rows reserved per partition (brand knowledge is a few docs)
+
+
+def partition_dirname(value: str) -> str:
+    """Filesystem-safe, collision-free directory name for a partition value"""
+    slug = re.sub(r"[^A-Za-z0-9_-]+", "-", str(value))[:48].strip("-") or "partition"
+    return f"{slug}-{hashlib.sha1(str(value).encode('utf-8')).hexdigest()[:8]}"
+
+
+class PartitionedCollection:
+    """Per-key VectorCollections with a shared embedding function and query cache"""
+
+    def __init__(
+        self,
+        root: Optional[str],
+        partition_key: str,
+        embedding_function: Callable[[List[str]], List[List[float]]],
+        dim: int = DEFAULT_DIM,
+        cache_size: int = QUERY_CACHE_SIZE
+    ):
+        """
+        Args:
+            root: Directory holding one store per partition (None = memory only)
+            partition_key: Metadata key routing records to partitions
+            embedding_function: Maps documents / query texts to embeddings
+            dim: Embedding dimension
+            cache_size: Cached query results across all partitions
+        """
+        self.root = root
+        self.partition_key = partition_key
+        self.embedding_function = embedding_function
+        self.dim = dim
+        self.cache_size = cache_size
+
+        self._lock = threading.RLock()
+        self._partitions: Dict[str, VectorCollection] = {}
+        self._signatures: Dict[str, Optional[Tuple[int, int]]] = {}
+        self._cache: "OrderedDict[tuple, Dict]" = OrderedDict()
+        self._generations: Dict[str, int] = {}   # bumped on every write / reload of a partition
+        self._hits = 0
+        self._misses = 0
+
+    # ── PARTITIONS ────────────────────────────────────────────────────────────
+
+    def _path(self, value: str) -> Optional[str]:
+        return os.path.join(self.root, partition_dirname(value)) if self.root else None
+
+    def partition(self, value: str) -> VectorCollection:
+        """The partition for `value`, opened (or re-opened if replaced on disk) as needed"""
+        value = str(value)
+        path = self._path(value)
+        with self._lock:
+            signature = store_signature(path) if path else None
+            current = self._partitions.get(value)
+            if current is not None and self._signatures.get(value) == signature:
+                return current
+            if path and store_exists(path):
+                current = VectorCollection.open(path, embedding_function=self.embedding_function,
+                                                initial_capacity=PARTITION_CAPACITY)
+            else:
+                current = VectorCollection(name=value, dim=self.dim, path=path, initial_capacity=PARTITION_CAPACITY,
+                                           embedding_function=self.embedding_function)
+            self._partitions[value] = current
+            self._signatures[value] = signature
+            self._invalidate(value)
+            return current
+
+    def _exists(self, value: str) -> bool:
+        """Whether `value` has a partition, open or on disk (reads never create one)"""
+        path = self._path(value)
+        return value in self._partitions or bool(path and store_exists(path))
+
+    def _invalidate(self, value: str):
+        self._generations[value] = self._generations.get(value, 0) + 1
+        for key in [k for k in self._cache if k[0] == value]:
+            del self._cache[key]
+
+    # ── WRITES ────────────────────────────────────────────────────────────────
+
+    def upsert(
+        self,
+        ids: Sequence[str],
+        documents: Sequence[str],
+        metadatas: Sequence[Dict],
+        embeddings: Optional[Sequence[Sequence[float]]] = None
+    ):
+        """
+        Insert or replace records, routed by metadata[partition_key]
+
+        Documents are embedded in one call; touched partitions are persisted.
+        """
+        if embeddings is None:
+            embeddings = self.embedding_function(list(documents))
+        groups: Dict[str, Tuple[list, list, list, list]] = {}
+        for record in zip(ids, documents, metadatas, embeddings):
+            value = str(record[2][self.partition_key])
+            for column, item in zip(groups.setdefault(value, ([], [], [], [])), record):
+                column.append(item)
+
+        with self._lock:
+            for value, (group_ids, group_docs, group_metas, group_vectors) in groups.items():
+                part = self.partition(value)
+                part.upsert(ids=group_ids, documents=group_docs, metadatas=group_metas,
+                            embeddings=group_vectors)
+                if part.path:
+                    part.persist()
+                self._signatures[value] = store_signature(part.path) if part.path else None
+                self._invalidate(value)
+
+    # ── QUERIES ───────────────────────────────────────────────────────────────
+
+    def query(
+        self,
+        value: str,
+        query_text: str,
+        n_results: int = 3,
+        include: Optional[List[str]] = None
+    ) -> Dict:
+        """
+        Top-n records of one partition for a query text (ChromaDB result shape)
+
+        Repeated (partition, normalized query, n_results) lookups are served
+        from the cache without embedding the query again.
+        """
+        value = str(value)
+        include = list(include or DEFAULT_QUERY_INCLUDE)
+        text_hash = hashlib.sha256(normalize_text(query_text).encode("utf-8")).hexdigest()
+        key = (value, text_hash, n_results, tuple(include))
+        empty = {"ids": [[]], **{field: [[]] for field in include}}
+        with self._lock:
+            if not self._exists(value):
+                return empty  # e.g. an unknown brand_id: no partition is kept for it
+            part = self.partition(value)
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self._hits += 1
+                return cached
+            self._misses += 1
+            generation = self._generations.get(value)
+
+        # Embedding the query runs outside the lock so other brands are not held up
+        if part.count() == 0:
+            result = empty
+        else:
+            result = part.query(query_texts=[query_text], n_results=n_results, include=include)
+
+        with self._lock:
+            if self._generations.get(value) == generation:  # not written while we searched
+                self._cache[key] = result
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return result
+
+    def count(self, value: Optional[str] = None) -> int:
+        """Records in one partition, or in the partitions opened so far"""
+        if value is not None:
+            value = str(value)
+            with self._lock:
+                return self.partition(value).count() if self._exists(value) else 0
+        with self._lock:
+            return sum(part.count() for part in self._partitions.values())
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "open_partitions": len(self._partitions),
+                "cached_queries": len(self._cache),
+                "cache_hits": self._hits,
+                "cache_misses": self._misses
+            }
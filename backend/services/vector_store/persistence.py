@@ -0,0 +1,396 @@
+"""
+On-Disk Layout for VectorCollection
+Memory-mapped storage so gunicorn --preload workers share one copy of the corpus.
+
+Directory layout:
+    manifest.json              name, dim, row count, metadata column schema
+    embeddings.npy             (n, dim) float32, opened with mmap
+    ids.bin / ids.offsets.npy  offset-indexed UTF-8 blob of record ids
+    documents.bin / documents.offsets.npy
+                               offset-indexed UTF-8 blob of documents
+    metadata/<n>.*.npy         columnar sidecar, one column per metadata key
+    codes.npy / quantizer_scales.npy
+                               optional int8 copy of the embeddings (see quantization.py)
+
+Every file is opened read-only (embeddings copy-on-write), so pages live in
+the OS page cache and are shared by every process that maps them.
+
+Several processes may write the same store: a writer holds store_lock()
+across re-reading the latest store and replacing it (see
+VectorCollection.persist), and readers notice a replaced store through
+store_signature().
+"""
+import json
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from services.vector_store.quantization import ScalarQuantizer, open_codes, open_codes_writer
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:  # Windows dev boxes
+    FCNTL_AVAILABLE = False
+
+
+MANIFEST_FILE = "manifest.json"
+FORMAT_VERSION = 1
+
+
+# ── READERS ───────────────────────────────────────────────────────────────────
+
+class StringBlob:
+    """Read-only sequence of strings stored as one UTF-8 blob plus offsets"""
+
+    def __init__(self, directory: str, name: str):
+        """
+        Map a blob written by write_string_blob()
+
+        Args:
+            directory: Store directory
+            name: Blob name (e.g. "documents")
+        """
+        self.offsets = np.load(os.path.join(directory, f"{name}.offsets.npy"), mmap_mode="r")
+        blob_path = os.path.join(directory, f"{name}.bin")
+        if os.path.getsize(blob_path) > 0:
+            self.blob = np.memmap(blob_path, dtype=np.uint8, mode="r")
+        else:
+            self.blob = np.zeros(0, dtype=np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        return self.blob[start:end].tobytes().decode("utf-8")
+
+
+class ColumnarMetadata:
+    """Read-only sequence of metadata dicts rebuilt from per-key columns"""
+
+    def __init__(self, directory: str, columns: List[Dict], count: int):
+        """
+        Map the metadata sidecar
+
+        Args:
+            directory: Store directory
+            columns: Column schema from the manifest
+            count: Row count from the manifest (rows may have no keys at all)
+        """
+        self.columns = []
+        meta_dir = os.path.join(directory, "metadata")
+        for position, spec in enumerate(columns):
+            prefix = os.path.join(meta_dir, str(position))
+            column = {
+                "key": spec["key"],
+                "kind": spec["kind"],
+                "present": np.load(f"{prefix}.present.npy", mmap_mode="r")
+            }
+            if spec["kind"] in ("bool", "int", "float", "category"):
+                column["values"] = np.load(f"{prefix}.values.npy", mmap_mode="r")
+            if spec["kind"] == "category":
+                column["dictionary"] = spec["dictionary"]
+            if spec["kind"] == "json":
+                column["values"] = StringBlob(meta_dir, f"{position}.json")
+            self.columns.append(column)
+        self._length = count
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index: int) -> Dict:
+        row = {}
+        for column in self.columns:
+            if column["present"][index]:
+                row[column["key"]] = self._decode(column, index)
+        return row
+
+    def column(self, key: str) -> Optional[Dict]:
+        """
+        Raw column arrays for a key, used to build secondary indexes without
+        materializing per-row dicts
+
+        Args:
+            key: Metadata key
+
+        Returns:
+            Column dict (kind, present, values[, dictionary]) or None
+        """
+        for column in self.columns:
+            if column["key"] == key:
+                return column
+        return None
+
+    @staticmethod
+    def _decode(column: Dict, index: int) -> Any:
+        kind = column["kind"]
+        if kind == "category":
+            return column["dictionary"][int(column["values"][index])]
+        if kind == "json":
+            return json.loads(column["values"][index])
+        return column["values"][index].item()
+
+
+# ── WRITERS ───────────────────────────────────────────────────────────────────
+
+def write_string_blob(directory: str, name: str, strings: Iterable[str]):
+    """
+    Write strings as one UTF-8 blob with an int64 offsets index
+
+    Args:
+        directory: Target directory
+        name: Blob name
+        strings: Strings in row order
+    """
+    offsets = [0]
+    with open(os.path.join(directory, f"{name}.bin"), "wb") as f:
+        for text in strings:
+            encoded = (text or "").encode("utf-8")
+            f.write(encoded)
+            offsets.append(offsets[-1] + len(encoded))
+    np.save(os.path.join(directory, f"{name}.offsets.npy"), np.array(offsets, dtype=np.int64))
+
+
+def _column_kind(values: List[Any]) -> str:
+    """Pick the narrowest column encoding that round-trips every value"""
+    if not values or any(v is None for v in values):
+        return "json"
+    if all(isinstance(v, bool) for v in values):
+        return "bool"
+    if all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+        return "int"
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+        return "float"
+    if all(isinstance(v, str) for v in values):
+        return "category"
+    return "json"
+
+
+def write_metadata_columns(directory: str, metadatas: Sequence[Dict]) -> List[Dict]:
+    """
+    Write metadata dicts as a columnar sidecar
+
+    Args:
+        directory: Store directory
+        metadatas: Metadata dicts in row order
+
+    Returns:
+        Column schema to record in the manifest
+    """
+    meta_dir = os.path.join(directory, "metadata")
+    os.makedirs(meta_dir, exist_ok=True)
+
+    keys: List[str] = []
+    seen = set()
+    for meta in metadatas:
+        for key in meta:
+            if key not in seen:
+                seen.add(key)
+                keys.append(key)
+
+    schema = []
+    for position, key in enumerate(keys):
+        prefix = os.path.join(meta_dir, str(position))
+        present = np.array([key in meta for meta in metadatas], dtype=bool)
+        raw = [meta.get(key) for meta in metadatas]
+        kind = _column_kind([v for v, p in zip(raw, present) if p])
+        spec = {"key": key, "kind": kind}
+
+        if kind == "bool":
+            values = np.array([bool(v) for v in raw], dtype=bool)
+        elif kind == "int":
+            values = np.array([v if p else 0 for v, p in zip(raw, present)], dtype=np.int64)
+        elif kind == "float":
+            values = np.array([v if p else 0.0 for v, p in zip(raw, present)], dtype=np.float64)
+        elif kind == "category":
+            dictionary: Dict[str, int] = {}
+            codes = np.zeros(len(raw), dtype=np.int32)
+            for i, (v, p) in enumerate(zip(raw, present)):
+                if p:
+                    codes[i] = dictionary.setdefault(v, len(dictionary))
+            values = codes
+            spec["dictionary"] = list(dictionary)
+        else:
+            values = None
+            write_string_blob(meta_dir, f"{position}.json",
+                              (json.dumps(v) if p else "" for v, p in zip(raw, present)))
+
+        if values is not None:
+            np.save(f"{prefix}.values.npy", values)
+        np.save(f"{prefix}.present.npy", present)
+        schema.append(spec)
+
+    return schema
+
+
+@contextmanager
+def store_lock(path: str, shared: bool = False):
+    """
+    Inter-process lock on one store path (e.g. across gunicorn workers)
+
+    Not reentrant: a process that holds it must not take it again.
+
+    Args:
+        path: Store directory
+        shared: Take a shared (reader) lock instead of an exclusive one
+    """
+    if not FCNTL_AVAILABLE:
+        yield
+        return
+    parent = os.path.dirname(os.path.abspath(path)) or "."
+    os.makedirs(parent, exist_ok=True)
+    with open(f"{os.path.abspath(path)}.lock", "a") as handle:
+        fcntl.flock(handle, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def store_signature(path: str) -> Optional[Tuple[int, int]]:
+    """(inode, mtime) of the store's manifest; changes whenever the store is replaced"""
+    try:
+        stat = os.stat(os.path.join(path, MANIFEST_FILE))
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+@contextmanager
+def atomic_directory(path: str, prefix: str = ".vector_store_", locked: bool = False):
+    """
+    Stage a directory next to `path` and swap it in when the block succeeds
+
+    Readers holding mappings of the old files keep working because unlinked
+    files stay alive until their last mapping closes.
+
+    Args:
+        path: Final directory
+        prefix: Name prefix for the staging directory
+        locked: The caller already holds store_lock(path)
+
+    Yields:
+        Staging directory to write into
+    """
+    parent = os.path.dirname(os.path.abspath(path)) or "."
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=prefix, dir=parent)
+
+    try:
+        yield staging
+        with (nullcontext() if locked else store_lock(path)):
+            backup = None
+            if os.path.exists(path):
+                backup = f"{path}.old.{os.getpid()}"
+                os.rename(path, backup)
+            os.rename(staging, path)
+            if backup:
+                shutil.rmtree(backup, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+
+def write_store(
+    path: str,
+    name: str,
+    dim: int,
+    ids: Sequence[str],
+    embedding_chunks: Iterable[np.ndarray],
+    documents: Sequence[str],
+    metadatas: Sequence[Dict],
+    quantizer: Optional[ScalarQuantizer] = None,
+    locked: bool = False
+):
+    """
+    Atomically write a store directory (written to a sibling temp dir, then renamed)
+
+    Args:
+        path: Target directory
+        name: Collection name
+        dim: Embedding dimension
+        ids: Record ids
+        embedding_chunks: (k, dim) float32 blocks in row order, streamed into
+            the output file so the full matrix is never copied onto the heap
+        documents: Documents in row order
+        metadatas: Metadata dicts in row order
+        quantizer: Fitted quantizer; also writes int8 codes for every row
+        locked: The caller already holds store_lock(path)
+    """
+    with atomic_directory(path, locked=locked) as staging:
+        matrix = np.lib.format.open_memmap(
+            os.path.join(staging, "embeddings.npy"), mode="w+",
+            dtype=np.float32, shape=(len(ids), dim)
+        )
+        codes = open_codes_writer(staging, quantizer, len(ids)) if quantizer is not None else None
+        written = 0
+        for chunk in embedding_chunks:
+            matrix[written:written + len(chunk)] = chunk
+            if codes is not None:
+                codes[written:written + len(chunk)] = quantizer.encode(chunk)
+            written += len(chunk)
+        matrix.flush()
+        del matrix
+        if codes is not None:
+            codes.flush()
+            del codes
+        write_string_blob(staging, "ids", ids)
+        write_string_blob(staging, "documents", documents)
+        columns = write_metadata_columns(staging, metadatas)
+
+        with open(os.path.join(staging, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump({
+                "format_version": FORMAT_VERSION,
+                "name": name,
+                "dim": dim,
+                "count": len(ids),
+                "quantization": quantizer.kind if quantizer is not None else None,
+                "metadata_columns": columns
+            }, f)
+
+
+def read_manifest(path: str) -> Dict:
+    """Load a store manifest"""
+    with open(os.path.join(path, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported vector store format: {manifest.get('format_version')}")
+    return manifest
+
+
+def store_exists(path: str) -> bool:
+    """True when `path` holds a written store"""
+    return bool(path) and os.path.exists(os.path.join(path, MANIFEST_FILE))
+
+
+def open_store(path: str) -> Dict:
+    """
+    Map a store directory without reading it into the heap
+
+    Args:
+        path: Store directory
+
+    Returns:
+        Dict with manifest, embeddings (copy-on-write mmap), ids, documents,
+        and metadatas readers, plus codes / quantizer for quantized stores
+    """
+    manifest = read_manifest(path)
+    if manifest["count"] == 0:
+        embeddings = np.zeros((0, manifest["dim"]), dtype=np.float32)
+    else:
+        embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="c")
+    quantized = manifest.get("quantization") is not None
+    return {
+        "manifest": manifest,
+        "embeddings": embeddings,
+        "codes": open_codes(path, manifest["count"], manifest["dim"]) if quantized else None,
+        "quantizer": ScalarQuantizer.load(path) if quantized else None,
+        "ids": StringBlob(path, "ids"),
+        "documents": StringBlob(path, "documents"),
+        "metadatas": ColumnarMetadata(path, manifest["metadata_columns"], manifest["count"])
+    }
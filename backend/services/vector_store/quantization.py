@@ -0,0 +1,126 @@
+"""
+Scalar Int8 Quantization for VectorCollection
+Stores each embedding component as one signed byte, 4× smaller than float32.
+
+Rows are L2-normalized before encoding, so each dimension is bounded; a
+per-dimension scale maps [-max|x_d|, +max|x_d|] onto [-127, 127]:
+
+    code[d]  = round(x[d] / scale[d])
+    x̂[d]     = code[d] * scale[d]
+
+Search is asymmetric: the query stays float and is folded into the scales,
+so a first-pass score is one int8 → float32 matrix-vector product
+(codes @ (q * scale)) done in cache-sized chunks. The shortlist it produces
+is then re-ranked exactly against the float rows.
+"""
+import os
+from typing import Optional
+
+import numpy as np
+
+SCORE_CHUNK = 8192       # rows converted to float32 per step (~12 MB at 384-d)
+FIT_SAMPLE = 65536       # rows sampled to fit the per-dimension scales
+SCALES_FILE = "quantizer_scales.npy"
+CODES_FILE = "codes.npy"
+
+
+class ScalarQuantizer:
+    """Per-dimension symmetric int8 quantizer"""
+
+    kind = "int8"
+
+    def __init__(self, scales: np.ndarray):
+        """
+        Args:
+            scales: (dim,) float32 step size per dimension
+        """
+        self.scales = np.asarray(scales, dtype=np.float32)
+
+    @classmethod
+    def fit(cls, vectors: np.ndarray, sample: int = FIT_SAMPLE, seed: int = 0) -> "ScalarQuantizer":
+        """
+        Fit scales on (a sample of) normalized rows
+
+        Args:
+            vectors: (n, dim) float32 rows (may be a memory map)
+            sample: Maximum rows inspected
+            seed: RNG seed for sampling
+
+        Returns:
+            ScalarQuantizer
+        """
+        n = vectors.shape[0]
+        if n > sample:
+            rows = np.sort(np.random.default_rng(seed).choice(n, sample, replace=False))
+            vectors = vectors[rows]
+        peak = np.abs(vectors).max(axis=0) if n else np.ones(vectors.shape[1], dtype=np.float32)
+        peak = np.where(peak > 0, peak, 1.0)
+        return cls(peak / 127.0)
+
+    @property
+    def dim(self) -> int:
+        return self.scales.shape[0]
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """(n, dim) float32 → (n, dim) int8 (values beyond the fitted range clip)"""
+        codes = np.rint(np.asarray(vectors, dtype=np.float32) / self.scales)
+        return np.clip(codes, -127, 127).astype(np.int8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        """(n, dim) int8 → approximate float32 rows"""
+        return codes.astype(np.float32) * self.scales
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """
+        Approximate inner products of every code row with a float query
+
+        Args:
+            codes: (n, dim) int8 rows
+            query: (dim,) float32 query
+
+        Returns:
+            (n,) float32 scores
+        """
+        folded = (query * self.scales).astype(np.float32)
+        out = np.empty(codes.shape[0], dtype=np.float32)
+        for start in range(0, codes.shape[0], SCORE_CHUNK):
+            block = codes[start:start + SCORE_CHUNK]
+            out[start:start + len(block)] = block.astype(np.float32) @ folded
+        return out
+
+    # ── PERSISTENCE ───────────────────────────────────────────────────────────
+
+    def save(self, directory: str):
+        np.save(os.path.join(directory, SCALES_FILE), self.scales)
+
+    @classmethod
+    def load(cls, directory: str) -> "ScalarQuantizer":
+        return cls(np.load(os.path.join(directory, SCALES_FILE)))
+
+
+def open_codes_writer(directory: str, quantizer: ScalarQuantizer, count: int) -> np.ndarray:
+    """
+    Create codes.npy (and the scales) in a store staging directory
+
+    Args:
+        directory: Store staging directory
+        quantizer: Fitted quantizer
+        count: Total rows
+
+    Returns:
+        Writable (count, dim) int8 map; fill it with quantizer.encode() blocks
+    """
+    quantizer.save(directory)
+    return np.lib.format.open_memmap(
+        os.path.join(directory, CODES_FILE), mode="w+", dtype=np.int8, shape=(count, quantizer.dim)
+    )
+
+
+def open_codes(directory: str, count: int, dim: int) -> Optional[np.ndarray]:
+    """Copy-on-write map of codes.npy, or None when the store is not quantized"""
+    path = os.path.join(directory, CODES_FILE)
+    if not os.path.exists(path):
+        return None
+    if count == 0:
+        return np.zeros((0, dim), dtype=np.int8)
+    return np.load(path, mmap_mode="c")
@@ -0,0 +1,319 @@
+"""
+Live ERS Ranking for VectorCollection
+Keeps is_winner and percentile_rank correct on every write.
+
+A single insert shifts the percentile of every post ranked below it, so the
+two fields are not stored per row. Instead an order-statistic tree over the
+live ERS values is updated in O(log n) per add / update / delete, and both
+fields are derived from it when a row is read or filtered:
+
+    percentile_rank = (posts with a strictly higher ERS + 1) / live posts
+    is_winner       = percentile_rank within the top `winner_fraction`
+
+This matches migrate_chromadb_metadata.py (rank 1 = best, top 20% are
+winners) without an offline re-sort of the corpus.
+"""
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from services.vector_store.where import Condition
+
+WINNER_FRACTION = 0.2
+UNRANKED_PERCENTILE = 1.0  # rows without a numeric ERS sit at the bottom
+_BLOCK_SIZE = 512
+
+
+class OrderStatisticTree:
+    """Sorted multiset of floats with O(log n) insert, remove and rank queries"""
+
+    def __init__(self, values: Optional[Iterable[float]] = None):
+        """
+        Build the tree
+
+        Values are kept in sorted blocks; a Fenwick tree over the block
+        lengths turns positions into block offsets in O(log blocks).
+
+        Args:
+            values: Optional initial values
+        """
+        ordered = sorted(values) if values is not None else []
+        self._blocks: List[List[float]] = [
+            ordered[i:i + _BLOCK_SIZE] for i in range(0, len(ordered), _BLOCK_SIZE)
+        ]
+        self._maxes: List[float] = [block[-1] for block in self._blocks]
+        self._len = len(ordered)
+        self._rebuild_fenwick()
+
+    def __len__(self) -> int:
+        return self._len
+
+    def _rebuild_fenwick(self):
+        tree = [0] * (len(self._blocks) + 1)
+        for i, block in enumerate(self._blocks, start=1):
+            tree[i] += len(block)
+            parent = i + (i & -i)
+            if parent <= len(self._blocks):
+                tree[parent] += tree[i]
+        self._fenwick = tree
+
+    def _fenwick_add(self, block: int, delta: int):
+        i = block + 1
+        while i < len(self._fenwick):
+            self._fenwick[i] += delta
+            i += i & -i
+
+    def _prefix(self, block: int) -> int:
+        """Number of values stored in blocks [0, block)"""
+        total, i = 0, block
+        while i > 0:
+            total += self._fenwick[i]
+            i -= i & -i
+        return total
+
+    def add(self, value: float):
+        """Insert a value"""
+        if not self._blocks:
+            self._blocks.append([value])
+            self._maxes.append(value)
+            self._len = 1
+            self._rebuild_fenwick()
+            return
+        block = min(bisect_right(self._maxes, value), len(self._blocks) - 1)
+        insort(self._blocks[block], value)
+        self._maxes[block] = self._blocks[block][-1]
+        self._len += 1
+        if len(self._blocks[block]) > 2 * _BLOCK_SIZE:
+            items = self._blocks[block]
+            self._blocks[block:block + 1] = [items[:_BLOCK_SIZE], items[_BLOCK_SIZE:]]
+            self._maxes[block:block + 1] = [items[_BLOCK_SIZE - 1], items[-1]]
+            self._rebuild_fenwick()
+        else:
+            self._fenwick_add(block, 1)
+
+    def remove(self, value: float) -> bool:
+        """
+        Remove one occurrence of a value
+
+        Returns:
+            False when the value was not present
+        """
+        block = bisect_left(self._maxes, value)
+        if block == len(self._blocks):
+            return False
+        items = self._blocks[block]
+        position = bisect_left(items, value)
+        if position == len(items) or items[position] != value:
+            return False
+        del items[position]
+        self._len -= 1
+        if items:
+            self._maxes[block] = items[-1]
+            self._fenwick_add(block, -1)
+        else:
+            del self._blocks[block]
+            del self._maxes[block]
+            self._rebuild_fenwick()
+        return True
+
+    def count_less(self, value: float) -> int:
+        """Number of stored values strictly below `value`"""
+        block = bisect_left(self._maxes, value)
+        if block == len(self._blocks):
+            return self._len
+        return self._prefix(block) + bisect_left(self._blocks[block], value)
+
+    def count_greater(self, value: float) -> int:
+        """Number of stored values strictly above `value`"""
+        block = bisect_right(self._maxes, value)
+        if block == len(self._blocks):
+            return 0
+        return self._len - self._prefix(block) - bisect_right(self._blocks[block], value)
+
+    def kth_smallest(self, k: int) -> float:
+        """Value at 0-based sorted position k"""
+        if not 0 <= k < self._len:
+            raise IndexError(k)
+        # Fenwick descent: find the block holding position k
+        block, remaining = 0, k
+        step = 1 << (len(self._blocks).bit_length())
+        while step:
+            nxt = block + step
+            if nxt < len(self._fenwick) and self._fenwick[nxt] <= remaining:
+                block = nxt
+                remaining -= self._fenwick[nxt]
+            step >>= 1
+        return self._blocks[block][remaining]
+
+    def kth_largest(self, k: int) -> float:
+        """Value ranked k-th from the top (1-based)"""
+        return self.kth_smallest(self._len - k)
+
+
+def _as_rank_value(value) -> float:
+    """ERS as a float, NaN when missing or non-numeric"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return np.nan
+
+
+class RankIndex:
+    """Derives is_winner / percentile_rank from live ERS order statistics"""
+
+    DERIVED_KEYS = ("is_winner", "percentile_rank")
+
+    def __init__(self, key: str = "ers", winner_fraction: float = WINNER_FRACTION, capacity: int = 1024):
+        """
+        Args:
+            key: Metadata key ranked (descending)
+            winner_fraction: Share of ranked rows flagged as winners
+            capacity: Rows pre-allocated
+        """
+        self.key = key
+        self.winner_fraction = winner_fraction
+        self.tree = OrderStatisticTree()
+        self.by_row = np.full(capacity, np.nan, dtype=np.float64)
+        self.unranked = 0  # live rows without a numeric value
+
+    # ── MAINTENANCE ───────────────────────────────────────────────────────────
+
+    def ensure_capacity(self, capacity: int):
+        if self.by_row.shape[0] < capacity:
+            grown = np.full(max(capacity, self.by_row.shape[0] * 2), np.nan, dtype=np.float64)
+            grown[:self.by_row.shape[0]] = self.by_row
+            self.by_row = grown
+
+    def add(self, row: int, metadata: Dict):
+        value = _as_rank_value(metadata.get(self.key))
+        self.by_row[row] = value
+        if np.isnan(value):
+            self.unranked += 1
+        else:
+            self.tree.add(value)
+
+    def remove(self, row: int):
+        value = self.by_row[row]
+        if np.isnan(value):
+            self.unranked -= 1
+        else:
+            self.tree.remove(float(value))
+        self.by_row[row] = np.nan
+
+    def update(self, row: int, metadata: Dict):
+        new = _as_rank_value(metadata.get(self.key))
+        old = self.by_row[row]
+        if new == old or (np.isnan(new) and np.isnan(old)):
+            return
+        self.remove(row)
+        self.add(row, metadata)
+
+    def load(self, start: int, values: np.ndarray):
+        """Bulk-load a float column (NaN = missing) into an empty index"""
+        self.ensure_capacity(start + len(values))
+        self.by_row[start:start + len(values)] = values
+        ranked = values[~np.isnan(values)]
+        self.tree = OrderStatisticTree(ranked.tolist())
+        self.unranked += len(values) - len(ranked)
+
+    # ── DERIVED FIELDS ────────────────────────────────────────────────────────
+
+    @property
+    def total(self) -> int:
+        return len(self.tree) + self.unranked
+
+    def winner_count(self) -> int:
+        """Number of winner slots (top `winner_fraction`, at least one)"""
+        return max(1, int(self.total * self.winner_fraction)) if len(self.tree) else 0
+
+    def winner_cutoff(self) -> float:
+        """Lowest ERS that still counts as a winner (inf when nobody is ranked)"""
+        slots = min(self.winner_count(), len(self.tree))
+        return self.tree.kth_largest(slots) if slots else np.inf
+
+    def _threshold(self, rank: int) -> float:
+        """Lowest value whose rank is ≤ `rank` (inf when no row qualifies)"""
+        rank = min(rank, len(self.tree))
+        return self.tree.kth_largest(rank) if rank >= 1 else np.inf
+
+    def derive(self, row: int) -> Dict:
+        """is_winner / percentile_rank for a row"""
+        value = self.by_row[row]
+        if np.isnan(value) or not self.total:
+            return {"is_winner": False, "percentile_rank": UNRANKED_PERCENTILE}
+        rank = self.tree.count_greater(float(value)) + 1
+        return {
+            "is_winner": bool(value >= self.winner_cutoff()),
+            "percentile_rank": rank / self.total
+        }
+
+    def midranks(self, values: np.ndarray) -> np.ndarray:
+        """
+        Ascending mid-rank of arbitrary values among live ranked rows
+
+        Args:
+            values: Raw values (need not be stored)
+
+        Returns:
+            (below + ½ · equal) / ranked rows per value, in [0, 1]
+        """
+        n = len(self.tree)
+        if not n:
+            return np.full(len(values), 0.5)
+        out = np.empty(len(values), dtype=np.float64)
+        for i, value in enumerate(np.asarray(values, dtype=np.float64).tolist()):
+            below = self.tree.count_less(value)
+            out[i] = (below + (n - below - self.tree.count_greater(value)) / 2) / n
+        return out
+
+    # ── PLANNER HOOKS ─────────────────────────────────────────────────────────
+
+    def supports(self, condition: Condition) -> bool:
+        if condition.key == "is_winner":
+            return condition.op in ("$eq", "$ne") and isinstance(condition.operand, bool)
+        if condition.key == "percentile_rank":
+            return condition.op in ("$lt", "$lte", "$gt", "$gte") and \
+                isinstance(condition.operand, (int, float)) and not isinstance(condition.operand, bool)
+        return False
+
+    def _plan(self, condition: Condition):
+        """
+        Reduce a condition to (threshold, unranked_match, negate): rows with
+        value ≥ threshold match (or don't, when negated); unranked rows match
+        when unranked_match is True
+        """
+        if condition.key == "is_winner":
+            want = condition.operand if condition.op == "$eq" else not condition.operand
+            return self.winner_cutoff(), not want, not want
+        total = self.total
+        operand = float(condition.operand)
+        if condition.op in ("$lte", "$gt"):
+            best = int(np.floor(operand * total + 1e-9))      # ranks ≤ p·n
+            unranked = UNRANKED_PERCENTILE <= operand
+        else:
+            best = int(np.ceil(operand * total - 1e-9)) - 1   # ranks < p·n
+            unranked = UNRANKED_PERCENTILE < operand
+        negate = condition.op in ("$gt", "$gte")
+        return self._threshold(best), unranked != negate, negate
+
+    def estimate(self, condition: Condition, total: int) -> int:
+        threshold, unranked_match, negate = self._plan(condition)
+        top = len(self.tree) - self.tree.count_less(threshold) if np.isfinite(threshold) else 0
+        ranked = len(self.tree) - top if negate else top
+        return ranked + (self.unranked if unranked_match else 0)
+
+    def _compare(self, column: np.ndarray, condition: Condition) -> np.ndarray:
+        threshold, unranked_match, negate = self._plan(condition)
+        missing = np.isnan(column)
+        with np.errstate(invalid="ignore"):
+            mask = column >= threshold
+        if negate:
+            mask = ~mask
+        mask[missing] = unranked_match
+        return mask
+
+    def mask(self, condition: Condition, start: int, stop: int) -> np.ndarray:
+        return self._compare(self.by_row[start:stop], condition)
+
+    def mask_rows(self, condition: Condition, rows: np.ndarray) -> np.ndarray:
+        return self._compare(self.by_row[rows], condition)
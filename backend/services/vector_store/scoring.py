@@ -0,0 +1,196 @@
+"""
+Fused Semantic + ERS Scoring
+One vectorized scorer for every "similarity blended with engagement" ranking.
+
+    combined = semantic_weight · max(0, cosine) + ers_weight · norm(ERS)
+
+ERS scales differ by source (app.calculate_ers caps at 100, Apify ERS is
+unbounded), so norm() maps a raw ERS onto [0, 1] against the live corpus
+distribution instead of a hard-coded maximum:
+
+- "percentile": mid-rank of the value among live ERS values, answered from
+  the collection's ERS order-statistic tree (RankIndex.midranks)
+- "zscore": logistic approximation of Φ((ERS - mean) / std), using running
+  moments from the collection's aggregates (see aggregates.py)
+
+Without a corpus distribution (e.g. a ChromaDB collection) the candidate set
+itself is the reference sample.
+"""
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from services.vector_store.collection import top_k_indices
+
+NORMALIZATIONS = ("percentile", "zscore")
+LOGISTIC_PROBIT = 1.702  # logistic(1.702 z) ≈ Φ(z) within 0.01
+
+
+class ERSDistribution:
+    """Reference distribution that maps raw ERS values onto [0, 1]"""
+
+    def __init__(
+        self,
+        ranker: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+        sample: Optional[np.ndarray] = None,
+        mean: Optional[float] = None,
+        std: Optional[float] = None
+    ):
+        """
+        Args:
+            ranker: Values → mid-ranks against the live corpus
+            sample: Reference values (sorted here) when no live ranking exists
+            mean: Corpus mean for z-scores
+            std: Corpus standard deviation for z-scores
+        """
+        self.ranker = ranker
+        self.sample = np.sort(np.asarray(sample, dtype=np.float64)) if sample is not None else None
+        self.mean = mean
+        self.std = std
+
+    @classmethod
+    def from_sample(cls, values: Sequence[float]) -> "ERSDistribution":
+        """Distribution of the given values themselves"""
+        values = np.asarray(values, dtype=np.float64)
+        if not len(values):
+            return cls(sample=values)
+        return cls(sample=values, mean=float(values.mean()), std=float(values.std()))
+
+    @classmethod
+    def from_collection(cls, collection, key: str = "ers") -> Optional["ERSDistribution"]:
+        """
+        Live distribution of `key` in a VectorCollection
+
+        Returns:
+            None when the collection is not a VectorCollection or tracks
+            neither a ranking nor running moments for `key`
+        """
+        if not hasattr(collection, "value_percentiles"):
+            return None
+        moments = collection.value_moments(key)
+        ranker = (lambda values: collection.value_percentiles(key, values)) \
+            if collection.rank_key == key else None
+        if ranker is None and moments is None:
+            return None
+        mean, std = moments or (None, None)
+        return cls(ranker=ranker, mean=mean, std=std)
+
+    def percentile(self, values: np.ndarray) -> np.ndarray:
+        """Mid-rank of each value: (below + ½ · equal) / n"""
+        values = np.asarray(values, dtype=np.float64)
+        if self.ranker is not None:
+            return self.ranker(values)
+        if self.sample is not None and len(self.sample):
+            below = np.searchsorted(self.sample, values, "left")
+            equal = np.searchsorted(self.sample, values, "right") - below
+            return (below + equal / 2) / len(self.sample)
+        return np.full(values.shape, 0.5)
+
+    def zscore(self, values: np.ndarray) -> np.ndarray:
+        """Approximate normal CDF of each value's z-score"""
+        values = np.asarray(values, dtype=np.float64)
+        if self.mean is None or not self.std:
+            return np.full(values.shape, 0.5)
+        z = (values - self.mean) / self.std
+        return 1.0 / (1.0 + np.exp(-LOGISTIC_PROBIT * z))
+
+
+class FusedScorer:
+    """Vectorized semantic + ERS blend with top-k selection"""
+
+    def __init__(
+        self,
+        semantic_weight: float = 0.7,
+        ers_weight: float = 0.3,
+        normalization: str = "percentile"
+    ):
+        """
+        Args:
+            semantic_weight: Weight of cosine similarity
+            ers_weight: Weight of normalized ERS
+            normalization: "percentile" or "zscore"
+        """
+        if normalization not in NORMALIZATIONS:
+            raise ValueError(f"Unknown ERS normalization: {normalization}")
+        self.semantic_weight = semantic_weight
+        self.ers_weight = ers_weight
+        self.normalization = normalization
+
+    def normalize_ers(self, ers: np.ndarray, distribution: Optional[ERSDistribution] = None) -> np.ndarray:
+        """Map raw ERS onto [0, 1] (the values themselves are the sample when no distribution is given)"""
+        ers = np.asarray(ers, dtype=np.float64)
+        distribution = distribution or ERSDistribution.from_sample(ers)
+        if self.normalization == "zscore" and distribution.mean is not None:
+            return distribution.zscore(ers)
+        if self.normalization == "percentile" and distribution.ranker is None \
+                and distribution.sample is None:
+            distribution = ERSDistribution.from_sample(ers)  # moments only: rank within the hits
+        return distribution.percentile(ers)
+
+    def score(
+        self,
+        similarities: np.ndarray,
+        ers: np.ndarray,
+        distribution: Optional[ERSDistribution] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Combined scores
+
+        Returns:
+            (combined, normalized ERS) arrays
+        """
+        semantic = np.maximum(np.asarray(similarities, dtype=np.float64), 0.0)
+        ers_norm = self.normalize_ers(ers, distribution)
+        return self.semantic_weight * semantic + self.ers_weight * ers_norm, ers_norm
+
+    def top_k(
+        self,
+        similarities: np.ndarray,
+        ers: np.ndarray,
+        k: int,
+        distribution: Optional[ERSDistribution] = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Best k candidates by combined score (argpartition, then sort of k)
+
+        Returns:
+            (indices best first, combined scores, normalized ERS) for those indices
+        """
+        combined, ers_norm = self.score(similarities, ers, distribution)
+        best = top_k_indices(combined, k)
+        return best, combined[best], ers_norm[best]
+
+    def rerank(
+        self,
+        results: Dict,
+        k: int,
+        distribution: Optional[ERSDistribution] = None,
+        ers_key: str = "ers"
+    ) -> Dict:
+        """
+        Re-rank a single-query ChromaDB-shaped result
+
+        Args:
+            results: Dict with ids / documents / metadatas / distances lists-of-lists
+            k: Results kept
+            distribution: Corpus ERS distribution (None = the hits themselves)
+            ers_key: Metadata key holding ERS
+
+        Returns:
+            Same shape, re-ordered and truncated, plus "scores"
+        """
+        if not results.get("ids") or not results["ids"][0]:
+            return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]], "scores": [[]]}
+
+        metadatas = results["metadatas"][0]
+        distances = np.asarray(results["distances"][0], dtype=np.float64)
+        ers = np.array([m.get(ers_key, 0) or 0 for m in metadatas], dtype=np.float64)
+        best, combined, _ = self.top_k(1.0 - distances, ers, k, distribution)
+        order = best.tolist()
+        return {
+            "ids": [[results["ids"][0][i] for i in order]],
+            "documents": [[results["documents"][0][i] for i in order]],
+            "metadatas": [[metadatas[i] for i in order]],
+            "distances": [[float(distances[i]) for i in order]],
+            "scores": [combined.tolist()]
+        }
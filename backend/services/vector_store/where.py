@@ -0,0 +1,144 @@
+"""
+ChromaDB-style metadata filters
+Evaluates `where` clauses such as {"$and": [{"is_winner": True}, {"ers": {"$gte": 50}}]}.
+
+compile_where() turns a clause into a small predicate tree once (cached by
+clause shape), which the planner in indexes.py answers from secondary indexes
+and which can also be evaluated row-by-row via .matches().
+"""
+import json
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, List
+
+COMPARISON_OPS = {"$eq", "$ne", "$gt", "$gte", "$lt", "$lte", "$in", "$nin"}
+_COMPILE_CACHE_SIZE = 256
+
+
+def _compare(value: Any, op: str, operand: Any) -> bool:
+    """Apply a single comparison operator to a metadata value"""
+    if op == "$eq":
+        return value == operand
+    if op == "$ne":
+        return value != operand
+    if op == "$in":
+        return value in operand
+    if op == "$nin":
+        return value not in operand
+    if value is None:
+        return False
+    try:
+        if op == "$gt":
+            return value > operand
+        if op == "$gte":
+            return value >= operand
+        if op == "$lt":
+            return value < operand
+        if op == "$lte":
+            return value <= operand
+    except TypeError:
+        return False
+    raise ValueError(f"Unsupported where operator: {op}")
+
+
+class Condition:
+    """Leaf predicate: one operator applied to one metadata key"""
+
+    def __init__(self, key: str, op: str, operand: Any):
+        if op not in COMPARISON_OPS:
+            raise ValueError(f"Unsupported where operator: {op}")
+        self.key = key
+        self.op = op
+        self.operand = operand
+
+    def matches(self, metadata: Dict) -> bool:
+        if self.key not in metadata:
+            return self.op in ("$ne", "$nin")
+        return _compare(metadata[self.key], self.op, self.operand)
+
+    def __repr__(self) -> str:
+        return f"Condition({self.key} {self.op} {self.operand!r})"
+
+
+class AndNode:
+    """All children must match"""
+
+    def __init__(self, children: List):
+        self.children = children
+
+    def matches(self, metadata: Dict) -> bool:
+        return all(child.matches(metadata) for child in self.children)
+
+
+class OrNode:
+    """At least one child must match"""
+
+    def __init__(self, children: List):
+        self.children = children
+
+    def matches(self, metadata: Dict) -> bool:
+        return any(child.matches(metadata) for child in self.children)
+
+
+def _compile(where: Dict):
+    """Build the predicate tree for a clause (uncached)"""
+    children = []
+    for key, condition in where.items():
+        if key == "$and":
+            children.append(AndNode([_compile(clause) for clause in condition]))
+        elif key == "$or":
+            children.append(OrNode([_compile(clause) for clause in condition]))
+        elif isinstance(condition, dict):
+            for op, operand in condition.items():
+                children.append(Condition(key, op, operand))
+        else:
+            children.append(Condition(key, "$eq", condition))
+    return children[0] if len(children) == 1 else AndNode(children)
+
+
+_compile_cache: "OrderedDict[str, object]" = OrderedDict()
+_compile_lock = Lock()
+
+
+def compile_where(where: Dict):
+    """
+    Compile a where clause into a predicate tree, reusing cached compilations
+
+    Args:
+        where: Filter clause
+
+    Returns:
+        Condition / AndNode / OrNode
+    """
+    cache_key = json.dumps(where, sort_keys=True, default=repr)
+    with _compile_lock:
+        compiled = _compile_cache.get(cache_key)
+        if compiled is not None:
+            _compile_cache.move_to_end(cache_key)
+            return compiled
+
+    compiled = _compile(where)
+    with _compile_lock:
+        _compile_cache[cache_key] = compiled
+        if len(_compile_cache) > _COMPILE_CACHE_SIZE:
+            _compile_cache.popitem(last=False)
+    return compiled
+
+
+def matches_where(metadata: Dict, where: Dict) -> bool:
+    """
+    Check whether a metadata dict satisfies a where clause
+
+    Supports $and / $or, the comparison operators $eq, $ne, $gt, $gte,
+    $lt, $lte, $in, $nin, and bare {"key": value} equality.
+
+    Args:
+        metadata: Record metadata
+        where: Filter clause
+
+    Returns:
+        True if the record matches
+    """
+    if not where:
+        return True
+    return compile_where(where).matches(metadata)
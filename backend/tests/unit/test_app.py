@@ -0,0 +1,262 @@
+"""
+Unit tests for the Flask API in app.py.
+
+The app is imported once per module against throwaway stores, the
+model-free hashing embedder and no LLM cache file.
+"""
+import json
+import os
+import subprocess
+import sys
+import threading
+import types
+
+import numpy as np
+import pytest
+
+from services.embedding.model import ModelNotReady
+
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="module")
+def app_module(tmp_path_factory):
+    root = tmp_path_factory.mktemp("app")
+    from config import Config
+    with pytest.MonkeyPatch.context() as patch:
+        for key, value in {
+            "VECTOR_STORE_PATH": str(root / "posts"),
+            "BRAND_KNOWLEDGE_PATH": str(root / "brand_knowledge"),
+            "EMBED_CACHE_PATH": "",
+            "EMBED_IDF_PATH": "",
+            "LLM_CACHE_PATH": "",
+            "LOCAL_CLASSIFIER_PATH": str(root / "classifier"),
+            "EMBEDDING_BACKEND": "hashing",
+        }.items():
+            patch.setenv(key, value)
+            if hasattr(Config, key):  # Config read the environment when it was first imported
+                patch.setattr(Config, key, value)
+        import app
+        yield app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def posts(app_module):
+    ids = [f"post-{i}" for i in range(5)]
+    app_module.collection.upsert(ids=ids, embeddings=np.ones((5, 384), dtype=np.float32),
+                                 documents=[f"text {i}" for i in range(5)],
+                                 metadatas=[{"ers": float(10 * i), "platform": "instagram"} for i in range(5)])
+    yield ids
+    app_module.collection.delete(ids=ids)
+
+
+@pytest.mark.unit
+@pytest.mark.usefixtures("posts")
+class TestPostsEndpoint:
+    """Test suite for the ERS-ordered /api/posts pages."""
+
+    def test_pages_follow_the_cursor(self, client):
+        first = client.get("/api/posts?limit=2").get_json()
+        assert [p["id"] for p in first["posts"]] == ["post-4", "post-3"]
+        second = client.get(f"/api/posts?limit=2&after={first['next_cursor']}").get_json()
+        assert [p["id"] for p in second["posts"]] == ["post-2", "post-1"]
+
+    @pytest.mark.parametrize("limit", ["0", "-3", "abc", "1.5"])
+    def test_invalid_limit_rejected(self, client, limit):
+        response = client.get(f"/api/posts?limit={limit}")
+        assert response.status_code == 400
+        assert "error" in response.get_json()
+
+
+
+@pytest.mark.unit
+class TestAddPosts:
+    """Test suite for adding scraped posts to the database."""
+
+    def test_counts_only_new_posts(self, app_module, client, monkeypatch):
+        monkeypatch.setattr(app_module, "classify_post_emotions", lambda texts: [("Authentic", "llm")] * len(texts))
+        posts = [{"text": "A scraped caption about our launch", "likes": 3},
+                 {"text": "Another scraped caption, much later", "likes": 1}]
+        before = app_module.collection.count()
+        first = client.post("/api/database/add-posts", json={"posts": posts}).get_json()
+        again = client.post("/api/database/add-posts", json={"posts": posts[1:] + [
+            {"text": "  A scraped  caption about our launch ", "likes": 9}]}).get_json()
+        try:
+            assert first["added_count"] == 2 and again["added_count"] == 0
+            assert app_module.collection.count() == before + 2
+        finally:
+            app_module.collection.delete(where={"source": "scraped"})
+
+
+def _item(draft: str, refs=()) -> dict:
+    return {"draft": draft, "top_posts": [{"text": text, "ers": 50.0} for text in refs], "found_banned": []}
+
+
+def _fake_llm(drafts, calls, barrier=None):
+    """call_llm stand-in: echoes each draft it finds in the prompt as what_works"""
+    def call_llm(prompt, template="prompt", **kwargs):
+        calls.append(template)
+        if barrier is not None:
+            barrier.wait()
+        found = sorted((prompt.index(d), d) for d in drafts if d in prompt)
+        if template == "analyze-batch":
+            return json.dumps({"analyses": [{"draft": n + 1, "what_works": d, "emotional_archetype": "Hero"}
+                                            for n, (_, d) in enumerate(found)]})
+        return json.dumps({"what_works": found[0][1], "emotional_archetype": "Hero"})
+    return call_llm
+
+
+@pytest.mark.unit
+class TestAnalyzeBatch:
+    """Test suite for packed, concurrent /api/analyze/batch scoring."""
+
+    def test_packs_respect_output_cap_of_every_routed_provider(self, app_module, monkeypatch):
+        monkeypatch.setattr(app_module, "llm_router", types.SimpleNamespace(providers=["gemini", "groq"]))
+        packs = app_module._pack_drafts([_item(f"draft number {i}") for i in range(10)])
+        assert [len(p) for p in packs] == [4, 4, 2]   # groq: 1500 // 350 drafts per prompt
+
+        monkeypatch.setattr(app_module, "llm_router", types.SimpleNamespace(providers=["gemini"]))
+        assert len(app_module._pack_drafts([_item(f"draft number {i}") for i in range(10)])) == 1
+
+    def test_packs_respect_prompt_token_budget(self, app_module, monkeypatch):
+        monkeypatch.setattr(app_module, "ANALYZE_PROMPT_TOKEN_BUDGET", 100)
+        items = [_item("x" * 80, refs=["r" * 80]) for _ in range(5)]   # 21 + 21 tokens each
+        packs = app_module._pack_drafts(items)
+        assert [len(p) for p in packs] == [2, 2, 1]
+        assert [item for pack in packs for item in pack] == items
+
+    def test_missing_batched_answers_retry_alone(self, app_module, monkeypatch):
+        drafts = ["first draft text", "second draft text", "third draft text"]
+        calls = []
+        fake = _fake_llm(drafts, calls)
+
+        def drop_second(prompt, template="prompt", **kwargs):
+            answer = json.loads(fake(prompt, template))
+            if template == "analyze-batch":
+                answer["analyses"] = [a for a in answer["analyses"] if a["draft"] != 2]
+            return json.dumps(answer)
+
+        monkeypatch.setattr(app_module, "call_llm", drop_second)
+        analyses = app_module._analyze_pack([_item(d) for d in drafts])
+        assert calls == ["analyze-batch", "analyze"]
+        assert [a["what_works"] for a in analyses] == drafts
+        assert "draft" not in analyses[0] and analyses[0]["banned_words_found"] == []
+
+    @pytest.mark.usefixtures("posts")
+    def test_results_in_input_order_with_packs_sent_concurrently(self, app_module, client, monkeypatch):
+        valid = [f"long enough draft number {i}" for i in range(4)]
+        drafts = ["short", valid[0], 42, valid[1], valid[2], None, valid[3]]
+        calls = []
+        monkeypatch.setattr(app_module, "LLM_MAX_OUTPUT_TOKENS", {"gemini": 700, "groq": 700})  # 2 per pack
+        # Both packs must be in flight at once to get past the barrier
+        monkeypatch.setattr(app_module, "call_llm", _fake_llm(valid, calls, threading.Barrier(2, timeout=5)))
+
+        body = client.post("/api/analyze/batch", json={"drafts": drafts}).get_json()
+
+        assert body["prompt_packs"] == 2 and calls == ["analyze-batch", "analyze-batch"]
+        results = body["results"]
+        assert [r["success"] for r in results] == [False, True, False, True, True, False, True]
+        assert [r["error"] for r in results if not r["success"]] == ["Draft too short"] * 3
+        assert [r["analysis"]["what_works"] for r in results if r["success"]] == valid
+
+
+@pytest.mark.unit
+class TestRetrainClassifier:
+    """Test suite for choosing the local classifier's training examples."""
+
+    def test_trains_on_llm_labelled_posts_only(self, app_module, monkeypatch):
+        sources = {"llm-0": "llm", "llm-1": "llm", "local": "local", "seeded": None, "bad-label": "llm"}
+        ids = list(sources)
+        metas = [{"emotion": "Motivational" if i == "bad-label" else "Authentic", "ers": 1.0,
+                  **({"emotion_source": source} if source else {})} for i, source in sources.items()]
+        vectors = np.arange(len(ids) * 384, dtype=np.float32).reshape(len(ids), 384)
+        app_module.collection.upsert(ids=ids, embeddings=vectors, documents=ids, metadatas=metas)
+
+        trained = {}
+
+        def train(head, x, labels):
+            trained[head] = (np.asarray(x), labels)
+            return {"examples": len(labels)}
+
+        monkeypatch.setattr(app_module.local_labeler, "train", train)
+        try:
+            report = app_module.retrain_local_classifier()
+        finally:
+            app_module.collection.delete(ids=ids)
+
+        assert report["emotion"] == {"examples": 2}
+        x, labels = trained["emotion"]
+        assert labels == ["Authentic", "Authentic"]
+        np.testing.assert_allclose(x, vectors[:2] / np.linalg.norm(vectors[:2], axis=1, keepdims=True), rtol=1e-5)
+
+
+def _not_ready(calls):
+    def encode(texts):
+        calls.append(list(texts))
+        raise ModelNotReady("loading")
+    return encode
+
+
+@pytest.mark.unit
+class TestEmbeddingNotReady:
+    """Test suite for ModelNotReady reaching the 503 handler from the ads and brand paths."""
+
+    def test_ads_share_the_app_encoder(self, app_module):
+        from routes import ads_intelligence
+        assert ads_intelligence.ingestion_service.embedding_fn is app_module.cached_embedder
+        assert ads_intelligence.recommendation_engine.ingestion_service is ads_intelligence.ingestion_service
+
+    def test_ads_query_waits_once(self, app_module, tmp_path, monkeypatch):
+        from config import Config
+        from services.ad_scraper.ingestion_service import ADIngestionService
+        monkeypatch.setattr(Config, "ADS_INDEX_PATH", str(tmp_path / "ads"))
+        calls = []
+        service = ADIngestionService(embedding_fn=_not_ready(calls))
+        with pytest.raises(ModelNotReady):
+            service.query_similar_ads("brief", "fitness")
+        assert len(calls) == 1
+
+    def test_brand_context_propagates(self, app_module):
+        from services.brand_intelligence import get_brand_context
+        from services.vector_store.partitioned import PartitionedCollection
+        knowledge = PartitionedCollection(None, "brand_id", _not_ready([]), dim=3)
+        knowledge.upsert(ids=["doc"], documents=["about us"], metadatas=[{"brand_id": "b", "type": "about"}],
+                         embeddings=[[1.0, 0.0, 0.0]])
+        with pytest.raises(ModelNotReady):
+            get_brand_context("b", "tone", collection=knowledge)
+
+
+    @pytest.mark.usefixtures("posts")
+    def test_stream_answers_503_before_opening(self, app_module, client, monkeypatch):
+        calls = []
+        monkeypatch.setattr(app_module, "_reference_posts_for", _not_ready(calls))
+        response = client.post("/api/analyze/stream", json={"draft": "A draft long enough to analyze"})
+        assert response.status_code == 503 and response.headers["Retry-After"]
+        assert response.get_json()["error"] == "embedding_model_not_ready" and len(calls) == 1
+
+
+@pytest.mark.unit
+class TestStartupConfig:
+    """Test suite for configuration checked when the app is imported."""
+
+    def test_unknown_embedding_backend_fails_loudly(self):
+        env = {**os.environ, "EMBEDDING_BACKEND": "minlm"}
+        result = subprocess.run([sys.executable, "-c", "import app"], cwd=BACKEND_DIR, env=env,
+                                capture_output=True, text=True, timeout=120)
+        assert result.returncode != 0
+        assert "Unknown EMBEDDING_BACKEND 'minlm'" in result.stderr
+
+    def test_settings_come_from_config(self, app_module):
+        from config import Config
+        assert app_module.llm_fanout.max_concurrency == Config.LLM_FANOUT_CONCURRENCY
+        assert app_module.llm_fanout.timeout == Config.LLM_FANOUT_TIMEOUT
+        assert app_module.emotion_classifier.max_prompt_tokens == Config.LLM_BATCH_TOKENS
+        assert app_module.emotion_classifier.max_items == Config.LLM_BATCH_ITEMS
+        assert app_module.local_labeler.threshold == Config.LOCAL_CLASSIFIER_THRESHOLD
+        assert app_module.embedding_cache.path == (Config.EMBED_CACHE_PATH or None)
@@ -0,0 +1,330 @@
+"""
+Unit tests for the embedding services.
+
+Tests micro-batching, the embedding cache, lazy model loading, the
+process pool, the hashed n-gram embedder and the local label classifier.
+"""
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from services.embedding.batcher import MicroBatchEmbedder
+from services.embedding.cache import CachedEncoder, EmbeddingCache, cache_key
+from services.embedding.classifier import CentroidClassifier, LocalLabeler, agreement_report, normalize_label
+from services.embedding.hashing import HashingEmbedder, load_or_fit
+from services.embedding.model import LazyEmbeddingModel, ModelNotReady
+from services.embedding.pool import EmbeddingProcessPool, parse_cpu_list
+
+
+class _LengthModel:
+    """Picklable-by-reference model for pool workers: [len(text), first char code]."""
+
+    def encode(self, texts):
+        return np.array([[len(t), ord(t[0]) if t else 0] for t in texts], dtype=np.float32)
+
+
+class _RecordingEncoder:
+    """Encoder returning [len(text), index] rows and recording batch sizes."""
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, texts):
+        self.batches.append(len(texts))
+        return np.array([[len(t), i] for i, t in enumerate(texts)], dtype=np.float32)
+
+
+@pytest.mark.unit
+class TestMicroBatchEmbedder:
+    """Test suite for the cross-request micro-batcher."""
+
+    def test_concurrent_requests_share_batches(self):
+        encoder = _RecordingEncoder()
+        service = MicroBatchEmbedder(encoder, max_batch_size=64, max_wait_ms=50)
+        results = {}
+        start = threading.Barrier(16)
+
+        def caller(n):
+            start.wait()
+            results[n] = service.encode(["x" * n, "y" * (n + 1)])
+
+        threads = [threading.Thread(target=caller, args=(n,)) for n in range(16)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert len(encoder.batches) < 16 and sum(encoder.batches) == 32
+        for n, vectors in results.items():
+            assert vectors.shape == (2, 2) and vectors[:, 0].tolist() == [n, n + 1]
+        metrics = service.metrics()
+        assert metrics["texts"] == 32 and metrics["avg_batch_size"] > 2
+        service.close()
+
+    def test_flushes_at_max_batch_size(self):
+        encoder = _RecordingEncoder()
+        service = MicroBatchEmbedder(encoder, max_batch_size=4, max_wait_ms=10_000)
+        futures = [service.submit([f"t{i}"]) for i in range(8)]
+        for future in futures:
+            future.result(timeout=5)
+        assert encoder.batches and max(encoder.batches) <= 4
+        service.close()
+
+    def test_single_text_and_errors(self):
+        service = MicroBatchEmbedder(_RecordingEncoder(), max_wait_ms=1)
+        assert service.encode("abc").tolist() == [3.0, 0.0]
+        assert service.encode([]).shape[0] == 0
+        service.close()
+
+        def broken(texts):
+            raise RuntimeError("model unavailable")
+
+        failing = MicroBatchEmbedder(broken, max_wait_ms=1)
+        with pytest.raises(RuntimeError):
+            failing.encode(["a"])
+        failing.close()
+        with pytest.raises(RuntimeError):
+            failing.submit(["b"])
+
+
+@pytest.mark.unit
+class TestEmbeddingCache:
+    """Test suite for the two-tier content-hash embedding cache."""
+
+    def test_only_misses_reach_the_encoder(self):
+        encoder = _RecordingEncoder()
+        cached = CachedEncoder(encoder, EmbeddingCache("model-a", capacity=10))
+        first = cached.encode(["hello  world", "bye", "hello world"])
+        assert encoder.batches == [2]  # normalized duplicates encoded once
+        np.testing.assert_array_equal(first[0], first[2])
+
+        cached.encode(["bye", "new"])
+        assert encoder.batches == [2, 1]
+        stats = cached.cache.stats()
+        assert (stats["memory_hits"], stats["misses"]) == (1, 4)
+
+    def test_disk_tier_survives_restart(self, tmp_path):
+        path = str(tmp_path / "cache" / "embeddings.sqlite3")
+        CachedEncoder(_RecordingEncoder(), EmbeddingCache("model-a", path=path)).encode(["abc", "de"])
+
+        encoder = _RecordingEncoder()
+        reopened = CachedEncoder(encoder, EmbeddingCache("model-a", path=path))
+        assert reopened.encode(["de", "abc"])[:, 0].tolist() == [2, 3]
+        assert encoder.batches == [] and reopened.cache.stats()["disk_hits"] == 2
+
+        other_model = CachedEncoder(encoder, EmbeddingCache("model-b", path=path))
+        other_model.encode(["abc"])
+        assert encoder.batches == [1]
+
+    def test_connection_opened_lazily_per_process(self, tmp_path, monkeypatch):
+        path = str(tmp_path / "cache" / "embeddings.sqlite3")
+        cache = EmbeddingCache("m", path=path)
+        assert cache._conn is None and not os.path.exists(path)  # nothing opened before a fork
+
+        cache.put_many([cache_key("m", "a")], np.ones((1, 3)))
+        parent = cache._conn
+        assert parent is not None and cache.stats()["persistent"]
+
+        pid = os.getpid()
+        monkeypatch.setattr(os, "getpid", lambda: pid + 1)   # as seen from a forked worker
+        cache._memory.clear()
+        assert cache.get_many([cache_key("m", "a")])[0].tolist() == [1, 1, 1]
+        assert cache._conn is not parent
+
+    def test_lru_evicts_oldest(self):
+        cache = EmbeddingCache("m", capacity=2)
+        keys = [cache_key("m", t) for t in ("a", "b", "c")]
+        cache.put_many(keys[:2], np.ones((2, 3)))
+        cache.get_many([keys[0]])
+        cache.put_many(keys[2:], np.ones((1, 3)))
+        assert [v is not None for v in cache.get_many(keys)] == [True, False, True]
+
+
+@pytest.mark.unit
+class TestLazyEmbeddingModel:
+    """Test suite for background-warmed model loading and readiness gating."""
+
+    def test_loads_off_the_calling_thread(self):
+        release = threading.Event()
+
+        def loader():
+            release.wait(5)
+            return type("Model", (), {"encode": lambda self, texts: np.ones((len(texts), 2))})()
+
+        model = LazyEmbeddingModel(loader, "m", ready_timeout=0.01, retry_after=7)
+        assert model.status()["state"] == "cold"
+        assert model.warm() == "loading" and not model.ready
+
+        with pytest.raises(ModelNotReady) as error:
+            model.encode(["a"])
+        assert error.value.retry_after == 7 and error.value.state == "loading"
+
+        release.set()
+        assert model.wait(5)
+        assert model.encode(["a", "b"]).shape == (2, 2)
+        assert model.status()["state"] == "ready" and model.status()["load_seconds"] is not None
+
+    def test_failed_load_is_reported(self):
+        def loader():
+            raise OSError("weights missing")
+
+        model = LazyEmbeddingModel(loader, "m", ready_timeout=1)
+        with pytest.raises(ModelNotReady):
+            model.encode(["a"])
+        assert model.status()["state"] == "failed" and "weights missing" in model.status()["error"]
+
+
+@pytest.mark.unit
+class TestEmbeddingProcessPool:
+    """Test suite for shared-memory process-pool encoding."""
+
+    def test_workers_fill_shared_output_in_order(self):
+        pool = EmbeddingProcessPool(factory="tests.unit.test_embedding:_LengthModel",
+                                    size=2, dim=2, chunk_rows=3).start(timeout=60)
+        try:
+            texts = [chr(97 + i) * (i + 1) for i in range(10)]
+            with pool.lease(texts) as vectors:
+                assert vectors.shape == (10, 2) and vectors.dtype == np.float32
+                assert vectors[:, 0].tolist() == list(range(1, 11))
+                assert vectors[:, 1].tolist() == [97 + i for i in range(10)]
+            assert pool.encode("hello").tolist() == [5.0, 104.0]
+            assert pool.encode([]).shape == (0, 2)
+        finally:
+            pool.close()
+
+    def test_dimension_mismatch_fails_the_request(self):
+        pool = EmbeddingProcessPool(factory="tests.unit.test_embedding:_LengthModel",
+                                    size=1, dim=3).start(timeout=60)
+        try:
+            with pytest.raises(RuntimeError, match="2-d vectors"):
+                pool.encode(["abc"])
+        finally:
+            pool.close()
+
+    def test_dead_worker_is_respawned(self):
+        pool = EmbeddingProcessPool(factory="tests.unit.test_embedding:_LengthModel",
+                                    size=1, dim=2).start(timeout=60)
+        try:
+            pool._workers[0].terminate()
+            pool._workers[0].join()
+            deadline = time.monotonic() + 30
+            while pool.restarts == 0 and time.monotonic() < deadline:
+                time.sleep(0.05)
+            assert pool.restarts == 1 and pool._workers[0].is_alive()
+            assert pool.encode("hello").tolist() == [5.0, 104.0]
+        finally:
+            pool.close()
+
+    def test_parse_cpu_list(self):
+        assert parse_cpu_list("0-2,5") == [0, 1, 2, 5]
+        assert parse_cpu_list("") is None
+
+
+@pytest.mark.unit
+class TestHashingEmbedder:
+    """Test suite for the model-free hashed n-gram embedder."""
+
+    CORPUS = [
+        "Behind the scenes of our product launch with the whole team",
+        "Thank you to our community for an incredible year of growth",
+        "Three lessons we learned shipping our first product",
+        "Our founders share the story of the worst week of the company",
+    ]
+
+    def test_shapes_and_normalization(self):
+        embedder = HashingEmbedder(dim=64)
+        vectors = embedder.encode(["launch day", "", "!!"])
+        assert vectors.shape == (3, 64) and vectors.dtype == np.float32
+        assert np.linalg.norm(vectors[0]) == pytest.approx(1.0, abs=1e-5)
+        assert not vectors[1].any()
+        assert embedder.encode("launch day").shape == (64,)
+        np.testing.assert_allclose(embedder.encode("launch day"), vectors[0])
+
+    def test_batch_matches_single_texts(self):
+        embedder = HashingEmbedder().fit(self.CORPUS)
+        batch = embedder.encode(self.CORPUS)
+        for text, row in zip(self.CORPUS, batch):
+            np.testing.assert_allclose(embedder.encode(text), row, atol=1e-6)
+
+    def test_similarity_follows_overlap(self):
+        embedder = HashingEmbedder().fit(self.CORPUS)
+        query, near, unrelated = embedder.encode([
+            "behind the scenes at our product launch",
+            "Behind-the-scenes of the product launch, with our team!",
+            "Quarterly tax filing deadlines for accountants",
+        ])
+        assert query @ near > 2 * (query @ unrelated)
+
+    def test_idf_is_persisted_and_fingerprinted(self, tmp_path):
+        path = str(tmp_path / "idf" / "hashing_idf.npy")
+        fitted = load_or_fit(path, self.CORPUS)
+        assert fitted.model_id != HashingEmbedder().model_id
+
+        reloaded = load_or_fit(path, ["a different corpus"])
+        assert reloaded.model_id == fitted.model_id
+        np.testing.assert_array_equal(reloaded.encode(self.CORPUS), fitted.encode(self.CORPUS))
+        assert load_or_fit(None).model_id == "hashed-ngram-384-tf"
+
+
+def _clustered(rng, labels, per_label=12, dim=16, noise=0.3):
+    """Unit-ish vectors scattered around one random centre per label"""
+    centres = rng.standard_normal((len(labels), dim))
+    vectors = np.concatenate([centres[i] + noise * rng.standard_normal((per_label, dim))
+                              for i in range(len(labels))])
+    return vectors.astype(np.float32), [label for label in labels for _ in range(per_label)]
+
+
+@pytest.mark.unit
+class TestLocalClassifier:
+    """Test suite for the nearest-centroid emotion / archetype classifier."""
+
+    def test_fit_predicts_nearest_label_with_confidence(self):
+        rng = np.random.default_rng(0)
+        vectors, labels = _clustered(rng, ["Inspiring", "Humorous", "Educational"])
+        model = CentroidClassifier.fit(vectors, labels, "m")
+        predictions = model.predict(vectors)
+        assert sum(p[0] == l for p, l in zip(predictions, labels)) / len(labels) > 0.95
+        assert all(0 < p[1] <= 1 for p in predictions)
+        assert model.predict(np.zeros((1, 16)))[0][1] < 0.5  # no signal → low confidence
+
+    def test_rare_labels_are_skipped(self):
+        vectors = np.eye(5, dtype=np.float32)
+        assert CentroidClassifier.fit(vectors, ["a", "a", "a", "b", "c"], "m") is None
+        model = CentroidClassifier.fit(np.eye(7, dtype=np.float32), ["a"] * 3 + ["b"] * 3 + ["c"], "m")
+        assert model.labels == ["a", "b"]
+
+    def test_agreement_report(self):
+        rng = np.random.default_rng(1)
+        vectors, labels = _clustered(rng, ["Inspiring", "Humorous"], per_label=10)
+        report = agreement_report(vectors, labels, "m", threshold=0.9)
+        assert report["evaluated"] == 20 and report["accuracy"] >= 0.9
+        assert 0 < report["confident_coverage"] <= 1 and report["per_label"]["Humorous"]["support"] == 10
+        assert "error" in agreement_report(vectors[:4], labels[:4], "m")
+
+    def test_labeler_thresholds_and_model_id(self, tmp_path):
+        rng = np.random.default_rng(2)
+        vectors, labels = _clustered(rng, ["Inspiring", "Humorous"], noise=0.05)
+        labeler = LocalLabeler(str(tmp_path), "model-a", threshold=0.9)
+        assert labeler.predict("emotion", vectors[:2]) == [None, None]
+        report = labeler.train("emotion", vectors, labels)
+        assert report["labels"] == {"Humorous": 12, "Inspiring": 12}
+
+        ambiguous = vectors[0] + vectors[-1]
+        predictions = labeler.predict("emotion", np.stack([vectors[0], ambiguous]))
+        assert predictions[0][0] == "Inspiring" and predictions[1] is None
+        assert labeler.stats()["emotion_escalated"] == 1
+
+        assert LocalLabeler(str(tmp_path), "model-b").head("emotion") is None
+        labeler.train("emotion", vectors, ["Humorous" if l == "Inspiring" else "Inspiring" for l in labels])
+        assert labeler.predict("emotion", vectors[:1])[0][0] == "Humorous"  # reloaded after retrain
+
+    def test_recorded_examples(self, tmp_path):
+        labeler = LocalLabeler(str(tmp_path), "m")
+        labeler.record("archetype", ["draft a", "draft b", ""], ["The Rebel", "The Sage", "x"])
+        labeler.record("archetype", ["draft a"], ["The Hero"])
+        assert labeler.recorded("archetype") == (["draft a", "draft b"], ["The Hero", "The Sage"])
+        assert labeler.recorded("missing") == ([], [])
+        assert normalize_label("  the underdog   story. ") == "The Underdog Story" and normalize_label(None) is None
@@ -0,0 +1,126 @@
+"""
+Unit tests for the shared HTTP transport.
+
+Tests keep-alive reuse, per-host concurrency limits, the HTTP/2 response
+conversion, streamed bodies and the metrics report against a local HTTP/1.1
+server.
+"""
+import json
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from services.http_transport import HTTP2_AVAILABLE, HTTPTransport, parse_host_limits
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_GET(self):
+        if self.path.startswith("/slow"):
+            time.sleep(0.05)
+        status = 404 if self.path.startswith("/missing") else 200
+        body = json.dumps({"path": self.path}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        # chunked server-sent events, one flush per event
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i in range(3):
+            event = f"data: {i}\n\n".encode()
+            self.wfile.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+            self.wfile.flush()
+            time.sleep(0.05)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.mark.unit
+class TestHTTPTransport:
+    """Test suite for pooled keep-alive requests, host limits and metrics."""
+
+    def test_sequential_requests_reuse_one_connection(self, server):
+        transport = HTTPTransport(dns_ttl=0)
+        for i in range(5):
+            assert transport.get(f"{server}/item/{i}", timeout=5).json() == {"path": f"/item/{i}"}
+        host = transport.metrics()["hosts"]["127.0.0.1"]
+        assert (host["requests"], host["new_connections"], host["reused_connections"]) == (5, 1, 4)
+        assert host["reuse_ratio"] == 0.8 and host["protocols"] == {"HTTP/1.1": 5}
+        transport.close()
+
+    def test_host_limit_caps_concurrency(self, server):
+        transport = HTTPTransport(host_limits={"127.0.0.1": 2}, dns_ttl=0)
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            list(executor.map(lambda i: transport.get(f"{server}/slow/{i}", timeout=5), range(6)))
+        host = transport.metrics()["hosts"]["127.0.0.1"]
+        assert host["max_in_flight"] == 2 and host["limit"] == 2
+        assert host["new_connections"] <= 2 and host["wait_ms"] > 0
+        transport.close()
+
+    def test_errors_are_counted_and_raised(self, server):
+        transport = HTTPTransport(dns_ttl=0)
+        with pytest.raises(requests.exceptions.HTTPError):
+            transport.get(f"{server}/missing", timeout=5).raise_for_status()
+        with pytest.raises(requests.exceptions.ConnectionError):
+            transport.get("http://127.0.0.1:1/", timeout=1)
+        assert transport.metrics()["hosts"]["127.0.0.1"]["errors"] == 1
+        transport.close()
+
+    @pytest.mark.skipif(not HTTP2_AVAILABLE, reason="httpx / h2 not installed")
+    def test_http2_path_returns_requests_responses(self, server):
+        transport = HTTPTransport(http2_hosts=["127.0.0.1"], dns_ttl=0)
+        response = transport.get(f"{server}/h2", params={"q": "1"}, timeout=5)
+        assert isinstance(response, requests.Response) and response.json() == {"path": "/h2?q=1"}
+        with pytest.raises(requests.exceptions.HTTPError):
+            transport.get(f"{server}/missing", timeout=5).raise_for_status()
+        with pytest.raises(requests.exceptions.ConnectionError):
+            transport.get("http://127.0.0.1:1/", timeout=1)
+        transport.close()
+
+    def test_dns_answers_are_cached(self):
+        transport = HTTPTransport(dns_ttl=60)
+        before = transport.metrics()["dns_cache"]["hits"]
+        first = socket.getaddrinfo("localhost", 80)
+        assert socket.getaddrinfo("localhost", 80) == first
+        assert transport.metrics()["dns_cache"]["hits"] == before + 1
+        transport.close()
+
+    def test_stream_lines_yield_as_they_arrive(self, server):
+        transport = HTTPTransport(host_limits={"127.0.0.1": 1}, dns_ttl=0)
+        started = time.perf_counter()
+        lines = transport.stream_lines("POST", f"{server}/events", timeout=5)
+        assert next(lines) == "data: 0" and time.perf_counter() - started < 0.1
+        assert transport.metrics()["hosts"]["127.0.0.1"]["in_flight"] == 1
+        assert [line for line in lines if line] == ["data: 1", "data: 2"]
+        assert transport.metrics()["hosts"]["127.0.0.1"]["in_flight"] == 0
+        with pytest.raises(requests.exceptions.HTTPError):
+            list(transport.stream_lines("GET", f"{server}/missing", timeout=5))
+        transport.close()
+
+    def test_parse_host_limits(self):
+        assert parse_host_limits("api.groq.com=4, Example.com=2") == {"api.groq.com": 4, "example.com": 2}
+        assert parse_host_limits("") == {}
@@ -0,0 +1,568 @@
+"""
+Unit tests for the LLM services.
+
+Tests the exact / semantic LLM response cache, the bounded fan-out executor,
+the batched classifier, the streaming helpers, the latency-aware router, the
+provider quota scheduler and the JSON extractor.
+"""
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from services.llm import cache as llm_cache
+from services.llm.cache import LLMResponseCache, cached_invoke_json
+from services.llm.classify import BatchClassifier
+from services.llm.fanout import FanOutExecutor
+from services.llm.json_extract import extract_json, repair_truncated
+from services.llm.quota import (BACKGROUND, INTERACTIVE, QuotaScheduler, TokenBucket, backoff_delay, lane,
+                                parse_quota_limits, retry_after_seconds)
+from services.llm.router import AllProvidersFailed, LLMRouter, is_unavailable
+from services.llm.streaming import JSONFieldStream, sse, sse_payloads
+
+
+class _CountingCall:
+    """Provider stand-in returning a fixed answer and counting calls"""
+
+    def __init__(self, answer, delay: float = 0.0):
+        self.answer = answer
+        self.delay = delay
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        return self.answer
+
+
+def _bag_of_words(texts):
+    """Tiny deterministic embedder: word counts over a fixed vocabulary"""
+    vocab = ["launch", "team", "proud", "sad", "tax", "today", "our", "new"]
+    return np.array([[t.lower().split().count(w) for w in vocab] for t in texts], dtype=np.float32)
+
+
+@pytest.mark.unit
+class TestLLMResponseCache:
+    """Test suite for the exact + semantic LLM response cache."""
+
+    def test_exact_hits_return_copies(self):
+        cache = LLMResponseCache()
+        call = _CountingCall({"ideas": ["a"]}, delay=0.01)
+        first = cache.get_or_call("groq:m:ideate", "prompt  one", call)
+        first["ideas"].append("mutated")
+        again = cache.get_or_call("groq:m:ideate", "prompt one", call)
+        assert again == {"ideas": ["a"]} and call.calls == 1
+        assert cache.get_or_call("gemini:m:ideate", "prompt one", call) and call.calls == 2
+
+        stats = cache.stats()
+        assert (stats["memory_hits"], stats["misses"]) == (1, 2) and stats["latency_saved_ms"] >= 10
+
+    def test_uncacheable_and_fresh(self):
+        cache = LLMResponseCache()
+        error = _CountingCall("[Groq Error: 429]")
+        for _ in range(2):
+            cache.get_or_call("ns", "p", error, cacheable=lambda r: not r.startswith("["))
+        assert error.calls == 2 and cache.stats()["uncacheable"] == 2
+
+        answer = _CountingCall("v1")
+        cache.get_or_call("ns", "q", answer)
+        answer.answer = "v2"
+        assert cache.get_or_call("ns", "q", answer, fresh=True) == "v2"
+        assert cache.get_or_call("ns", "q", answer) == "v2" and answer.calls == 2
+
+    def test_entries_expire_after_ttl(self):
+        cache = LLMResponseCache(ttl=0.05)
+        call = _CountingCall("x")
+        cache.get_or_call("ns", "p", call)
+        time.sleep(0.08)
+        cache.get_or_call("ns", "p", call)
+        assert call.calls == 2
+
+    def test_semantic_hits_stay_in_namespace(self):
+        cache = LLMResponseCache(semantic_threshold=0.9)
+        cache.enable_semantic(_bag_of_words, "bow")
+        tag = _CountingCall("Inspiring")
+        cache.get_or_call("llm:emotion-tag", "Post: our new launch today", tag, semantic_text="our new launch today")
+        assert cache.get_or_call("llm:emotion-tag", "Post: Our  NEW launch today!", tag,
+                                 semantic_text="Our new launch today") == "Inspiring"
+        assert tag.calls == 1 and cache.stats()["semantic_hits"] == 1
+
+        cache.get_or_call("llm:emotion-tag", "Post: tax today", tag, semantic_text="tax today")
+        cache.get_or_call("llm:other", "x our new launch today", tag, semantic_text="our new launch today")
+        assert tag.calls == 3
+
+    def test_persists_across_restarts(self, tmp_path):
+        path = str(tmp_path / "llm" / "responses.sqlite3")
+        writer = LLMResponseCache(path=path)
+        writer.enable_semantic(_bag_of_words, "bow")
+        writer.get_or_call("ns", "exact prompt", _CountingCall({"a": 1}))
+        writer.get_or_call("tag", "Post: proud team", _CountingCall("Authentic"), semantic_text="proud team")
+
+        reader = LLMResponseCache(path=path)
+        reader.enable_semantic(_bag_of_words, "bow")
+        call = _CountingCall("new")
+        assert reader.get_or_call("ns", "exact prompt", call) == {"a": 1}
+        assert reader.get_or_call("tag", "Post: team proud", call, semantic_text="team proud") == "Authentic"
+        assert call.calls == 0 and reader.stats()["disk_hits"] >= 1
+
+        other_model = LLMResponseCache(path=path)
+        other_model.enable_semantic(_bag_of_words, "other-embedder")
+        assert other_model.stats()["semantic_entries"] == 0
+
+    def test_connection_and_semantic_rows_loaded_per_process(self, tmp_path, monkeypatch):
+        path = str(tmp_path / "llm" / "responses.sqlite3")
+        writer = LLMResponseCache(path=path)
+        writer.enable_semantic(_bag_of_words, "bow")
+        writer.get_or_call("tag", "Post: proud team", _CountingCall("Authentic"), semantic_text="proud team")
+
+        cache = LLMResponseCache(path=path)
+        cache.enable_semantic(_bag_of_words, "bow")
+        assert cache._conn is None and cache._semantic == {}   # nothing opened before a fork
+        assert cache.stats()["semantic_entries"] == 1
+        parent = cache._conn
+
+        pid = os.getpid()
+        monkeypatch.setattr(os, "getpid", lambda: pid + 1)   # as seen from a forked worker
+        call = _CountingCall("new")
+        assert cache.get_or_call("tag", "Post: team proud", call, semantic_text="team proud") == "Authentic"
+        assert call.calls == 0 and cache._conn is not parent and cache._semantic_pid == pid + 1
+
+    def test_semantic_hit_on_an_entry_not_kept_in_memory(self, tmp_path):
+        cache = LLMResponseCache(path=str(tmp_path / "responses.sqlite3"), capacity=0)
+        cache.enable_semantic(_bag_of_words, "bow")
+        cache.get_or_call("tag", "Post: proud team", _CountingCall("Authentic", delay=0.01), semantic_text="proud team")
+        call = _CountingCall("new")
+        assert cache.get_or_call("tag", "Post: team proud", call, semantic_text="team proud") == "Authentic"
+        stats = cache.stats()
+        assert call.calls == 0 and stats["semantic_hits"] == 1 and stats["latency_saved_ms"] > 0
+
+    def test_concurrent_misses_make_one_call(self):
+        cache = LLMResponseCache()
+        call = _CountingCall("slow answer", delay=0.1)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_call("ns", "p", call)))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == ["slow answer"] * 4 and call.calls == 1
+        assert cache.stats()["coalesced"] == 3
+
+    def test_memory_tier_is_bounded(self):
+        cache = LLMResponseCache(capacity=2)
+        for prompt in ("a", "b", "c"):
+            cache.get_or_call("ns", prompt, _CountingCall(prompt))
+        assert cache.stats()["memory_entries"] == 2
+
+    def test_cached_invoke_json_decorator(self, monkeypatch):
+        monkeypatch.setattr(llm_cache, "_shared", LLMResponseCache())
+
+        class Client:
+            model = "m1"
+            calls = 0
+
+            @cached_invoke_json("test-ads")
+            def invoke_json(self, prompt, max_tokens=1500):
+                Client.calls += 1
+                return {"error": "JSON parse failed"} if "bad" in prompt else {"ok": prompt}
+
+        client = Client()
+        assert client.invoke_json("p") == client.invoke_json("p") == {"ok": "p"} and Client.calls == 1
+        client.invoke_json("p", max_tokens=10)
+        client.invoke_json("p", fresh=True)
+        client.invoke_json("bad")
+        client.invoke_json("bad")
+        assert Client.calls == 5
+
+
+@pytest.mark.unit
+class TestFanOutExecutor:
+    """Test suite for the order-preserving bounded LLM fan-out."""
+
+    def test_results_keep_input_order(self):
+        executor = FanOutExecutor(max_concurrency=4)
+        delays = [0.04, 0.0, 0.02, 0.01, 0.03]
+        results = executor.map(lambda d: (time.sleep(d), d)[1], delays)
+        assert results == delays
+
+    def test_concurrency_is_capped(self):
+        executor = FanOutExecutor(max_concurrency=3)
+        lock = threading.Lock()
+        state = {"now": 0, "peak": 0}
+
+        def call(_):
+            with lock:
+                state["now"] += 1
+                state["peak"] = max(state["peak"], state["now"])
+            time.sleep(0.03)
+            with lock:
+                state["now"] -= 1
+
+        start = time.monotonic()
+        executor.map(call, range(9))
+        assert state["peak"] == 3 and time.monotonic() - start < 0.25
+
+    def test_timeouts_and_errors_degrade_per_item(self):
+        executor = FanOutExecutor(max_concurrency=4, timeout=0.1)
+
+        def tag(text):
+            if text == "slow":
+                time.sleep(0.5)
+            if text == "boom":
+                raise RuntimeError("provider down")
+            return text.upper()
+
+        start = time.monotonic()
+        assert executor.map(tag, ["a", "slow", "boom", "b"], default="Unknown") == ["A", "Unknown", "Unknown", "B"]
+        assert time.monotonic() - start < 0.4
+        metrics = executor.metrics()
+        assert (metrics["completed"], metrics["timed_out"], metrics["failed"]) == (2, 1, 1)
+
+
+
+class _LabelProvider:
+    """Provider stand-in answering numbered batch prompts with one label per item"""
+
+    def __init__(self, labels=("Inspiring", "Humorous"), bad_above: int = 0, error: str = None):
+        self.labels = labels
+        self.bad_above = bad_above
+        self.error = error
+        self.prompts = []
+
+    def __call__(self, prompt):
+        self.prompts.append(prompt)
+        if self.error:
+            return self.error
+        items = [line for line in prompt.splitlines() if line[:1].isdigit()]
+        if self.bad_above and len(items) > self.bad_above:
+            return '["Inspiring"]'  # wrong length
+        return "```json\n" + json.dumps([self.labels["joke" in item] for item in items]) + "\n```"
+
+
+@pytest.mark.unit
+class TestBatchClassifier:
+    """Test suite for multi-item batched LLM classification."""
+
+    LABELS = ["Inspiring", "Humorous", "Educational"]
+
+    def _classifier(self, provider, **kwargs):
+        return BatchClassifier(provider, self.LABELS, "the tone of each post", **kwargs)
+
+    def test_packs_items_into_few_prompts(self):
+        provider = _LabelProvider()
+        classifier = self._classifier(provider, max_items=4)
+        texts = [f"post {i}" if i % 3 else f"joke {i}" for i in range(10)]
+        labels = classifier.classify(texts)
+        assert labels == ["Humorous" if i % 3 == 0 else "Inspiring" for i in range(10)]
+        assert len(provider.prompts) == 3
+        assert "exactly 4 labels" in provider.prompts[0] and "exactly 2 labels" in provider.prompts[2]
+        assert classifier.stats()["calls_saved"] == 7
+
+    def test_token_budget_limits_batch_size(self):
+        classifier = self._classifier(_LabelProvider())
+        budget = classifier._base_tokens + 2 * (60 // 4 + 1 + 6)
+        classifier.max_prompt_tokens = budget
+        assert [len(b) for b in classifier._batches(["x" * 60] * 5)] == [2, 2, 1]
+
+    def test_malformed_answers_split_and_retry(self):
+        provider = _LabelProvider(bad_above=2)
+        classifier = self._classifier(provider)
+        assert classifier.classify([f"post {i}" for i in range(5)]) == ["Inspiring"] * 5
+        stats = classifier.stats()
+        assert stats["splits"] >= 2 and stats["defaulted"] == 0
+
+    def test_invalid_labels_and_provider_errors_default(self):
+        assert self._classifier(_LabelProvider(labels=("Angry", "Angry"))).classify(["a", "b"]) == ["Unknown"] * 2
+
+        provider = _LabelProvider(error="[Groq Error: 429]")
+        classifier = self._classifier(provider, is_answer=lambda raw: not raw.startswith("["))
+        assert classifier.classify(["a", "b", "c"]) == ["Unknown"] * 3
+        assert len(provider.prompts) == 1 and classifier.stats()["provider_errors"] == 1
+
+    def test_labels_are_cached_per_text(self):
+        cache = LLMResponseCache()
+        provider = _LabelProvider()
+        classifier = self._classifier(provider, cache=cache, namespace="test:tone")
+        classifier.classify(["post a", "joke b", "post a"])
+        assert len(provider.prompts) == 1 and "exactly 2 labels" in provider.prompts[0]
+        assert classifier.classify(["joke b", "post c"]) == ["Humorous", "Inspiring"]
+        assert len(provider.prompts) == 2 and "exactly 1 labels" in provider.prompts[1]
+        assert classifier.stats()["cached"] == 1
+
+
+@pytest.mark.unit
+class TestStreaming:
+    """Test suite for SSE parsing and the incremental JSON field reader."""
+
+    ANSWER = ('Here you go:\n```json\n{"ideas": [{"id": "1", "hook": "a \\"quoted\\" }, brace"}, '
+              '{"id": "2", "scores": [1, 2]}], "post_text": "Hi, there", "hashtags": ["#a", "#b"], '
+              '"word_count": 42, "final": true}\n```')
+
+    def _events(self, chunk_size):
+        reader, events = JSONFieldStream(), []
+        for start in range(0, len(self.ANSWER), chunk_size):
+            events += reader.feed(self.ANSWER[start:start + chunk_size])
+        return reader, events
+
+    def test_values_are_reported_as_they_close(self):
+        for chunk_size in (1, 7, len(self.ANSWER)):
+            reader, events = self._events(chunk_size)
+            assert events == [
+                ("item", ("ideas", 0), {"id": "1", "hook": 'a "quoted" }, brace'}),
+                ("item", ("ideas", 1), {"id": "2", "scores": [1, 2]}),
+                ("field", ("post_text",), "Hi, there"),
+                ("field", ("hashtags",), ["#a", "#b"]),
+                ("field", ("word_count",), 42),
+                ("field", ("final",), True),
+            ]
+            assert reader.done and reader.result()["word_count"] == 42
+
+    def test_first_item_arrives_before_the_answer_ends(self):
+        reader = JSONFieldStream()
+        cut = self.ANSWER.index('{"id": "2"')
+        assert [e[0] for e in reader.feed(self.ANSWER[:cut])] == ["item"]
+        assert not reader.done and reader.result() is None
+
+    def test_sse_payloads(self):
+        lines = [": keep-alive", "data: {\"a\": 1}", "", "event: x", "data: line1", "data: line2", "",
+                 "data: [DONE]", "", "data: ignored", ""]
+        assert list(sse_payloads(lines)) == ['{"a": 1}', "line1\nline2"]
+        assert list(sse_payloads(["data: tail"])) == ["tail"]
+        assert sse("item", {"v": 1}) == 'event: item\ndata: {"v": 1}\n\n'
+
+
+class _Provider:
+    """Router target answering after `delay` seconds, or raising `error`"""
+
+    def __init__(self, name, delay=0.0, error=None):
+        self.name = name
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise RuntimeError(self.error)
+        return f"answer from {self.name}"
+
+
+@pytest.mark.unit
+class TestLLMRouter:
+    """Test suite for latency ranking, circuit breakers, hedging and failover."""
+
+    def _router(self, *providers, **kwargs):
+        router = LLMRouter(min_samples=2, hedge_floor=0.0, **kwargs)
+        for provider in providers:
+            router.add(provider.name, provider)
+        return router
+
+    def test_fastest_provider_is_chosen_per_call_class(self):
+        slow, fast = _Provider("slow", delay=0.03), _Provider("fast")
+        router = self._router(slow, fast, hedge=False)
+        for _ in range(2):
+            router.observe("slow", "ideate", 0.5)
+            router.observe("fast", "ideate", 0.1)
+            router.observe("slow", "tags", 0.1)
+            router.observe("fast", "tags", 0.5)
+        assert router.ranked("ideate") == ["fast", "slow"]
+        assert router.ranked("tags") == ["slow", "fast"]
+        assert router.ranked("unmeasured") == ["slow", "fast"]  # registration order
+        assert router.call(lambda p: p(), "ideate") == "answer from fast"
+
+    def test_breaker_opens_on_repeated_429_and_half_opens(self):
+        flaky, backup = _Provider("flaky", error="429 Too Many Requests"), _Provider("backup")
+        router = self._router(flaky, backup, hedge=False, breaker_failures=2, cooldown=0.05)
+        for _ in range(2):
+            assert router.call(lambda p: p()) == "answer from backup"
+        assert router.ranked() == ["backup"]
+        assert router.metrics()["providers"]["flaky"]["breaker"] == "open"
+        assert router.call(lambda p: p()) == "answer from backup"
+        assert flaky.calls == 2  # skipped while open
+
+        time.sleep(0.06)
+        flaky.error = None
+        assert "flaky" in router.ranked()
+        router.call(lambda p: p(), only=["flaky"])
+        assert router.metrics()["providers"]["flaky"]["breaker"] == "closed"
+
+    def test_non_availability_errors_do_not_open_the_breaker(self):
+        bad = _Provider("bad", error="invalid prompt")
+        router = self._router(bad, breaker_failures=1)
+        with pytest.raises(AllProvidersFailed, match="invalid prompt"):
+            router.call(lambda p: p())
+        assert router.ranked() == ["bad"]
+        assert is_unavailable(RuntimeError("503 Service Unavailable"))
+        assert is_unavailable("[Gemini Error: 429 Client Error]")
+        assert not is_unavailable(ValueError("JSON parse failed"))
+
+    def test_slow_call_is_hedged_to_the_next_provider(self):
+        stuck, quick = _Provider("stuck", delay=0.5), _Provider("quick")
+        router = self._router(stuck, quick, hedge_after=0.05)
+        started = time.perf_counter()
+        assert router.call(lambda p: p()) == "answer from quick"
+        assert time.perf_counter() - started < 0.4
+        counters = router.metrics()
+        assert counters["hedges"] == 1 and counters["hedge_wins"] == 1
+
+    def test_admission_wait_is_not_latency_and_hedging_can_be_off(self):
+        first, second = _Provider("first", delay=0.02), _Provider("second")
+        router = self._router(first, second, hedge_after=0.05)
+        queued = lambda name: time.sleep(0.15 if name == "first" else 0)
+        assert router.call(lambda p: p(), "tags", admit=queued) == "answer from first"
+        assert router.metrics()["hedges"] == 0
+        assert router.metrics()["providers"]["first"]["classes"]["tags"]["p50_ms"] < 100
+
+        first.delay = 0.15
+        assert router.call(lambda p: p(), "tags", hedge=False) == "answer from first"
+        assert router.metrics()["hedges"] == 0 and second.calls == 0
+
+    def test_rejected_answers_fail_over_and_all_errors_are_reported(self):
+        a, b = _Provider("a"), _Provider("b", error="500 Internal Server Error")
+        router = self._router(a, b, hedge=False)
+        with pytest.raises(AllProvidersFailed) as raised:
+            router.call(lambda p: p(), ok=lambda answer: "error" not in answer and answer.endswith("z"))
+        assert "a: answer from a" in str(raised.value) and "500" in str(raised.value)
+        assert router.metrics()["failovers"] == 1
+        stats = router.metrics()["providers"]["a"]["classes"]["default"]
+        assert stats["calls"] == 1 and stats["error_rate"] == 1.0
+
+
+class _HTTPError(Exception):
+    """Stand-in for requests / openai status errors"""
+
+    def __init__(self, status, headers=None, text=""):
+        super().__init__(f"{status} error {text}")
+        self.response = type("Response", (), {"status_code": status, "headers": headers or {}, "text": text})()
+
+
+@pytest.mark.unit
+class TestQuotaScheduler:
+    """Test suite for provider budgets, Retry-After holds and priority lanes."""
+
+    def test_token_bucket_limits_rate(self):
+        bucket = TokenBucket(rate=20, burst=1)
+        assert bucket.delay() == 0.0
+        bucket.take()
+        assert bucket.delay() == pytest.approx(0.05, abs=0.01)
+        bucket.take(3)   # overdrawn: later callers wait out the debt
+        assert bucket.delay() >= 0.19
+        assert bucket.delay(5) == pytest.approx(bucket.delay(), abs=0.01)   # capped at burst
+
+    def test_available_quota_does_not_wait(self):
+        scheduler = QuotaScheduler({"groq": (600, None)})
+        started = time.perf_counter()
+        for _ in range(5):
+            assert scheduler.acquire("groq") == 0.0
+            assert scheduler.acquire("unlisted") == 0.0
+        assert time.perf_counter() - started < 0.05
+        assert scheduler.metrics()["groq"]["waited"] == 0
+
+    def test_request_and_token_budgets_space_calls(self):
+        scheduler = QuotaScheduler(parse_quota_limits("a=600", "b=6000"))  # 10 req/s; 100 tokens/s
+        for _ in range(10):  # one second of burst
+            assert scheduler.acquire("a") == 0.0
+        assert scheduler.acquire("a") >= 0.08
+        scheduler.acquire("b", tokens=6000)  # a full minute of burst
+        scheduler.settle("b", tokens=5)
+        started = time.perf_counter()
+        scheduler.acquire("b", tokens=5)
+        assert time.perf_counter() - started >= 0.08
+        assert parse_quota_limits("Gemini=60, groq=0", "gemini=1000") == {"gemini": (60.0, 1000.0)}
+
+    def test_retry_after_hints(self):
+        assert retry_after_seconds(_HTTPError(429, {"Retry-After": "3"})) == 3.0
+        assert retry_after_seconds(_HTTPError(429, {"retry-after-ms": "250"})) == 0.25
+        assert retry_after_seconds(RuntimeError("Rate limit reached. Please try again in 1m2.5s.")) == 62.5
+        assert retry_after_seconds('429 {"retryDelay": "12s"}') == 12.0
+        wrapped = RuntimeError("Groq API error")
+        wrapped.__cause__ = _HTTPError(429, {"Retry-After": "2"})
+        assert retry_after_seconds(wrapped) == 2.0
+        assert retry_after_seconds(RuntimeError("boom")) is None
+        assert 4.0 <= backoff_delay(3) <= 8.0 and 5.0 <= backoff_delay(0, retry_after=5.0) <= 5.5
+
+    def test_throttling_holds_the_provider(self):
+        scheduler = QuotaScheduler()
+        assert scheduler.note_error("gemini", _HTTPError(500)) is None
+        held = scheduler.note_error("gemini", _HTTPError(429, {"Retry-After": "0.1"}))
+        assert 0.1 <= held <= 0.11
+        assert scheduler.acquire("gemini") >= 0.09
+        assert scheduler.acquire("groq") == 0.0  # other providers unaffected
+
+    def test_interactive_lane_is_admitted_first(self):
+        scheduler = QuotaScheduler({"p": (600, None)})  # one request per 0.1 s after the burst
+        for _ in range(10):
+            scheduler.acquire("p")
+        order = []
+
+        def call(name, priority):
+            scheduler.acquire("p", priority=priority)
+            order.append(name)
+
+        background = [threading.Thread(target=call, args=(f"bg{i}", BACKGROUND)) for i in range(2)]
+        for thread in background:
+            thread.start()
+        time.sleep(0.02)
+        with lane(INTERACTIVE):
+            interactive = threading.Thread(target=call, args=("ui", None))
+            interactive.start()
+        for thread in background + [interactive]:
+            thread.join()
+        assert order[0] == "ui"
+
+    def test_call_retries_with_backoff(self):
+        scheduler = QuotaScheduler()
+        attempts = []
+
+        def flaky():
+            attempts.append(time.perf_counter())
+            if len(attempts) < 2:
+                raise _HTTPError(429, {"Retry-After": "0.05"})
+            return "ok"
+
+        assert scheduler.call("apify", flaky, retries=2) == "ok"
+        assert attempts[1] - attempts[0] >= 0.05
+        with pytest.raises(RuntimeError):
+            scheduler.call("apify", lambda: (_ for _ in ()).throw(RuntimeError("down")), retries=0)
+
+
+@pytest.mark.unit
+class TestJSONExtract:
+    """Test suite for the shared LLM JSON extractor and truncation repair."""
+
+    ANSWER = ('Sure! Here is {your} plan:\n```json\n{"ideas": [{"id": 1, "hook": "a \\"b\\" {c}"}, {"id": 2}], '
+              '"post_text": "line one\nline two", "score": 7}\n```\nWant {more}?')
+
+    def test_first_object_is_found_past_fences_and_prose(self):
+        parsed = extract_json(self.ANSWER)
+        assert parsed == {"ideas": [{"id": 1, "hook": 'a "b" {c}'}, {"id": 2}],
+                          "post_text": "line one\nline two", "score": 7}
+        assert extract_json('{"a": 1} {"b": 2}') == {"a": 1}
+        assert extract_json("[Gemini Error: 429]") is None and extract_json("") is None
+
+    def test_truncated_answers_are_repaired(self):
+        cut = '```json\n{"ideas": [{"id": 1, "t": "x"}, {"id": 2, "t": "half'
+        assert extract_json(cut) == {"ideas": [{"id": 1, "t": "x"}]}
+        assert extract_json(cut, repair=False) is None
+        assert extract_json('{"post_text": "hi", "hashtags": ["#a", "#b') == {"post_text": "hi", "hashtags": ["#a"]}
+        assert extract_json('{"a": {"b": 1, "c": [1, 2') == {"a": {"b": 1, "c": [1]}}  # 2 may be 2xx
+        assert extract_json('{"post_text": "hel') is None
+        assert repair_truncated('{"a": [], "b": {') == '{"a": [], "b": {}}'
+
+    def test_streaming_matches_single_pass(self):
+        for chunk_size in (1, 5, 64):
+            reader = JSONFieldStream()
+            for start in range(0, len(self.ANSWER), chunk_size):
+                reader.feed(self.ANSWER[start:start + chunk_size])
+            assert reader.done and reader.finish() == extract_json(self.ANSWER)
+
+        # A stream cut off at max_tokens is repaired like a whole answer
+        reader = JSONFieldStream()
+        reader.feed('{"ideas": [{"id": 1}, {"id"')
+        assert not reader.done
+        assert reader.finish() == {"ideas": [{"id": 1}]} and reader.finish(repair=False) is None
\ No newline at end of file
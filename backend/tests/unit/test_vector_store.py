@@ -0,0 +1,642 @@
+"""
+Unit tests for the in-process VectorCollection.
+
+Tests cosine ranking, where filtering, and the ChromaDB-compatible surface.
+"""
+import numpy as np
+import pytest
+
+from services.ad_scraper.ad_vector_store import AdVectorStore
+from services.vector_store.aggregates import RunningAggregates, field_category, field_value
+from services.vector_store.collection import VectorCollection, top_k_indices
+from services.vector_store.ivf import IVFFlatIndex
+from services.vector_store.partitioned import PartitionedCollection
+from services.vector_store.quantization import ScalarQuantizer
+from services.vector_store.ranking import OrderStatisticTree
+from services.vector_store.scoring import ERSDistribution, FusedScorer
+from services.vector_store.where import compile_where, matches_where
+
+
+def _unit(*values):
+    vec = np.zeros(4, dtype=np.float32)
+    vec[:len(values)] = values
+    return vec.tolist()
+
+
+@pytest.fixture
+def collection():
+    col = VectorCollection(name="test", dim=4, initial_capacity=2)
+    col.add(
+        ids=["a", "b", "c", "d"],
+        embeddings=[_unit(1, 0), _unit(0, 1), _unit(1, 1), _unit(-1, 0)],
+        documents=["alpha", "beta", "gamma", "delta"],
+        metadatas=[
+            {"ers": 80, "platform": "instagram", "is_winner": True},
+            {"ers": 20, "platform": "linkedin", "is_winner": False},
+            {"ers": 55, "platform": "instagram", "is_winner": False},
+            {"ers": 95, "platform": "twitter", "is_winner": True},
+        ]
+    )
+    return col
+
+
+@pytest.mark.unit
+class TestVectorCollection:
+    """Test suite for VectorCollection."""
+
+    def test_count_and_duplicate_ids_skipped(self, collection):
+        added = collection.add(ids=["a", "e", "e"], embeddings=[_unit(0, 0, 1)] * 3,
+                               documents=["dup", "new", "again"], metadatas=[{}] * 3)
+        assert added == 1 and collection.count() == 5
+        assert collection.get(ids=["a"])["documents"] == ["alpha"]
+
+    def test_query_ranks_by_cosine_similarity(self, collection):
+        result = collection.query(query_embeddings=[_unit(1, 0)], n_results=3)
+
+        assert result["ids"][0] == ["a", "c", "b"]
+        assert result["distances"][0][0] == pytest.approx(0.0, abs=1e-6)
+        assert result["distances"][0][1] == pytest.approx(1 - 1 / np.sqrt(2), abs=1e-6)
+
+    def test_query_with_where_filter(self, collection):
+        result = collection.query(
+            query_embeddings=[_unit(1, 0)], n_results=5,
+            where={"$and": [{"is_winner": True}, {"ers": {"$gte": 90}}]}
+        )
+        assert result["ids"][0] == ["d"]
+        assert result["metadatas"][0][0]["platform"] == "twitter"
+
+    def test_query_texts_use_embedding_function(self):
+        col = VectorCollection(dim=4, embedding_function=lambda texts: [_unit(len(t), 1) for t in texts])
+        col.add(ids=["x"], documents=["abc"])
+        result = col.query(query_texts=["abc"], n_results=1)
+        assert result["ids"][0] == ["x"]
+
+    def test_get_where_limit_offset(self, collection):
+        result = collection.get(where={"platform": "instagram"}, limit=1, offset=1)
+        assert result["ids"] == ["c"]
+
+    def test_update_merges_metadata(self, collection):
+        collection.update(ids=["b"], metadatas=[{"is_winner": True}])
+        meta = collection.get(ids=["b"])["metadatas"][0]
+        assert meta == {"ers": 20, "platform": "linkedin", "is_winner": True}
+
+    def test_delete_excludes_rows_from_reads(self, collection):
+        collection.delete(ids=["a"])
+        assert collection.count() == 3
+        result = collection.query(query_embeddings=[_unit(1, 0)], n_results=10)
+        assert "a" not in result["ids"][0]
+        assert len(result["ids"][0]) == 3
+
+    def test_upsert_overwrites_existing(self, collection):
+        collection.upsert(ids=["b", "e"], embeddings=[_unit(1, 0), _unit(0, 0, 1)],
+                          documents=["beta2", "epsilon"], metadatas=[{"ers": 1}, {"ers": 2}])
+        assert collection.count() == 5
+        assert collection.get(ids=["b"])["documents"] == ["beta2"]
+
+    def test_wrong_dimension_rejected(self, collection):
+        with pytest.raises(ValueError):
+            collection.add(ids=["z"], embeddings=[[1.0, 2.0]], documents=["z"])
+
+
+@pytest.mark.unit
+class TestWhereAndTopK:
+    """Test suite for where matching and top-k selection."""
+
+    def test_matches_where_operators(self):
+        meta = {"ers": 50, "source": "instagram"}
+        assert matches_where(meta, {"source": {"$in": ["instagram", "twitter"]}})
+        assert matches_where(meta, {"$or": [{"ers": {"$lt": 10}}, {"source": "instagram"}]})
+        assert not matches_where(meta, {"brand_id": "acme"})
+        assert matches_where(meta, {"brand_id": {"$ne": "acme"}})
+
+    def test_top_k_indices_sorted(self):
+        scores = np.array([0.1, 0.9, 0.5, 0.7], dtype=np.float32)
+        assert top_k_indices(scores, 2).tolist() == [1, 3]
+        assert top_k_indices(scores, 10).tolist() == [1, 3, 2, 0]
+
+
+@pytest.mark.unit
+class TestPersistence:
+    """Test suite for the memory-mapped on-disk layout."""
+
+    def test_persist_and_open_round_trip(self, collection, tmp_path):
+        collection.update(ids=["c"], metadatas=[{"tags": ["a", "b"], "score": 1.5}])
+        collection.persist(str(tmp_path / "store"))
+
+        reopened = VectorCollection.open(str(tmp_path / "store"))
+
+        assert reopened.count() == 4
+        assert isinstance(reopened._base_embeddings, np.memmap)
+        assert reopened.get(ids=["c"])["metadatas"][0] == {
+            "ers": 55, "platform": "instagram", "is_winner": False, "tags": ["a", "b"], "score": 1.5
+        }
+        assert reopened.get(ids=["a"])["metadatas"][0]["is_winner"] is True
+        before = collection.query(query_embeddings=[_unit(1, 0.2)], n_results=4)
+        after = reopened.query(query_embeddings=[_unit(1, 0.2)], n_results=4)
+        assert before["ids"] == after["ids"]
+
+    def test_writes_after_open_land_in_tail(self, collection, tmp_path):
+        path = str(tmp_path / "store")
+        collection.persist(path)
+        reopened = VectorCollection.open(path)
+
+        reopened.add(ids=["e"], embeddings=[_unit(0, 0, 1)], documents=["epsilon"], metadatas=[{"ers": 5}])
+        reopened.update(ids=["a"], metadatas=[{"ers": 81}])
+        reopened.delete(ids=["b"])
+
+        assert reopened.count() == 4
+        assert reopened.query(query_embeddings=[_unit(0, 0, 1)], n_results=1)["ids"][0] == ["e"]
+        assert reopened.get(where={"ers": {"$gte": 81}})["ids"] == ["a", "d"]
+
+        reopened.persist()
+        compacted = VectorCollection.open(path)
+        assert compacted.count() == 4
+        assert compacted.get()["ids"] == ["a", "c", "d", "e"]
+
+    def test_open_or_create_without_store(self, tmp_path):
+        col = VectorCollection.open_or_create(str(tmp_path / "missing"), dim=4)
+        assert col.count() == 0
+        col.add(ids=["x"], embeddings=[_unit(1)], documents=["x"])
+        col.persist()
+        reopened = VectorCollection.open_or_create(str(tmp_path / "missing"), dim=4)
+        assert reopened.count() == 1
+        assert reopened.get()["metadatas"] == [{}]   # no metadata columns at all
+
+    def test_concurrent_writers_merge_instead_of_overwriting(self, collection, tmp_path):
+        path = str(tmp_path / "store")
+        collection.persist(path)
+        worker_1, worker_2 = VectorCollection.open(path), VectorCollection.open(path)
+
+        worker_1.add(ids=["from_w1"], embeddings=[_unit(0, 0, 1)], documents=["one"], metadatas=[{"ers": 1}])
+        worker_1.delete(ids=["b"])
+        worker_1.persist()
+        worker_2.add(ids=["from_w2"], embeddings=[_unit(0, 0, 0, 1)], documents=["two"], metadatas=[{"ers": 2}])
+        worker_2.update(ids=["a"], metadatas=[{"ers": 81}])
+        worker_2.persist()
+
+        expected = ["a", "c", "d", "from_w1", "from_w2"]
+        assert VectorCollection.open(path).get()["ids"] == expected
+        assert VectorCollection.open(path).get(ids=["a"])["metadatas"][0]["ers"] == 81
+        # worker_1 re-maps onto the replaced store on its next read
+        assert worker_1.get()["ids"] == expected
+        assert worker_1.query(query_embeddings=[_unit(0, 0, 0, 1)], n_results=1)["ids"] == [["from_w2"]]
+
+    def test_unpersisted_writes_survive_a_remap(self, collection, tmp_path):
+        path = str(tmp_path / "store")
+        collection.persist(path)
+        reader, writer = VectorCollection.open(path), VectorCollection.open(path)
+        reader.add(ids=["local"], embeddings=[_unit(0, 0, 1)], documents=["local"])
+
+        writer.add(ids=["remote"], embeddings=[_unit(0, 0, 0, 1)], documents=["remote"])
+        writer.persist()
+
+        assert reader.count() == 6
+        assert set(reader.get()["ids"]) == {"a", "b", "c", "d", "local", "remote"}
+
+
+@pytest.mark.unit
+class TestMetadataIndexes:
+    """Test suite for the secondary indexes and query planner."""
+
+    WHERES = [
+        {"is_winner": True},
+        {"platform": {"$in": ["instagram", "twitter"]}},
+        {"platform": {"$nin": ["instagram"]}},
+        {"$and": [{"ers": {"$gte": 50}}, {"platform": "instagram"}]},
+        {"$and": [{"ers": {"$gt": 10, "$lt": 60}}, {"emotion": "Joy"}]},
+        {"$or": [{"is_winner": True}, {"ers": {"$lte": 5}}]},
+        {"$or": [{"source": "meta_ads"}, {"emotion": "Fear"}]},
+        {"percentile_rank": {"$lte": 10}},
+    ]
+
+    @pytest.fixture
+    def populated(self):
+        rng = np.random.default_rng(7)
+        col = VectorCollection(dim=4, initial_capacity=8)
+        metadatas = []
+        for i in range(2000):
+            meta = {"ers": float(rng.uniform(0, 100)), "is_winner": bool(i % 7 == 0),
+                    "platform": ["instagram", "linkedin", "twitter"][i % 3],
+                    "emotion": ["Joy", "Fear"][i % 2]}
+            if i % 3 == 0:
+                meta["source"] = "meta_ads"
+            if i % 4 == 0:
+                meta["percentile_rank"] = float(rng.uniform(0, 100))
+            metadatas.append(meta)
+        col.add(ids=[str(i) for i in range(2000)], embeddings=rng.random((2000, 4)),
+                metadatas=metadatas)
+        return col
+
+    def _expected(self, col, where):
+        everything = col.get()
+        return [i for i, m in zip(everything["ids"], everything["metadatas"]) if matches_where(m, where)]
+
+    def test_planner_matches_row_evaluation(self, populated):
+        for where in self.WHERES:
+            assert populated.get(where=where)["ids"] == self._expected(populated, where)
+            assert populated.get(where=where, limit=5, offset=3)["ids"] == \
+                self._expected(populated, where)[3:8]
+
+    def test_indexes_follow_writes(self, populated):
+        populated.update(ids=["1", "2"], metadatas=[{"is_winner": True, "ers": 99.5}, {"ers": 0.5}])
+        populated.upsert(ids=["3"], embeddings=[_unit(1)], metadatas=[{"platform": "tiktok"}])
+        populated.delete(where={"ers": {"$gte": 95}, "is_winner": False})
+
+        assert "1" in populated.get(where={"$and": [{"is_winner": True}, {"ers": {"$gte": 99}}]})["ids"]
+        assert populated.get(where={"platform": "tiktok"})["ids"] == ["3"]
+        assert populated.get(where={"ers": {"$gte": 95}, "is_winner": False})["ids"] == []
+        for where in self.WHERES:
+            assert populated.get(where=where)["ids"] == self._expected(populated, where)
+
+    def test_indexes_rebuilt_from_mapped_columns(self, populated, tmp_path):
+        populated.persist(str(tmp_path / "store"))
+        reopened = VectorCollection.open(str(tmp_path / "store"))
+        reopened.add(ids=["new"], embeddings=[_unit(1)], metadatas=[{"is_winner": True, "ers": 1.0}])
+        reopened.update(ids=["0"], metadatas=[{"is_winner": False}])
+
+        for where in self.WHERES:
+            assert reopened.get(where=where)["ids"] == self._expected(reopened, where)
+
+    def test_compile_where_is_cached(self):
+        where = {"$and": [{"is_winner": True}, {"ers": {"$gte": 50}}]}
+        assert compile_where(where) is compile_where({"$and": [{"is_winner": True}, {"ers": {"$gte": 50}}]})
+
+
+@pytest.mark.unit
+class TestLiveRanking:
+    """Test suite for incrementally maintained is_winner / percentile_rank."""
+
+    def test_order_statistic_tree_matches_sorted_list(self):
+        rng = np.random.default_rng(3)
+        tree, reference = OrderStatisticTree(), []
+        for value in rng.integers(0, 200, 3000).astype(float).tolist():
+            tree.add(value)
+            reference.append(value)
+        for value in reference[::3]:
+            assert tree.remove(value)
+        for value in reference[::3]:
+            reference.remove(value)
+        reference.sort()
+
+        assert len(tree) == len(reference)
+        assert not tree.remove(1000.0)
+        for probe in (-1.0, 0.0, 57.0, 57.5, 199.0, 250.0):
+            assert tree.count_less(probe) == sum(v < probe for v in reference)
+            assert tree.count_greater(probe) == sum(v > probe for v in reference)
+        for k in (0, 1, len(reference) // 2, len(reference) - 1):
+            assert tree.kth_smallest(k) == reference[k]
+        assert tree.kth_largest(1) == reference[-1]
+
+    def test_winners_follow_every_write(self):
+        col = VectorCollection(dim=4, rank_key="ers")
+        col.add(ids=[f"p{i}" for i in range(10)], embeddings=[_unit(1)] * 10,
+                metadatas=[{"ers": float(i), "is_winner": False} for i in range(10)])
+
+        assert col.get(where={"is_winner": True})["ids"] == ["p8", "p9"]
+        assert col.get(ids=["p9"])["metadatas"][0]["percentile_rank"] == pytest.approx(0.1)
+
+        col.add(ids=["top"], embeddings=[_unit(1)], metadatas=[{"ers": 50.0}])
+        assert col.get(where={"is_winner": True})["ids"] == ["p9", "top"]
+        assert col.get(ids=["p9"])["metadatas"][0]["percentile_rank"] == pytest.approx(2 / 11)
+
+        col.delete(ids=["top"])
+        col.update(ids=["p0"], metadatas=[{"ers": 99.0}])
+        assert col.get(where={"is_winner": True})["ids"] == ["p0", "p9"]
+        assert col.get(where={"percentile_rank": {"$lte": 0.1}})["ids"] == ["p0"]
+
+    def test_ranking_rebuilt_after_reopen(self, tmp_path):
+        col = VectorCollection(dim=4, rank_key="ers", path=str(tmp_path / "store"))
+        col.add(ids=["a", "b", "c", "d", "e"], embeddings=[_unit(1)] * 5,
+                metadatas=[{"ers": 10}, {"ers": 40}, {"ers": 30}, {"ers": 20}, {"platform": "x"}])
+        col.persist()
+
+        reopened = VectorCollection.open(str(tmp_path / "store"), rank_key="ers")
+        reopened.add(ids=["f"], embeddings=[_unit(1)], metadatas=[{"ers": 35}])
+
+        everything = reopened.get()
+        metas = dict(zip(everything["ids"], everything["metadatas"]))
+        assert metas["b"]["is_winner"] is True and metas["f"]["is_winner"] is False
+        assert metas["f"]["percentile_rank"] == pytest.approx(2 / 6)
+        assert metas["e"] == {"platform": "x", "is_winner": False, "percentile_rank": 1.0}
+
+
+@pytest.mark.unit
+class TestIVFFlatIndex:
+    """Test suite for the niche-partitioned IVF-Flat ANN index."""
+
+    @pytest.fixture
+    def clustered(self):
+        rng = np.random.default_rng(11)
+        centres = rng.standard_normal((20, 16)).astype(np.float32)
+        vectors = centres[rng.integers(0, 20, 3000)] + 0.3 * rng.standard_normal((3000, 16)).astype(np.float32)
+        index = IVFFlatIndex(16, n_probe=4, train_threshold=500)
+        for start in range(0, 3000, 500):
+            index.add([f"ad{i}" for i in range(start, start + 500)], vectors[start:start + 500],
+                      ["fitness" if i % 2 else "beauty" for i in range(start, start + 500)])
+        return index, vectors
+
+    def test_exact_probe_matches_brute_force(self, clustered):
+        index, vectors = clustered
+        q = vectors[7]
+        ids, _ = index.search(q, 5, partition="fitness", n_probe=10_000)
+        normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        scores = normed @ (q / np.linalg.norm(q))
+        fitness = np.arange(1, 3000, 2)
+        expected = fitness[np.argsort(-scores[fitness])[:5]]
+        assert ids == [f"ad{i}" for i in expected]
+
+    def test_recall_report_improves_with_n_probe(self, clustered):
+        index, vectors = clustered
+        report = index.recall_report(vectors[:40], k=5, n_probes=(1, 64))
+        recalls = [row["recall@5"] for row in report["approximate"]]
+        assert report["vectors"] == 3000 and report["partitions"] == 2
+        assert recalls[0] <= recalls[1] == 1.0
+
+    def test_upsert_and_remove(self, clustered):
+        index, vectors = clustered
+        index.add(["ad1"], [vectors[2]], ["fitness"])
+        index.remove(["ad3"])
+        ids, _ = index.search(vectors[2], 2, partition="fitness", n_probe=10_000)
+        assert ids[0] == "ad1"
+        assert len(index) == 2999 and "ad3" not in index
+
+    def test_save_load_round_trip(self, clustered, tmp_path):
+        index, vectors = clustered
+        index.save(str(tmp_path / "ivf"))
+        loaded = IVFFlatIndex.load(str(tmp_path / "ivf"))
+        for q in vectors[:5]:
+            assert loaded.search(q, 5, partition="beauty")[0] == index.search(q, 5, partition="beauty")[0]
+        loaded.add(["new"], [vectors[0]], ["beauty"])
+        assert len(loaded) == 3001
+        assert "new" in loaded.search(vectors[0], 2, partition="beauty", n_probe=10_000)[0]
+
+    def test_ad_store_routes_niche_to_partition(self, tmp_path):
+        store = AdVectorStore(lambda texts: [[1.0, 0, 0, 0] if "gym" in t else [0, 1.0, 0, 0] for t in texts],
+                              path=str(tmp_path / "ads"))
+        store.upsert(documents=["gym ad", "lipstick ad", "gym promo"],
+                     metadatas=[{"niche": "fitness", "platform": "meta"}, {"niche": "beauty", "platform": "meta"},
+                                {"niche": "fitness", "platform": "youtube"}],
+                     ids=["a", "b", "c"])
+        store.persist()
+
+        reopened = AdVectorStore.open_or_create(str(tmp_path / "ads"), store.embedding_function)
+        result = reopened.query(query_texts=["gym"], n_results=5,
+                                where={"$and": [{"niche": "fitness"}, {"platform": "youtube"}]})
+        assert result["ids"][0] == ["c"]
+        assert result["distances"][0][0] == pytest.approx(0.0, abs=1e-6)
+        assert reopened.query(query_texts=["lipstick"], n_results=5, where={"niche": "beauty"})["ids"] == [["b"]]
+
+
+@pytest.mark.unit
+class TestRunningAggregates:
+    """Test suite for write-maintained dashboard aggregates."""
+
+    @staticmethod
+    def _spec():
+        return RunningAggregates(
+            numeric={"ers": field_value("ers", 0.0)},
+            categorical={"platform": field_category("platform")},
+            top_by="ers",
+            top_capacity=4
+        )
+
+    def test_stats_follow_every_write(self):
+        col = VectorCollection(dim=4, aggregates=self._spec())
+        col.add(ids=[f"p{i}" for i in range(10)], embeddings=[_unit(1)] * 10,
+                documents=[f"doc{i}" for i in range(10)],
+                metadatas=[{"ers": float(i), "platform": "ig" if i % 2 else "li"} for i in range(10)])
+        col.delete(ids=["p9", "p8", "p7"])
+        col.update(ids=["p0"], metadatas=[{"ers": 50.0, "platform": "x"}])
+
+        stats = col.stats(top_k=3)
+        assert stats["count"] == 7
+        assert stats["numeric"]["ers"]["max"] == 50.0 and stats["numeric"]["ers"]["min"] == 1.0
+        assert stats["numeric"]["ers"]["avg"] == pytest.approx((50 + 1 + 2 + 3 + 4 + 5 + 6) / 7)
+        assert stats["histograms"]["platform"] == {"ig": 3, "li": 3, "x": 1}
+        assert [t["id"] for t in stats["top"]] == ["p0", "p6", "p5"]
+        assert stats["top"][0]["document"] == "doc0"
+        assert col.verify_stats()["consistent"]
+
+    def test_heap_refills_after_deletes_drain_it(self):
+        col = VectorCollection(dim=4, aggregates=self._spec())
+        col.add(ids=[f"p{i}" for i in range(20)], embeddings=[_unit(1)] * 20,
+                metadatas=[{"ers": float(i)} for i in range(20)])
+        col.delete(ids=["p19", "p18", "p17"])
+        col.add(ids=["low"], embeddings=[_unit(1)], metadatas=[{"ers": -1.0}])
+
+        assert [t["value"] for t in col.stats(top_k=3)["top"]] == [16.0, 15.0, 14.0]
+        assert col.stats()["numeric"]["ers"]["min"] == -1.0
+
+    def test_verify_repairs_drift_and_survives_reopen(self, tmp_path):
+        col = VectorCollection(dim=4, path=str(tmp_path / "store"), aggregates=self._spec())
+        col.add(ids=["a", "b"], embeddings=[_unit(1)] * 2,
+                metadatas=[{"ers": 10, "platform": "ig"}, {"ers": 30}])
+        col.persist()
+        col.add(ids=["c"], embeddings=[_unit(1)], metadatas=[{"ers": 20, "platform": "ig"}])
+        assert col.stats()["histograms"]["platform"] == {"ig": 2, "unknown": 1}
+
+        col._aggregates_cache.count = 99
+        report = col.verify_stats()
+        assert not report["consistent"] and "count" in report["drift"]
+        assert col.stats()["count"] == 3
+
+        reopened = VectorCollection.open(str(tmp_path / "store"), aggregates=self._spec())
+        assert reopened.stats()["numeric"]["ers"]["sum"] == 40.0
+
+
+@pytest.mark.unit
+class TestSortedScan:
+    """Test suite for cursor-paginated scans over the ERS index."""
+
+    @pytest.fixture
+    def posts(self):
+        col = VectorCollection(dim=4, initial_capacity=8)
+        ers = [5.0, 9.0, 5.0, None, 1.0, 9.0, 7.0, None, 5.0, 3.0]
+        col.add(ids=[f"p{i}" for i in range(10)], embeddings=[_unit(1)] * 10,
+                metadatas=[{"platform": "ig" if i % 2 else "li", **({"ers": e} if e is not None else {})}
+                           for i, e in enumerate(ers)])
+        col.delete(ids=["p6"])
+        return col
+
+    def test_order_is_ers_desc_then_id_with_unranked_last(self, posts):
+        ids = [r["id"] for r in posts.scan_sorted("ers", batch_size=2)]
+        assert ids == ["p1", "p5", "p0", "p2", "p8", "p9", "p4", "p3", "p7"]
+
+    def test_cursor_resumes_inside_tie_group_and_unranked_tail(self, posts):
+        assert [r["id"] for r in posts.scan_sorted("ers", after=(5.0, "p0"))][:2] == ["p2", "p8"]
+        assert [r["id"] for r in posts.scan_sorted("ers", after=(None, "p3"))] == ["p7"]
+
+        posts.add(ids=["p10"], embeddings=[_unit(1)], metadatas=[{"ers": 5.0}])
+        resumed = [r["id"] for r in posts.scan_sorted("ers", after=(5.0, "p2"), batch_size=1)]
+        assert resumed[:2] == ["p8", "p9"]
+        assert "p10" not in resumed  # ids sort as strings: "p10" < "p2"
+
+    def test_filters_and_value_range(self, posts):
+        records = list(posts.scan_sorted("ers", where={"platform": "ig"}, min_value=2, max_value=9))
+        assert [(r["id"], r["value"]) for r in records] == [("p1", 9.0), ("p5", 9.0), ("p9", 3.0)]
+
+    def test_descending_with_non_positive_count_is_empty(self, posts):
+        index = posts._indexes.sorted["ers"]
+        for count in (0, -3):
+            values, rows, exhausted = index.descending(np.inf, -np.inf, count)
+            assert len(values) == len(rows) == 0 and not exhausted
+        assert index.descending(0.5, 0.0, 0)[2]  # nothing in range at all
+
+
+@pytest.mark.unit
+class TestQuantization:
+    """Test suite for int8 codes with exact re-ranking."""
+
+    def test_quantizer_round_trip_error_is_small(self):
+        rng = np.random.default_rng(5)
+        vectors = rng.standard_normal((500, 32)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        quantizer = ScalarQuantizer.fit(vectors)
+        codes = quantizer.encode(vectors)
+
+        assert codes.dtype == np.int8
+        assert np.abs(quantizer.decode(codes) - vectors).max() <= quantizer.scales.max() / 2 + 1e-6
+        np.testing.assert_allclose(quantizer.scores(codes, vectors[0]), vectors @ vectors[0], atol=0.02)
+
+    def test_quantized_store_matches_exact_search(self, tmp_path):
+        rng = np.random.default_rng(9)
+        vectors = rng.standard_normal((2000, 16)).astype(np.float32)
+        col = VectorCollection(dim=16, quantization="int8")
+        col.add(ids=[f"p{i}" for i in range(2000)], embeddings=vectors,
+                metadatas=[{"platform": "ig" if i % 2 else "li"} for i in range(2000)])
+        col.persist(str(tmp_path / "store"))
+        col.add(ids=["tail"], embeddings=[vectors[3] + vectors[7]], metadatas=[{"platform": "li"}])
+        col.update(ids=["p5"], embeddings=[vectors[4] + vectors[6]])
+
+        exact = VectorCollection.open(str(tmp_path / "store"))
+        exact.add(ids=["tail"], embeddings=[vectors[3] + vectors[7]], metadatas=[{"platform": "li"}])
+        exact.update(ids=["p5"], embeddings=[vectors[4] + vectors[6]])
+        assert col._base_codes is not None and exact._base_codes is None
+
+        for q in vectors[:20]:
+            for where in (None, {"platform": "li"}):
+                got = col.query(query_embeddings=[q], n_results=5, where=where)
+                want = exact.query(query_embeddings=[q], n_results=5, where=where)
+                assert got["ids"] == want["ids"]
+                np.testing.assert_allclose(got["distances"], want["distances"], atol=1e-5)
+
+    def test_unknown_quantization_rejected(self):
+        with pytest.raises(ValueError):
+            VectorCollection(dim=4, quantization="pq")
+
+
+@pytest.mark.unit
+class TestFusedScorer:
+    """Test suite for the vectorized semantic + ERS re-ranker."""
+
+    def test_matches_scalar_blend(self):
+        rng = np.random.default_rng(5)
+        sims, ers = rng.uniform(-0.2, 1, 500), rng.uniform(0, 300, 500)
+        scorer = FusedScorer(semantic_weight=0.4, ers_weight=0.6)
+        best, combined, _ = scorer.top_k(sims, ers, 10)
+
+        pct = [(np.sum(ers < e) + np.sum(ers == e) / 2) / len(ers) for e in ers]
+        scalar = [0.4 * max(0, s) + 0.6 * p for s, p in zip(sims, pct)]
+        assert best.tolist() == sorted(range(500), key=lambda i: -scalar[i])[:10]
+        np.testing.assert_allclose(combined, np.sort(scalar)[::-1][:10])
+
+    def test_percentiles_follow_live_corpus(self, collection):
+        col = VectorCollection(dim=4, rank_key="ers")
+        col.add(ids=["a", "b", "c", "d"], embeddings=[_unit(1)] * 4,
+                metadatas=[{"ers": 10}, {"ers": 20}, {"ers": 30}, {"ers": 40}])
+        distribution = ERSDistribution.from_collection(col)
+        np.testing.assert_allclose(distribution.percentile([20, 25, 100]), [0.375, 0.5, 1.0])
+
+        col.delete(ids=["a"])
+        np.testing.assert_allclose(distribution.percentile([20]), [1 / 6])
+        assert ERSDistribution.from_collection(collection) is None  # no rank_key / aggregates
+
+    def test_zscore_uses_running_moments(self):
+        col = VectorCollection(dim=4, aggregates=RunningAggregates(numeric={"ers": field_value("ers")}))
+        col.add(ids=["a", "b", "c"], embeddings=[_unit(1)] * 3,
+                metadatas=[{"ers": 10}, {"ers": 20}, {"ers": 30}])
+        distribution = ERSDistribution.from_collection(col)
+        assert distribution.mean == pytest.approx(20) and distribution.std == pytest.approx(np.std([10, 20, 30]))
+
+        normalized = FusedScorer(normalization="zscore").normalize_ers([20, 30, 1000], distribution)
+        assert normalized[0] == pytest.approx(0.5) and 0.85 < normalized[1] < normalized[2] <= 1.0
+
+    def test_rerank_keeps_chroma_shape(self):
+        results = {"ids": [["x", "y", "z"]], "documents": [["dx", "dy", "dz"]],
+                   "metadatas": [[{"ers": 0}, {"ers": 500}, {}]], "distances": [[0.1, 0.3, 0.2]]}
+        ranked = FusedScorer(semantic_weight=0.5, ers_weight=0.5).rerank(results, 2)
+        assert ranked["ids"] == [["y", "x"]] and ranked["documents"] == [["dy", "dx"]]
+        assert ranked["distances"] == [[0.3, 0.1]] and len(ranked["scores"][0]) == 2
+        assert FusedScorer().rerank({"ids": [[]]}, 2)["ids"] == [[]]
+
+    def test_unknown_normalization_rejected(self):
+        with pytest.raises(ValueError):
+            FusedScorer(normalization="minmax")
+
+
+class _KeywordEmbedder:
+    """Maps texts onto 4 keyword axes and counts how many texts it embedded"""
+
+    KEYWORDS = ("mission", "values", "products", "about")
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, texts):
+        self.calls += len(texts)
+        return [[float(k in t.lower()) for k in self.KEYWORDS] for t in texts]
+
+
+@pytest.mark.unit
+class TestPartitionedCollection:
+    """Test suite for per-brand knowledge partitions and their query cache."""
+
+    def _store(self, root=None):
+        embedder = _KeywordEmbedder()
+        knowledge = PartitionedCollection(root, "brand_id", embedder, dim=4)
+        knowledge.upsert(
+            ids=["a_mission", "a_values", "b_mission"],
+            documents=["Mission: fast shoes", "Values: craft", "Mission: slow food"],
+            metadatas=[{"brand_id": "a", "type": "mission"}, {"brand_id": "a", "type": "values"},
+                       {"brand_id": "b", "type": "mission"}]
+        )
+        return knowledge, embedder
+
+    def test_query_only_touches_one_partition(self):
+        knowledge, _ = self._store()
+        result = knowledge.query("a", "our mission", n_results=3)
+        assert result["ids"][0][0] == "a_mission" and set(result["ids"][0]) == {"a_mission", "a_values"}
+        assert knowledge.query("b", "mission")["ids"] == [["b_mission"]]
+        assert knowledge.query("nobody", "mission")["ids"] == [[]]
+        assert (knowledge.count("a"), knowledge.count("b")) == (2, 1)
+
+    def test_unknown_partitions_are_not_opened(self, tmp_path):
+        for root in (None, str(tmp_path)):
+            knowledge, embedder = self._store(root)
+            embedded = embedder.calls
+            for brand in ("x", "y", "z"):
+                assert knowledge.query(brand, "mission")["ids"] == [[]] and knowledge.count(brand) == 0
+            assert knowledge.stats()["open_partitions"] == 2 and embedder.calls == embedded
+
+    def test_results_cached_until_partition_written(self):
+        knowledge, embedder = self._store()
+        first = knowledge.query("a", "Our  mission")
+        embedded = embedder.calls
+        assert knowledge.query("a", "Our mission") is first and embedder.calls == embedded
+
+        knowledge.upsert(ids=["b_about"], documents=["About: kitchen"],
+                         metadatas=[{"brand_id": "b", "type": "about"}])
+        assert knowledge.query("a", "Our mission") is first  # other brand's write keeps the entry
+        knowledge.upsert(ids=["a_mission"], documents=["Mission: faster shoes"],
+                         metadatas=[{"brand_id": "a", "type": "mission"}])
+        refreshed = knowledge.query("a", "Our mission")
+        assert refreshed is not first and refreshed["documents"][0][0] == "Mission: faster shoes"
+
+    def test_partitions_persist_and_reload_across_instances(self, tmp_path):
+        writer, _ = self._store(str(tmp_path))
+        reader = PartitionedCollection(str(tmp_path), "brand_id", _KeywordEmbedder(), dim=4)
+        assert reader.query("a", "values", n_results=1)["ids"] == [["a_values"]]
+
+        writer.upsert(ids=["a_products"], documents=["Products: boots"],
+                      metadatas=[{"brand_id": "a", "type": "products"}])
+        assert reader.query("a", "products", n_results=1)["ids"] == [["a_products"]]
@@ -0,0 +1,39 @@
+"""
+Retrain the Local Emotion / Archetype Classifiers
+Refits the nearest-centroid classifiers from the LLM labels collected so far
+and prints how often they agree with the LLM (k-fold holdout).
+
+Emotion examples are posts in the vector store tagged by the LLM; archetype
+examples are the archetypes recorded from /api/analyze answers. Running
+workers pick the new classifiers up on their next prediction. The same
+refit is available as POST /api/classifier/retrain.
+
+Usage:
+    python train_local_classifier.py
+    python train_local_classifier.py --threshold 0.8
+"""
+import argparse
+import json
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrain the local emotion / archetype classifiers")
+    parser.add_argument("--threshold", type=float, default=None,
+                        help="Confidence threshold to report agreement at (default: LOCAL_CLASSIFIER_THRESHOLD)")
+    args = parser.parse_args()
+
+    import app  # loads the vector store, embedder and classifier settings
+
+    if args.threshold is not None:
+        app.local_labeler.threshold = args.threshold
+    if not app.embedder.wait(timeout=600):
+        print(f"⚠️  Embedding model not ready: {app.embedder.status()}")
+        return
+    report = app.retrain_local_classifier()
+    for head, result in report.items():
+        print(f"\n🧠 {head}")
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()